@@ -105,6 +105,12 @@ class ProcessingConstants:
     IPV4_MAX_SEGMENT = 255
     IPV6_MIN_SEGMENT = 0
     IPV6_MAX_SEGMENT = 65535
+    # Directories smaller than this are prescanned serially (worker start-up dominates)
+    PRESCAN_PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+    # Captures smaller than this are masked in-process when masking_workers is "auto"
+    PARALLEL_MASKING_MIN_BYTES = 256 * 1024 * 1024
+    # Size cap of the on-disk keep rule cache (least recently used entries are evicted)
+    RULE_CACHE_MAX_BYTES = 256 * 1024 * 1024
 
     # IP address segment processing
     IPV4_SEGMENTS_COUNT = 4
@@ -0,0 +1,262 @@
+"""
+Hierarchical IP mapping engine
+
+Produces exactly the mappings of the per-address generators in
+``pktmask.core.strategy`` (``_generate_new_ipv4_address_hierarchical`` and
+``_generate_new_ipv6_address_hierarchical``) for large address sets:
+
+- Addresses are integer-encoded and sorted once, so every A / A.B / A.B.C
+  prefix forms a contiguous run and its replacement segment is resolved once
+  per run instead of once per address
+- Used IPv4 segment values are tracked in a 256-entry bitmap with a free
+  counter, so a saturated level costs O(1) instead of scanning the whole
+  segment range as strings
+- IPv6 candidate ranges are contiguous, so the chosen candidate is computed
+  arithmetically instead of materializing up to 61440 candidates per segment
+- One ``random.Random`` is re-seeded per choice instead of constructing a new
+  generator, which yields the same draws
+"""
+
+from __future__ import annotations
+
+import hashlib
+import ipaddress
+import random
+import socket
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from ..common.constants import ProcessingConstants
+
+# (address string, mapped address or None, error message or None)
+MappingResult = Tuple[str, Optional[str], Optional[str]]
+
+
+def segment_seed(seed_base: str, original_seg: str) -> int:
+    """Deterministic seed for a segment choice (same as ``strategy._safe_hash``)"""
+    digest = hashlib.sha256(f"{seed_base}_{original_seg}".encode("utf-8")).hexdigest()
+    return int(digest[: ProcessingConstants.HASH_DIGEST_LENGTH], ProcessingConstants.HEX_BASE)
+
+
+def _ipv4_delta(value: int) -> int:
+    digits = len(str(value))
+    if digits == 1:
+        return 3
+    if digits == 2:
+        return 5
+    return 20
+
+
+class SegmentPool:
+    """Bitmap of the IPv4 segment values already handed out at one level"""
+
+    __slots__ = ("min_val", "max_val", "used", "free", "_random")
+
+    def __init__(self, min_val: int, max_val: int, rng: random.Random):
+        self.min_val = min_val
+        self.max_val = max_val
+        self.used = bytearray(max_val + 1)
+        self.free = max_val - min_val + 1
+        self._random = rng
+
+    @property
+    def used_count(self) -> int:
+        return self.max_val - self.min_val + 1 - self.free
+
+    def pick(self, orig: int, seed_base: str) -> int:
+        """Choose a replacement for ``orig`` exactly like ``strategy._generate_unique_segment``
+
+        Raises:
+            ValueError: If ``orig`` is outside the pool's range
+        """
+        min_val, max_val, used = self.min_val, self.max_val, self.used
+        if orig < min_val or orig > max_val:
+            raise ValueError(f"Segment out of range: {orig}")
+
+        orig_free = not used[orig]
+        if self.free - orig_free > 0:
+            delta = _ipv4_delta(orig)
+            lower = max(min_val, orig - delta)
+            upper = min(max_val, orig + delta)
+            candidates = [v for v in range(lower, upper + 1) if v != orig and not used[v]]
+            if not candidates:
+                candidates = [v for v in range(min_val, max_val + 1) if v != orig and not used[v]]
+            if len(candidates) == 1:
+                value = candidates[0]
+            else:
+                self._random.seed(segment_seed(seed_base, str(orig)))
+                value = candidates[self._random.randint(0, len(candidates) - 1)]
+        elif orig_free:
+            # Only the original value is left; the offset scan ends up choosing it
+            value = orig
+        else:
+            # Level exhausted: the original segment is kept and not recorded
+            return orig
+
+        used[value] = 1
+        self.free -= 1
+        return value
+
+
+class IPv4HierarchyMapper:
+    """Hierarchical IPv4 mapping over integer-encoded addresses
+
+    ``maps`` holds the same string-keyed A / A.B / A.B.C tables that
+    ``_generate_new_ipv4_address_hierarchical`` fills in.
+    """
+
+    def __init__(self, freq1: Dict[str, int], freq2: Dict[str, int], freq3: Dict[str, int]):
+        self.freq1, self.freq2, self.freq3 = freq1, freq2, freq3
+        self.maps: Tuple[Dict[str, str], Dict[str, str], Dict[str, str]] = ({}, {}, {})
+        rng = random.Random()
+        self.pools = (
+            SegmentPool(ProcessingConstants.IPV4_MIN_SEGMENT, ProcessingConstants.IPV4_MAX_SEGMENT, rng),
+            SegmentPool(0, 255, rng),
+            SegmentPool(0, 255, rng),
+        )
+
+    def map_sorted(self, addresses: Sequence[Tuple[int, str]]) -> List[MappingResult]:
+        """Map ``(integer value, address string)`` pairs sorted by integer value"""
+        threshold = ProcessingConstants.HIGH_FREQUENCY_THRESHOLD
+        first_map, second_map, third_map = self.maps
+        pool_a, pool_b, pool_c = self.pools
+        results: List[MappingResult] = []
+
+        prefix8 = prefix16 = prefix24 = -1
+        new_a = new_ab = new_abc = ""
+        error: Optional[str] = None
+        for value, address in addresses:
+            if value >> 24 != prefix8:
+                prefix8 = value >> 24
+                prefix16 = prefix24 = -1
+                key1 = str(prefix8)
+                error = None
+                try:
+                    if self.freq1.get(key1, 0) >= threshold:
+                        if key1 not in first_map:
+                            first_map[key1] = str(pool_a.pick(prefix8, f"first_{key1}"))
+                        new_a = first_map[key1]
+                    else:
+                        # Low-frequency A segments occur in exactly one address
+                        new_a = str(pool_a.pick(prefix8, f"first_single_{key1}"))
+                except ValueError as e:
+                    error = str(e)
+            if error is not None:
+                results.append((address, None, error))
+                continue
+
+            if value >> 16 != prefix16:
+                prefix16 = value >> 16
+                prefix24 = -1
+                key2 = f"{key1}.{(value >> 16) & 0xFF}"
+                if key2 not in second_map:
+                    seed = "second_freq_" if self.freq2.get(key2, 0) >= threshold else "second_single_"
+                    second_map[key2] = str(pool_b.pick((value >> 16) & 0xFF, seed + key2))
+                new_ab = f"{new_a}.{second_map[key2]}"
+
+            if value >> 8 != prefix24:
+                prefix24 = value >> 8
+                key3 = f"{key2}.{(value >> 8) & 0xFF}"
+                if key3 not in third_map:
+                    seed = "third_freq_" if self.freq3.get(key3, 0) >= threshold else "third_single_"
+                    third_map[key3] = str(pool_c.pick((value >> 8) & 0xFF, seed + key3))
+                new_abc = f"{new_ab}.{third_map[key3]}"
+
+            results.append((address, f"{new_abc}.{value & 0xFF}", None))
+        return results
+
+
+class IPv6HierarchyMapper:
+    """Hierarchical IPv6 mapping over integer-encoded addresses
+
+    ``maps`` has the layout of the tables ``_generate_new_ipv6_address_hierarchical``
+    uses and may be shared with it.
+    """
+
+    def __init__(self, freqs: Sequence[Dict[str, int]], maps: Optional[Sequence[Dict[str, str]]] = None):
+        self.freqs = freqs
+        self.maps = maps if maps is not None else tuple({} for _ in range(7))
+        self._random = random.Random()
+
+    def _segment(self, original_seg: str, seed_base: str) -> str:
+        """Same result as ``strategy._generate_unique_ipv6_segment``"""
+        n = len(original_seg)
+        orig = int(original_seg, 16)
+        lower = 16 ** (n - 1) if n > 1 else 0
+        upper = 16**n - 1
+        delta = {1: 3, 2: 8, 3: 32, 4: 128}.get(n, 256)
+
+        # Candidates are a contiguous range minus the original value
+        first, last = max(lower, orig - delta), min(upper, orig + delta)
+        count = last - first + 1 - (first <= orig <= last)
+        if count <= 0:
+            first, last = lower, upper
+            count = last - first + 1 - (first <= orig <= last)
+        if count <= 0:
+            return format((orig + 1) % (upper - lower + 1) + lower, "x").zfill(n)
+
+        self._random.seed(segment_seed(seed_base, original_seg))
+        value = first + self._random.randint(0, count - 1)
+        if first <= orig <= value:
+            value += 1
+        return format(value, "x").zfill(n)
+
+    def map_sorted(self, addresses: Iterable[Tuple[int, str]]) -> List[MappingResult]:
+        """Map ``(integer value, address string)`` pairs; sorting lets prefixes hit the cache"""
+        threshold = ProcessingConstants.HIGH_FREQUENCY_THRESHOLD
+        results: List[MappingResult] = []
+        for value, address in addresses:
+            digits = format(value, "032x")
+            exploded = ":".join(digits[i : i + 4] for i in range(0, 32, 4))
+            new_parts = []
+            for i in range(7):
+                key = exploded[: 5 * i + 4]
+                segment = exploded[5 * i : 5 * i + 4]
+                if self.freqs[i].get(key, 0) >= threshold:
+                    level_map = self.maps[i]
+                    if key not in level_map:
+                        level_map[key] = self._segment(segment, f"ipv6_{i}_{key}")
+                    new_parts.append(level_map[key])
+                else:
+                    new_parts.append(self._segment(segment, f"ipv6_single_{i}_{key}"))
+            new_parts.append(exploded[35:])
+            results.append((address, ":".join(new_parts), None))
+        return results
+
+
+def _encode(address: str, family: int, parse) -> int:
+    """Integer value of an address; inet_pton for canonical text, ``ipaddress`` otherwise"""
+    try:
+        packed = socket.inet_pton(family, address)
+        if socket.inet_ntop(family, packed) == address:
+            return int.from_bytes(packed, "big")
+    except OSError:
+        pass
+    return int(parse(address))
+
+
+def encode_addresses(addresses: Iterable[str]) -> Tuple[List[Tuple[int, str]], List[Tuple[int, str]], List[str]]:
+    """Split addresses into sorted integer-encoded IPv4 and IPv6 lists
+
+    Addresses the integer path cannot reproduce exactly (invalid strings, IPv6
+    with a scope or an embedded dotted quad) are returned unchanged, in input
+    order, for the per-address generators.
+
+    Returns:
+        (IPv4 (value, address) pairs, IPv6 (value, address) pairs, remaining addresses)
+    """
+    ipv4: List[Tuple[int, str]] = []
+    ipv6: List[Tuple[int, str]] = []
+    remaining: List[str] = []
+    for address in addresses:
+        try:
+            if "." in address:
+                ipv4.append((_encode(address, socket.AF_INET, ipaddress.IPv4Address), address))
+            elif "%" not in address:
+                ipv6.append((_encode(address, socket.AF_INET6, ipaddress.IPv6Address), address))
+            else:
+                remaining.append(address)
+        except ValueError:
+            remaining.append(address)
+    ipv4.sort()
+    ipv6.sort()
+    return ipv4, ipv6, remaining
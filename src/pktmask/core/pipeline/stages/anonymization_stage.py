@@ -7,13 +7,22 @@ Eliminates adapter layer, unified StageStats format return.
 
 from __future__ import annotations
 
+import os
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 from pktmask.common.exceptions import ProcessingError, ResourceError
 from pktmask.core.pipeline.base_stage import StageBase
 from pktmask.core.pipeline.models import StageStats
+from pktmask.core.rawpacket.ip_rewrite import AddressRewriter
+from pktmask.core.rawpacket.pcap_io import (
+    RawCaptureReader,
+    RawPcapWriter,
+    detect_capture_format,
+    dissect_record,
+    scapy_output_linktype,
+)
 from pktmask.core.strategy import HierarchicalAnonymizationStrategy
 from pktmask.infrastructure.logging import get_logger
 from pktmask.utils.reporting import FileReporter
@@ -36,6 +45,13 @@ class AnonymizationStage(StageBase):
                 - method: Anonymization method (default: "prefix_preserving")
                 - ipv4_prefix: IPv4 prefix length (default: 24)
                 - ipv6_prefix: IPv6 prefix length (default: 64)
+                - processing_mode: "streaming" rewrites packets one at a time while reading;
+                  "in_memory" loads the whole file with rdpcap (default: "streaming")
+                - rewrite_engine: Streaming rewrite engine: "raw" patches addresses and checksums in
+                  the frame bytes, "scapy" rebuilds every packet, "auto" uses "raw" for pcap/pcapng
+                  input (default: "auto")
+                - prescan_workers: Worker processes for the directory address prescan; None
+                  decides from CPU count and directory size, 1 scans serially (default: None)
                 - enabled: Whether stage is enabled (default: True)
                 - name: Stage name
                 - priority: Processing priority
@@ -46,6 +62,9 @@ class AnonymizationStage(StageBase):
         self.method = config.get("method", "prefix_preserving")
         self.ipv4_prefix = config.get("ipv4_prefix", 24)
         self.ipv6_prefix = config.get("ipv6_prefix", 64)
+        self.processing_mode = config.get("processing_mode", "streaming")
+        self.rewrite_engine = config.get("rewrite_engine", "auto")
+        self.prescan_workers = config.get("prescan_workers")
         self.enabled = config.get("enabled", True)
         self.stage_name = config.get("name", "ip_anonymization")
         self.priority = config.get("priority", 0)
@@ -57,6 +76,9 @@ class AnonymizationStage(StageBase):
         self._strategy: Optional[HierarchicalAnonymizationStrategy] = None
         self._reporter: Optional[FileReporter] = None
 
+        # Files covered by the mapping built in prepare_for_directory
+        self._prepared_files: Set[str] = set()
+
         # Statistics
         self._stats = {}
 
@@ -80,7 +102,7 @@ class AnonymizationStage(StageBase):
                 self.config.update(config)
 
             # Initialize HierarchicalAnonymizationStrategy
-            self._strategy = HierarchicalAnonymizationStrategy()
+            self._strategy = HierarchicalAnonymizationStrategy(prescan_workers=self.prescan_workers)
             self._reporter = FileReporter()
 
             self._initialized = True
@@ -121,57 +143,26 @@ class AnonymizationStage(StageBase):
             # 重置统计信息
             self._stats.clear()
 
-            # Import Scapy with error handling
-            try:
-                from scapy.all import rdpcap, wrpcap
-            except ImportError as e:
-                raise ProcessingError("Scapy library not available for IP anonymization") from e
-
-            # 读取数据包 with retry mechanism
-            def load_packets():
-                return rdpcap(str(input_path))
-
-            packets = self.retry_operation(load_packets, f"loading packets from {input_path}")
-            total_packets = len(packets)
-
-            self.logger.info(f"Loaded {total_packets} packets from {input_path}")
-
-            # 关键修复：先构建IP映射表 with error handling
+            # 构建IP映射表：目录级映射已覆盖该文件时直接复用，避免重复预扫描
             with self.safe_operation("IP mapping construction"):
-                self.logger.info("Analyzing IP addresses and building mapping table...")
-                self._strategy.build_mapping_from_directory([str(input_path)])
+                if self._has_prepared_mapping(input_path):
+                    self.logger.info("Reusing directory-level IP mapping")
+                else:
+                    self.logger.info("Analyzing IP addresses and building mapping table...")
+                    self._strategy.build_mapping_from_directory([str(input_path)])
                 ip_mappings = self._strategy.get_ip_map()
                 self.logger.info(f"IP mapping construction completed: {len(ip_mappings)} IP addresses")
 
-            # 开始匿名化数据包 with error handling
             self.logger.info("Starting packet anonymization")
-            anonymized_packets = 0
-            anonymized_pkts = []
-
-            # 处理每个数据包 with individual packet error handling
-            for i, packet in enumerate(packets):
-                try:
-                    modified_packet, was_modified = self._strategy.anonymize_packet(packet)
-                    anonymized_pkts.append(modified_packet)
-                    if was_modified:
-                        anonymized_packets += 1
-                except Exception as e:
-                    self.logger.warning(
-                        f"Failed to anonymize packet {i+1}/{total_packets}: {e}. Using original packet."
-                    )
-                    anonymized_pkts.append(packet)  # Keep original packet to maintain file integrity
-
-            # 保存匿名化后的数据包 with error handling
-            def save_packets():
-                if anonymized_pkts:
-                    wrpcap(str(output_path), anonymized_pkts)
-                    self.logger.info(f"Saved {len(anonymized_pkts)} anonymized packets to {output_path}")
-                else:
-                    # 如果没有数据包，创建空文件
-                    output_path.touch()
-                    self.logger.warning("No packets to save, created empty output file")
-
-            self.retry_operation(save_packets, f"saving anonymized packets to {output_path}")
+            rewrite_engine = None
+            if self.processing_mode == "in_memory":
+                total_packets, anonymized_packets = self._anonymize_in_memory(input_path, output_path)
+            elif self._should_use_raw_engine(input_path):
+                rewrite_engine = "raw"
+                total_packets, anonymized_packets = self._anonymize_raw(input_path, output_path)
+            else:
+                rewrite_engine = "scapy"
+                total_packets, anonymized_packets = self._anonymize_streaming(input_path, output_path)
 
             processing_time = time.time() - start_time
             duration_ms = processing_time * 1000
@@ -210,6 +201,8 @@ class AnonymizationStage(StageBase):
                 duration_ms=duration_ms,
                 extra_metrics={
                     "method": self.method,
+                    "processing_mode": self.processing_mode,
+                    "rewrite_engine": rewrite_engine,
                     "ipv4_prefix": self.ipv4_prefix,
                     "ipv6_prefix": self.ipv6_prefix,
                     "original_ips": original_ips,
@@ -241,6 +234,184 @@ class AnonymizationStage(StageBase):
             self.logger.error(error_msg, exc_info=True)
             raise ProcessingError(error_msg) from e
 
+    def _has_prepared_mapping(self, input_path: Path) -> bool:
+        """Whether prepare_for_directory already built a mapping covering ``input_path``"""
+        return bool(self._strategy.get_ip_map()) and os.path.abspath(str(input_path)) in self._prepared_files
+
+    def _anonymize_packet(self, packet, index: int):
+        """Anonymize one packet, keeping the original if anonymization fails.
+
+        Returns:
+            Tuple of (packet to write, whether it was modified)
+        """
+        try:
+            return self._strategy.anonymize_packet(packet)
+        except Exception as e:
+            self.logger.warning(f"Failed to anonymize packet {index}: {e}. Using original packet.")
+            return packet, False  # Keep original packet to maintain file integrity
+
+    def _anonymize_in_memory(self, input_path: Path, output_path: Path) -> Tuple[int, int]:
+        """Load the whole file with rdpcap, anonymize and write with wrpcap.
+
+        Returns:
+            Tuple of (total packets, anonymized packets)
+        """
+        # Import Scapy with error handling
+        try:
+            from scapy.all import rdpcap, wrpcap
+        except ImportError as e:
+            raise ProcessingError("Scapy library not available for IP anonymization") from e
+
+        # 读取数据包 with retry mechanism
+        def load_packets():
+            return rdpcap(str(input_path))
+
+        packets = self.retry_operation(load_packets, f"loading packets from {input_path}")
+        total_packets = len(packets)
+
+        self.logger.info(f"Loaded {total_packets} packets from {input_path}")
+
+        anonymized_packets = 0
+        anonymized_pkts = []
+
+        # 处理每个数据包 with individual packet error handling
+        for i, packet in enumerate(packets):
+            modified_packet, was_modified = self._anonymize_packet(packet, i + 1)
+            anonymized_pkts.append(modified_packet)
+            if was_modified:
+                anonymized_packets += 1
+
+        # 保存匿名化后的数据包 with error handling
+        def save_packets():
+            if anonymized_pkts:
+                wrpcap(str(output_path), anonymized_pkts)
+                self.logger.info(f"Saved {len(anonymized_pkts)} anonymized packets to {output_path}")
+            else:
+                # 如果没有数据包，创建空文件
+                output_path.touch()
+                self.logger.warning("No packets to save, created empty output file")
+
+        self.retry_operation(save_packets, f"saving anonymized packets to {output_path}")
+
+        return total_packets, anonymized_packets
+
+    def _anonymize_streaming(self, input_path: Path, output_path: Path) -> Tuple[int, int]:
+        """Read, anonymize and write packets one at a time.
+
+        Memory use is bounded by a single packet; output is byte-identical to the
+        in-memory mode.
+
+        Returns:
+            Tuple of (total packets, anonymized packets)
+        """
+        try:
+            from scapy.utils import PcapReader, PcapWriter
+        except ImportError as e:
+            raise ProcessingError("Scapy library not available for IP anonymization") from e
+
+        def anonymize():
+            total_packets = 0
+            anonymized_packets = 0
+            writer = None
+
+            try:
+                # PcapReader detects pcap/pcapng from the file magic, as rdpcap does
+                with PcapReader(str(input_path)) as reader:
+                    for packet in reader:
+                        total_packets += 1
+                        modified_packet, was_modified = self._anonymize_packet(packet, total_packets)
+                        if was_modified:
+                            anonymized_packets += 1
+
+                        if writer is None:
+                            writer = PcapWriter(str(output_path))
+                        writer.write(modified_packet)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if writer is None:
+                # 如果没有数据包，创建空文件
+                output_path.touch()
+                self.logger.warning("No packets to save, created empty output file")
+            else:
+                self.logger.info(f"Saved {total_packets} anonymized packets to {output_path}")
+
+            return total_packets, anonymized_packets
+
+        return self.retry_operation(anonymize, f"streaming IP anonymization of {input_path}")
+
+    def _should_use_raw_engine(self, input_path: Path) -> bool:
+        """Whether the streaming pass can patch raw frames instead of rebuilding packets"""
+        if self.rewrite_engine == "scapy":
+            return False
+        return detect_capture_format(str(input_path)) is not None
+
+    def _anonymize_raw(self, input_path: Path, output_path: Path) -> Tuple[int, int]:
+        """Rewrite addresses directly in the record bytes.
+
+        Addresses are replaced in place and IP/TCP/UDP/ICMPv6 checksums updated
+        incrementally, so the cost per packet does not depend on payload size.
+        Frames the raw rewriter does not support (tunnels, fragments, extension
+        headers) are anonymized through scapy. Output matches the scapy engine
+        for packets whose original checksums were valid.
+
+        Returns:
+            Tuple of (total packets, anonymized packets)
+        """
+
+        def anonymize():
+            rewriter = AddressRewriter(self._strategy.get_ip_map())
+            total_packets = 0
+            anonymized_packets = 0
+            dissected_packets = 0
+            writer = None
+
+            try:
+                with RawCaptureReader(str(input_path)) as reader:
+                    for record in reader:
+                        total_packets += 1
+                        data = record.data
+                        try:
+                            frame = bytearray(data)
+                            was_modified = rewriter.rewrite(record.linktype, frame)
+                            if was_modified is None:
+                                dissected_packets += 1
+                                packet, was_modified = self._strategy.anonymize_packet(dissect_record(record))
+                                if was_modified:
+                                    data = bytes(packet)
+                            elif was_modified:
+                                data = bytes(frame)
+                        except Exception as e:
+                            self.logger.warning(
+                                f"Failed to anonymize packet {total_packets}: {e}. Using original packet."
+                            )
+                            data, was_modified = record.data, False
+                        if was_modified:
+                            anonymized_packets += 1
+
+                        if writer is None:
+                            writer = RawPcapWriter(str(output_path))
+                            writer.write_header(scapy_output_linktype(record.linktype, record.data))
+                        writer.write_record(data, record.sec, record.usec, record.wirelen)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if writer is None:
+                # 如果没有数据包，创建空文件
+                output_path.touch()
+                self.logger.warning("No packets to save, created empty output file")
+            else:
+                self.logger.info(
+                    f"Saved {total_packets} anonymized packets to {output_path} "
+                    f"({dissected_packets} rewritten with scapy)"
+                )
+
+            return total_packets, anonymized_packets
+
+        return self.retry_operation(anonymize, f"raw IP anonymization of {input_path}")
+
     def get_display_name(self) -> str:
         """Get display name for UI presentation"""
         return "Anonymize IPs"
@@ -264,6 +435,7 @@ class AnonymizationStage(StageBase):
 
         # Use strategy's build_mapping_from_directory method to build IP mapping
         self._strategy.build_mapping_from_directory(all_files)
+        self._prepared_files = {os.path.abspath(str(path)) for path in all_files}
 
         ip_count = len(self._strategy.get_ip_map())
         self.logger.info(f"Directory IP mapping prepared: {ip_count} unique IP addresses")
@@ -283,6 +455,7 @@ class AnonymizationStage(StageBase):
             # Reset strategy state
             if hasattr(self._strategy, "reset"):
                 self._strategy.reset()
+        self._prepared_files.clear()
 
         # Clear statistics
         self._stats.clear()
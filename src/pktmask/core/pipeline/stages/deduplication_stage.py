@@ -7,16 +7,29 @@ Eliminates adapter layer, unified StageStats format return.
 
 from __future__ import annotations
 
-import hashlib
 import time
 from pathlib import Path
-from typing import Any, Dict, Optional, Set
+from typing import Any, Dict, Optional, Tuple, Union
 
 from pktmask.common.exceptions import ProcessingError, ResourceError
 from pktmask.core.pipeline.base_stage import StageBase
 from pktmask.core.pipeline.models import StageStats
+from pktmask.core.rawpacket.digests import (
+    CompactDigestSet,
+    LRUDigestSet,
+    WindowedDigestSet,
+    get_digest_function,
+)
+from pktmask.core.rawpacket.pcap_io import (
+    RawCaptureReader,
+    RawPcapWriter,
+    detect_capture_format,
+    scapy_output_linktype,
+)
 from pktmask.infrastructure.logging import get_logger
 
+DigestStore = Union[set, CompactDigestSet, WindowedDigestSet, LRUDigestSet]
+
 
 class DeduplicationStage(StageBase):
     """Unified deduplication stage - eliminates BaseProcessor dependency
@@ -32,7 +45,19 @@ class DeduplicationStage(StageBase):
 
         Args:
             config: Configuration dictionary with the following parameters:
-                - algorithm: Deduplication algorithm (default: "md5")
+                - algorithm: Deduplication algorithm: "md5", "sha1", "sha256", "blake2b-64",
+                  "blake2b-128", "xxh64" or "xxh3-128" (xxhash names fall back to BLAKE2b of the
+                  same width when xxhash is not installed) (default: "md5")
+                - digest_store: "set" keeps binary digests in a Python set; "compact" keeps them
+                  in an open-addressing table that needs far less memory but probes it in Python,
+                  so only use it for captures whose digests would not fit in memory (default: "set")
+                - dedup_scope: "global" removes every repeat of a packet; "window" only removes
+                  repeats within dedup_window_ms of the last kept copy; "lru" only remembers the
+                  dedup_max_entries most recent digests (default: "global")
+                - dedup_window_ms: Window for the "window" scope in milliseconds (default: 10)
+                - dedup_max_entries: Capacity of the "lru" scope (default: 1000000)
+                - processing_mode: "streaming" hashes raw records and writes unique ones
+                  immediately; "in_memory" loads the whole file with scapy (default: "streaming")
                 - enabled: Whether stage is enabled (default: True)
                 - name: Stage name
                 - priority: Processing priority
@@ -41,6 +66,11 @@ class DeduplicationStage(StageBase):
 
         # Parse configuration
         self.algorithm = config.get("algorithm", "md5")
+        self.processing_mode = config.get("processing_mode", "streaming")
+        self.digest_store = config.get("digest_store", "set")
+        self.dedup_scope = config.get("dedup_scope", "global")
+        self.dedup_window_ms = float(config.get("dedup_window_ms", 10))
+        self.dedup_max_entries = int(config.get("dedup_max_entries", 1000000))
         self.enabled = config.get("enabled", True)
         self.stage_name = config.get("name", "deduplication")
         self.priority = config.get("priority", 0)
@@ -49,12 +79,40 @@ class DeduplicationStage(StageBase):
         self.logger = get_logger("dedup_stage")
 
         # Deduplication state
-        self._packet_hashes: Set[str] = set()
+        self._digest_algorithm, self._digest = get_digest_function(self.algorithm)
+        if self._digest_algorithm != self.algorithm:
+            self.logger.warning(
+                f"Deduplication algorithm '{self.algorithm}' unavailable, using '{self._digest_algorithm}'"
+            )
+        self._packet_hashes: DigestStore = self._create_digest_store()
 
         # Statistics
         self._stats = {}
 
-        self.logger.info(f"DeduplicationStage created: algorithm={self.algorithm}")
+        self.logger.info(
+            f"DeduplicationStage created: algorithm={self.algorithm}, scope={self.dedup_scope}, "
+            f"store={self.digest_store}"
+        )
+
+    def _create_digest_store(self) -> DigestStore:
+        """Create the digest store selected by ``dedup_scope``/``digest_store``"""
+        if self.dedup_scope == "window":
+            return WindowedDigestSet(self.dedup_window_ms / 1000.0)
+        if self.dedup_scope == "lru":
+            return LRUDigestSet(self.dedup_max_entries)
+        if self.digest_store == "set":
+            return set()
+        return CompactDigestSet(len(self._digest(b"")))
+
+    def _is_new_digest(self, digest: bytes, timestamp: float) -> bool:
+        """Record ``digest``; return True if the packet should be kept"""
+        store = self._packet_hashes
+        if isinstance(store, set):
+            if digest in store:
+                return False
+            store.add(digest)
+            return True
+        return store.add(digest, timestamp)
 
     def initialize(self, config: Optional[Dict] = None) -> bool:
         """Initialize deduplication components.
@@ -122,64 +180,10 @@ class DeduplicationStage(StageBase):
             self._stats.clear()
             self._packet_hashes.clear()  # 清空哈希集合，确保每个文件独立处理
 
-            # Import Scapy with error handling
-            try:
-                from scapy.all import rdpcap, wrpcap
-            except ImportError as e:
-                raise ProcessingError("Scapy library not available for deduplication") from e
-
-            # 读取数据包 with retry mechanism and memory monitoring
-            def load_packets():
-                # Check memory pressure before loading
-                if self.resource_manager.get_memory_pressure() > 0.8:
-                    self.logger.warning("High memory pressure detected before loading packets")
-                return rdpcap(str(input_path))
-
-            packets = self.retry_operation(load_packets, f"loading packets from {input_path}")
-            total_packets = len(packets)
-
-            self.logger.info(f"Loaded {total_packets} packets from {input_path}")
-
-            # Deduplication processing with memory monitoring and error handling
-            unique_packets = []
-            removed_count = 0
-
-            with self.safe_operation("packet deduplication"):
-                for i, packet in enumerate(packets):
-                    try:
-                        # Monitor memory pressure during processing
-                        if i % 1000 == 0 and self.resource_manager.get_memory_pressure() > 0.9:
-                            self.logger.warning(
-                                f"High memory pressure during deduplication at packet {i}/{total_packets}"
-                            )
-
-                        # Generate packet hash with error handling
-                        packet_hash = self._generate_packet_hash(packet)
-
-                        if packet_hash not in self._packet_hashes:
-                            self._packet_hashes.add(packet_hash)
-                            unique_packets.append(packet)
-                        else:
-                            removed_count += 1
-
-                    except Exception as e:
-                        self.logger.warning(
-                            f"Failed to process packet {i+1}/{total_packets} during deduplication: {e}. "
-                            f"Treating as unique packet."
-                        )
-                        unique_packets.append(packet)  # Keep packet to maintain file integrity
-
-            # 保存去重后的数据包 with error handling
-            def save_unique_packets():
-                if unique_packets:
-                    wrpcap(str(output_path), unique_packets)
-                    self.logger.info(f"Saved {len(unique_packets)} unique packets to {output_path}")
-                else:
-                    # 如果没有唯一数据包，创建空文件
-                    output_path.touch()
-                    self.logger.warning("No unique packets found, created empty output file")
-
-            self.retry_operation(save_unique_packets, f"saving deduplicated packets to {output_path}")
+            if self.processing_mode == "streaming" and detect_capture_format(str(input_path)) is not None:
+                total_packets, unique_count, removed_count = self._deduplicate_streaming(input_path, output_path)
+            else:
+                total_packets, unique_count, removed_count = self._deduplicate_in_memory(input_path, output_path)
 
             processing_time = time.time() - start_time
             duration_ms = processing_time * 1000
@@ -194,7 +198,7 @@ class DeduplicationStage(StageBase):
             self._stats.update(
                 {
                     "total_packets": total_packets,
-                    "unique_packets": len(unique_packets),
+                    "unique_packets": unique_count,
                     "removed_count": removed_count,
                     "deduplication_rate": deduplication_rate,
                     "space_saved": space_saved,
@@ -215,8 +219,11 @@ class DeduplicationStage(StageBase):
                 duration_ms=duration_ms,
                 extra_metrics={
                     "algorithm": self.algorithm,
+                    "digest_algorithm": self._digest_algorithm,
+                    "dedup_scope": self.dedup_scope,
+                    "tracked_digests": len(self._packet_hashes),
                     "total_packets": total_packets,
-                    "unique_packets": len(unique_packets),
+                    "unique_packets": unique_count,
                     "removed_count": removed_count,
                     "deduplication_rate": deduplication_rate,
                     "space_saved": space_saved,
@@ -248,6 +255,122 @@ class DeduplicationStage(StageBase):
             self._packet_hashes.clear()
             raise ProcessingError(error_msg) from e
 
+    def _deduplicate_in_memory(self, input_path: Path, output_path: Path) -> Tuple[int, int, int]:
+        """Load the whole file with scapy, deduplicate and write unique packets.
+
+        Returns:
+            Tuple of (total packets, unique packets, removed packets)
+        """
+        # Import Scapy with error handling
+        try:
+            from scapy.all import rdpcap, wrpcap
+        except ImportError as e:
+            raise ProcessingError("Scapy library not available for deduplication") from e
+
+        # 读取数据包 with retry mechanism and memory monitoring
+        def load_packets():
+            # Check memory pressure before loading
+            if self.resource_manager.get_memory_pressure() > 0.8:
+                self.logger.warning("High memory pressure detected before loading packets")
+            return rdpcap(str(input_path))
+
+        packets = self.retry_operation(load_packets, f"loading packets from {input_path}")
+        total_packets = len(packets)
+
+        self.logger.info(f"Loaded {total_packets} packets from {input_path}")
+
+        # Deduplication processing with memory monitoring and error handling
+        unique_packets = []
+        removed_count = 0
+
+        with self.safe_operation("packet deduplication"):
+            for i, packet in enumerate(packets):
+                try:
+                    # Monitor memory pressure during processing
+                    if i % 1000 == 0 and self.resource_manager.get_memory_pressure() > 0.9:
+                        self.logger.warning(f"High memory pressure during deduplication at packet {i}/{total_packets}")
+
+                    # Generate packet hash with error handling
+                    packet_hash = self._generate_packet_hash(packet)
+
+                    if self._is_new_digest(packet_hash, float(packet.time)):
+                        unique_packets.append(packet)
+                    else:
+                        removed_count += 1
+
+                except Exception as e:
+                    self.logger.warning(
+                        f"Failed to process packet {i+1}/{total_packets} during deduplication: {e}. "
+                        f"Treating as unique packet."
+                    )
+                    unique_packets.append(packet)  # Keep packet to maintain file integrity
+
+        # 保存去重后的数据包 with error handling
+        def save_unique_packets():
+            if unique_packets:
+                wrpcap(str(output_path), unique_packets)
+                self.logger.info(f"Saved {len(unique_packets)} unique packets to {output_path}")
+            else:
+                # 如果没有唯一数据包，创建空文件
+                output_path.touch()
+                self.logger.warning("No unique packets found, created empty output file")
+
+        self.retry_operation(save_unique_packets, f"saving deduplicated packets to {output_path}")
+
+        return total_packets, len(unique_packets), removed_count
+
+    def _deduplicate_streaming(self, input_path: Path, output_path: Path) -> Tuple[int, int, int]:
+        """Deduplicate record by record without building scapy packets.
+
+        Records are hashed as raw bytes (the same bytes ``bytes(packet)`` yields for a
+        dissected packet) and unique ones are written immediately, so memory use is
+        bounded by the hash set. Output is byte-identical to the in-memory mode.
+
+        Returns:
+            Tuple of (total packets, unique packets, removed packets)
+        """
+
+        def deduplicate():
+            # Restart from a clean state if a previous attempt failed midway
+            self._packet_hashes.clear()
+            total_packets = 0
+            unique_count = 0
+            removed_count = 0
+            writer = None
+
+            try:
+                with RawCaptureReader(str(input_path)) as reader:
+                    for record in reader:
+                        total_packets += 1
+
+                        if total_packets % 1000 == 0 and self.resource_manager.get_memory_pressure() > 0.9:
+                            self.logger.warning(f"High memory pressure during deduplication at packet {total_packets}")
+
+                        packet_hash = self._hash_bytes(record.data)
+                        if not self._is_new_digest(packet_hash, record.sec + record.usec / 1000000.0):
+                            removed_count += 1
+                            continue
+
+                        if writer is None:
+                            writer = RawPcapWriter(str(output_path))
+                            writer.write_header(scapy_output_linktype(record.linktype, record.data))
+                        writer.write_record(record.data, record.sec, record.usec, record.wirelen)
+                        unique_count += 1
+            finally:
+                if writer is not None:
+                    writer.close()
+
+            if writer is None:
+                # 如果没有唯一数据包，创建空文件
+                output_path.touch()
+                self.logger.warning("No unique packets found, created empty output file")
+            else:
+                self.logger.info(f"Saved {unique_count} unique packets to {output_path}")
+
+            return total_packets, unique_count, removed_count
+
+        return self.retry_operation(deduplicate, f"streaming deduplication of {input_path}")
+
     def get_display_name(self) -> str:
         """Get display name for this stage"""
         return "Remove Dupes"
@@ -266,24 +389,19 @@ class DeduplicationStage(StageBase):
         """Get stage description for UI and documentation"""
         return "Remove completely duplicate packets to reduce file size"
 
-    def _generate_packet_hash(self, packet) -> str:
+    def _generate_packet_hash(self, packet) -> bytes:
         """生成数据包哈希值"""
         try:
             # 使用数据包的原始字节生成哈希
-            packet_bytes = bytes(packet)
-            if self.algorithm == "sha256":
-                return hashlib.sha256(packet_bytes).hexdigest()
-            else:
-                # 默认使用MD5（与原实现保持一致）
-                return hashlib.md5(packet_bytes).hexdigest()
+            return self._hash_bytes(bytes(packet))
         except Exception as e:
             self.logger.warning(f"Failed to generate packet hash: {e}")
             # 回退：使用字符串表示
-            packet_str = str(packet).encode()
-            if self.algorithm == "sha256":
-                return hashlib.sha256(packet_str).hexdigest()
-            else:
-                return hashlib.md5(packet_str).hexdigest()
+            return self._hash_bytes(str(packet).encode())
+
+    def _hash_bytes(self, data: bytes) -> bytes:
+        """生成字节串的二进制摘要"""
+        return self._digest(data)
 
     def _calculate_space_saved(self, input_path: Path, output_path: Path) -> dict:
         """计算空间节省"""
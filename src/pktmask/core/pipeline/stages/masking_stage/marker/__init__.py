@@ -7,6 +7,7 @@ that need to be preserved, and generates structured KeepRule lists.
 Core Components:
 - ProtocolMarker: Protocol marker base class
 - TLSProtocolMarker: TLS protocol marker implementation
+- NativeTLSProtocolMarker: tshark-free TLS marker (marker_config tls_engine="native")
 - KeepRule/KeepRuleSet: Keep rule data structures
 
 Technical Features:
@@ -17,7 +18,8 @@ Technical Features:
 """
 
 from .base import ProtocolMarker
+from .native_tls_marker import NativeTLSProtocolMarker
 from .tls_marker import TLSProtocolMarker
 from .types import FlowInfo, KeepRule, KeepRuleSet
 
-__all__ = ["ProtocolMarker", "TLSProtocolMarker", "KeepRule", "KeepRuleSet", "FlowInfo"]
+__all__ = ["ProtocolMarker", "TLSProtocolMarker", "NativeTLSProtocolMarker", "KeepRule", "KeepRuleSet", "FlowInfo"]
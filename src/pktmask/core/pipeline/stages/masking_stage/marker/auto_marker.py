@@ -7,7 +7,7 @@ their KeepRuleSets. Used when MaskingStage.protocol == 'auto'.
 
 from __future__ import annotations
 
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 
 from .types import KeepRuleSet
 
@@ -21,7 +21,11 @@ class AutoProtocolMarker:
     def initialize(self) -> bool:
         try:
             from .http_marker import HTTPProtocolMarker
-            from .tls_marker import TLSProtocolMarker
+
+            if self.marker_config.get("tls_engine") == "native":
+                from .native_tls_marker import NativeTLSProtocolMarker as TLSProtocolMarker
+            else:
+                from .tls_marker import TLSProtocolMarker
 
             self.tls_marker = TLSProtocolMarker(self.marker_config)
             self.http_marker = HTTPProtocolMarker(self.marker_config)
@@ -40,6 +44,16 @@ class AutoProtocolMarker:
         except Exception:
             pass
 
+    def cache_fingerprint(self) -> Optional[Dict[str, Any]]:
+        """Rule cache identity of the combined markers (None if any part is uncacheable)"""
+        if not (self.tls_marker and self.http_marker):
+            return None
+        tls = self.tls_marker.cache_fingerprint()
+        http = self.http_marker.cache_fingerprint()
+        if tls is None or http is None:
+            return None
+        return {"marker": self.__class__.__name__, "tls": tls, "http": http}
+
     def analyze_file(self, pcap_path: str, config: Dict[str, Any]) -> KeepRuleSet:
         ruleset = KeepRuleSet()
         # TLS first (more deterministic), then HTTP
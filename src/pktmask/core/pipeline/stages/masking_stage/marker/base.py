@@ -8,8 +8,9 @@ from __future__ import annotations
 
 import logging
 from abc import ABC, abstractmethod
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Optional
 
+from ......infrastructure.logging import HotPathTracer
 from .types import KeepRuleSet
 
 
@@ -27,6 +28,8 @@ class ProtocolMarker(ABC):
         """
         self.config = config
         self.logger = logging.getLogger(f"{self.__class__.__module__}.{self.__class__.__name__}")
+        # 逐帧调试信息（PKTMASK_TRACE 开启，按 1/N 采样）
+        self._trace = HotPathTracer(self.logger, (config or {}).get("trace_sample_rate"))
         self._initialized = False
 
     @abstractmethod
@@ -113,6 +116,13 @@ class ProtocolMarker(ABC):
         """获取版本信息"""
         return "1.0.0"
 
+    def cache_fingerprint(self) -> Optional[Dict[str, Any]]:
+        """规则缓存标识：同一文件在相同标识下生成的规则必须相同
+
+        子类应加入影响规则输出的配置和外部工具版本；返回 None 表示结果不可缓存。
+        """
+        return {"marker": self.__class__.__name__, "version": self.get_version()}
+
     def cleanup(self) -> None:
         """清理资源"""
         self.logger.debug(f"{self.__class__.__name__} 清理资源")
@@ -0,0 +1,268 @@
+"""
+Columnar keep rules
+
+KeepRuleSet holds one KeepRule (with its own metadata dict) per TLS record,
+convenient for markers and tests but several hundred bytes per rule. The
+masker only needs, per flow direction, the sorted header-only and
+full-preserve sequence ranges. ColumnarKeepRules stores exactly that:
+
+- interned flows: ``(stream_id, tuple_key)`` pairs referenced by index
+- parallel columns flow (``I``), direction (``B``), strategy (``B``),
+  seq_start / seq_end (``Q``): 22 bytes per rule
+- rows sorted by (flow, direction, strategy, seq_start, seq_end); ``groups``
+  maps ``(flow, direction, strategy)`` to its row slice
+
+:class:`RangeView` exposes one slice as a read-only sequence of
+``(start, end)`` tuples backed by memoryviews of the columns, so the masker
+shares the columns instead of copying them. :meth:`ColumnarKeepRules.to_bytes`
+is a compact save format (flow and group tables + raw little-endian columns).
+"""
+
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from .types import KeepRule
+
+DIRECTIONS = ("forward", "reverse")
+STRATEGIES = ("header_only", "full_preserve")
+HEADER_ONLY = 0
+FULL_PRESERVE = 1
+
+# Marker strategy names -> strategy code ('full_message' is the TLS marker's name for full_preserve)
+_STRATEGY_CODES = {"header_only": HEADER_ONLY, "full_preserve": FULL_PRESERVE, "full_message": FULL_PRESERVE}
+_DIRECTION_CODES = {name: code for code, name in enumerate(DIRECTIONS)}
+
+COLUMNAR_FORMAT_VERSION = 1
+_MAGIC = b"PMKC"
+_HEADER = struct.Struct("<4sHQI")  # magic, format version, row count, JSON table length
+_COLUMNS = (
+    ("flow_column", "I"),
+    ("direction_column", "B"),
+    ("strategy_column", "B"),
+    ("seq_start", "Q"),
+    ("seq_end", "Q"),
+)
+
+GroupKey = Tuple[int, int, int]
+
+
+def _rebuild_range_view(starts: bytes, ends: bytes) -> "RangeView":
+    return RangeView.from_arrays(_array_from_bytes("Q", starts, native=True), _array_from_bytes("Q", ends, native=True))
+
+
+def _array_from_bytes(typecode: str, data, native: bool = False) -> array:
+    column = array(typecode)
+    column.frombytes(data)
+    if not native and sys.byteorder != "little":
+        column.byteswap()
+    return column
+
+
+class RangeView:
+    """Read-only sequence of ``(start, end)`` ranges over two sequence-number columns
+
+    ``starts``/``ends`` are memoryviews (or arrays); indexing them yields ints
+    without materializing tuples, which is what the rule cursor uses.
+    """
+
+    __slots__ = ("starts", "ends")
+
+    def __init__(self, starts: Sequence[int], ends: Sequence[int]):
+        self.starts = starts
+        self.ends = ends
+
+    @classmethod
+    def from_arrays(cls, starts: array, ends: array) -> "RangeView":
+        return cls(memoryview(starts), memoryview(ends))
+
+    @classmethod
+    def from_pairs(cls, pairs: Iterable[Tuple[int, int]]) -> "RangeView":
+        starts, ends = array("Q"), array("Q")
+        for start, end in pairs:
+            starts.append(start)
+            ends.append(end)
+        return cls.from_arrays(starts, ends)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RangeView(self.starts[index], self.ends[index])
+        return (self.starts[index], self.ends[index])
+
+    def __iter__(self) -> Iterator[Tuple[int, int]]:
+        return zip(self.starts, self.ends)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (RangeView, list, tuple)):
+            return len(self) == len(other) and all(a == tuple(b) for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # memoryviews cannot be pickled (rule data is sent to shard workers): copy the slice
+        return _rebuild_range_view, (bytes(self.starts), bytes(self.ends))
+
+    def __repr__(self) -> str:
+        preview = list(zip(self.starts[:3], self.ends[:3]))
+        return f"RangeView({preview}{'...' if len(self) > 3 else ''}, len={len(self)})"
+
+
+class ColumnarKeepRules:
+    """Keep rules as interned flows plus parallel, per-group sorted columns"""
+
+    def __init__(self) -> None:
+        # (stream_id, tuple_key); tuple_key is "" when the rule had none
+        self.flows: List[Tuple[str, str]] = []
+        self.flow_column = array("I")
+        self.direction_column = array("B")
+        self.strategy_column = array("B")
+        self.seq_start = array("Q")
+        self.seq_end = array("Q")
+        # (flow, direction, strategy) -> [lo, hi) row slice
+        self.groups: Dict[GroupKey, Tuple[int, int]] = {}
+        # Rules with a preserve_strategy other than header_only/full_preserve/full_message
+        self.unknown_strategies = 0
+
+    @classmethod
+    def from_rules(cls, rules: Iterable[KeepRule]) -> "ColumnarKeepRules":
+        """Build from KeepRule objects; unknown preserve strategies count as full_preserve"""
+        flow_index: Dict[Tuple[str, str], int] = {}
+        pending: Dict[GroupKey, Tuple[array, array]] = {}
+        unknown = 0
+        for rule in rules:
+            metadata = rule.metadata or {}
+            strategy = _STRATEGY_CODES.get(metadata.get("preserve_strategy", "full_preserve"))
+            if strategy is None:
+                unknown += 1
+                strategy = FULL_PRESERVE
+            flow_key = (rule.stream_id, metadata.get("tuple_key") or "")
+            flow = flow_index.get(flow_key)
+            if flow is None:
+                flow = flow_index[flow_key] = len(flow_index)
+            group_key = (flow, _DIRECTION_CODES[rule.direction], strategy)
+            group = pending.get(group_key)
+            if group is None:
+                group = pending[group_key] = (array("Q"), array("Q"))
+            group[0].append(rule.seq_start)
+            group[1].append(rule.seq_end)
+
+        columns = cls()
+        columns.flows = list(flow_index)
+        columns.unknown_strategies = unknown
+        for group_key in sorted(pending):
+            starts, ends = pending.pop(group_key)
+            if not _pairs_sorted(starts, ends):
+                pairs = sorted(zip(starts, ends))
+                starts = array("Q", (start for start, _ in pairs))
+                ends = array("Q", (end for _, end in pairs))
+            columns._append_group(group_key, starts, ends)
+        return columns
+
+    def _append_group(self, group_key: GroupKey, starts: array, ends: array) -> None:
+        flow, direction, strategy = group_key
+        count = len(starts)
+        lo = len(self.seq_start)
+        self.flow_column.extend(array("I", [flow]) * count)
+        self.direction_column.extend(array("B", [direction]) * count)
+        self.strategy_column.extend(array("B", [strategy]) * count)
+        self.seq_start.extend(starts)
+        self.seq_end.extend(ends)
+        self.groups[group_key] = (lo, lo + count)
+
+    def __len__(self) -> int:
+        return len(self.seq_start)
+
+    def ranges(self, flow: int, direction: int, strategy: int) -> Optional[RangeView]:
+        """Zero-copy view of one group's sorted ranges (None if the group is empty)"""
+        bounds = self.groups.get((flow, direction, strategy))
+        if bounds is None:
+            return None
+        lo, hi = bounds
+        return RangeView(memoryview(self.seq_start)[lo:hi], memoryview(self.seq_end)[lo:hi])
+
+    def rows(self) -> Iterator[Tuple[str, str, int, int, str, str]]:
+        """``(stream_id, direction, seq_start, seq_end, strategy, tuple_key)`` of every rule, in row order"""
+        flows = self.flows
+        for flow, direction, strategy, start, end in zip(
+            self.flow_column, self.direction_column, self.strategy_column, self.seq_start, self.seq_end
+        ):
+            stream_id, tuple_key = flows[flow]
+            yield stream_id, DIRECTIONS[direction], start, end, STRATEGIES[strategy], tuple_key
+
+    def nbytes(self) -> int:
+        """Memory used by the columns"""
+        return sum(len(getattr(self, name)) * getattr(self, name).itemsize for name, _ in _COLUMNS)
+
+    # --- Save / load ---
+
+    def to_bytes(self) -> bytes:
+        flow_table = json.dumps(
+            {
+                "flows": self.flows,
+                "groups": [[*group_key, lo, hi] for group_key, (lo, hi) in self.groups.items()],
+                "unknown_strategies": self.unknown_strategies,
+            },
+            separators=(",", ":"),
+        ).encode("utf-8")
+        parts = [_HEADER.pack(_MAGIC, COLUMNAR_FORMAT_VERSION, len(self), len(flow_table)), flow_table]
+        for name, _ in _COLUMNS:
+            column = getattr(self, name)
+            if sys.byteorder != "little" and column.itemsize > 1:
+                column = array(column.typecode, column)
+                column.byteswap()
+            parts.append(column.tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ColumnarKeepRules":
+        """Inverse of :meth:`to_bytes`; raises ValueError for foreign or corrupt data"""
+        view = memoryview(data)
+        if len(view) < _HEADER.size:
+            raise ValueError("Truncated columnar keep rules")
+        magic, version, rows, table_length = _HEADER.unpack_from(view)
+        if magic != _MAGIC or version != COLUMNAR_FORMAT_VERSION:
+            raise ValueError("Not columnar keep rules of this version")
+        offset = _HEADER.size + table_length
+        row_size = sum(array(typecode).itemsize for _, typecode in _COLUMNS)
+        if len(view) != offset + rows * row_size:
+            raise ValueError("Corrupt columnar keep rules: size mismatch")
+
+        table = json.loads(bytes(view[_HEADER.size : offset]).decode("utf-8"))
+        columns = cls()
+        columns.flows = [tuple(flow) for flow in table["flows"]]
+        columns.unknown_strategies = table.get("unknown_strategies", 0)
+        for name, typecode in _COLUMNS:
+            size = rows * array(typecode).itemsize
+            setattr(columns, name, _array_from_bytes(typecode, view[offset : offset + size]))
+            offset += size
+        for flow, direction, strategy, lo, hi in table["groups"]:
+            if not (0 <= lo <= hi <= rows and 0 <= flow < len(columns.flows)):
+                raise ValueError("Corrupt columnar keep rules: bad group table")
+            columns.groups[(flow, direction, strategy)] = (lo, hi)
+        return columns
+
+    def save(self, path: str) -> None:
+        with open(path, "wb") as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "ColumnarKeepRules":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+
+def _pairs_sorted(starts: Sequence[int], ends: Sequence[int]) -> bool:
+    previous = (0, 0)
+    for pair in zip(starts, ends):
+        if pair < previous:
+            return False
+        previous = pair
+    return True
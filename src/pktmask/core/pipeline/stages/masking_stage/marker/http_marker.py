@@ -31,6 +31,7 @@ except Exception:  # pragma: no cover - scapy may be unavailable in some envs
     IP = IPv6 = TCP = PcapReader = None
     SCAPY_AVAILABLE = False
 
+from ......infrastructure.logging import HotPathTracer
 from .types import KeepRule, KeepRuleSet
 
 # Common HTTP method tokens and response prefix for quick heuristics
@@ -68,6 +69,7 @@ class HTTPProtocolMarker:
     def __init__(self, config: Dict[str, Any]):
         self.config = config or {}
         self.logger = logging.getLogger(f"{self.__class__.__module__}.{self.__class__.__name__}")
+        self._trace = HotPathTracer(self.logger, self.config.get("trace_sample_rate"))
 
         # Flow bookkeeping (must mirror Masker to align stream_id + direction)
         self.flow_id_counter = 0
@@ -89,6 +91,10 @@ class HTTPProtocolMarker:
         self.tuple_to_stream_id.clear()
         self.flow_directions.clear()
 
+    def cache_fingerprint(self) -> Dict[str, Any]:
+        """Rule cache identity: header recognition only depends on the port heuristic"""
+        return {"marker": self.__class__.__name__, "ports": list(self.http_ports)}
+
     # --- Public API ---
     def analyze_file(self, pcap_path: str, config: Dict[str, Any]) -> KeepRuleSet:
         ruleset = KeepRuleSet()
@@ -217,7 +223,8 @@ class HTTPProtocolMarker:
                         ruleset.tcp_flows.setdefault(stream_id, {"directions": {"forward": {}, "reverse": {}}})
 
                     except Exception as e:  # per-packet resilience
-                        self.logger.debug(f"HTTP marker packet error: {e}")
+                        if self._trace.enabled and self._trace.sample():
+                            self._trace.log(f"HTTP marker packet error: {e}")
                         continue
 
             ruleset.metadata.update(
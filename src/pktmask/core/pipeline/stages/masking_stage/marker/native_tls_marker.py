@@ -0,0 +1,621 @@
+"""
+Native TLS Protocol Marker
+
+tshark-free alternative to TLSProtocolMarker. The capture is read once; the
+TCP byte stream of every IPv4 flow direction is reassembled in Python and TLS
+record headers (content type, version, length) are parsed directly from it.
+Keep rules have the same shape and ``header_only``/``full_message``
+semantics as the tshark marker's reassembled-payload rules.
+
+Reassembly keeps bounded state per flow direction:
+
+- in-order data is parsed as it arrives and never buffered (record bodies
+  are skipped by length, only a partial record header of < 5 bytes is kept)
+- out-of-order segments wait in a buffer of at most ``max_reassembly_buffer``
+  bytes; when it overflows (lost segment) the gap is skipped
+- retransmitted bytes are dropped
+
+Record boundaries are only trusted when the stream is followed from its SYN or
+a record header is confirmed by the next header right after the record. After
+a gap or in mid-stream captures the parser searches for a plausible header
+(type 20-24, version 3.0-3.4, sane length) and keeps a candidate only once the
+following header confirms it, so arbitrary TCP payload is not mistaken for TLS.
+tshark's heuristics and ``decode_as`` are not needed: every TCP port is scanned.
+"""
+
+from __future__ import annotations
+
+import heapq
+import re
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    from scapy.all import IP, TCP, Padding, PcapReader
+
+    SCAPY_AVAILABLE = True
+except ImportError:
+    IP = TCP = Padding = PcapReader = None
+    SCAPY_AVAILABLE = False
+
+from .....rawpacket.frame import NEEDS_DISSECTION, TCP_SEGMENT, FrameClassifier, pack_flow_key
+from .....rawpacket.pcap_io import RawCaptureReader, detect_capture_format, dissect_record
+from .base import ProtocolMarker
+from .tls_marker import TLS_CONTENT_TYPES, resolve_preserve_config
+from .types import FlowInfo, KeepRule, KeepRuleSet
+
+TLS_RECORD_HEADER_SIZE = 5
+# Largest TLSCiphertext fragment (2^14 plaintext + 2048 expansion)
+MAX_TLS_RECORD_LENGTH = 2**14 + 2048
+# Out-of-order bytes buffered per flow direction before a gap is skipped
+DEFAULT_MAX_REASSEMBLY_BUFFER = 1 << 20
+
+_SEQ_MASK = 0xFFFFFFFF
+_SEQ_HALF = 1 << 31
+_TCP_SYN = 0x02
+# Record header candidate: content type, major version 3, minor version 0-4
+_HEADER_CANDIDATE = re.compile(rb"[\x14-\x18]\x03[\x00-\x04]")
+
+# Record in progress: [content_type, version, length, header_seq, end_seq, received, confirmed, at_start]
+_TYPE, _VERSION, _LENGTH, _HEADER_SEQ, _END_SEQ, _RECEIVED, _CONFIRMED, _AT_START = range(8)
+
+
+def _plausible_header(data, pos: int) -> bool:
+    return (
+        data[pos] in TLS_CONTENT_TYPES
+        and data[pos + 1] == 3
+        and data[pos + 2] <= 4
+        and (data[pos + 3] << 8 | data[pos + 4]) <= MAX_TLS_RECORD_LENGTH
+    )
+
+
+class _FlowDirection:
+    """Reassembly and TLS record parsing state of one TCP flow direction
+
+    Finished records are appended to ``sink`` as
+    ``(direction, content_type, version, length, header_seq, end_seq, received, complete)``.
+    """
+
+    __slots__ = (
+        "stream_id",
+        "direction",
+        "tuple_key",
+        "flow",
+        "sink",
+        "max_buffer",
+        "syn_seq",
+        "next_seq",
+        "offset",
+        "pending",
+        "pending_bytes",
+        "synced",
+        "carry",
+        "carry_seq",
+        "record",
+        "remaining",
+        "held",
+        "consumed",
+        "stats",
+    )
+
+    def __init__(self, stream_id: str, direction: str, tuple_key: str, flow: list, sink: list, max_buffer: int, stats):
+        self.stream_id = stream_id
+        self.direction = direction
+        self.tuple_key = tuple_key
+        # Shared with the opposite direction: [packet_count, canonical endpoints]
+        self.flow = flow
+        self.sink = sink
+        self.max_buffer = max_buffer
+        self.stats = stats
+        self._reset()
+
+    def _reset(self) -> None:
+        self.syn_seq: Optional[int] = None
+        self.next_seq: Optional[int] = None  # 32-bit sequence number of the next in-order byte
+        self.offset = 0  # Stream offset of next_seq (unwrapped)
+        self.pending: List[Tuple[int, int, bytes]] = []  # heap of (stream offset, seq, data)
+        self.pending_bytes = 0
+        self.synced = False  # The next in-order byte is known to start a record
+        self.carry = b""  # Unparsed tail (< 5 bytes): partial header or search window
+        self.carry_seq = 0
+        self.record: Optional[list] = None
+        self.remaining = 0  # Body bytes of ``record`` still expected
+        self.held: Optional[list] = None  # Complete unconfirmed record waiting for the next header
+        self.consumed = 0
+
+    # --- TCP reassembly ---
+
+    def feed(self, seq: int, payload: bytes, syn: bool) -> None:
+        if syn:
+            if self.syn_seq == seq:
+                return
+            if self.syn_seq is not None or self.next_seq is not None:
+                # Port reuse: a new connection on the same 4-tuple
+                self.finish()
+                self._reset()
+            self.syn_seq = seq
+            self.next_seq = (seq + 1) & _SEQ_MASK
+            self.synced = True
+            seq += 1
+        if not payload:
+            return
+
+        if self.next_seq is None:
+            self.next_seq = seq & _SEQ_MASK
+        delta = ((seq - self.next_seq + _SEQ_HALF) & _SEQ_MASK) - _SEQ_HALF
+        if delta > 0:
+            self.stats["out_of_order_segments"] += 1
+            heapq.heappush(self.pending, (self.offset + delta, seq, payload))
+            self.pending_bytes += len(payload)
+            while self.pending_bytes > self.max_buffer:
+                self._skip_gap()
+            return
+        if delta < 0:
+            if -delta >= len(payload):
+                self.stats["retransmitted_bytes"] += len(payload)
+                return
+            self.stats["retransmitted_bytes"] -= delta
+            payload = payload[-delta:]
+            seq -= delta
+        self._deliver(seq, payload)
+        if self.pending:
+            self._drain()
+
+    def _deliver(self, seq: int, payload: bytes) -> None:
+        self._consume(seq, payload)
+        self.next_seq = (seq + len(payload)) & _SEQ_MASK
+        self.offset += len(payload)
+
+    def _drain(self) -> None:
+        pending = self.pending
+        while pending and pending[0][0] <= self.offset:
+            offset, seq, payload = heapq.heappop(pending)
+            self.pending_bytes -= len(payload)
+            overlap = self.offset - offset
+            if overlap >= len(payload):
+                self.stats["retransmitted_bytes"] += len(payload)
+                continue
+            self.stats["retransmitted_bytes"] += overlap
+            self._deliver(seq + overlap, payload[overlap:])
+
+    def _skip_gap(self) -> None:
+        """Give up on the missing bytes before the earliest buffered segment"""
+        offset, seq, _ = self.pending[0]
+        self._gap(offset - self.offset)
+        self.next_seq = seq & _SEQ_MASK
+        self.offset = offset
+        self._drain()
+
+    def finish(self) -> None:
+        """End of capture: flush buffered segments and the record in progress"""
+        while self.pending:
+            self._skip_gap()
+        record = self.record
+        if record is not None:
+            if record[_CONFIRMED]:
+                self._emit(record, False)
+        elif self.held is not None and self.held[_AT_START]:
+            # Single record at the very start of a direction, nothing after it
+            self._emit(self.held, True)
+        self.record = self.held = None
+        self.remaining = 0
+        self.carry = b""
+
+    # --- TLS record parsing ---
+
+    def _gap(self, size: int) -> None:
+        self.stats["reassembly_gaps"] += 1
+        self.carry = b""
+        if self.remaining:
+            if size < self.remaining:
+                # The record header was seen, its declared end is still known
+                self.remaining -= size
+                return
+            size -= self.remaining
+            self.remaining = 0
+            self._record_done()
+            if size == 0:
+                return
+        # The next record boundary is lost
+        self.held = None
+        self.synced = False
+
+    def _consume(self, seq: int, data: bytes) -> None:
+        carry = self.carry
+        if carry:
+            buf = carry + data
+            carry_len = len(carry)
+            carry_seq = self.carry_seq
+            self.carry = b""
+        else:
+            buf = data
+            carry_len = 0
+            carry_seq = 0
+        # Sequence number of buf[p]: the carried bytes keep the numbers of their own segment
+        data_seq = seq - carry_len
+
+        size = len(buf)
+        pos = 0
+        while pos < size:
+            remaining = self.remaining
+            if remaining:
+                take = size - pos if size - pos < remaining else remaining
+                pos += take
+                record = self.record
+                record[_RECEIVED] += take
+                record[_END_SEQ] = (data_seq if pos > carry_len else carry_seq) + pos
+                self.remaining = remaining - take
+                if not self.remaining:
+                    self._record_done()
+                continue
+
+            if size - pos < TLS_RECORD_HEADER_SIZE:
+                break
+
+            if self.synced or self.held is not None:
+                # Record boundary: the header must be here
+                if not _plausible_header(buf, pos):
+                    self.stats["resync_events"] += 1
+                    self.held = None
+                    self.synced = False
+                    pos += 1
+                    continue
+                if self.held is not None:
+                    self._emit(self.held, True)
+                    self.held = None
+                    self.synced = True
+                confirmed = True
+            else:
+                match = _HEADER_CANDIDATE.search(buf, pos)
+                if match is None or match.start() > size - TLS_RECORD_HEADER_SIZE:
+                    skip_to = max(pos, size - TLS_RECORD_HEADER_SIZE + 1)
+                    if match is not None:
+                        skip_to = min(skip_to, match.start())
+                    self.stats["skipped_bytes"] += skip_to - pos
+                    pos = skip_to
+                    break
+                self.stats["skipped_bytes"] += match.start() - pos
+                pos = match.start()
+                if not _plausible_header(buf, pos):
+                    self.stats["skipped_bytes"] += 1
+                    pos += 1
+                    continue
+                confirmed = False
+
+            header_seq = (data_seq if pos >= carry_len else carry_seq) + pos
+            length = buf[pos + 3] << 8 | buf[pos + 4]
+            self.record = [
+                buf[pos],
+                (buf[pos + 1], buf[pos + 2]),
+                length,
+                header_seq,
+                header_seq + TLS_RECORD_HEADER_SIZE,
+                0,
+                confirmed,
+                self.consumed == 0 and pos == 0,
+            ]
+            pos += TLS_RECORD_HEADER_SIZE
+            self.remaining = length
+            if not length:
+                self._record_done()
+
+        if pos < size:
+            self.carry = bytes(buf[pos:])
+            self.carry_seq = (data_seq if pos >= carry_len else carry_seq) + pos
+        self.consumed += len(data)
+
+    def _record_done(self) -> None:
+        record = self.record
+        self.record = None
+        if record[_CONFIRMED]:
+            self._emit(record, True)
+            self.synced = True
+        else:
+            self.held = record
+
+    def _emit(self, record: list, complete: bool) -> None:
+        self.sink.append(
+            (
+                self,
+                record[_TYPE],
+                record[_VERSION],
+                record[_LENGTH],
+                record[_HEADER_SEQ],
+                record[_END_SEQ],
+                record[_RECEIVED],
+                complete,
+            )
+        )
+
+
+class NativeTLSProtocolMarker(ProtocolMarker):
+    """不依赖tshark的TLS协议标记器
+
+    单次读取抓包文件，在Python中按流方向重组TCP字节流并直接解析TLS记录头，
+    生成与 TLSProtocolMarker 相同语义的保留规则。
+    """
+
+    def __init__(self, config: Dict[str, Any]):
+        """初始化原生TLS协议标记器
+
+        Args:
+            config: TLS特定配置（preserve/tls 保留策略，max_reassembly_buffer）
+        """
+        super().__init__(config)
+        self.preserve_config = resolve_preserve_config(config)
+        self.max_reassembly_buffer = int(config.get("max_reassembly_buffer", DEFAULT_MAX_REASSEMBLY_BUFFER))
+
+        # 与Masker一致的本地stream_id分配
+        self.flow_id_counter: int = 0
+        self.tuple_to_stream_id: Dict[str, str] = {}
+        # stream_id -> [packet_count, canonical forward (src_ip, src_port, dst_ip, dst_port)]
+        self._flows: Dict[str, list] = {}
+
+    def _initialize_components(self) -> None:
+        """验证scapy可用（帧分类依赖scapy的层绑定）"""
+        if not SCAPY_AVAILABLE:
+            raise RuntimeError("Scapy unavailable, native TLS marker cannot classify frames")
+
+    def analyze_file(self, pcap_path: str, config: Dict[str, Any]) -> KeepRuleSet:
+        """单次扫描文件并生成TLS保留规则
+
+        Args:
+            pcap_path: PCAP/PCAPNG 文件路径
+            config: 分析配置
+
+        Returns:
+            KeepRuleSet: TLS保留规则集合
+        """
+        self.logger.info(f"Starting native TLS traffic analysis: {pcap_path}")
+        start_time = time.time()
+
+        try:
+            self._initialize_components()
+            ruleset = self._analyze(pcap_path)
+        except Exception as e:
+            self.logger.error(f"Native TLS traffic analysis failed: {e}")
+            ruleset = KeepRuleSet()
+            ruleset.metadata = {
+                "analyzer": "NativeTLSProtocolMarker",
+                "version": self.get_version(),
+                "pcap_path": pcap_path,
+                "error": str(e),
+                "analysis_failed": True,
+            }
+            return ruleset
+
+        analysis_time = time.time() - start_time
+        ruleset.metadata = {
+            "analyzer": "NativeTLSProtocolMarker",
+            "version": self.get_version(),
+            "pcap_path": pcap_path,
+            "preserve_config": self.preserve_config,
+            "analysis_time": analysis_time,
+            "tls_records_found": ruleset.statistics["tls_records"],
+            "tcp_flows_found": len(ruleset.tcp_flows),
+        }
+        self.logger.info(
+            f"Native TLS analysis completed, took {analysis_time:.2f} seconds, "
+            f"generated {len(ruleset.rules)} keep rules"
+        )
+        return ruleset
+
+    def _analyze(self, pcap_path: str) -> KeepRuleSet:
+        stats = {
+            "tcp_segments": 0,
+            "dissected_packets": 0,
+            "tls_records": 0,
+            "out_of_order_segments": 0,
+            "retransmitted_bytes": 0,
+            "reassembly_gaps": 0,
+            "resync_events": 0,
+            "skipped_bytes": 0,
+        }
+        # stream_id 按文件分配
+        self.flow_id_counter = 0
+        self.tuple_to_stream_id = {}
+        self._flows = {}
+        sink: list = []
+        directions: Dict[bytes, _FlowDirection] = {}
+
+        for flow_key, sport, dport, seq, payload, syn, addresses in self._iter_tcp_segments(pcap_path, stats):
+            state = directions.get(flow_key)
+            if state is None:
+                if addresses is None:
+                    addresses = (socket.inet_ntoa(flow_key[0:4]), socket.inet_ntoa(flow_key[4:8]))
+                state = directions[flow_key] = self._new_direction(*addresses, sport, dport, sink, stats)
+            state.flow[0] += 1
+            state.feed(seq, payload, syn)
+
+        for state in directions.values():
+            state.finish()
+
+        return self._build_ruleset(sink, stats)
+
+    def _iter_tcp_segments(self, pcap_path: str, stats: Dict[str, int]):
+        """Yield (flow_key, sport, dport, seq, payload, syn, addresses) of every IPv4 TCP segment
+
+        Frames are classified from the record bytes; tunnels and other exotic
+        encapsulations are dissected with scapy, pairing the first TCP and
+        IPv4 layers like the Masker does. ``addresses`` is None when the
+        (src, dst) strings have not been formatted yet.
+        """
+        if detect_capture_format(pcap_path) is None:
+            with PcapReader(pcap_path) as reader:
+                for packet in reader:
+                    stats["dissected_packets"] += 1
+                    segment = self._segment_from_packet(packet)
+                    if segment is not None:
+                        stats["tcp_segments"] += 1
+                        yield segment
+            return
+
+        classifier = FrameClassifier()
+        with RawCaptureReader(pcap_path) as reader:
+            for record in reader:
+                data = record.data
+                verdict, info = classifier.classify(record.linktype, data)
+                if verdict == TCP_SEGMENT:
+                    stats["tcp_segments"] += 1
+                    yield (
+                        info.flow_key,
+                        info.sport,
+                        info.dport,
+                        info.seq,
+                        data[info.payload_offset : info.segment_end],
+                        bool(data[info.tcp_offset + 13] & _TCP_SYN),
+                        None,
+                    )
+                elif verdict == NEEDS_DISSECTION:
+                    stats["dissected_packets"] += 1
+                    segment = self._segment_from_packet(dissect_record(record))
+                    if segment is not None:
+                        stats["tcp_segments"] += 1
+                        yield segment
+
+    @staticmethod
+    def _segment_from_packet(packet):
+        tcp = packet.getlayer(TCP)
+        if tcp is None:
+            return None
+        ip = packet.getlayer(IP)
+        if ip is None:
+            return None
+        payload = bytes(tcp.payload)
+        padding = tcp.getlayer(Padding)
+        if padding is not None:
+            # Link-layer padding is not part of the TCP stream
+            payload = payload[: len(payload) - len(padding)]
+        src, dst, sport, dport = str(ip.src), str(ip.dst), int(tcp.sport), int(tcp.dport)
+        flow_key = pack_flow_key(src, dst, sport, dport)
+        return flow_key, sport, dport, int(tcp.seq), payload, bool(int(tcp.flags) & _TCP_SYN), (src, dst)
+
+    def _new_direction(
+        self, src: str, dst: str, sport: int, dport: int, sink: list, stats: Dict[str, int]
+    ) -> _FlowDirection:
+        """Local stream_id, canonical direction and tuple_key of a new flow direction (same rules as the Masker)"""
+        if (src, sport) < (dst, dport):
+            tuple_key = f"{src}:{sport}-{dst}:{dport}"
+            forward = (src, sport, dst, dport)
+        else:
+            tuple_key = f"{dst}:{dport}-{src}:{sport}"
+            forward = (dst, dport, src, sport)
+        stream_id = self.tuple_to_stream_id.get(tuple_key)
+        if stream_id is None:
+            stream_id = self.tuple_to_stream_id[tuple_key] = str(self.flow_id_counter)
+            self.flow_id_counter += 1
+        flow = self._flows.setdefault(stream_id, [0, forward])
+        direction = "forward" if (src, sport, dst, dport) == forward else "reverse"
+        if self._trace.enabled and self._trace.sample():
+            self._trace.log(f"New flow direction: {tuple_key}, stream_id={stream_id}, direction={direction}")
+        return _FlowDirection(stream_id, direction, tuple_key, flow, sink, self.max_reassembly_buffer, stats)
+
+    def _build_ruleset(self, sink: list, stats: Dict[str, int]) -> KeepRuleSet:
+        ruleset = KeepRuleSet()
+        preserve_full_application_data = self.preserve_config.get("application_data", False)
+        tls_streams = set()
+
+        for state, content_type, version, length, header_seq, end_seq, received, complete in sink:
+            stats["tls_records"] += 1
+            tls_streams.add(state.stream_id)
+            header_seq_end = header_seq + TLS_RECORD_HEADER_SIZE
+            if complete:
+                payload_seq_end = header_seq_end + length
+                actual_length = length
+            else:
+                payload_seq_end = end_seq
+                actual_length = received
+                if not self._plausible_truncated_record(content_type, length, actual_length):
+                    continue
+
+            tls_type_name = TLS_CONTENT_TYPES[content_type]
+            if content_type == 23 and not preserve_full_application_data:
+                # TLS-23且配置为False：只保留5字节TLS记录头部
+                seq_end = header_seq_end
+                rule_type = "tls_applicationdata_header"
+                preserve_strategy = "header_only"
+            else:
+                seq_end = payload_seq_end
+                rule_type = f"tls_{tls_type_name.lower()}"
+                preserve_strategy = "full_message"
+
+            if not complete and not self._plausible_truncated_rule(
+                content_type, seq_end - header_seq, preserve_strategy, actual_length
+            ):
+                continue
+
+            ruleset.add_rule(
+                KeepRule(
+                    stream_id=state.stream_id,
+                    direction=state.direction,
+                    seq_start=header_seq,
+                    seq_end=seq_end,
+                    rule_type=rule_type,
+                    metadata={
+                        "tls_content_type": content_type,
+                        "tls_type_name": tls_type_name,
+                        "tls_header_seq_start": header_seq,
+                        "tls_header_seq_end": header_seq_end,
+                        "tls_payload_seq_start": header_seq_end,
+                        "tls_payload_seq_end": payload_seq_end,
+                        "is_complete": complete,
+                        "is_cross_segment": not complete,
+                        "preserve_strategy": preserve_strategy,
+                        "declared_length": length,
+                        "actual_length": actual_length,
+                        "tuple_key": state.tuple_key,
+                    },
+                )
+            )
+            if self._trace.enabled and self._trace.sample():
+                self._trace.log(
+                    f"Generated keep rule: flow {state.stream_id}-{state.direction} TLS-{content_type} "
+                    f"version {version} seq {header_seq}-{seq_end}"
+                )
+
+        for stream_id in sorted(tls_streams, key=int):
+            packet_count, (src_ip, src_port, dst_ip, dst_port) = self._flows[stream_id]
+            ruleset.tcp_flows[stream_id] = FlowInfo(
+                stream_id=stream_id,
+                src_ip=src_ip,
+                dst_ip=dst_ip,
+                src_port=src_port,
+                dst_port=dst_port,
+                protocol="tcp",
+                direction="forward",
+                packet_count=packet_count,
+            )
+
+        ruleset.statistics = stats
+        return ruleset
+
+    @staticmethod
+    def _plausible_truncated_record(content_type: int, declared_length: int, actual_length: int) -> bool:
+        """抓包结束时未完整的记录：与 TLSProtocolMarker 的跨段记录校验一致"""
+        if declared_length > 16384:
+            return False
+        if content_type in (20, 21) and declared_length > 10:
+            return False
+        return declared_length * 0.1 <= actual_length <= declared_length
+
+    @staticmethod
+    def _plausible_truncated_rule(content_type: int, rule_length: int, preserve_strategy: str, actual_length: int):
+        """未完整记录生成的规则：与 TLSProtocolMarker 的跨段规则校验一致"""
+        if rule_length > 2048:
+            return False
+        if (content_type == 20 and rule_length > 100) or (content_type == 21 and rule_length > 50):
+            return False
+        if preserve_strategy == "full_message":
+            return abs(rule_length - (TLS_RECORD_HEADER_SIZE + actual_length)) <= 10
+        return True
+
+    def get_supported_protocols(self) -> List[str]:
+        """获取支持的协议列表"""
+        return ["tls", "ssl"]
+
+    def cache_fingerprint(self) -> Optional[Dict[str, Any]]:
+        """规则缓存标识：保留策略与重组缓冲上限"""
+        fingerprint = super().cache_fingerprint()
+        fingerprint.update({"preserve": self.preserve_config, "max_reassembly_buffer": self.max_reassembly_buffer})
+        return fingerprint
@@ -0,0 +1,289 @@
+"""
+Keep rule cache
+
+Marking a capture (tshark passes, reassembly, rule generation) is the most
+expensive part of masking. The cache stores the KeepRuleSet of a capture on
+disk, keyed by
+
+- a digest of the file content (not its path or timestamps), and
+- the marker fingerprint: marker class, marker configuration (preserve
+  settings, decode-as rules, ...) and the versions of the tools it ran.
+
+The digest covers the file the masking stage actually marks. In a pipeline that
+is the output of deduplication/anonymization, so an entry is only reused when
+the masking input is byte-identical: re-running the same capture with the same
+upstream settings, or a masking-only run of the same file. Changing the
+anonymization or deduplication settings produces a different masking input and
+therefore a cache miss.
+
+The cache is opt-in (``rule_cache.enabled = True``) and lives in the user's
+configuration directory unless ``rule_cache.directory`` is set. Flow records
+(``tcp_flows``) are stored without their IP addresses, but keep rules still
+carry their ``tuple_key`` (endpoint addresses and ports of the marked capture),
+which the masker needs to match packets to rules, so enabling the cache
+persists those endpoints.
+
+Entries use a compact binary format (string table + packed rule records,
+zlib-compressed) and the directory is kept below ``max_bytes`` by evicting the
+least recently used entries (entry mtime is refreshed on every hit).
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import struct
+import zlib
+from dataclasses import asdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from ......common.constants import FileConstants, ProcessingConstants
+from .types import FlowInfo, KeepRule, KeepRuleSet
+
+RULE_CACHE_VERSION = 2
+CACHE_FILE_SUFFIX = ".rules"
+
+_MAGIC = b"PMKR"
+_FILE_HEADER = struct.Struct("<4sHI")  # magic, format version, uncompressed body length
+_HEADER_LENGTH = struct.Struct("<I")
+# stream_id string, direction, seq_start, seq_end, rule_type string, metadata string
+_RULE = struct.Struct("<IBQQII")
+_DIRECTIONS = ("forward", "reverse")
+_FLOW_INFO_TAG = "__flow_info__"
+# Flow record fields not written to the cache (the masker does not read them)
+_ADDRESS_FIELDS = frozenset({"src_ip", "dst_ip"})
+_READ_BLOCK = 1 << 20
+
+
+def file_content_digest(path: str) -> str:
+    """BLAKE2 digest of a file's bytes"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        while True:
+            block = f.read(_READ_BLOCK)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _without_addresses(value: Any) -> Any:
+    """Copy of a flow record with the IP address fields blanked (nested dicts included)"""
+    if isinstance(value, dict):
+        return {key: "" if key in _ADDRESS_FIELDS else _without_addresses(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_without_addresses(item) for item in value]
+    return value
+
+
+def encode_keep_rules(keep_rules: KeepRuleSet) -> bytes:
+    """Serialize a KeepRuleSet with the IP addresses of its flow records blanked
+
+    Raises TypeError/ValueError for non-JSON metadata or compacted rule sets.
+    """
+    if keep_rules.columns is not None:
+        raise ValueError("Compacted keep rules have no per-rule metadata to cache")
+    strings: List[str] = []
+    index: Dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(strings)
+            strings.append(value)
+        return position
+
+    records = bytearray()
+    for rule in keep_rules.rules:
+        metadata = json.dumps(rule.metadata, sort_keys=True, separators=(",", ":"))
+        records += _RULE.pack(
+            intern(rule.stream_id),
+            _DIRECTIONS.index(rule.direction),
+            rule.seq_start,
+            rule.seq_end,
+            intern(rule.rule_type),
+            intern(metadata),
+        )
+
+    tcp_flows = {
+        stream_id: _without_addresses({_FLOW_INFO_TAG: asdict(flow)} if isinstance(flow, FlowInfo) else flow)
+        for stream_id, flow in keep_rules.tcp_flows.items()
+    }
+    header = json.dumps(
+        {
+            "strings": strings,
+            "rule_count": len(keep_rules.rules),
+            "tcp_flows": tcp_flows,
+            "statistics": keep_rules.statistics,
+            "metadata": keep_rules.metadata,
+        },
+        separators=(",", ":"),
+    ).encode("utf-8")
+    body = _HEADER_LENGTH.pack(len(header)) + header + bytes(records)
+    return _FILE_HEADER.pack(_MAGIC, RULE_CACHE_VERSION, len(body)) + zlib.compress(body, 6)
+
+
+def decode_keep_rules(data: bytes) -> KeepRuleSet:
+    """Inverse of :func:`encode_keep_rules`; raises ValueError for foreign or corrupt data"""
+    if len(data) < _FILE_HEADER.size:
+        raise ValueError("Truncated keep rule cache entry")
+    magic, version, body_length = _FILE_HEADER.unpack_from(data)
+    if magic != _MAGIC or version != RULE_CACHE_VERSION:
+        raise ValueError("Not a keep rule cache entry of this version")
+    try:
+        body = zlib.decompress(data[_FILE_HEADER.size :])
+    except zlib.error as e:
+        raise ValueError(f"Corrupt keep rule cache entry: {e}") from e
+    if len(body) != body_length:
+        raise ValueError("Corrupt keep rule cache entry: length mismatch")
+
+    header_length = _HEADER_LENGTH.unpack_from(body)[0]
+    offset = _HEADER_LENGTH.size + header_length
+    header = json.loads(body[_HEADER_LENGTH.size : offset].decode("utf-8"))
+    strings = header["strings"]
+    if len(body) - offset != header["rule_count"] * _RULE.size:
+        raise ValueError("Corrupt keep rule cache entry: rule table size mismatch")
+
+    parsed_metadata: Dict[int, Dict[str, Any]] = {}
+    rules = []
+    for stream_index, direction, seq_start, seq_end, type_index, metadata_index in _RULE.iter_unpack(body[offset:]):
+        metadata = parsed_metadata.get(metadata_index)
+        if metadata is None:
+            metadata = parsed_metadata[metadata_index] = json.loads(strings[metadata_index])
+        rules.append(
+            KeepRule(
+                stream_id=strings[stream_index],
+                direction=_DIRECTIONS[direction],
+                seq_start=seq_start,
+                seq_end=seq_end,
+                rule_type=strings[type_index],
+                # Rules sharing metadata must not share the dict
+                metadata=dict(metadata),
+            )
+        )
+
+    tcp_flows = {
+        stream_id: FlowInfo(**flow[_FLOW_INFO_TAG]) if isinstance(flow, dict) and _FLOW_INFO_TAG in flow else flow
+        for stream_id, flow in header["tcp_flows"].items()
+    }
+    return KeepRuleSet(rules=rules, tcp_flows=tcp_flows, statistics=header["statistics"], metadata=header["metadata"])
+
+
+class KeepRuleCache:
+    """On-disk LRU cache of marker results"""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max(0, int(max_bytes))
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.logger = logging.getLogger(f"{self.__class__.__module__}.{self.__class__.__name__}")
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional["KeepRuleCache"]:
+        """Build from the ``rule_cache`` config section (``enabled``, ``directory``, ``max_bytes``)"""
+        if not config.get("enabled", False):
+            return None
+        directory = config.get("directory") or Path.home() / FileConstants.CONFIG_DIR_NAME / "rule_cache"
+        return cls(str(directory), config.get("max_bytes", ProcessingConstants.RULE_CACHE_MAX_BYTES))
+
+    def key_for(self, pcap_path: str, marker_fingerprint: Dict[str, Any]) -> str:
+        """Cache key of marking ``pcap_path`` with the marker described by ``marker_fingerprint``"""
+        from ...... import __version__
+
+        identity = json.dumps(
+            {"cache_version": RULE_CACHE_VERSION, "pktmask": __version__, "marker": marker_fingerprint},
+            sort_keys=True,
+            default=str,
+        )
+        digest = hashlib.blake2b(digest_size=20)
+        digest.update(file_content_digest(pcap_path).encode("ascii"))
+        digest.update(identity.encode("utf-8"))
+        return digest.hexdigest()
+
+    def _entry_path(self, key: str) -> Path:
+        return self.directory / f"{key}{CACHE_FILE_SUFFIX}"
+
+    def get(self, key: str) -> Optional[KeepRuleSet]:
+        path = self._entry_path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        try:
+            keep_rules = decode_keep_rules(data)
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.warning(f"Discarding unreadable keep rule cache entry {path}: {e}")
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        try:
+            # Mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return keep_rules
+
+    def put(self, key: str, keep_rules: KeepRuleSet) -> bool:
+        """Store ``keep_rules``; False if the rule set cannot be serialized or exceeds the cap"""
+        try:
+            data = encode_keep_rules(keep_rules)
+        except (TypeError, ValueError) as e:
+            self.logger.debug(f"Keep rules not cacheable: {e}")
+            return False
+        if len(data) > self.max_bytes:
+            return False
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._entry_path(key)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+        self.stores += 1
+        self._evict(keep=path)
+        return True
+
+    def _evict(self, keep: Path) -> None:
+        entries = []
+        total = 0
+        for path in self.directory.glob(f"*{CACHE_FILE_SUFFIX}"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            entries.append((stat.st_mtime_ns, stat.st_size, path))
+            total += stat.st_size
+
+        # Least recently used first
+        entries.sort(key=lambda entry: entry[0])
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            if self._remove(path):
+                total -= size
+                self.evictions += 1
+
+    def _remove(self, path: Path) -> bool:
+        try:
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+        except OSError as e:
+            self.logger.warning(f"Failed to remove keep rule cache entry {path}: {e}")
+            return False
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions}
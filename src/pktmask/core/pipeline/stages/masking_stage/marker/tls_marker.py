@@ -13,10 +13,14 @@ import re
 import shutil
 import subprocess
 import time
+from bisect import bisect_right
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from .base import ProtocolMarker
+from .tshark_fields import TsharkFieldDecoder, TsharkFieldRecord, TsharkFieldsError
+from .tshark_stream import PacketSpool, tshark_fields_stream, tshark_json_stream
 from .types import FlowInfo, KeepRule, KeepRuleSet
 
 # TLS协议类型映射（复用自tls_flow_analyzer）
@@ -40,6 +44,144 @@ TLS_PROCESSING_STRATEGIES = {
 # 最小tshark版本要求
 MIN_TSHARK_VERSION: Tuple[int, int, int] = (4, 2, 0)
 
+# 批量流分析时每次tshark扫描覆盖的最大流数量（限制 -Y 过滤表达式长度）
+DEFAULT_FLOW_ANALYSIS_BATCH_SIZE = 2000
+
+# 两阶段TLS扫描共用的字段
+_TLS_SCAN_COMMON_FIELDS = (
+    "frame.number",
+    "frame.protocols",
+    "frame.time_relative",
+    "ip.src",
+    "ip.dst",
+    "ipv6.src",
+    "ipv6.dst",
+    "tcp.srcport",
+    "tcp.dstport",
+    "tcp.stream",
+    "tcp.seq",
+    "tcp.seq_raw",  # 绝对序列号
+    "tcp.len",
+    "tcp.payload",
+)
+
+# 第一阶段（启用重组）：TLS记录头字段
+TLS_RECORD_SCAN_FIELDS = _TLS_SCAN_COMMON_FIELDS + (
+    "tls.record.content_type",
+    "tls.record.opaque_type",
+    "tls.record.length",
+    "tls.record.version",
+    "tls.app_data",
+)
+
+# 第二阶段（禁用重组）：TLS段数据字段
+TLS_SEGMENT_SCAN_FIELDS = _TLS_SCAN_COMMON_FIELDS + ("tls.segment.data",)
+
+# TCP流分析字段
+TCP_FLOW_FIELDS = (
+    "frame.number",
+    "frame.time_relative",
+    "ip.src",
+    "ip.dst",
+    "ipv6.src",
+    "ipv6.dst",
+    "tcp.srcport",
+    "tcp.dstport",
+    "tcp.stream",
+    "tcp.seq",
+    "tcp.seq_raw",
+    "tcp.len",
+    "tcp.flags",
+    "tcp.payload",
+)
+
+# 合并后的TLS数据包在流分析与回退规则生成阶段实际读取的字段（流式扫描结果只暂存这些列）
+TLS_PACKET_SPOOL_FIELDS = (
+    "frame.number",
+    "ip.src",
+    "ip.dst",
+    "ipv6.src",
+    "ipv6.dst",
+    "tcp.srcport",
+    "tcp.dstport",
+    "tcp.stream",
+    "tcp.seq_raw",
+    "tcp.len",
+    "tcp.payload",
+    "tls.record.content_type",
+    "tls.segment.data",
+)
+
+# 所有扫描字段：各扫描的记录类型都提供这些属性（未提取的字段为空元组），
+# 合并后的两阶段扫描结果与流分析结果可以由同一段代码读取
+_TLS_PACKET_FIELDS = tuple(dict.fromkeys(TLS_RECORD_SCAN_FIELDS + TLS_SEGMENT_SCAN_FIELDS + TCP_FLOW_FIELDS))
+
+
+def resolve_preserve_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    """TLS保留策略配置 - 支持多种配置格式"""
+    if "preserve" in config:
+        # GUI格式：直接使用preserve配置
+        return config["preserve"]
+    if "tls" in config:
+        # 脚本格式：转换tls配置到内部格式
+        tls_config = config["tls"]
+        return {
+            "handshake": tls_config.get("preserve_handshake", True),
+            "application_data": tls_config.get("preserve_application_data", False),
+            "alert": tls_config.get("preserve_alert", True),
+            "change_cipher_spec": tls_config.get("preserve_change_cipher_spec", True),
+            "heartbeat": tls_config.get("preserve_heartbeat", True),
+        }
+    # 默认配置
+    return {
+        "handshake": True,
+        "application_data": False,
+        "alert": True,
+        "change_cipher_spec": True,
+        "heartbeat": True,
+    }
+
+
+class SegmentSeqIndex:
+    """重组载荷偏移 -> TCP原始序列号索引
+
+    按重组顺序记录每个载荷段的起始偏移（有序数组）与原始序列号，
+    偏移查找为二分查找，单条TLS记录的定位开销为 O(log 段数)。
+    """
+
+    __slots__ = ("offsets", "seqs", "lengths")
+
+    def __init__(self) -> None:
+        self.offsets: List[int] = []
+        self.seqs: List[int] = []
+        self.lengths: List[int] = []
+
+    def append(self, offset: int, tcp_seq_raw: int, length: int) -> None:
+        """追加一个载荷段（offset 必须递增）"""
+        self.offsets.append(offset)
+        self.seqs.append(tcp_seq_raw)
+        self.lengths.append(length)
+
+    def seq_at(self, offset: int) -> int:
+        """重组载荷中 offset 处字节的原始序列号；不在任何段内时返回0"""
+        index = bisect_right(self.offsets, offset) - 1
+        if index < 0:
+            return 0
+        relative_offset = offset - self.offsets[index]
+        if relative_offset >= self.lengths[index]:
+            return 0
+        return self.seqs[index] + relative_offset
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, SegmentSeqIndex):
+            return NotImplemented
+        return (self.offsets, self.seqs, self.lengths) == (other.offsets, other.seqs, other.lengths)
+
+    __hash__ = None
+
 
 class TLSProtocolMarker(ProtocolMarker):
     """TLS协议标记器
@@ -56,33 +198,24 @@ class TLSProtocolMarker(ProtocolMarker):
         super().__init__(config)
 
         # TLS保留策略配置 - 支持多种配置格式
-        if "preserve" in config:
-            # GUI格式：直接使用preserve配置
-            self.preserve_config = config["preserve"]
-        elif "tls" in config:
-            # 脚本格式：转换tls配置到内部格式
-            tls_config = config["tls"]
-            self.preserve_config = {
-                "handshake": tls_config.get("preserve_handshake", True),
-                "application_data": tls_config.get("preserve_application_data", False),
-                "alert": tls_config.get("preserve_alert", True),
-                "change_cipher_spec": tls_config.get("preserve_change_cipher_spec", True),
-                "heartbeat": tls_config.get("preserve_heartbeat", True),
-            }
-        else:
-            # 默认配置
-            self.preserve_config = {
-                "handshake": True,
-                "application_data": False,
-                "alert": True,
-                "change_cipher_spec": True,
-                "heartbeat": True,
-            }
+        self.preserve_config = resolve_preserve_config(config)
 
         # tshark配置
         self.tshark_path = config.get("tshark_path")
+        self.tshark_version: Optional[str] = None
         self.decode_as = config.get("decode_as", [])
 
+        # TCP流分析模式：batched（批量单次扫描）或 per_stream（逐流扫描，旧行为）
+        self.flow_analysis_mode = config.get("flow_analysis_mode", "batched")
+        self.flow_analysis_batch_size = config.get("flow_analysis_batch_size", DEFAULT_FLOW_ANALYSIS_BATCH_SIZE)
+
+        # TLS消息扫描模式：streaming（管道增量解析）或 buffered（完整读取stdout后解析，旧行为）
+        self.tls_scan_mode = config.get("tls_scan_mode", "streaming")
+
+        # tshark输出格式：fields（制表符分隔字段，逐行解码为记录）或 json（-T json，旧行为）
+        self.tshark_output = config.get("tshark_output", "fields")
+        self._field_decoders: Dict[Tuple[str, ...], TsharkFieldDecoder] = {}
+
         # 注释：移除序列号状态管理，直接使用绝对序列号
         # self.seq_state = {}
 
@@ -131,13 +264,15 @@ class TLSProtocolMarker(ProtocolMarker):
 
         try:
             # 第一阶段：扫描TLS消息（复用tls_flow_analyzer逻辑）
-            tls_packets = self._scan_tls_messages(pcap_path)
+            with self._spool_tls_packets(self._scan_tls_messages(pcap_path)) as tls_packets:
+                tls_packets_found = len(tls_packets)
+                self.logger.debug(f"Found {tls_packets_found} packets containing TLS messages")
 
-            # 第二阶段：分析TCP流（复用tls_flow_analyzer逻辑）
-            tcp_flows = self._analyze_tcp_flows(pcap_path, tls_packets)
+                # 第二阶段：分析TCP流（复用tls_flow_analyzer逻辑）
+                tcp_flows = self._analyze_tcp_flows(pcap_path, tls_packets)
 
-            # 第三阶段：生成保留规则
-            ruleset = self._generate_keep_rules(tls_packets, tcp_flows)
+                # 第三阶段：生成保留规则
+                ruleset = self._generate_keep_rules(tls_packets, tcp_flows)
 
             # 设置元数据
             analysis_time = time.time() - start_time
@@ -147,7 +282,7 @@ class TLSProtocolMarker(ProtocolMarker):
                 "pcap_path": pcap_path,
                 "preserve_config": self.preserve_config,
                 "analysis_time": analysis_time,
-                "tls_packets_found": len(tls_packets),
+                "tls_packets_found": tls_packets_found,
                 "tcp_flows_found": len(tcp_flows),
             }
 
@@ -202,7 +337,8 @@ class TLSProtocolMarker(ProtocolMarker):
             min_str = ".".join(map(str, MIN_TSHARK_VERSION))
             raise RuntimeError(f"tshark 版本过低 ({ver_str})，需要 ≥ {min_str}")
 
-        self.logger.debug(f"Detected tshark {'.'.join(map(str, version))} at {executable}")
+        self.tshark_version = ".".join(map(str, version))
+        self.logger.debug(f"Detected tshark {self.tshark_version} at {executable}")
         return executable
 
     def _parse_tshark_version(self, output: str) -> Optional[Tuple[int, int, int]]:
@@ -261,12 +397,19 @@ class TLSProtocolMarker(ProtocolMarker):
             f"已检查路径: {default_paths}"
         )
 
-    def _scan_tls_messages(self, pcap_path: str) -> List[Dict[str, Any]]:
+    def _scan_tls_messages(self, pcap_path: str) -> Iterable[TsharkFieldRecord]:
         """扫描PCAP文件中的TLS消息（复用自tls_flow_analyzer）
 
         使用两阶段扫描方法：
         1. 第一阶段：扫描包含TLS记录头的包（启用TCP重组）
         2. 第二阶段：扫描包含TLS段数据的包（禁用TCP重组，捕获跨分段情况）
+
+        默认以流式模式运行两阶段扫描（``tls_scan_mode="streaming"``），返回逐包产出合并结果的
+        迭代器（tshark在开始迭代时启动）；``tls_scan_mode="buffered"`` 保留完整读取输出后合并
+        的旧行为，返回列表。
+
+        tshark输出默认为 ``-T fields``（``tshark_output="fields"``），逐行解码为带类型的记录；
+        ``tshark_output="json"`` 保留 JSON 输出，每个数据包转换为同一种记录。
         """
         self.logger.debug("Scanning TLS messages")
 
@@ -276,48 +419,7 @@ class TLSProtocolMarker(ProtocolMarker):
             "-2",  # 两遍分析，启用重组
             "-r",
             pcap_path,
-            "-T",
-            "json",
-            "-e",
-            "frame.number",
-            "-e",
-            "frame.protocols",
-            "-e",
-            "frame.time_relative",
-            "-e",
-            "ip.src",
-            "-e",
-            "ip.dst",
-            "-e",
-            "ipv6.src",
-            "-e",
-            "ipv6.dst",
-            "-e",
-            "tcp.srcport",
-            "-e",
-            "tcp.dstport",
-            "-e",
-            "tcp.stream",
-            "-e",
-            "tcp.seq",
-            "-e",
-            "tcp.seq_raw",  # 绝对序列号
-            "-e",
-            "tcp.len",
-            "-e",
-            "tcp.payload",
-            "-e",
-            "tls.record.content_type",
-            "-e",
-            "tls.record.opaque_type",
-            "-e",
-            "tls.record.length",
-            "-e",
-            "tls.record.version",
-            "-e",
-            "tls.app_data",
-            "-E",
-            "occurrence=a",
+            *self._output_args(TLS_RECORD_SCAN_FIELDS),
             "-o",
             "tcp.desegment_tcp_streams:TRUE",
         ]
@@ -327,40 +429,7 @@ class TLSProtocolMarker(ProtocolMarker):
             self.tshark_exec,
             "-r",
             pcap_path,
-            "-T",
-            "json",
-            "-e",
-            "frame.number",
-            "-e",
-            "frame.protocols",
-            "-e",
-            "frame.time_relative",
-            "-e",
-            "ip.src",
-            "-e",
-            "ip.dst",
-            "-e",
-            "ipv6.src",
-            "-e",
-            "ipv6.dst",
-            "-e",
-            "tcp.srcport",
-            "-e",
-            "tcp.dstport",
-            "-e",
-            "tcp.stream",
-            "-e",
-            "tcp.seq",
-            "-e",
-            "tcp.seq_raw",  # 绝对序列号
-            "-e",
-            "tcp.len",
-            "-e",
-            "tcp.payload",
-            "-e",
-            "tls.segment.data",  # TLS段数据字段
-            "-E",
-            "occurrence=a",
+            *self._output_args(TLS_SEGMENT_SCAN_FIELDS),
             "-o",
             "tcp.desegment_tcp_streams:FALSE",
         ]
@@ -371,6 +440,24 @@ class TLSProtocolMarker(ProtocolMarker):
                 cmd_reassembled.extend(["-d", spec])
                 cmd_segments.extend(["-d", spec])
 
+        if self.tls_scan_mode == "buffered":
+            return self._scan_tls_messages_buffered(cmd_reassembled, cmd_segments)
+        return self._scan_tls_messages_streaming(cmd_reassembled, cmd_segments)
+
+    def _spool_tls_packets(self, tls_packets: Iterable[TsharkFieldRecord]):
+        """供后续阶段多次遍历的扫描结果（上下文管理器）
+
+        缓冲模式的列表直接使用；流式扫描的结果逐包暂存到临时文件，而不是收集到内存中，
+        且只暂存 ``TLS_PACKET_SPOOL_FIELDS`` 的列。
+        """
+        if isinstance(tls_packets, list):
+            return nullcontext(tls_packets)
+        return PacketSpool(tls_packets, self._field_decoder(TLS_PACKET_SPOOL_FIELDS))
+
+    def _scan_tls_messages_buffered(
+        self, cmd_reassembled: List[str], cmd_segments: List[str]
+    ) -> List[TsharkFieldRecord]:
+        """缓冲模式：依次执行两阶段扫描，完整读取输出后合并（旧行为）"""
         try:
             # Use hidden subprocess to prevent cmd window popup on Windows
             from ......utils.subprocess_utils import run_hidden_subprocess
@@ -384,7 +471,7 @@ class TLSProtocolMarker(ProtocolMarker):
                 encoding="utf-8",
                 errors="replace",
             )
-            packets_reassembled = json.loads(completed_reassembled.stdout)
+            packets_reassembled = self._decode_tshark_output(completed_reassembled.stdout, TLS_RECORD_SCAN_FIELDS)
 
             # 执行第二阶段扫描
             completed_segments = run_hidden_subprocess(
@@ -395,22 +482,146 @@ class TLSProtocolMarker(ProtocolMarker):
                 encoding="utf-8",
                 errors="replace",
             )
-            packets_segments = json.loads(completed_segments.stdout)
+            packets_segments = self._decode_tshark_output(completed_segments.stdout, TLS_SEGMENT_SCAN_FIELDS)
 
-        except (subprocess.CalledProcessError, json.JSONDecodeError) as exc:
+        except (subprocess.CalledProcessError, json.JSONDecodeError, TsharkFieldsError) as exc:
             raise RuntimeError(f"TLS消息扫描失败: {exc}") from exc
 
         # 合并两阶段的结果
-        tls_packets = self._merge_tls_scan_results(packets_reassembled, packets_segments)
+        return self._merge_tls_scan_results(packets_reassembled, packets_segments)
+
+    def _scan_tls_messages_streaming(
+        self, cmd_reassembled: List[str], cmd_segments: List[str]
+    ) -> Iterator[TsharkFieldRecord]:
+        """流式模式：两阶段扫描并发运行，通过管道增量解析并按帧号归并
+
+        两个tshark进程的输出都按帧号递增，归并时每次只需持有各自的当前数据包，
+        合并后的TLS数据包逐个产出给调用方，内存占用不随tshark输出总量增长。
 
-        self.logger.debug(f"Found {len(tls_packets)} packets containing TLS messages")
-        return tls_packets
+        Raises:
+            RuntimeError: 迭代过程中tshark失败或输出格式错误
+        """
+        try:
+            if self.tshark_output == "json":
+                with (
+                    tshark_json_stream(cmd_reassembled) as packets_reassembled,
+                    tshark_json_stream(cmd_segments) as packets_segments,
+                ):
+                    yield from self._merge_tls_scan_streams(
+                        self._records_from_json(packets_reassembled, TLS_RECORD_SCAN_FIELDS),
+                        self._records_from_json(packets_segments, TLS_SEGMENT_SCAN_FIELDS),
+                    )
+                return
+
+            decoder_reassembled = self._field_decoder(TLS_RECORD_SCAN_FIELDS)
+            decoder_segments = self._field_decoder(TLS_SEGMENT_SCAN_FIELDS)
+            with (
+                tshark_fields_stream(cmd_reassembled, decoder_reassembled) as records_reassembled,
+                tshark_fields_stream(cmd_segments, decoder_segments) as records_segments,
+            ):
+                yield from self._merge_tls_scan_streams(records_reassembled, records_segments)
+        except (subprocess.CalledProcessError, json.JSONDecodeError, TsharkFieldsError) as exc:
+            raise RuntimeError(f"TLS消息扫描失败: {exc}") from exc
+
+    def _field_decoder(self, fields: Tuple[str, ...]) -> TsharkFieldDecoder:
+        """字段列表对应的解码器（按字段列表缓存，记录类型只生成一次）"""
+        decoder = self._field_decoders.get(fields)
+        if decoder is None:
+            decoder = self._field_decoders[fields] = TsharkFieldDecoder(fields, optional_fields=_TLS_PACKET_FIELDS)
+        return decoder
+
+    def _output_args(self, fields: Tuple[str, ...]) -> List[str]:
+        """tshark 输出格式与字段参数（-T fields/json 及 -e 列表）"""
+        if self.tshark_output == "json":
+            args = ["-T", "json"]
+            for field in fields:
+                args.extend(["-e", field])
+            return args + ["-E", "occurrence=a"]
+        return self._field_decoder(fields).command_args()
+
+    def _decode_tshark_output(self, stdout: str, fields: Tuple[str, ...]) -> List[TsharkFieldRecord]:
+        """把完整的 tshark stdout 解码为行记录列表
+
+        Raises:
+            json.JSONDecodeError: JSON 输出格式错误
+            TsharkFieldsError: 字段输出格式错误
+        """
+        if self.tshark_output == "json":
+            return list(self._records_from_json(json.loads(stdout), fields))
+        return self._field_decoder(fields).decode_output(stdout)
+
+    def _records_from_json(
+        self, packets: Iterable[Dict[str, Any]], fields: Tuple[str, ...]
+    ) -> Iterator[TsharkFieldRecord]:
+        """``-T json`` 输出的数据包转换为与字段输出相同的记录（JSON 兼容路径）"""
+        decode_layers = self._field_decoder(fields).decode_layers
+        for packet in packets:
+            yield decode_layers(packet.get("_source", {}).get("layers", {}))
+
+    def _merge_tls_scan_streams(
+        self,
+        packets_reassembled: Iterator[TsharkFieldRecord],
+        packets_segments: Iterator[TsharkFieldRecord],
+    ) -> Iterator[TsharkFieldRecord]:
+        """按帧号归并两个有序的扫描结果流（与 _merge_tls_scan_results 语义一致）
+
+        同一帧优先使用重组版本（包含TLS记录头），否则使用包含TLS段数据的非重组版本。
+
+        Args:
+            packets_reassembled: 启用TCP重组的扫描结果（按帧号递增）
+            packets_segments: 禁用TCP重组的扫描结果（按帧号递增）
+
+        Yields:
+            合并后的TLS数据包（按帧号递增）
+        """
+
+        def advance(packets: Iterator[TsharkFieldRecord]) -> Tuple[Optional[TsharkFieldRecord], Optional[int]]:
+            # 跳过缺少帧号的数据包（与缓冲模式的过滤条件一致）
+            for packet in packets:
+                frame = packet.first("frame_number")
+                if frame:
+                    return packet, int(frame)
+            return None, None
+
+        reassembled_count = segments_count = 0
+        reassembled_added = segments_added = 0
+
+        r_packet, r_frame = advance(packets_reassembled)
+        s_packet, s_frame = advance(packets_segments)
+
+        while r_packet is not None or s_packet is not None:
+            current = min(f for f in (r_frame, s_frame) if f is not None)
+            chosen = None
+
+            if r_frame == current:
+                reassembled_count += 1
+                if self._has_tls_content(r_packet):
+                    chosen = r_packet
+                    reassembled_added += 1
+                r_packet, r_frame = advance(packets_reassembled)
+
+            if s_frame == current:
+                segments_count += 1
+                if chosen is None and self._has_tls_segment_data(s_packet):
+                    chosen = s_packet
+                    segments_added += 1
+                s_packet, s_frame = advance(packets_segments)
+
+            if chosen is not None:
+                yield chosen
+
+        self.logger.debug(
+            f"Merged scan streams: {reassembled_count} reassembled packets, "
+            f"{segments_count} segment packets, "
+            f"{reassembled_added + segments_added} after merge "
+            f"(reassembled_added={reassembled_added}, segments_added={segments_added})"
+        )
 
     def _merge_tls_scan_results(
         self,
-        packets_reassembled: List[Dict[str, Any]],
-        packets_segments: List[Dict[str, Any]],
-    ) -> List[Dict[str, Any]]:
+        packets_reassembled: List[TsharkFieldRecord],
+        packets_segments: List[TsharkFieldRecord],
+    ) -> List[TsharkFieldRecord]:
         """合并两阶段TLS扫描结果
 
         Args:
@@ -433,38 +644,30 @@ class TLSProtocolMarker(ProtocolMarker):
 
         # 第一阶段：添加包含TLS记录头的包
         for packet in packets_reassembled:
-            layers = packet.get("_source", {}).get("layers", {})
-            frame_number = self._get_first_value(layers.get("frame.number"))
+            frame_number = packet.first("frame_number")
 
-            if frame_number and self._has_tls_content(layers):
-                merged_packets[str(frame_number)] = packet
+            if frame_number and self._has_tls_content(packet):
+                merged_packets[int(frame_number)] = packet
 
                 _dbg_reassembled_added += 1
-                if layers.get("tls.record.content_type") or layers.get("tls.record.opaque_type"):
+                if packet.tls_record_content_type or packet.tls_record_opaque_type:
                     _dbg_ct_present_count += 1
 
         # 第二阶段：添加包含TLS段数据的包（跨分段情况）
         for packet in packets_segments:
-            layers = packet.get("_source", {}).get("layers", {})
-            frame_number = self._get_first_value(layers.get("frame.number"))
+            frame_number = packet.first("frame_number")
 
-            if frame_number and self._has_tls_segment_data(layers):
+            if frame_number and self._has_tls_segment_data(packet):
                 # 如果已经存在，优先使用重组后的版本（包含更完整的TLS信息）
-                if str(frame_number) not in merged_packets:
-                    merged_packets[str(frame_number)] = packet
+                if int(frame_number) not in merged_packets:
+                    merged_packets[int(frame_number)] = packet
 
                     _dbg_segments_added += 1
-                    if not (
-                        layers.get("tls.record.content_type") or layers.get("tls.record.opaque_type")
-                    ) and self._has_tls_segment_data(layers):
+                    if not (packet.tls_record_content_type or packet.tls_record_opaque_type):
                         _dbg_seg_only_count += 1
 
-        # 转换为列表并按frame.number排序
-        result_packets = list(merged_packets.values())
-
-        result_packets.sort(
-            key=lambda p: int(self._get_first_value(p.get("_source", {}).get("layers", {}).get("frame.number", 0)))
-        )
+        # 按frame.number排序
+        result_packets = [merged_packets[frame] for frame in sorted(merged_packets)]
 
         self.logger.debug(
             f"Merged scan results: {len(packets_reassembled)} reassembled packets, "
@@ -482,35 +685,25 @@ class TLSProtocolMarker(ProtocolMarker):
 
         return result_packets
 
-    def _has_tls_segment_data(self, layers: Dict[str, Any]) -> bool:
+    def _has_tls_segment_data(self, packet: TsharkFieldRecord) -> bool:
         """检查数据包是否包含TLS段数据（用于识别跨分段的TLS消息片段）"""
-        segment_data = layers.get("tls.segment.data", [])
-
-        # 统一转换为列表
-        if not isinstance(segment_data, list):
-            segment_data = [segment_data] if segment_data else []
+        return any(packet.tls_segment_data)
 
-        # 检查是否有TLS段数据
-        return len(segment_data) > 0 and any(data for data in segment_data if data)
-
-    def _infer_tls_type_from_segment_data(self, layers: Dict[str, Any]) -> Optional[int]:
+    def _infer_tls_type_from_segment_data(self, packet: TsharkFieldRecord) -> Optional[int]:
         """通过分析TLS段数据的头部来确定消息类型（复用tls_flow_analyzer逻辑）
 
         Args:
-            layers: 数据包的layers信息
+            packet: 数据包记录
 
         Returns:
             推断的TLS类型，如果无法推断则返回None
         """
-        tls_segment_data = layers.get("tls.segment.data")
-        if not tls_segment_data:
+        segment_data_hex = packet.first("tls_segment_data")
+        if not segment_data_hex:
             return None
 
         try:
-            # 获取段数据（可能是列表格式）
-            segment_data_hex = tls_segment_data[0] if isinstance(tls_segment_data, list) else tls_segment_data
-
-            if segment_data_hex and len(segment_data_hex) >= 2:
+            if len(segment_data_hex) >= 2:
                 # TLS记录的第一个字节是内容类型
                 content_type_byte = int(segment_data_hex[:2], 16)
                 if content_type_byte in TLS_CONTENT_TYPES:
@@ -521,88 +714,54 @@ class TLSProtocolMarker(ProtocolMarker):
 
         return None
 
-    def _has_tls_content(self, layers: Dict[str, Any]) -> bool:
-        """检查数据包是否包含TLS记录头（复用自tls_flow_analyzer）"""
-        content_types = layers.get("tls.record.content_type", [])
-        opaque_types = layers.get("tls.record.opaque_type", [])
-
-        # 统一转换为列表
-        if not isinstance(content_types, list):
-            content_types = [content_types] if content_types else []
-        if not isinstance(opaque_types, list):
-            opaque_types = [opaque_types] if opaque_types else []
-
-        # 检查是否包含已知的TLS内容类型
-        all_types = content_types + opaque_types
-        for content_type in all_types:
-            if content_type and str(content_type).isdigit():
-                type_num = int(content_type)
-                if type_num in TLS_CONTENT_TYPES:
-                    return True
+    def _has_tls_content(self, packet: TsharkFieldRecord) -> bool:
+        """检查数据包是否包含已知TLS内容类型的记录头（复用自tls_flow_analyzer）"""
+        # 非十进制的类型值保留为文本，不会与 TLS_CONTENT_TYPES 的整数键匹配
+        return any(
+            content_type in TLS_CONTENT_TYPES
+            for content_type in packet.tls_record_content_type + packet.tls_record_opaque_type
+        )
 
-        return False
+    def _analyze_tcp_flows(self, pcap_path: str, tls_packets: Iterable[TsharkFieldRecord]) -> Dict[str, Dict[str, Any]]:
+        """分析TCP流（复用自tls_flow_analyzer逻辑）
 
-    def _analyze_tcp_flows(self, pcap_path: str, tls_packets: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
-        """分析TCP流（复用自tls_flow_analyzer逻辑）"""
+        默认使用批量模式：一次tshark扫描提取多个流的字段并在内存中按 tcp.stream 分组，
+        避免对每个流单独重新解析整个文件。``flow_analysis_mode="per_stream"`` 可回退到逐流模式。
+        """
         self.logger.debug("Analyzing TCP flows")
 
         # 提取唯一的TCP流ID
         stream_ids = set()
         for packet in tls_packets:
-            layers = packet.get("_source", {}).get("layers", {})
-            stream_id = self._get_first_value(layers.get("tcp.stream"))
+            stream_id = packet.first("tcp_stream")
             if stream_id is not None:
                 stream_ids.add(str(stream_id))
 
         tcp_flows = {}
-        for stream_id in stream_ids:
-            flow_info = self._analyze_single_tcp_flow(pcap_path, stream_id)
-            if flow_info:
-                tcp_flows[stream_id] = flow_info
+        if self.flow_analysis_mode == "per_stream":
+            for stream_id in stream_ids:
+                flow_info = self._analyze_single_tcp_flow(pcap_path, stream_id)
+                if flow_info:
+                    tcp_flows[stream_id] = flow_info
+        else:
+            packets_by_stream = self._scan_tcp_flow_packets(pcap_path, stream_ids)
+            for stream_id in stream_ids:
+                flow_info = self._build_flow_info(stream_id, packets_by_stream.get(stream_id, []))
+                if flow_info:
+                    tcp_flows[stream_id] = flow_info
 
         self.logger.debug(f"Analyzed {len(tcp_flows)} TCP flows")
         return tcp_flows
 
-    def _analyze_single_tcp_flow(self, pcap_path: str, stream_id: str) -> Optional[Dict[str, Any]]:
-        """分析单个TCP流（复用自tls_flow_analyzer逻辑）"""
+    def _build_flow_fields_cmd(self, pcap_path: str, display_filter: str) -> List[str]:
+        """构建TCP流字段提取的tshark命令"""
         cmd = [
             self.tshark_exec,
             "-r",
             pcap_path,
             "-Y",
-            f"tcp.stream == {stream_id}",
-            "-T",
-            "json",
-            "-e",
-            "frame.number",
-            "-e",
-            "frame.time_relative",
-            "-e",
-            "ip.src",
-            "-e",
-            "ip.dst",
-            "-e",
-            "ipv6.src",
-            "-e",
-            "ipv6.dst",
-            "-e",
-            "tcp.srcport",
-            "-e",
-            "tcp.dstport",
-            "-e",
-            "tcp.stream",
-            "-e",
-            "tcp.seq",
-            "-e",
-            "tcp.seq_raw",
-            "-e",
-            "tcp.len",
-            "-e",
-            "tcp.flags",
-            "-e",
-            "tcp.payload",
-            "-E",
-            "occurrence=a",
+            display_filter,
+            *self._output_args(TCP_FLOW_FIELDS),
             "-o",
             "tcp.desegment_tcp_streams:TRUE",
         ]
@@ -611,6 +770,71 @@ class TLSProtocolMarker(ProtocolMarker):
             for spec in self.decode_as:
                 cmd.extend(["-d", spec])
 
+        return cmd
+
+    def _scan_tcp_flow_packets(self, pcap_path: str, stream_ids: Set[str]) -> Dict[str, List[TsharkFieldRecord]]:
+        """批量提取多个TCP流的数据包，按 tcp.stream 分组
+
+        每次tshark扫描覆盖最多 ``flow_analysis_batch_size`` 个流，扫描次数与流数量成
+        ``ceil(n / batch_size)`` 关系，而不是与流数量成正比。
+
+        Args:
+            pcap_path: PCAP文件路径
+            stream_ids: 需要分析的tshark tcp.stream 编号集合
+
+        Returns:
+            stream_id -> 该流的数据包列表（保持帧顺序）
+        """
+        packets_by_stream: Dict[str, List[TsharkFieldRecord]] = {sid: [] for sid in stream_ids}
+        if not stream_ids:
+            return packets_by_stream
+
+        # Use hidden subprocess to prevent cmd window popup on Windows
+        from ......utils.subprocess_utils import run_hidden_subprocess
+
+        ordered_ids = sorted(stream_ids, key=lambda sid: int(sid) if sid.isdigit() else sid)
+        batch_size = max(1, int(self.flow_analysis_batch_size))
+
+        for batch_start in range(0, len(ordered_ids), batch_size):
+            batch = ordered_ids[batch_start : batch_start + batch_size]
+            display_filter = f"tcp.stream in {{{' '.join(batch)}}}"
+            cmd = self._build_flow_fields_cmd(pcap_path, display_filter)
+
+            try:
+                completed = run_hidden_subprocess(
+                    cmd,
+                    check=True,
+                    text=True,
+                    capture_output=True,
+                    encoding="utf-8",
+                    errors="replace",
+                )
+                packets = (
+                    self._decode_tshark_output(completed.stdout, TCP_FLOW_FIELDS) if completed.stdout.strip() else []
+                )
+            except (subprocess.CalledProcessError, json.JSONDecodeError, TsharkFieldsError):
+                self.logger.warning(f"Batched TCP flow analysis failed ({len(batch)} streams), retrying per stream")
+                for stream_id in batch:
+                    packets_by_stream[stream_id] = self._fetch_single_tcp_flow_packets(pcap_path, stream_id) or []
+                continue
+
+            batch_set = set(batch)
+            for packet in packets:
+                # 隧道场景下一个帧可能携带多个 tcp.stream，与 "tcp.stream == N" 过滤语义保持一致
+                for sid in dict.fromkeys(str(v) for v in packet.tcp_stream):
+                    if sid in batch_set:
+                        packets_by_stream[sid].append(packet)
+
+        self.logger.debug(
+            f"Batched TCP flow scan: {len(stream_ids)} streams in "
+            f"{(len(ordered_ids) + batch_size - 1) // batch_size} tshark pass(es)"
+        )
+        return packets_by_stream
+
+    def _fetch_single_tcp_flow_packets(self, pcap_path: str, stream_id: str) -> Optional[List[TsharkFieldRecord]]:
+        """提取单个TCP流的数据包（逐流模式）"""
+        cmd = self._build_flow_fields_cmd(pcap_path, f"tcp.stream == {stream_id}")
+
         try:
             # Use hidden subprocess to prevent cmd window popup on Windows
             from ......utils.subprocess_utils import run_hidden_subprocess
@@ -623,11 +847,18 @@ class TLSProtocolMarker(ProtocolMarker):
                 encoding="utf-8",
                 errors="replace",
             )
-            packets = json.loads(completed.stdout)
-        except (subprocess.CalledProcessError, json.JSONDecodeError):
+            return self._decode_tshark_output(completed.stdout, TCP_FLOW_FIELDS)
+        except (subprocess.CalledProcessError, json.JSONDecodeError, TsharkFieldsError):
             self.logger.warning(f"TCP flow analysis failed (stream {stream_id})")
             return None
 
+    def _analyze_single_tcp_flow(self, pcap_path: str, stream_id: str) -> Optional[Dict[str, Any]]:
+        """分析单个TCP流（复用自tls_flow_analyzer逻辑）"""
+        packets = self._fetch_single_tcp_flow_packets(pcap_path, stream_id)
+        return self._build_flow_info(stream_id, packets)
+
+    def _build_flow_info(self, stream_id: str, packets: Optional[List[TsharkFieldRecord]]) -> Optional[Dict[str, Any]]:
+        """由单个流的数据包构建流分析结果（方向识别 + 载荷重组）"""
         if not packets:
             return None
 
@@ -645,12 +876,6 @@ class TLSProtocolMarker(ProtocolMarker):
             "packet_count": len(packets),
         }
 
-    def _get_first_value(self, value: Any) -> Any:
-        """获取第一个值（处理列表和单值）（复用自tls_flow_analyzer）"""
-        if isinstance(value, list):
-            return value[0] if value else None
-        return value
-
     def _build_tuple_key_from_values(self, src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> str:
         """生成与Masker一致的规范化tuple_key（较小(ip,port)在前）。"""
         if (str(src_ip), int(src_port)) < (str(dst_ip), int(dst_port)):
@@ -658,13 +883,13 @@ class TLSProtocolMarker(ProtocolMarker):
         else:
             return f"{dst_ip}:{int(dst_port)}-{src_ip}:{int(src_port)}"
 
-    def _get_endpoints_from_layers(self, layers: Dict[str, Any]) -> Tuple[str, int, str, int]:
-        """从tshark JSON layers提取四元组端点。"""
-        src_ip = self._get_first_value(layers.get("ip.src")) or self._get_first_value(layers.get("ipv6.src")) or ""
-        dst_ip = self._get_first_value(layers.get("ip.dst")) or self._get_first_value(layers.get("ipv6.dst")) or ""
-        src_port = int(self._get_first_value(layers.get("tcp.srcport")) or 0)
-        dst_port = int(self._get_first_value(layers.get("tcp.dstport")) or 0)
-        return str(src_ip), src_port, str(dst_ip), dst_port
+    def _get_endpoints(self, packet: TsharkFieldRecord) -> Tuple[str, int, str, int]:
+        """从tshark数据包记录提取四元组端点。"""
+        src_ip = packet.first("ip_src") or packet.first("ipv6_src") or ""
+        dst_ip = packet.first("ip_dst") or packet.first("ipv6_dst") or ""
+        src_port = int(packet.first("tcp_srcport") or 0)
+        dst_port = int(packet.first("tcp_dstport") or 0)
+        return src_ip, src_port, dst_ip, dst_port
 
     def _get_local_stream_id_from_values(self, src_ip: str, src_port: int, dst_ip: str, dst_port: int) -> str:
         """依据tuple_key返回/分配本地stream_id（与Masker一致）。"""
@@ -719,7 +944,7 @@ class TLSProtocolMarker(ProtocolMarker):
             else "reverse"
         )
 
-    def _identify_flow_directions(self, packets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _identify_flow_directions(self, packets: List[TsharkFieldRecord]) -> Dict[str, Any]:
         """识别TCP流的两个方向（与Masker一致：基于字典序的canonical方向）"""
         directions = {
             "forward": {
@@ -742,21 +967,13 @@ class TLSProtocolMarker(ProtocolMarker):
             return directions
 
         # 读取第一个包的端点，计算 canonical forward（字典序较小端点作为源）
-        first_layers = packets[0].get("_source", {}).get("layers", {})
-        a_ip = self._get_first_value(first_layers.get("ip.src")) or self._get_first_value(first_layers.get("ipv6.src"))
-        b_ip = self._get_first_value(first_layers.get("ip.dst")) or self._get_first_value(first_layers.get("ipv6.dst"))
-        a_port = self._get_first_value(first_layers.get("tcp.srcport"))
-        b_port = self._get_first_value(first_layers.get("tcp.dstport"))
-
-        # 统一为字符串+整数用于比较
-        a_port_i = int(a_port) if a_port is not None else 0
-        b_port_i = int(b_port) if b_port is not None else 0
-        if (str(a_ip), a_port_i) < (str(b_ip), b_port_i):
-            f_src_ip, f_src_port = str(a_ip), a_port_i
-            f_dst_ip, f_dst_port = str(b_ip), b_port_i
+        a_ip, a_port, b_ip, b_port = self._get_endpoints(packets[0])
+        if (a_ip, a_port) < (b_ip, b_port):
+            f_src_ip, f_src_port = a_ip, a_port
+            f_dst_ip, f_dst_port = b_ip, b_port
         else:
-            f_src_ip, f_src_port = str(b_ip), b_port_i
-            f_dst_ip, f_dst_port = str(a_ip), a_port_i
+            f_src_ip, f_src_port = b_ip, b_port
+            f_dst_ip, f_dst_port = a_ip, a_port
 
         directions["forward"].update(
             {
@@ -776,111 +993,83 @@ class TLSProtocolMarker(ProtocolMarker):
         )
 
         # 按 canonical forward 划分所有数据包
+        forward_endpoints = (f_src_ip, f_src_port, f_dst_ip, f_dst_port)
         for packet in packets:
-            layers = packet.get("_source", {}).get("layers", {})
-            src_ip = self._get_first_value(layers.get("ip.src")) or self._get_first_value(layers.get("ipv6.src"))
-            dst_ip = self._get_first_value(layers.get("ip.dst")) or self._get_first_value(layers.get("ipv6.dst"))
-            src_port = int(self._get_first_value(layers.get("tcp.srcport")) or 0)
-            dst_port = int(self._get_first_value(layers.get("tcp.dstport")) or 0)
-
-            if (str(src_ip), src_port, str(dst_ip), dst_port) == (
-                directions["forward"]["src_ip"],
-                int(directions["forward"]["src_port"] or 0),
-                directions["forward"]["dst_ip"],
-                int(directions["forward"]["dst_port"] or 0),
-            ):
+            if self._get_endpoints(packet) == forward_endpoints:
                 directions["forward"]["packets"].append(packet)
             else:
                 directions["reverse"]["packets"].append(packet)
 
         return directions
 
-    def _reassemble_tcp_payloads(self, packets: List[Dict[str, Any]], directions: Dict[str, Any]) -> Dict[str, Any]:
-        """重组 TCP 载荷并记录序列号映射（移植自 tls_flow_analyzer）"""
+    def _reassemble_tcp_payloads(self, packets: List[TsharkFieldRecord], directions: Dict[str, Any]) -> Dict[str, Any]:
+        """重组 TCP 载荷并记录序列号映射（移植自 tls_flow_analyzer）
+
+        载荷追加到 bytearray（均摊线性），序列号映射为按偏移有序的 SegmentSeqIndex。
+        """
         reassembled = {
-            "forward": {"payload": b"", "seq_mapping": []},
-            "reverse": {"payload": b"", "seq_mapping": []},
+            "forward": {"payload": bytearray(), "seq_mapping": SegmentSeqIndex()},
+            "reverse": {"payload": bytearray(), "seq_mapping": SegmentSeqIndex()},
         }
 
         for direction_name, direction_info in directions.items():
             # 按序列号排序数据包
-            direction_packets = sorted(
-                direction_info["packets"],
-                key=lambda p: int(self._get_first_value(p.get("_source", {}).get("layers", {}).get("tcp.seq", 0))),
-            )
+            direction_packets = sorted(direction_info["packets"], key=lambda p: int(p.first("tcp_seq") or 0))
 
             # 重组载荷并记录序列号映射
-            payload_data = b""
-            seq_mapping = []
-            current_offset = 0
+            payload_data = bytearray()
+            seq_mapping = SegmentSeqIndex()
 
             for packet in direction_packets:
-                layers = packet.get("_source", {}).get("layers", {})
-                tcp_payload = layers.get("tcp.payload")
-                tcp_seq_raw = self._get_first_value(layers.get("tcp.seq_raw"))
-
-                if tcp_payload and tcp_seq_raw:
-                    payload_hex = self._get_first_value(tcp_payload)
-                    if payload_hex:
-                        try:
-                            # 清理十六进制字符串
-                            clean_hex = payload_hex.replace(":", "").replace(" ", "")
-                            payload_bytes = bytes.fromhex(clean_hex)
-
-                            # 记录这段载荷在重组数据中的位置和对应的序列号
-                            if len(payload_bytes) > 0:
-                                seq_mapping.append(
-                                    {
-                                        "offset_start": current_offset,
-                                        "offset_end": current_offset + len(payload_bytes) - 1,
-                                        "tcp_seq_raw": int(tcp_seq_raw),
-                                        "payload_length": len(payload_bytes),
-                                    }
-                                )
-
-                                payload_data += payload_bytes
-                                current_offset += len(payload_bytes)
-                        except ValueError:
-                            continue
+                # 记录属性中的载荷已是去掉分隔符的十六进制文本
+                payload_hex = packet.first("tcp_payload")
+                tcp_seq_raw = packet.first("tcp_seq_raw")
+
+                if payload_hex and tcp_seq_raw is not None:
+                    try:
+                        payload_bytes = bytes.fromhex(payload_hex)
+
+                        # 记录这段载荷在重组数据中的位置和对应的序列号
+                        if len(payload_bytes) > 0:
+                            seq_mapping.append(len(payload_data), int(tcp_seq_raw), len(payload_bytes))
+                            payload_data += payload_bytes
+                    except ValueError:
+                        continue
 
             reassembled[direction_name]["payload"] = payload_data
             reassembled[direction_name]["seq_mapping"] = seq_mapping
 
         return reassembled
 
-    def _find_actual_seq_for_offset(self, tls_offset: int, seq_mapping: List[Dict[str, Any]]) -> int:
-        """根据TLS记录在重组载荷中的偏移位置，查找对应的实际TCP序列号（移植自 tls_flow_analyzer）"""
-        for mapping in seq_mapping:
-            offset_start = mapping["offset_start"]
-            offset_end = mapping["offset_end"]
-            tcp_seq_raw = mapping["tcp_seq_raw"]
-
-            if offset_start <= tls_offset <= offset_end:
-                # TLS记录在这个TCP包的载荷中
-                # 计算TLS记录在该TCP包载荷中的相对偏移
-                relative_offset = tls_offset - offset_start
-                return tcp_seq_raw + relative_offset
+    def _find_actual_seq_for_offset(self, tls_offset: int, seq_mapping: SegmentSeqIndex) -> int:
+        """根据TLS记录在重组载荷中的偏移位置，查找对应的实际TCP序列号（移植自 tls_flow_analyzer）
 
-        # 如果没有找到匹配的映射，返回0（这种情况不应该发生）
-        return 0
+        没有找到匹配的映射时返回0（这种情况不应该发生）
+        """
+        return seq_mapping.seq_at(tls_offset)
 
     def _parse_tls_records_from_payload(
         self,
         payload: bytes,
         stream_id: str,
         direction: str,
-        seq_mapping: List[Dict[str, Any]],
+        seq_mapping: SegmentSeqIndex,
     ) -> List[Dict[str, Any]]:
-        """从 TCP 载荷中解析 TLS 记录（移植自 tls_flow_analyzer）"""
+        """从 TCP 载荷中解析 TLS 记录（移植自 tls_flow_analyzer）
+
+        逐字节读取记录头，记录体按长度跳过，不复制载荷切片。
+        """
         records = []
         offset = 0
+        payload = memoryview(payload)
+        payload_length = len(payload)
 
-        while offset + 5 <= len(payload):
+        while offset + 5 <= payload_length:
             # 解析 TLS 记录头 (5 字节)
             content_type = payload[offset]
             version_major = payload[offset + 1]
             version_minor = payload[offset + 2]
-            length = int.from_bytes(payload[offset + 3 : offset + 5], byteorder="big")
+            length = payload[offset + 3] << 8 | payload[offset + 4]
 
             # 验证内容类型
             if content_type not in TLS_CONTENT_TYPES:
@@ -895,9 +1084,9 @@ class TLSProtocolMarker(ProtocolMarker):
             tls_header_seq_end = tls_header_seq_start + 5
             tls_payload_seq_start = tls_header_seq_end
 
-            if record_end > len(payload):
+            if record_end > payload_length:
                 # 记录不完整，可能跨段
-                actual_length = len(payload) - offset - 5
+                actual_length = payload_length - offset - 5
 
                 # 【修复1】：验证跨段消息的合理性
                 if not self._validate_cross_segment_record(content_type, length, actual_length):
@@ -907,7 +1096,7 @@ class TLSProtocolMarker(ProtocolMarker):
                     offset += 1  # 跳过这个字节，继续寻找下一个TLS记录
                     continue
 
-                tls_payload_seq_end = self._find_actual_seq_for_offset(len(payload) - 1, seq_mapping) + 1
+                tls_payload_seq_end = self._find_actual_seq_for_offset(payload_length - 1, seq_mapping) + 1
                 records.append(
                     {
                         "stream_id": stream_id,
@@ -955,7 +1144,7 @@ class TLSProtocolMarker(ProtocolMarker):
         return records
 
     def _generate_keep_rules(
-        self, tls_packets: List[Dict[str, Any]], tcp_flows: Dict[str, Dict[str, Any]]
+        self, tls_packets: Iterable[TsharkFieldRecord], tcp_flows: Dict[str, Dict[str, Any]]
     ) -> KeepRuleSet:
         """生成保留规则（重构版本，使用重组载荷和精确序列号计算）"""
         self.logger.debug("Generating keep rules (using reassembled payload analysis)")
@@ -1097,7 +1286,7 @@ class TLSProtocolMarker(ProtocolMarker):
 
     def _generate_fallback_rules_from_packets(
         self,
-        tls_packets: List[Dict[str, Any]],
+        tls_packets: Iterable[TsharkFieldRecord],
         tcp_flows: Dict[str, Dict[str, Any]],
         ruleset: KeepRuleSet,
     ) -> None:
@@ -1105,15 +1294,13 @@ class TLSProtocolMarker(ProtocolMarker):
         self.logger.debug("Generating fallback keep rules (single-packet TLS messages)")
 
         for packet in tls_packets:
-            layers = packet.get("_source", {}).get("layers", {})
-
             # 提取基础信息（对齐Masker 的本地stream_id与canonical方向）
-            src_ip, src_port, dst_ip, dst_port = self._get_endpoints_from_layers(layers)
+            src_ip, src_port, dst_ip, dst_port = self._get_endpoints(packet)
             local_stream_id = self._get_local_stream_id_from_values(src_ip, src_port, dst_ip, dst_port)
             direction = self._determine_direction_from_values(local_stream_id, src_ip, src_port, dst_ip, dst_port)
 
-            frame_number = self._get_first_value(layers.get("frame.number"))
-            tcp_seq_raw = self._get_first_value(layers.get("tcp.seq_raw"))
+            frame_number = packet.first("frame_number")
+            tcp_seq_raw = packet.first("tcp_seq_raw")
 
             if not all([local_stream_id, frame_number, tcp_seq_raw is not None]):
                 continue
@@ -1140,18 +1327,14 @@ class TLSProtocolMarker(ProtocolMarker):
 
                 if self._is_applicationdata_fragment(packet):
                     # ApplicationData片段：完全掩码（不生成保留规则）
-                    ct = layers.get("tls.record.content_type", [])
-                    if not isinstance(ct, list):
-                        ct = [ct] if ct else []
-                    payload_hex = self._get_tcp_payload_hex(packet)
                     self.logger.warning(
                         "FallbackTLS: ApplicationData fragment -> skip keep rule: frame=%s, sid=%s, dir=%s, ct=%s, seg_present=%s, payload_prefix=%s",
                         frame_number,
                         local_stream_id,
                         direction,
-                        ct,
-                        bool(layers.get("tls.segment.data")),
-                        (payload_hex[:10] if payload_hex else ""),
+                        list(packet.tls_record_content_type),
+                        bool(packet.tls_segment_data),
+                        tcp_payload[:10],
                     )
                     continue
                 else:
@@ -1170,9 +1353,7 @@ class TLSProtocolMarker(ProtocolMarker):
                 self.logger.debug(f"Detected TLS record start: Frame {frame_number}")
 
                 # 【解决方案3A】：验证TLS内容类型与载荷的一致性
-                content_types = layers.get("tls.record.content_type", [])
-                if content_types and not isinstance(content_types, list):
-                    content_types = [content_types]
+                content_types = packet.tls_record_content_type
 
                 if not content_types:
                     self.logger.debug(
@@ -1180,8 +1361,8 @@ class TLSProtocolMarker(ProtocolMarker):
                     )
 
                 for content_type in content_types:
-                    if content_type and str(content_type).isdigit():
-                        type_num = int(content_type)
+                    if isinstance(content_type, int):
+                        type_num = content_type
 
                         # 验证TLS类型与载荷头部的一致性
                         if not self._validate_tls_type_consistency(tcp_payload, type_num):
@@ -1210,26 +1391,21 @@ class TLSProtocolMarker(ProtocolMarker):
 
     def _create_simple_packet_rule(
         self,
-        packet: Dict[str, Any],
+        packet: TsharkFieldRecord,
         tcp_flows: Dict[str, Dict[str, Any]],
         tls_type: int,
     ) -> Optional[KeepRule]:
         """为单包TLS消息创建简化规则"""
         try:
-            layers = packet.get("_source", {}).get("layers", {})
-
             # 基于端点 -> 本地 stream_id + canonical 方向/tuple_key
-            src_ip, src_port, dst_ip, dst_port = self._get_endpoints_from_layers(layers)
+            src_ip, src_port, dst_ip, dst_port = self._get_endpoints(packet)
             stream_id = self._get_local_stream_id_from_values(src_ip, src_port, dst_ip, dst_port)
             direction = self._determine_direction_from_values(stream_id, src_ip, src_port, dst_ip, dst_port)
             tuple_key = self._build_tuple_key_from_values(src_ip, src_port, dst_ip, dst_port)
 
-            frame_number = self._get_first_value(layers.get("frame.number"))
-            tcp_seq_raw = self._get_first_value(layers.get("tcp.seq_raw"))
-            tcp_len_raw = self._get_first_value(layers.get("tcp.len", 0))
-
-            tcp_seq = int(tcp_seq_raw) if tcp_seq_raw is not None else 0
-            tcp_len = int(tcp_len_raw) if tcp_len_raw is not None else 0
+            frame_number = packet.first("frame_number")
+            tcp_seq = int(packet.first("tcp_seq_raw") or 0)
+            tcp_len = int(packet.first("tcp_len") or 0)
 
             # 检查是否为TLS-23 ApplicationData且配置为只保留头部
             tls_type_name = TLS_CONTENT_TYPES.get(tls_type, f"unknown_{tls_type}")
@@ -1273,14 +1449,15 @@ class TLSProtocolMarker(ProtocolMarker):
             self.logger.warning(f"Failed to create simplified packet rule: {e}")
             return None
 
-    def _determine_packet_direction(self, packet: Dict[str, Any], flow_info: Optional[Dict[str, Any]]) -> Optional[str]:
+    def _determine_packet_direction(
+        self, packet: TsharkFieldRecord, flow_info: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
         """确定数据包的流方向"""
         if not flow_info:
             return "forward"  # 默认方向
 
-        layers = packet.get("_source", {}).get("layers", {})
-        src_ip = self._get_first_value(layers.get("ip.src")) or self._get_first_value(layers.get("ipv6.src"))
-        src_port = self._get_first_value(layers.get("tcp.srcport"))
+        src_ip = packet.first("ip_src") or packet.first("ipv6_src")
+        src_port = packet.first("tcp_srcport")
 
         directions = flow_info.get("directions", {})
         forward_info = directions.get("forward", {})
@@ -1588,6 +1765,20 @@ class TLSProtocolMarker(ProtocolMarker):
         """获取支持的协议列表"""
         return ["tls", "ssl"]
 
+    def cache_fingerprint(self) -> Optional[Dict[str, Any]]:
+        """规则缓存标识：保留策略、decode-as 规则与 tshark 版本（版本未知时不可缓存）"""
+        if self.tshark_version is None:
+            return None
+        fingerprint = super().cache_fingerprint()
+        fingerprint.update(
+            {
+                "preserve": self.preserve_config,
+                "decode_as": self.decode_as,
+                "tshark_version": self.tshark_version,
+            }
+        )
+        return fingerprint
+
     def _validate_specific_config(self, config: Dict[str, Any]) -> List[str]:
         """验证TLS特定配置"""
         errors = []
@@ -1613,11 +1804,11 @@ class TLSProtocolMarker(ProtocolMarker):
 
         return errors
 
-    def _is_tls_record_start(self, packet_info: Dict[str, Any], payload_hex: str) -> bool:
+    def _is_tls_record_start(self, packet_info: TsharkFieldRecord, payload_hex: str) -> bool:
         """检测是否为TLS记录的开始
 
         Args:
-            packet_info: 包信息字典
+            packet_info: 数据包记录
             payload_hex: TCP载荷的十六进制字符串
 
         Returns:
@@ -1664,46 +1855,33 @@ class TLSProtocolMarker(ProtocolMarker):
         except (ValueError, TypeError):
             return False
 
-    def _is_tls_fragment(self, packet_info: Dict[str, Any]) -> bool:
+    def _is_tls_fragment(self, packet_info: TsharkFieldRecord) -> bool:
         """检测是否为TLS记录片段
 
         Args:
-            packet_info: 包信息字典，包含layers信息
+            packet_info: 数据包记录
 
         Returns:
             bool: True如果是TLS片段，False如果是完整记录或非TLS数据
         """
-        layers = packet_info.get("_source", {}).get("layers", {})
-
         # 检查Wireshark是否将其标记为tls.segment.data
-        if "tls.segment.data" in layers:
-            return True
-
-        # 检查是否有tcp.segments字段（表明TCP层面的重组）
-        if "tcp.segments" in layers:
-            # 进一步检查是否有TLS相关的段信息
-            return self._has_tls_segment_data(layers)
+        return bool(packet_info.tls_segment_data)
 
-        return False
-
-    def _is_applicationdata_fragment(self, packet_info: Dict[str, Any]) -> bool:
+    def _is_applicationdata_fragment(self, packet_info: TsharkFieldRecord) -> bool:
         """检测是否为ApplicationData记录的片段
 
         Args:
-            packet_info: 包信息字典
+            packet_info: 数据包记录
 
         Returns:
             bool: True如果是ApplicationData片段
         """
-        layers = packet_info.get("_source", {}).get("layers", {})
-        frame_no = self._get_first_value(layers.get("frame.number"))
+        frame_no = packet_info.first("frame_number")
 
         # 如果有明确的TLS内容类型且为23，则是ApplicationData
-        content_types = layers.get("tls.record.content_type", [])
+        content_types = packet_info.tls_record_content_type
         if content_types:
-            if not isinstance(content_types, list):
-                content_types = [content_types]
-            is_app23 = any(str(ct) == "23" for ct in content_types)
+            is_app23 = 23 in content_types
             self.logger.debug(f"FragClass frame={frame_no} content_type={content_types} -> appdata={is_app23}")
             return is_app23
 
@@ -1711,58 +1889,46 @@ class TLSProtocolMarker(ProtocolMarker):
         is_frag = self._is_tls_fragment(packet_info)
         if is_frag:
             self.logger.debug(
-                f"FragClass frame={frame_no} no_content_type seg_present={bool(layers.get('tls.segment.data'))} -> default_appdata=True"
+                f"FragClass frame={frame_no} no_content_type seg_present={bool(packet_info.tls_segment_data)} -> default_appdata=True"
             )
             return True
 
         self.logger.debug(f"FragClass frame={frame_no} not_tls_fragment -> appdata=False")
         return False
 
-    def _get_tcp_payload_hex(self, packet: Dict[str, Any]) -> str:
+    def _get_tcp_payload_hex(self, packet: TsharkFieldRecord) -> str:
         """获取TCP载荷的十六进制字符串
 
         Args:
-            packet: 包信息字典
+            packet: 数据包记录
 
         Returns:
             str: TCP载荷的十六进制字符串，如果没有载荷则返回空字符串
         """
-        layers = packet.get("_source", {}).get("layers", {})
-        tcp_payload = layers.get("tcp.payload", "")
-
-        if isinstance(tcp_payload, list):
-            # 如果是列表，取第一个元素
-            tcp_payload = tcp_payload[0] if tcp_payload else ""
-
-        return str(tcp_payload) if tcp_payload else ""
+        return packet.first("tcp_payload") or ""
 
     def _create_full_preserve_rule(
-        self, packet: Dict[str, Any], tcp_flows: Dict[str, Dict[str, Any]]
+        self, packet: TsharkFieldRecord, tcp_flows: Dict[str, Dict[str, Any]]
     ) -> Optional[KeepRule]:
         """为TLS片段创建完全保留规则
 
         Args:
-            packet: 包信息字典
+            packet: 数据包记录
             tcp_flows: TCP流信息
 
         Returns:
             KeepRule: 完全保留规则，如果创建失败则返回None
         """
         try:
-            layers = packet.get("_source", {}).get("layers", {})
-
             # 基于端点 -> 本地 stream_id + canonical 方向/tuple_key
-            src_ip, src_port, dst_ip, dst_port = self._get_endpoints_from_layers(layers)
+            src_ip, src_port, dst_ip, dst_port = self._get_endpoints(packet)
             local_stream_id = self._get_local_stream_id_from_values(src_ip, src_port, dst_ip, dst_port)
             direction = self._determine_direction_from_values(local_stream_id, src_ip, src_port, dst_ip, dst_port)
             tuple_key = self._build_tuple_key_from_values(src_ip, src_port, dst_ip, dst_port)
 
-            frame_number = self._get_first_value(layers.get("frame.number"))
-            tcp_seq_raw = self._get_first_value(layers.get("tcp.seq_raw"))
-            tcp_len_raw = self._get_first_value(layers.get("tcp.len", 0))
-
-            tcp_seq = int(tcp_seq_raw) if tcp_seq_raw is not None else 0
-            tcp_len = int(tcp_len_raw) if tcp_len_raw is not None else 0
+            frame_number = packet.first("frame_number")
+            tcp_seq = int(packet.first("tcp_seq_raw") or 0)
+            tcp_len = int(packet.first("tcp_len") or 0)
 
             # 创建完全保留规则（保留整个TCP载荷）
             rule = KeepRule(
@@ -1817,7 +1983,7 @@ class TLSProtocolMarker(ProtocolMarker):
         except (ValueError, TypeError):
             return False
 
-    def _validate_rule_reasonableness(self, rule: KeepRule, packet: Dict[str, Any], payload_hex: str) -> bool:
+    def _validate_rule_reasonableness(self, rule: KeepRule, packet: TsharkFieldRecord, payload_hex: str) -> bool:
         """验证规则的合理性
 
         Args:
@@ -1829,8 +1995,7 @@ class TLSProtocolMarker(ProtocolMarker):
             bool: True如果规则合理，False如果不合理
         """
         try:
-            layers = packet.get("_source", {}).get("layers", {})
-            tcp_len = int(self._get_first_value(layers.get("tcp.len", 0)))
+            tcp_len = int(packet.first("tcp_len") or 0)
 
             # 1. 检查规则长度的合理性
             rule_length = rule.seq_end - rule.seq_start
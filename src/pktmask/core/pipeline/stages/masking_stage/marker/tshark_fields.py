@@ -0,0 +1,184 @@
+"""
+tshark 字段输出解码
+
+``-T json -e ...`` 为每个数据包输出嵌套的 ``_source.layers`` 对象，字段名在每个包中
+重复出现并带缩进，解析需要完整的 JSON 解码。``-T fields`` 每个包只输出一行以制表符
+分隔的字段值（同一字段的多次出现以逗号聚合），输出量和解析开销都小得多。
+
+:class:`TsharkFieldDecoder` 根据字段列表生成带 ``__slots__`` 的行记录类型，并把每行
+直接解码为记录。属性按字段类型给出该字段所有出现值组成的元组（缺失字段为空元组）：
+整数字段为 int，字节字段为去掉分隔符的十六进制文本，其余为文本。
+``-T json -e`` 输出的 ``layers`` 字典可由 :meth:`TsharkFieldDecoder.decode_layers`
+转换为同一种记录，两种输出格式共用同一套下游逻辑；:meth:`TsharkFieldRecord.layers`
+则反向还原出 ``layers`` 字典。
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type
+
+FIELD_SEPARATOR = "\t"
+FIELD_AGGREGATOR = ","
+
+
+class TsharkFieldsError(ValueError):
+    """tshark 字段输出格式错误（列数与字段列表不一致）"""
+
+
+def _int_value(value: str) -> Any:
+    # 非十进制值保留原文本，与 JSON 路径按字符串判断的语义保持一致
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def _hex_value(value: str) -> str:
+    # 旧版本 tshark 以冒号分隔字节
+    return value.replace(":", "")
+
+
+# 字段类型：未列出的字段按文本处理
+FIELD_TYPES: Dict[str, Callable[[str], Any]] = {
+    "frame.number": _int_value,
+    "tcp.srcport": _int_value,
+    "tcp.dstport": _int_value,
+    "tcp.stream": _int_value,
+    "tcp.seq": _int_value,
+    "tcp.seq_raw": _int_value,
+    "tcp.len": _int_value,
+    "tls.record.content_type": _int_value,
+    "tls.record.opaque_type": _int_value,
+    "tls.record.length": _int_value,
+    "tcp.payload": _hex_value,
+    "tls.app_data": _hex_value,
+    "tls.segment.data": _hex_value,
+}
+
+
+class _TypedField:
+    """记录属性：按字段类型转换该列的所有出现值（缺失字段为空元组）"""
+
+    __slots__ = ("index", "convert")
+
+    def __init__(self, index: int, convert: Callable[[str], Any]):
+        self.index = index
+        self.convert = convert
+
+    def __get__(self, record: Optional["TsharkFieldRecord"], owner: type) -> Any:
+        if record is None:
+            return self
+        column = record[self.index]
+        return tuple(map(self.convert, column.split(FIELD_AGGREGATOR))) if column else ()
+
+
+class TsharkFieldRecord(tuple):
+    """字段输出行记录基类（具体类型由 :class:`TsharkFieldDecoder` 生成）
+
+    与 namedtuple 相同，记录本身是原始列文本组成的元组（``__slots__ = ()``），
+    构造只需一次 ``tuple.__new__``；带类型的值在访问属性时转换，只读取少数字段的
+    过滤逻辑不会为其余列付出转换开销。
+    """
+
+    __slots__ = ()
+
+    # 字段名，顺序与 tshark -e 参数一致
+    FIELDS: Tuple[str, ...] = ()
+
+    def first(self, attr: str) -> Any:
+        """属性的第一个值（字段缺失时为 None）"""
+        values = getattr(self, attr)
+        return values[0] if values else None
+
+    def layers(self) -> Dict[str, List[str]]:
+        """与 ``-T json -e`` 输出等价的 layers 字典（只包含出现的字段，值为原始文本）"""
+        return {field: column.split(FIELD_AGGREGATOR) for field, column in zip(self.FIELDS, self) if column}
+
+    def to_packet(self) -> Dict[str, Any]:
+        """与 ``-T json`` 输出中单个数据包等价的字典"""
+        return {"_source": {"layers": self.layers()}}
+
+    def __repr__(self) -> str:
+        present = ", ".join(f"{field}={column!r}" for field, column in zip(self.FIELDS, self) if column)
+        return f"{self.__class__.__name__}({present})"
+
+
+class TsharkFieldDecoder:
+    """把 ``-T fields`` 输出逐行解码为带类型的行记录"""
+
+    def __init__(self, fields: Sequence[str], optional_fields: Sequence[str] = ()):
+        """
+        Args:
+            fields: 输出字段列表（与 tshark -e 参数顺序一致）
+            optional_fields: 不提取、但记录上仍可访问的字段（属性恒为空元组），使不同
+                字段列表的记录可以由同一段代码处理
+        """
+        self.fields = tuple(fields)
+        absent = tuple(field for field in dict.fromkeys(optional_fields) if field not in self.fields)
+        attrs = tuple(field.replace(".", "_") for field in self.fields + absent)
+        invalid = [field for field, attr in zip(self.fields + absent, attrs) if not attr.isidentifier()]
+        if invalid:
+            raise ValueError(f"Unsupported tshark field names: {invalid}")
+        namespace: Dict[str, Any] = {"__slots__": (), "FIELDS": self.fields}
+        for index, (field, attr) in enumerate(zip(self.fields, attrs)):
+            namespace[attr] = _TypedField(index, FIELD_TYPES.get(field, str))
+        for attr in attrs[len(self.fields) :]:
+            namespace[attr] = ()
+        self.record_type: Type[TsharkFieldRecord] = type("TsharkFieldRow", (TsharkFieldRecord,), namespace)
+
+    def command_args(self) -> List[str]:
+        """tshark 输出参数：``-T fields`` 及分隔符设置和 ``-e`` 字段列表"""
+        args = [
+            "-T",
+            "fields",
+            "-E",
+            "separator=/t",
+            "-E",
+            f"aggregator={FIELD_AGGREGATOR}",
+            "-E",
+            "occurrence=a",
+            "-E",
+            "quote=n",
+            "-E",
+            "header=n",
+        ]
+        for field in self.fields:
+            args.extend(["-e", field])
+        return args
+
+    def decode_line(self, line: str) -> TsharkFieldRecord:
+        """解码一行输出
+
+        Raises:
+            TsharkFieldsError: 列数与字段数量不一致
+        """
+        columns = line.rstrip("\r\n").split(FIELD_SEPARATOR)
+        if len(columns) != len(self.fields):
+            raise TsharkFieldsError(f"Expected {len(self.fields)} tshark fields, got {len(columns)}: {line[:200]!r}")
+        return tuple.__new__(self.record_type, columns)
+
+    def decode_layers(self, layers: Dict[str, Any]) -> TsharkFieldRecord:
+        """把 ``-T json -e`` 输出中单个数据包的 layers 字典转换为记录
+
+        只保留本解码器的字段；值按字段输出的聚合方式拼接为列文本。
+        """
+        columns = []
+        for field in self.fields:
+            value = layers.get(field)
+            if isinstance(value, list):
+                columns.append(FIELD_AGGREGATOR.join(map(str, value)))
+            else:
+                columns.append("" if value is None else str(value))
+        return tuple.__new__(self.record_type, columns)
+
+    def iter_records(self, lines: Iterable[str]) -> Iterator[TsharkFieldRecord]:
+        """逐行解码（跳过空行）"""
+        decode_line = self.decode_line
+        for line in lines:
+            if line.strip("\r\n"):
+                yield decode_line(line)
+
+    def decode_output(self, text: str) -> List[TsharkFieldRecord]:
+        """解码完整的 stdout 文本"""
+        # 按 "\n" 切分：splitlines 还会在其他控制字符处断行
+        return list(self.iter_records(text.split("\n")))
@@ -0,0 +1,220 @@
+"""
+tshark 流式输出读取工具
+
+以管道方式读取 tshark 输出并增量解析（``-T json`` 逐个数组元素，``-T fields``
+逐行），避免将整个 stdout 文本读入内存后再一次性解析。对多GB抓包文件，内存占用
+只与单个数据包对象大小相关。需要多次遍历的结果由 :class:`PacketSpool` 暂存到
+临时文件，而不是保存在内存中。
+"""
+
+from __future__ import annotations
+
+import json
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Type
+
+from .tshark_fields import FIELD_SEPARATOR, TsharkFieldDecoder, TsharkFieldRecord
+
+# 每次从管道读取的字符数
+DEFAULT_READ_CHUNK_SIZE = 1 << 16
+
+_JSON_SEPARATORS = " \t\r\n,"
+
+# 截断的元素在缓冲区末尾附近报错（字面量、数字、转义序列等短 token 被截断），
+# 或报告字符串未结束；距末尾更远的错误是真正的语法错误
+_TRUNCATION_MARGIN = 16
+
+
+def _may_be_truncated(exc: json.JSONDecodeError, length: int) -> bool:
+    """解析错误是否可能只是因为元素尚未读完"""
+    return exc.msg.startswith("Unterminated string") or length - exc.pos <= _TRUNCATION_MARGIN
+
+
+def iter_json_array(stream: TextIO, chunk_size: int = DEFAULT_READ_CHUNK_SIZE) -> Iterator[Any]:
+    """增量解析顶层 JSON 数组，逐个产出数组元素
+
+    适用于 ``tshark -T json`` 输出（``[ {...}, {...} ]``）。缓冲区只保留尚未解析
+    完成的尾部数据；元素不完整时继续读取，其他语法错误立即抛出，不会一直缓冲到
+    输出结束。
+
+    Args:
+        stream: 文本流（如子进程 stdout）
+        chunk_size: 每次读取的字符数
+
+    Yields:
+        数组中的每个元素
+
+    Raises:
+        json.JSONDecodeError: 输出不是合法的 JSON 数组
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+    in_array = False
+
+    while True:
+        # 跳过空白和元素分隔符，必要时补充数据
+        while True:
+            while pos < len(buf) and buf[pos] in _JSON_SEPARATORS:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            chunk = stream.read(chunk_size)
+            if chunk:
+                buf = buf[pos:] + chunk
+                pos = 0
+            else:
+                eof = True
+
+        if pos >= len(buf):
+            # 空输出（tshark 未读到任何帧时可能不输出任何内容）或数组已结束
+            if in_array:
+                raise json.JSONDecodeError("Unterminated JSON array", buf, pos)
+            return
+
+        if not in_array:
+            if buf[pos] != "[":
+                raise json.JSONDecodeError("Expected '[' at start of tshark JSON output", buf, pos)
+            in_array = True
+            pos += 1
+            continue
+
+        if buf[pos] == "]":
+            return
+
+        try:
+            obj, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError as exc:
+            if eof or not _may_be_truncated(exc, len(buf)):
+                raise
+            chunk = stream.read(chunk_size)
+            if chunk:
+                buf = buf[pos:] + chunk
+            else:
+                buf = buf[pos:]
+                eof = True
+            pos = 0
+            continue
+
+        yield obj
+        pos = end
+        if pos >= chunk_size:
+            buf = buf[pos:]
+            pos = 0
+
+
+class PacketSpool:
+    """把逐个产出的行记录暂存到临时文件，供后续按原顺序多次遍历
+
+    只暂存 ``decoder`` 的字段：每条记录写为一行制表符分隔的列文本（与 ``-T fields``
+    输出相同，记录缺少的字段写为空列），回放时由 ``decoder`` 逐行解码，不经过字典或
+    JSON。构造时完整消费 ``records``；迭代时逐行读取，内存占用只与单条记录大小相关。
+    同一时间只支持一个迭代器。
+    """
+
+    def __init__(self, records: Iterable[TsharkFieldRecord], decoder: TsharkFieldDecoder):
+        self._decoder = decoder
+        self._file = tempfile.TemporaryFile(mode="w+", encoding="utf-8")
+        self._count = 0
+        # 记录类型 -> 暂存字段在该类型中的列号（缺少的字段为 None）
+        columns_by_type: Dict[Type[TsharkFieldRecord], List[Optional[int]]] = {}
+        try:
+            for record in records:
+                columns = columns_by_type.get(type(record))
+                if columns is None:
+                    index = {field: i for i, field in enumerate(record.FIELDS)}
+                    columns = columns_by_type[type(record)] = [index.get(field) for field in decoder.fields]
+                self._file.write(FIELD_SEPARATOR.join(record[i] if i is not None else "" for i in columns))
+                self._file.write("\n")
+                self._count += 1
+            self._file.flush()
+        except BaseException:
+            self._file.close()
+            raise
+
+    def __enter__(self) -> "PacketSpool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[TsharkFieldRecord]:
+        self._file.seek(0)
+        return self._decoder.iter_records(self._file)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+@contextmanager
+def _tshark_stdout(cmd: List[str]) -> Iterator[TextIO]:
+    """启动 tshark 并返回其 stdout 管道
+
+    stderr 写入临时文件，避免管道写满导致 tshark 阻塞。正常结束时检查退出码，
+    提前退出（异常或未读完）时终止子进程。
+
+    Raises:
+        subprocess.CalledProcessError: tshark 以非零退出码结束
+    """
+    # Use hidden subprocess to prevent cmd window popup on Windows
+    from ......utils.subprocess_utils import popen_hidden_subprocess
+
+    with tempfile.TemporaryFile(mode="w+", encoding="utf-8", errors="replace") as stderr_file:
+        proc = popen_hidden_subprocess(cmd, stderr=stderr_file)
+        completed = False
+        try:
+            yield proc.stdout
+            # 读取剩余输出，保证进程能够正常退出
+            for _ in iter(lambda: proc.stdout.read(DEFAULT_READ_CHUNK_SIZE), ""):
+                pass
+            completed = True
+        finally:
+            if not completed and proc.poll() is None:
+                proc.kill()
+            proc.stdout.close()
+            returncode = proc.wait()
+
+        if returncode != 0:
+            stderr_file.seek(0)
+            raise subprocess.CalledProcessError(returncode, cmd, stderr=stderr_file.read())
+
+
+@contextmanager
+def tshark_json_stream(cmd: List[str]) -> Iterator[Iterator[Any]]:
+    """启动 tshark 并以迭代器形式逐包返回 ``-T json`` 输出
+
+    Args:
+        cmd: tshark 命令（必须包含 ``-T json``）
+
+    Yields:
+        数据包字典迭代器
+
+    Raises:
+        subprocess.CalledProcessError: tshark 以非零退出码结束
+    """
+    with _tshark_stdout(cmd) as stdout:
+        yield iter_json_array(stdout)
+
+
+@contextmanager
+def tshark_fields_stream(cmd: List[str], decoder: TsharkFieldDecoder) -> Iterator[Iterator[TsharkFieldRecord]]:
+    """启动 tshark 并以迭代器形式逐行返回 ``-T fields`` 输出解码后的记录
+
+    Args:
+        cmd: tshark 命令（输出参数来自 ``decoder.command_args()``）
+        decoder: 与命令字段列表一致的解码器
+
+    Yields:
+        行记录迭代器
+
+    Raises:
+        subprocess.CalledProcessError: tshark 以非零退出码结束
+    """
+    with _tshark_stdout(cmd) as stdout:
+        yield decoder.iter_records(stdout)
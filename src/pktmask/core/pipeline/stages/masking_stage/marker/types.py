@@ -7,7 +7,10 @@ Marker模块数据结构定义
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from .columnar import ColumnarKeepRules
 
 
 @dataclass
@@ -121,17 +124,40 @@ class KeepRuleSet:
     """保留规则集合
 
     包含了对整个PCAP文件进行掩码处理所需的所有保留规则和相关信息。
+    compact() 之后规则只以列式形式（columns）保存，rules 为空。
     """
 
     rules: List[KeepRule] = field(default_factory=list)
     tcp_flows: Dict[str, FlowInfo] = field(default_factory=dict)
     statistics: Dict[str, Any] = field(default_factory=dict)
     metadata: Dict[str, Any] = field(default_factory=dict)
+    columns: Optional["ColumnarKeepRules"] = None
 
     def add_rule(self, rule: KeepRule) -> None:
         """添加保留规则"""
+        if self.columns is not None:
+            raise ValueError("规则集合已压缩为列式存储，不能再添加规则")
         self.rules.append(rule)
 
+    def columnar(self) -> "ColumnarKeepRules":
+        """列式规则表示（已压缩时直接返回，否则按 rules 构建）"""
+        if self.columns is not None:
+            return self.columns
+        from .columnar import ColumnarKeepRules
+
+        return ColumnarKeepRules.from_rules(self.rules)
+
+    def compact(self) -> "ColumnarKeepRules":
+        """转换为列式存储并释放逐条 KeepRule 对象（规则类型与其余元数据不再保留）"""
+        self.columns = self.columnar()
+        self.rules = []
+        return self.columns
+
+    @property
+    def rule_count(self) -> int:
+        """规则数量（包括已压缩的规则）"""
+        return len(self.columns) if self.columns is not None else len(self.rules)
+
     def get_rules_for_stream(self, stream_id: str, direction: str) -> List[KeepRule]:
         """获取指定流和方向的所有规则"""
         return [rule for rule in self.rules if rule.stream_id == stream_id and rule.direction == direction]
@@ -0,0 +1,168 @@
+"""
+Masking checkpoints
+
+A checkpoint records how far the raw engine got through a file: the input
+reader position, the synced output writer position, the flow state that
+decides stream ids and the statistics collected so far. It is written as JSON
+(atomically, via a temporary file) every ``interval_packets`` packets and
+removed once the file is complete. Checkpoints are opt-in and live in a
+directory of their own (``~/.pktmask/checkpoints`` unless configured), so a
+failed run leaves nothing next to the output. Only the in-process raw engine
+can resume; the scapy engine and sharded masking ignore checkpoints.
+
+Stream ids are assigned in order of first appearance, so the flow table is the
+list of flow keys in that order. It is kept in an append-only journal next to
+the checkpoint (one key per line): each save appends only the flows created
+since the previous save and records the journal length in the JSON state,
+which therefore stays small however many flows the capture has.
+
+The checkpoint carries a fingerprint of the input file and the keep rules, so a
+retry or a restarted job only resumes work that was produced from the same
+input with the same rules. The output file itself is verified against the
+saved writer state (size and CRC32 of the written prefix) before resuming.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from ......common.constants import FileConstants
+from ..marker.types import KeepRuleSet
+
+CHECKPOINT_VERSION = 2
+
+
+def keep_rules_fingerprint(keep_rules: KeepRuleSet) -> str:
+    """Digest of everything in a rule set that affects the masked output (its columnar form)"""
+    return hashlib.sha1(keep_rules.columnar().to_bytes()).hexdigest()
+
+
+class MaskingCheckpoint:
+    """Checkpoint file of one input -> output masking run"""
+
+    def __init__(self, path: str, fingerprint: Dict[str, Any], interval_packets: int):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.interval_packets = max(1, int(interval_packets))
+        self.flows_path = f"{path}.flows"
+        # Flows (and journal bytes) covered by the last saved state
+        self.flow_count = 0
+        self._flows_bytes = 0
+        self.saved = 0
+        self.logger = logging.getLogger(f"{self.__class__.__module__}.{self.__class__.__name__}")
+
+    @classmethod
+    def for_run(
+        cls, input_path: str, output_path: str, keep_rules: KeepRuleSet, config: Dict[str, Any]
+    ) -> "MaskingCheckpoint":
+        """Build from the ``checkpoint`` config section (``path``, ``directory``, ``interval_packets``)"""
+        stat = os.stat(input_path)
+        fingerprint = {
+            "version": CHECKPOINT_VERSION,
+            "input_path": os.path.abspath(input_path),
+            "input_size": stat.st_size,
+            "input_mtime_ns": stat.st_mtime_ns,
+            "output_path": os.path.abspath(output_path),
+            "keep_rules": keep_rules_fingerprint(keep_rules),
+        }
+        path = config.get("path")
+        if not path:
+            directory = Path(config.get("directory") or Path.home() / FileConstants.CONFIG_DIR_NAME / "checkpoints")
+            directory.mkdir(parents=True, exist_ok=True)
+            output_key = hashlib.sha1(fingerprint["output_path"].encode("utf-8")).hexdigest()
+            path = str(directory / f"{output_key}.ckpt")
+        return cls(path, fingerprint, config.get("interval_packets", 1_000_000))
+
+    def due(self, processed_packets: int) -> bool:
+        return processed_packets % self.interval_packets == 0
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Saved state if it belongs to this run, else None (stale checkpoints are removed)
+
+        Use :meth:`load_flows` for the flow keys recorded with the state.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except FileNotFoundError:
+            # A journal without a checkpoint belongs to no resumable run
+            self.discard()
+            return None
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable masking checkpoint {self.path}: {e}")
+            self.discard()
+            return None
+
+        if checkpoint.get("fingerprint") != self.fingerprint:
+            self.logger.info(f"Ignoring masking checkpoint of a different input or rule set: {self.path}")
+            self.discard()
+            return None
+        self.flow_count = checkpoint.get("flow_count", 0)
+        self._flows_bytes = checkpoint.get("flows_bytes", 0)
+        return checkpoint["state"]
+
+    def load_flows(self) -> List[str]:
+        """Flow keys of the loaded state in stream id order
+
+        Journal entries appended after the last saved state are dropped.
+
+        Raises:
+            ValueError: The journal is shorter than the saved state says
+        """
+        if not self.flow_count:
+            self._truncate_flows()
+            return []
+        try:
+            with open(self.flows_path, "rb") as f:
+                data = f.read(self._flows_bytes)
+        except OSError as e:
+            raise ValueError(f"Unreadable flow journal {self.flows_path}: {e}") from e
+        flows = data.decode("utf-8").split("\n")[:-1]
+        if len(data) != self._flows_bytes or len(flows) != self.flow_count:
+            raise ValueError(f"Flow journal {self.flows_path} does not match its checkpoint")
+        self._truncate_flows()
+        return flows
+
+    def _truncate_flows(self) -> None:
+        with open(self.flows_path, "ab") as f:
+            f.truncate(self._flows_bytes)
+
+    def save(self, state: Dict[str, Any], new_flows: Iterable[str] = ()) -> None:
+        """Append ``new_flows`` (flows created since the previous save) to the journal, then save ``state``"""
+        data = "".join(f"{key}\n" for key in new_flows).encode("utf-8")
+        if data:
+            with open(self.flows_path, "ab") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            self.flow_count += data.count(b"\n")
+            self._flows_bytes += len(data)
+
+        temp_path = f"{self.path}.tmp"
+        checkpoint = {
+            "fingerprint": self.fingerprint,
+            "flow_count": self.flow_count,
+            "flows_bytes": self._flows_bytes,
+            "state": state,
+        }
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.saved += 1
+
+    def discard(self) -> None:
+        self.flow_count = self._flows_bytes = 0
+        for path in (self.path, f"{self.path}.tmp", self.flows_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.logger.warning(f"Failed to remove masking checkpoint {path}: {e}")
@@ -19,6 +19,14 @@ try:
 except ImportError:
     PcapReader = None
 
+from .....rawpacket.pcap_io import WriteDigest, count_pcap_records
+
+# 输出文件验证方式：
+# - digest: 使用写入时收集的记录数、字节数与CRC32，不重新读取文件
+# - walk: 额外遍历输出文件的记录头核对记录数（只读16字节头，不解析数据包）
+# - paranoid: 用scapy完整重新解析输出文件计数并计算MD5（旧行为）
+OUTPUT_VERIFICATION_MODES = ("digest", "walk", "paranoid")
+
 
 @dataclass
 class ValidationResult:
@@ -57,6 +65,10 @@ class DataValidator:
         self.enable_file_size_validation = config.get("enable_file_size_validation", True)
         self.max_file_size_mb = config.get("max_file_size_mb", 1024)  # 1GB默认限制
         self.min_file_size_bytes = config.get("min_file_size_bytes", 24)  # PCAP文件头最小大小
+        self.output_verification = config.get("output_verification", "digest")
+        if self.output_verification not in OUTPUT_VERIFICATION_MODES:
+            self.logger.warning(f"未知的输出验证方式 {self.output_verification!r}，使用 digest")
+            self.output_verification = "digest"
 
         self.logger.info(f"数据验证器初始化: 校验和验证={'启用' if self.enable_checksum_validation else '禁用'}")
 
@@ -120,19 +132,27 @@ class DataValidator:
         return result
 
     def validate_output_file(
-        self, file_path: Union[str, Path], expected_packet_count: Optional[int] = None
+        self,
+        file_path: Union[str, Path],
+        expected_packet_count: Optional[int] = None,
+        write_digest: Optional[WriteDigest] = None,
     ) -> ValidationResult:
         """验证输出文件
 
+        提供 write_digest 时，包数量与校验和直接取自写入过程中收集的计数，文件只检查
+        大小与文件头；未提供时（或 paranoid 模式）才重新读取整个文件。
+
         Args:
             file_path: 文件路径
             expected_packet_count: 期望的数据包数量
+            write_digest: 写入输出文件时收集的计数与校验和
 
         Returns:
             ValidationResult: 验证结果
         """
         file_path = Path(file_path)
         result = ValidationResult(is_valid=True)
+        paranoid = self.output_verification == "paranoid"
 
         try:
             # 1. 检查文件是否存在
@@ -146,24 +166,47 @@ class DataValidator:
             if file_size < self.min_file_size_bytes:
                 return ValidationResult(is_valid=False, error_message=f"输出文件太小: {file_size} bytes")
 
-            # 3. 验证PCAP文件格式
-            pcap_validation = self._validate_pcap_format(file_path)
+            # 3. 验证PCAP文件格式（非 paranoid 模式只检查文件头）
+            pcap_validation = self._validate_pcap_format(file_path, sample_packets=paranoid)
             if not pcap_validation.is_valid:
                 return pcap_validation
 
             result.details.update(pcap_validation.details)
 
-            # 4. 验证数据包数量
+            # 4. 核对写入计数：文件大小必须等于写入的字节数
+            if write_digest is not None:
+                result.details.update(write_digest.to_dict())
+                if file_size != write_digest.bytes_written:
+                    return ValidationResult(
+                        is_valid=False,
+                        error_message=f"输出文件大小与写入字节数不一致: {file_size} != {write_digest.bytes_written}",
+                        details=result.details,
+                    )
+
+            # 5. 验证数据包数量
             if self.enable_packet_count_validation and expected_packet_count is not None:
-                # 重新完整计算包数量，而不是使用格式验证时的部分计数
-                actual_count = self._count_packets_in_file(file_path)
+                if paranoid:
+                    # 重新完整解析文件计算包数量
+                    actual_count = self._count_packets_in_file(file_path)
+                    count_source = "scapy"
+                elif self.output_verification == "walk" or write_digest is None:
+                    actual_count = self._walk_packets_in_file(file_path)
+                    count_source = "record_walk"
+                else:
+                    actual_count = write_digest.records
+                    count_source = "write_digest"
                 result.details["packet_count"] = actual_count
+                result.details["packet_count_source"] = count_source
 
                 if actual_count != expected_packet_count:
                     result.warnings.append(f"数据包数量不匹配: 期望{expected_packet_count}, 实际{actual_count}")
+                if write_digest is not None and actual_count != write_digest.records:
+                    result.warnings.append(
+                        f"输出文件记录数与写入数不一致: 写入{write_digest.records}, 实际{actual_count}"
+                    )
 
-            # 5. 计算文件校验和
-            if self.enable_checksum_validation:
+            # 6. 计算文件校验和（有写入计数时使用写入过程中的CRC32）
+            if self.enable_checksum_validation and (paranoid or write_digest is None):
                 result.details["file_checksum"] = self._calculate_file_checksum(file_path)
 
             self.logger.debug(f"输出文件验证通过: {file_path}")
@@ -241,8 +284,13 @@ class DataValidator:
 
         return result
 
-    def _validate_pcap_format(self, file_path: Path) -> ValidationResult:
-        """验证PCAP文件格式"""
+    def _validate_pcap_format(self, file_path: Path, sample_packets: bool = True) -> ValidationResult:
+        """验证PCAP文件格式
+
+        Args:
+            file_path: PCAP文件路径
+            sample_packets: 是否用scapy解析前10个数据包做进一步验证
+        """
         result = ValidationResult(is_valid=True)
 
         try:
@@ -267,7 +315,7 @@ class DataValidator:
                 result.details["linktype"] = linktype
 
             # 如果有scapy，进行更详细的验证
-            if PcapReader is not None:
+            if sample_packets and PcapReader is not None:
                 try:
                     packet_count = 0
                     with PcapReader(str(file_path)) as reader:
@@ -313,6 +361,21 @@ class DataValidator:
             self.logger.warning(f"计算包数量失败: {e}")
             return 0
 
+    def _walk_packets_in_file(self, file_path: Path) -> int:
+        """遍历记录头计算数据包数量（不解析数据包）
+
+        Args:
+            file_path: PCAP文件路径
+
+        Returns:
+            数据包数量，无法遍历时返回0
+        """
+        try:
+            return count_pcap_records(str(file_path))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"遍历记录头失败: {e}")
+            return 0
+
     def _calculate_file_checksum(self, file_path: Path) -> str:
         """计算文件校验和"""
         hash_md5 = hashlib.md5()
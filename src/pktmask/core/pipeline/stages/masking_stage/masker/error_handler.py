@@ -7,12 +7,15 @@ Provides comprehensive exception handling, error recovery and error reporting me
 from __future__ import annotations
 
 import logging
+import os
+import sys
 import time
 import traceback
+from collections import deque
 from dataclasses import dataclass, field
 from enum import Enum
 from pathlib import Path
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
 
 
 class ErrorSeverity(Enum):
@@ -50,12 +53,50 @@ class ErrorInfo:
     recovery_attempted: bool = False
     recovery_successful: bool = False
     recovery_details: Optional[str] = None
+    # (category, error type, site) the error is aggregated under
+    signature: Optional[Tuple[str, str, str]] = None
+    # False once the signature has used up its full samples (no traceback, not logged or kept)
+    sampled: bool = True
+
+
+@dataclass
+class ErrorGroup:
+    """Aggregated occurrences of one error signature"""
+
+    category: ErrorCategory
+    error_type: str
+    site: str
+    count: int = 0
+    first_seen: float = 0.0
+    last_seen: float = 0.0
+    first_message: str = ""
+    last_message: str = ""
+
+
+def _error_site(error: Union[Exception, str]) -> str:
+    """Where an error originated: innermost traceback frame, or the caller of handle_error for messages"""
+    tb = getattr(error, "__traceback__", None)
+    if tb is not None:
+        while tb.tb_next is not None:
+            tb = tb.tb_next
+        code = tb.tb_frame.f_code
+        return f"{os.path.basename(code.co_filename)}:{code.co_name}:{tb.tb_lineno}"
+    # Frames: _error_site <- handle_error <- caller
+    frame = sys._getframe(2)
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}:{frame.f_lineno}"
 
 
 class ErrorRecoveryHandler:
     """Error recovery handler
 
     Provides comprehensive exception handling, error recovery and error reporting mechanisms.
+
+    Errors are aggregated by (category, exception type, site). Only the first
+    ``error_samples_per_group`` occurrences of a signature are logged in full,
+    kept with their traceback in the bounded ``error_history`` and written to
+    the error log file; later ones are counted in ``error_groups`` and logged
+    at the 10th, 100th, 1000th... repeat. Error log file entries are written
+    in batches of ``error_log_batch_size``.
     """
 
     def __init__(self, config: Dict[str, Any]):
@@ -73,12 +114,20 @@ class ErrorRecoveryHandler:
         self.enable_auto_recovery = config.get("enable_auto_recovery", True)
         self.fail_fast = config.get("fail_fast", False)  # 是否快速失败
         self.error_log_file = config.get("error_log_file", None)
+        self.max_error_history = config.get("max_error_history", 1000)
+        self.error_samples_per_group = config.get("error_samples_per_group", 5)
+        self.error_log_batch_size = max(1, config.get("error_log_batch_size", 100))
 
         # 内部状态
-        self.error_history: List[ErrorInfo] = []
+        self.error_history: Deque[ErrorInfo] = deque(maxlen=self.max_error_history)
+        self.error_groups: Dict[Tuple[str, str, str], ErrorGroup] = {}
         self.recovery_handlers: Dict[ErrorCategory, List[Callable]] = {}
         self.error_count_by_category: Dict[ErrorCategory, int] = {}
         self.total_errors = 0
+        self.suppressed_errors = 0
+        self.recoveries_attempted = 0
+        self.recoveries_succeeded = 0
+        self._pending_log_entries: List[str] = []
 
         # 注册默认的恢复处理器
         self._register_default_recovery_handlers()
@@ -108,26 +157,48 @@ class ErrorRecoveryHandler:
         Returns:
             ErrorInfo: Error information object
         """
-        # Create error information
+        now = time.time()
+        message = str(error)
+        is_exception = isinstance(error, Exception)
+        error_type = type(error).__name__ if is_exception else "message"
+        site = _error_site(error)
+        signature = (category.value, error_type, site)
+
+        # Aggregate by signature
+        group = self.error_groups.get(signature)
+        if group is None:
+            group = self.error_groups[signature] = ErrorGroup(category, error_type, site, first_seen=now)
+            group.first_message = message
+        group.count += 1
+        group.last_seen = now
+        group.last_message = message
+        sampled = group.count <= self.error_samples_per_group
+
+        # Create error information (tracebacks are only formatted for sampled errors)
         error_info = ErrorInfo(
-            timestamp=time.time(),
+            timestamp=now,
             severity=severity,
             category=category,
-            message=str(error),
-            exception=error if isinstance(error, Exception) else None,
-            traceback_str=(traceback.format_exc() if isinstance(error, Exception) else None),
+            message=message,
+            exception=error if is_exception else None,
+            traceback_str=(traceback.format_exc() if is_exception and sampled else None),
             context=context or {},
+            signature=signature,
+            sampled=sampled,
         )
 
-        # Log error
-        self._log_error(error_info)
-
         # Update statistics
         self.total_errors += 1
         self.error_count_by_category[category] = self.error_count_by_category.get(category, 0) + 1
 
-        # Add to history
-        self.error_history.append(error_info)
+        if sampled:
+            # Log error and add to history
+            self._log_error(error_info)
+            self.error_history.append(error_info)
+        else:
+            self.suppressed_errors += 1
+            if self._is_log_milestone(group.count):
+                self._log_repeated_error(error_info, group)
 
         # Attempt recovery
         if attempt_recovery and self.enable_auto_recovery:
@@ -210,6 +281,28 @@ class ErrorRecoveryHandler:
 
         raise last_exception
 
+    @staticmethod
+    def _is_log_milestone(count: int) -> bool:
+        """True at 10, 100, 1000... occurrences"""
+        while count >= 10 and count % 10 == 0:
+            count //= 10
+        return count == 1
+
+    def _log_repeated_error(self, error_info: ErrorInfo, group: ErrorGroup):
+        """Log a summary line for a signature whose full records are no longer kept"""
+        log_message = (
+            f"[{error_info.category.value.upper()}] {error_info.message} "
+            f"(repeated {group.count} times at {group.site}, further repeats are only counted)"
+        )
+        if error_info.severity == ErrorSeverity.LOW:
+            self.logger.debug(log_message)
+        elif error_info.severity == ErrorSeverity.MEDIUM:
+            self.logger.warning(log_message)
+        elif error_info.severity == ErrorSeverity.HIGH:
+            self.logger.error(log_message)
+        else:  # CRITICAL
+            self.logger.critical(log_message)
+
     def _log_error(self, error_info: ErrorInfo):
         """Log error information"""
         log_message = f"[{error_info.category.value.upper()}] {error_info.message}"
@@ -239,6 +332,7 @@ class ErrorRecoveryHandler:
     def _attempt_recovery(self, error_info: ErrorInfo):
         """Attempt error recovery"""
         error_info.recovery_attempted = True
+        self.recoveries_attempted += 1
 
         # 获取对应类别的恢复处理器
         handlers = self.recovery_handlers.get(error_info.category, [])
@@ -247,14 +341,17 @@ class ErrorRecoveryHandler:
             try:
                 if handler(error_info):
                     error_info.recovery_successful = True
+                    self.recoveries_succeeded += 1
                     error_info.recovery_details = f"通过处理器 {handler.__name__} 恢复成功"
-                    self.logger.info(f"错误恢复成功: {error_info.recovery_details}")
+                    if error_info.sampled:
+                        self.logger.info(f"错误恢复成功: {error_info.recovery_details}")
                     return
             except Exception as recovery_error:
                 self.logger.warning(f"恢复处理器 {handler.__name__} 执行失败: {recovery_error}")
 
         error_info.recovery_details = "所有恢复尝试均失败"
-        self.logger.warning(f"错误恢复失败: {error_info.message}")
+        if error_info.sampled:
+            self.logger.warning(f"错误恢复失败: {error_info.message}")
 
     def _register_default_recovery_handlers(self):
         """注册默认的恢复处理器"""
@@ -295,23 +392,53 @@ class ErrorRecoveryHandler:
         self.register_recovery_handler(ErrorCategory.OUTPUT_ERROR, file_error_recovery)
 
     def _write_error_log_file(self, error_info: ErrorInfo):
-        """Write error log file"""
+        """Queue an error log file entry, writing the queue once a batch is full"""
+        lines = [
+            f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(error_info.timestamp))}\n",
+            f"Severity: {error_info.severity.value}\n",
+            f"Category: {error_info.category.value}\n",
+            f"Message: {error_info.message}\n",
+        ]
+        if error_info.context:
+            lines.append(f"Context: {error_info.context}\n")
+        if error_info.traceback_str:
+            lines.append(f"Stack trace:\n{error_info.traceback_str}\n")
+        lines.append("-" * 80 + "\n")
+        self._pending_log_entries.append("".join(lines))
+        if len(self._pending_log_entries) >= self.error_log_batch_size:
+            self.flush_error_log(include_summary=False)
+
+    def flush_error_log(self, include_summary: bool = True):
+        """Write queued error log file entries
+
+        Args:
+            include_summary: Also append the counts of signatures with suppressed repeats
+        """
+        if not self.error_log_file:
+            return
+        entries = self._pending_log_entries
+        if include_summary and self.suppressed_errors:
+            summary = [f"{time.strftime('%Y-%m-%d %H:%M:%S')}\nRepeated errors (only the first samples logged):\n"]
+            for group in self.error_groups.values():
+                if group.count > self.error_samples_per_group:
+                    summary.append(
+                        f"  {group.count}x [{group.category.value}] {group.error_type} at {group.site}: "
+                        f"{group.last_message}\n"
+                    )
+            summary.append("-" * 80 + "\n")
+            entries.append("".join(summary))
+        if not entries:
+            return
         try:
             log_file = Path(self.error_log_file)
             log_file.parent.mkdir(parents=True, exist_ok=True)
 
             with open(log_file, "a", encoding="utf-8") as f:
-                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(error_info.timestamp))}\n")
-                f.write(f"Severity: {error_info.severity.value}\n")
-                f.write(f"Category: {error_info.category.value}\n")
-                f.write(f"Message: {error_info.message}\n")
-                if error_info.context:
-                    f.write(f"Context: {error_info.context}\n")
-                if error_info.traceback_str:
-                    f.write(f"Stack trace:\n{error_info.traceback_str}\n")
-                f.write("-" * 80 + "\n")
+                f.write("".join(entries))
         except Exception as e:
             self.logger.warning(f"Failed to write error log file: {e}")
+        finally:
+            entries.clear()
 
     def get_error_summary(self) -> Dict[str, Any]:
         """获取错误摘要"""
@@ -326,25 +453,46 @@ class ErrorRecoveryHandler:
                     "message": error.message,
                     "recovery_successful": error.recovery_successful,
                 }
-                for error in self.error_history[-10:]  # 最近10个错误
+                for error in list(self.error_history)[-10:]  # 最近10个错误
             ],
             "recovery_success_rate": self._calculate_recovery_success_rate(),
+            "suppressed_errors": self.suppressed_errors,
+            "error_groups": [
+                {
+                    "category": group.category.value,
+                    "error_type": group.error_type,
+                    "site": group.site,
+                    "count": group.count,
+                    "first_seen": group.first_seen,
+                    "last_seen": group.last_seen,
+                    "first_message": group.first_message,
+                }
+                for group in sorted(self.error_groups.values(), key=lambda g: g.count, reverse=True)[:20]
+            ],
         }
 
     def _calculate_recovery_success_rate(self) -> float:
         """计算恢复成功率"""
-        attempted_recoveries = [e for e in self.error_history if e.recovery_attempted]
-        if not attempted_recoveries:
+        if not self.recoveries_attempted:
             return 0.0
+        return self.recoveries_succeeded / self.recoveries_attempted
 
-        successful_recoveries = [e for e in attempted_recoveries if e.recovery_successful]
-        return len(successful_recoveries) / len(attempted_recoveries)
+    def reset(self):
+        """开始处理新文件：重复错误按文件分组，错误日志中的汇总只包含当前文件"""
+        self.flush_error_log(include_summary=False)
+        self.error_groups.clear()
+        self.suppressed_errors = 0
 
     def clear_error_history(self):
         """清空错误历史"""
+        self.flush_error_log()
         self.error_history.clear()
+        self.error_groups.clear()
         self.error_count_by_category.clear()
         self.total_errors = 0
+        self.suppressed_errors = 0
+        self.recoveries_attempted = 0
+        self.recoveries_succeeded = 0
         self.logger.info("错误历史已清空")
 
 
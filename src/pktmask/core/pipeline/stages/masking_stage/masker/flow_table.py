@@ -0,0 +1,48 @@
+"""
+TCP flow table for payload masking
+
+Maps the packed directional 4-tuple of a TCP segment (see
+``rawpacket.frame.TcpFrameInfo.flow_key``) to everything the masker derives
+from it: the numeric stream id, the canonical direction and the keep-rule
+data for that flow direction. The string keys and rule lookups are computed
+once, when a flow direction is first seen; every later segment costs one
+dict lookup.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+
+
+class FlowEntry:
+    """Resolved state of one flow direction"""
+
+    __slots__ = ("stream_id", "tuple_key", "direction", "rule_data", "has_rules", "cursor")
+
+    def __init__(self, stream_id: str, tuple_key: str, direction: str, rule_data: Dict[str, Any], has_rules: bool):
+        self.stream_id = stream_id
+        self.tuple_key = tuple_key
+        self.direction = direction
+        self.rule_data = rule_data
+        # False when rule_data is the empty placeholder used for full masking
+        self.has_rules = has_rules
+        # RuleCursor over rule_data, created with the first payload-carrying segment
+        self.cursor = None
+
+
+class FlowTable:
+    """Flow directions seen in one masking run, bound to that run's rule lookup"""
+
+    def __init__(self, rule_lookup: Dict[str, Any]):
+        self.rule_lookup = rule_lookup
+        self._entries: Dict[bytes, FlowEntry] = {}
+
+    def get(self, flow_key: bytes) -> Optional[FlowEntry]:
+        return self._entries.get(flow_key)
+
+    def add(self, flow_key: bytes, entry: FlowEntry) -> FlowEntry:
+        self._entries[flow_key] = entry
+        return entry
+
+    def __len__(self) -> int:
+        return len(self._entries)
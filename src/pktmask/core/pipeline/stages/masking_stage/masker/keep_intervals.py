@@ -0,0 +1,183 @@
+"""
+Keep-interval algebra for payload masking
+
+Keep rules are half-open sequence ranges ``[start, end)``. For one TCP segment
+they are clipped to payload offsets, combined into a sorted list of disjoint
+intervals and applied with one slice copy per interval into a zeroed buffer,
+so no work is done per payload byte in Python.
+"""
+
+from __future__ import annotations
+
+from bisect import bisect_right
+from operator import le
+from typing import Iterable, List, Sequence, Tuple
+
+from ..marker.columnar import RangeView
+
+Interval = Tuple[int, int]
+
+
+def clip_to_segment(ranges: Iterable[Interval], seg_start: int, seg_end: int) -> List[Interval]:
+    """Clip sequence ranges to a segment and convert them to payload offsets
+
+    Args:
+        ranges: Keep ranges in sequence-number space
+        seg_start: Sequence number of the first payload byte
+        seg_end: Sequence number after the last payload byte
+
+    Returns:
+        Non-empty ``[left, right)`` payload offsets, in input order
+    """
+    clipped = []
+    for keep_start, keep_end in ranges:
+        left = keep_start if keep_start > seg_start else seg_start
+        right = keep_end if keep_end < seg_end else seg_end
+        if left < right:
+            clipped.append((left - seg_start, right - seg_start))
+    return clipped
+
+
+def union_intervals(intervals: List[Interval]) -> List[Interval]:
+    """Sorted, disjoint union of half-open intervals (adjacent ones are joined)"""
+    if len(intervals) < 2:
+        return list(intervals)
+    intervals = sorted(intervals)
+    merged = [intervals[0]]
+    for start, end in intervals[1:]:
+        last_start, last_end = merged[-1]
+        if start <= last_end:
+            if end > last_end:
+                merged[-1] = (last_start, end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_intervals(intervals: List[Interval], removed: List[Interval]) -> List[Interval]:
+    """Parts of sorted disjoint ``intervals`` not covered by sorted disjoint ``removed``"""
+    result = []
+    index = 0
+    for start, end in intervals:
+        while index < len(removed) and removed[index][1] <= start:
+            index += 1
+        cursor = start
+        probe = index
+        while probe < len(removed) and removed[probe][0] < end:
+            cut_start, cut_end = removed[probe]
+            if cut_start > cursor:
+                result.append((cursor, cut_start))
+            if cut_end > cursor:
+                cursor = cut_end
+            probe += 1
+        if cursor < end:
+            result.append((cursor, end))
+    return result
+
+
+def covered_length(intervals: Iterable[Interval]) -> int:
+    """Total length of disjoint intervals"""
+    return sum(end - start for start, end in intervals)
+
+
+def apply_keep_intervals(payload: bytes, keep: List[Interval]) -> bytes:
+    """Zero every payload byte outside the disjoint ``keep`` offsets"""
+    length = len(payload)
+    if not keep:
+        return bytes(length)
+    if len(keep) == 1 and keep[0][0] == 0 and keep[0][1] >= length:
+        return bytes(payload)
+    buf = bytearray(length)
+    view = memoryview(payload)
+    for left, right in keep:
+        buf[left:right] = view[left:right]
+    return bytes(buf)
+
+
+def first_ending_after(ranges: List[Interval], seq: int) -> int:
+    """Index of the first range in start-sorted ``ranges`` whose end is after ``seq`` (binary search)"""
+    left, right = 0, len(ranges)
+    while left < right:
+        mid = (left + right) // 2
+        if ranges[mid][1] > seq:
+            right = mid
+        else:
+            left = mid + 1
+    return left
+
+
+def ends_sorted(ends: Sequence[int]) -> bool:
+    """Whether range ends never decrease (what binary search and RuleCursor need besides sorted starts)"""
+    return all(map(le, ends, ends[1:]))
+
+
+def _columns(ranges) -> Tuple[Sequence[int], Sequence[int]]:
+    """Start and end columns of keep ranges (shared with a RangeView, split from a list of tuples)"""
+    if isinstance(ranges, RangeView):
+        return ranges.starts, ranges.ends
+    return [start for start, _ in ranges], [end for _, end in ranges]
+
+
+def _advance(
+    starts: Sequence[int], ends: Sequence[int], index: int, seg_start: int, seg_end: int
+) -> Tuple[int, List[Interval]]:
+    """Skip ranges ending at or before ``seg_start`` and collect the ones overlapping the segment"""
+    count = len(ends)
+    while index < count and ends[index] <= seg_start:
+        index += 1
+    overlapping = []
+    probe = index
+    while probe < count and starts[probe] < seg_end:
+        if ends[probe] > seg_start:
+            overlapping.append((starts[probe], ends[probe]))
+        probe += 1
+    return index, overlapping
+
+
+class RuleCursor:
+    """Position in the start-sorted keep ranges of one flow direction
+
+    Segments of a flow mostly arrive in increasing sequence order, so the
+    cursor only moves forward past ranges that ended before the current
+    segment: amortized O(1) per segment. The first segment, and any segment
+    starting before the previous one (retransmission, reordering, or the
+    sequence number wrapping at 2**32), positions the cursor with a binary
+    search. Like that search, the cursor expects range ends to be sorted too;
+    the masker guarantees this by merging ranges whose ends are out of order.
+
+    Ranges given as :class:`RangeView` are read straight from their columns.
+    """
+
+    __slots__ = (
+        "_header_starts",
+        "_header_ends",
+        "_full_starts",
+        "_full_ends",
+        "_header_index",
+        "_full_index",
+        "_last_start",
+        "reseeks",
+    )
+
+    def __init__(self, header_ranges: Sequence[Interval], full_ranges: Sequence[Interval]):
+        self._header_starts, self._header_ends = _columns(header_ranges)
+        self._full_starts, self._full_ends = _columns(full_ranges)
+        self._header_index = 0
+        self._full_index = 0
+        self._last_start = None
+        self.reseeks = 0
+
+    def overlapping(self, seg_start: int, seg_end: int) -> Tuple[List[Interval], List[Interval]]:
+        """Header-only and full-preserve ranges overlapping ``[seg_start, seg_end)``"""
+        if self._last_start is None or seg_start < self._last_start:
+            if self._last_start is not None:
+                self.reseeks += 1
+            self._header_index = bisect_right(self._header_ends, seg_start)
+            self._full_index = bisect_right(self._full_ends, seg_start)
+        self._last_start = seg_start
+
+        self._header_index, header = _advance(
+            self._header_starts, self._header_ends, self._header_index, seg_start, seg_end
+        )
+        self._full_index, full = _advance(self._full_starts, self._full_ends, self._full_index, seg_start, seg_end)
+        return header, full
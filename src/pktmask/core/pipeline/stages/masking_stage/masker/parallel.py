@@ -0,0 +1,318 @@
+"""
+Flow-sharded parallel masking
+
+Splits the masking of one capture across worker processes. The main process
+keeps reading, classifying and resolving flows in packet order (so stream ids
+and directions are assigned exactly as in single-process mode) and sends each
+payload-carrying TCP segment to the worker owning its flow. Flows are assigned
+to workers by a hash of the canonical (direction-independent) 4-tuple, and a
+worker receives the keep rules of a flow direction together with its first
+segment, so it only ever holds the rules of its own flows.
+
+Workers mask the payload, patch the frame and recompute the checksum, then
+return the rewritten records by record index. ``OrderedMerger`` writes records
+in their original order as soon as every earlier record is resolved, so the
+output is byte-identical to the single-process raw engine.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import queue
+import zlib
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .....rawpacket.frame import TcpFrameInfo, rewrite_tcp_payload
+from .flow_table import FlowEntry
+from .stats import MaskingStats
+
+# Segments per message sent to a worker
+SHARD_BATCH_SIZE = 512
+# Batches a worker may have queued or in progress before the reader waits for it
+MAX_BATCHES_IN_FLIGHT = 4
+# Records the merger may hold back per worker before the reader waits for results
+MAX_SHARD_BACKLOG_PER_WORKER = 2 * SHARD_BATCH_SIZE * MAX_BATCHES_IN_FLIGHT
+# Seconds between worker liveness checks while waiting for results
+RESULT_POLL_INTERVAL = 0.5
+
+
+def flow_shard(flow_key: bytes, shards: int) -> int:
+    """Shard of a packed directional 4-tuple; both directions of a flow map to the same shard"""
+    forward = flow_key[0:4] + flow_key[8:10]
+    backward = flow_key[4:8] + flow_key[10:12]
+    canonical = forward + backward if forward <= backward else backward + forward
+    return zlib.crc32(canonical) % shards
+
+
+def _rewrite_frame(data: bytes, ip_offset: int, tcp_offset: int, payload_offset: int, segment_end: int, payload):
+    frame = bytearray(data)
+    rewrite_tcp_payload(
+        frame,
+        tcp_offset,
+        segment_end,
+        payload_offset,
+        payload,
+        data[ip_offset + 12 : ip_offset + 16],
+        data[ip_offset + 16 : ip_offset + 20],
+    )
+    return bytes(frame)
+
+
+def _shard_worker(shard: int, config: Dict[str, Any], tasks, results) -> None:
+    """Worker process: mask the segments of the flows assigned to ``shard``
+
+    Messages put on ``results``: ``("batch", shard, batch_id, rewritten, errors)``
+    per task, ``("done", shard, preserved_bytes, masked_bytes)`` after the stop
+    sentinel, or ``("failed", shard, message)`` if the worker cannot continue.
+    """
+    try:
+        from .payload_masker import PayloadMasker
+
+        masker = PayloadMasker(config)
+        stats = MaskingStats(success=True)
+        masker._current_stats = stats
+        flows: Dict[int, FlowEntry] = {}
+
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            batch_id, new_flows, segments = task
+            for ordinal, stream_id, tuple_key, direction, rule_data, has_rules in new_flows:
+                flows[ordinal] = FlowEntry(stream_id, tuple_key, direction, rule_data, has_rules)
+
+            rewritten = {}
+            errors = []
+            for index, data, ip_offset, tcp_offset, payload_offset, segment_end, seq, ordinal in segments:
+                try:
+                    new_payload = masker._mask_flow_payload(flows[ordinal], data[payload_offset:], seq)
+                    if new_payload is not None:
+                        rewritten[index] = _rewrite_frame(
+                            data, ip_offset, tcp_offset, payload_offset, segment_end, new_payload
+                        )
+                except Exception as e:
+                    errors.append((index, f"{type(e).__name__}: {e}"))
+            results.put(("batch", shard, batch_id, rewritten, errors))
+
+        results.put(("done", shard, stats.preserved_bytes, stats.masked_bytes))
+    except Exception as e:
+        results.put(("failed", shard, f"{type(e).__name__}: {e}"))
+
+
+class ShardPool:
+    """Worker processes masking TCP segments, one per flow shard
+
+    ``submit`` queues a segment for its flow's worker; every finished batch is
+    handed to ``on_result`` as ``(indices, rewritten, errors)``. Results are
+    only received inside ``submit``, ``poll``, ``wait`` and ``close``, always on
+    the calling thread.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        config: Dict[str, Any],
+        on_result: Callable[..., None],
+        batch_size: int = SHARD_BATCH_SIZE,
+        max_in_flight: int = MAX_BATCHES_IN_FLIGHT,
+    ):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self._on_result = on_result
+
+        context = multiprocessing.get_context()
+        self._results = context.Queue()
+        self._tasks = []
+        self._processes = []
+        try:
+            for shard in range(workers):
+                tasks = context.Queue()
+                process = context.Process(
+                    target=_shard_worker,
+                    args=(shard, config, tasks, self._results),
+                    name=f"pktmask-mask-shard-{shard}",
+                    daemon=True,
+                )
+                process.start()
+                self._tasks.append(tasks)
+                self._processes.append(process)
+        except Exception:
+            self.abort()
+            raise
+
+        self._batches: List[list] = [[] for _ in range(workers)]
+        self._new_flows: List[list] = [[] for _ in range(workers)]
+        self._in_flight = [0] * workers
+        self._batch_indices: Dict[int, List[int]] = {}
+        self._next_batch_id = 0
+        # FlowEntry (identity) -> (shard, ordinal) for flow directions already sent
+        self._flow_slots: Dict[FlowEntry, Tuple[int, int]] = {}
+        self.outstanding = 0
+        self.preserved_bytes = 0
+        self.masked_bytes = 0
+        self.batches_sent = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            try:
+                self.close()
+            except BaseException:
+                self.abort()
+                raise
+        else:
+            self.abort()
+
+    def submit(self, index: int, data: bytes, info: TcpFrameInfo, flow: FlowEntry) -> None:
+        """Queue a payload-carrying segment of ``flow`` for masking"""
+        slot = self._flow_slots.get(flow)
+        if slot is None:
+            shard = flow_shard(info.flow_key, self.workers)
+            slot = self._flow_slots[flow] = (shard, len(self._flow_slots))
+            self._new_flows[shard].append(
+                (slot[1], flow.stream_id, flow.tuple_key, flow.direction, flow.rule_data, flow.has_rules)
+            )
+        shard, ordinal = slot
+        batch = self._batches[shard]
+        batch.append(
+            (index, data, info.ip_offset, info.tcp_offset, info.payload_offset, info.segment_end, info.seq, ordinal)
+        )
+        self.outstanding += 1
+        if len(batch) >= self.batch_size:
+            self._send(shard)
+
+    def flush(self) -> None:
+        """Send all partially filled batches"""
+        for shard in range(self.workers):
+            if self._batches[shard]:
+                self._send(shard)
+
+    def poll(self) -> None:
+        """Handle the results that have already arrived, without waiting"""
+        while self._receive(timeout=None):
+            pass
+
+    def wait(self) -> None:
+        """Block until at least one result arrives (partial batches must be flushed first)"""
+        while not self._receive(timeout=RESULT_POLL_INTERVAL):
+            self._check_workers()
+
+    def close(self) -> None:
+        """Mask everything submitted, stop the workers and collect their byte counters"""
+        self.flush()
+        while self.outstanding:
+            self.wait()
+        for tasks in self._tasks:
+            tasks.put(None)
+        remaining = set(range(self.workers))
+        while remaining:
+            try:
+                message = self._results.get(timeout=RESULT_POLL_INTERVAL)
+            except queue.Empty:
+                self._check_workers(remaining)
+                continue
+            kind, shard = message[0], message[1]
+            if kind == "done":
+                self.preserved_bytes += message[2]
+                self.masked_bytes += message[3]
+                remaining.discard(shard)
+            elif kind == "failed":
+                raise RuntimeError(f"Masking worker {shard} failed: {message[2]}")
+        for process in self._processes:
+            process.join()
+
+    def abort(self) -> None:
+        """Terminate the workers without waiting for pending work"""
+        for tasks in self._tasks:
+            tasks.cancel_join_thread()
+        for process in self._processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self._processes:
+            process.join()
+
+    def _send(self, shard: int) -> None:
+        while self._in_flight[shard] >= self.max_in_flight:
+            self.wait()
+        batch = self._batches[shard]
+        batch_id = self._next_batch_id
+        self._next_batch_id += 1
+        self._batch_indices[batch_id] = [segment[0] for segment in batch]
+        self._tasks[shard].put((batch_id, self._new_flows[shard], batch))
+        self._batches[shard] = []
+        self._new_flows[shard] = []
+        self._in_flight[shard] += 1
+        self.batches_sent += 1
+
+    def _receive(self, timeout: Optional[float]) -> bool:
+        try:
+            if timeout is None:
+                message = self._results.get_nowait()
+            else:
+                message = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return False
+
+        kind, shard = message[0], message[1]
+        if kind == "failed":
+            raise RuntimeError(f"Masking worker {shard} failed: {message[2]}")
+        if kind != "batch":
+            raise RuntimeError(f"Unexpected message from masking worker {shard}: {kind}")
+        _, _, batch_id, rewritten, errors = message
+        indices = self._batch_indices.pop(batch_id)
+        self._in_flight[shard] -= 1
+        self.outstanding -= len(indices)
+        self._on_result(indices, rewritten, errors)
+        return True
+
+    def _check_workers(self, shards=None) -> None:
+        for shard in range(self.workers) if shards is None else shards:
+            process = self._processes[shard]
+            if not process.is_alive():
+                raise RuntimeError(f"Masking worker {shard} exited unexpectedly (exit code {process.exitcode})")
+
+
+class OrderedMerger:
+    """Writes records in capture order while some of them are still being masked
+
+    Records are added in index order; those handed to a worker are marked
+    pending and hold back the output until ``complete`` resolves them.
+    """
+
+    def __init__(self, writer):
+        self._writer = writer
+        self._queue: deque = deque()
+        self._pending = set()
+        self._rewritten: Dict[int, bytes] = {}
+
+    def __len__(self) -> int:
+        """Records added but not yet written"""
+        return len(self._queue)
+
+    def add(self, index: int, record, data: bytes, pending: bool = False) -> None:
+        self._queue.append((index, record, data))
+        if pending:
+            self._pending.add(index)
+        else:
+            self.release()
+
+    def complete(self, index: int, data: Optional[bytes]) -> None:
+        """Resolve a pending record; ``data`` None keeps the bytes it was added with"""
+        self._pending.discard(index)
+        if data is not None:
+            self._rewritten[index] = data
+
+    def release(self) -> None:
+        """Write every leading record that is no longer pending"""
+        records, pending, writer = self._queue, self._pending, self._writer
+        while records:
+            index, record, data = records[0]
+            if index in pending:
+                return
+            records.popleft()
+            data = self._rewritten.pop(index, data)
+            writer.write_record(data, record.sec, record.usec, record.wirelen)
@@ -7,18 +7,21 @@ Universal payload masking processor based on TCP_MARKER_REFERENCE algorithm.
 from __future__ import annotations
 
 import logging
+import os
+import sys
 import time
 from collections import defaultdict
+from itertools import chain, islice
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 
 try:
-    from scapy.all import IP, TCP, PcapReader, PcapWriter, Raw
+    from scapy.all import IP, TCP, Padding, PcapReader, PcapWriter, Raw, conf
 
     SCAPY_AVAILABLE = True
 except ImportError:
     # Scapy may not be available in test environment
-    PcapReader = PcapWriter = IP = TCP = Raw = None
+    PcapReader = PcapWriter = IP = TCP = Raw = Padding = conf = None
     SCAPY_AVAILABLE = False
 
 # Try to import tunnel protocol support (optional)
@@ -27,11 +30,46 @@ try:
 except ImportError:
     vxlan = geneve = None
 
+from ......common.constants import ProcessingConstants
+from ......infrastructure.logging import HotPathTracer
+from .....rawpacket.frame import (
+    PASS_THROUGH,
+    TCP_SEGMENT,
+    FrameClassifier,
+    TcpFrameInfo,
+    pack_flow_key,
+    rewrite_tcp_payload,
+)
+from .....rawpacket.pcap_io import (
+    DigestingFile,
+    RawCaptureReader,
+    RawPcapWriter,
+    SyncPolicy,
+    SyncTracker,
+    WriteDigest,
+    detect_capture_format,
+    dissect_record,
+    scapy_output_linktype,
+    sync_file,
+)
 from ....resource_manager import ResourceManager
+from ..marker.columnar import DIRECTIONS, FULL_PRESERVE, HEADER_ONLY, ColumnarKeepRules, RangeView
 from ..marker.types import KeepRuleSet
+from .checkpoint import MaskingCheckpoint
 from .data_validator import DataValidator
 from .error_handler import ErrorCategory, ErrorRecoveryHandler, ErrorSeverity
 from .fallback_handler import FallbackHandler
+from .flow_table import FlowEntry, FlowTable
+from .keep_intervals import (
+    RuleCursor,
+    apply_keep_intervals,
+    clip_to_segment,
+    covered_length,
+    ends_sorted,
+    subtract_intervals,
+    union_intervals,
+)
+from .parallel import MAX_SHARD_BACKLOG_PER_WORKER, OrderedMerger, ShardPool
 from .stats import MaskingStats
 
 
@@ -50,6 +88,8 @@ class PayloadMasker:
         """
         self.config = config
         self.logger = logging.getLogger(f"{self.__class__.__module__}.{self.__class__.__name__}")
+        # Per-packet / per-flow diagnostics (PKTMASK_TRACE, or "trace_sample_rate" in config)
+        self._trace = HotPathTracer(self.logger, config.get("trace_sample_rate"))
 
         # Note: Remove sequence number state management, use absolute sequence numbers directly
         # self.seq_state = defaultdict(lambda: {"last": None, "epoch": 0})
@@ -59,11 +99,31 @@ class PayloadMasker:
         self.stream_id_cache = {}  # Cache stream_id for packets
         self.flow_id_counter = 0  # Flow ID counter, simulating tshark's tcp.stream
         self.tuple_to_stream_id = {}  # Mapping from five-tuple to stream_id
+        self._flow_table: Optional[FlowTable] = None  # Packed 4-tuple -> resolved flow direction
+        self._output_digest: Optional[WriteDigest] = None  # Counters collected while writing the output
+        self._checkpoint: Optional[MaskingCheckpoint] = None  # Checkpoint file of the current raw-engine run
 
         # Configuration parameters
         self.chunk_size = config.get("chunk_size", 1000)
         self.verify_checksums = config.get("verify_checksums", True)
         self.mask_byte_value = config.get("mask_byte_value", 0x00)
+        # Payload rewrite mode: "inplace" patches the captured frame bytes, "deepcopy" rebuilds via scapy
+        self.payload_rewrite_mode = config.get("payload_rewrite_mode", "inplace")
+        # Packet engine: "raw" parses headers from record bytes and only dissects exotic
+        # frames with scapy, "scapy" dissects every packet, "auto" uses raw when the file allows it
+        self.masking_engine = config.get("masking_engine", "auto")
+        # Worker processes for the raw engine: 1 masks in-process, "auto" uses one per
+        # spare CPU for captures larger than ProcessingConstants.PARALLEL_MASKING_MIN_BYTES
+        self.masking_workers = config.get("masking_workers", 1)
+        # Output writer: records are buffered in memory and written in large chunks,
+        # fsync only on close unless sync_every_bytes / sync_every_packets is set
+        writer_config = config.get("output_writer", {})
+        self.output_buffer_size = writer_config.get("buffer_size", 4 * 1024 * 1024)
+        self.output_sync_policy = SyncPolicy.from_config(writer_config)
+        # Checkpoints (opt-in): the in-process raw engine periodically saves its position so
+        # that a retry or a restarted job resumes there instead of starting the file over
+        self.checkpoint_config = config.get("checkpoint", {})
+        self.enable_checkpoints = self.checkpoint_config.get("enabled", False)
 
         # 性能优化配置
         self.enable_performance_monitoring = config.get("enable_performance_monitoring", True)
@@ -130,6 +190,9 @@ class PayloadMasker:
         self.flow_directions.clear()
         self.stream_id_cache.clear()
         self.tuple_to_stream_id.clear()
+        self._flow_table = None
+        self._output_digest = None
+        self._checkpoint = None
 
         # Reset flow ID counter
         self.flow_id_counter = 0
@@ -235,11 +298,17 @@ class PayloadMasker:
             def process_file():
                 with (
                     PcapReader(input_path) as reader,
-                    PcapWriter(output_path, sync=True) as writer,
+                    PcapWriter(output_path, sync=False, bufsz=self.output_buffer_size) as writer,
                 ):
+                    self._output_digest = WriteDigest()
+                    writer.f = DigestingFile(writer.f, self._output_digest)
+                    sync_tracker = SyncTracker(self.output_sync_policy)
                     for packet in reader:
                         stats.processed_packets += 1
 
+                        if stats.processed_packets == 1:
+                            self._bind_writer_linktype(writer, packet)
+
                         try:
                             # Process single packet
                             modified_packet, packet_modified = self._process_packet(packet, rule_lookup)
@@ -265,7 +334,7 @@ class PayloadMasker:
                         if self.resource_manager.should_flush_buffer("packet_buffer"):
                             # Flush buffer and write
                             buffered_packets = self.resource_manager.flush_buffer("packet_buffer")
-                            self._write_packets_to_file(buffered_packets, writer)
+                            self._write_packets_to_file(buffered_packets, writer, sync_tracker)
 
                         # 定期报告进度
                         if stats.processed_packets % self.chunk_size == 0:
@@ -282,10 +351,27 @@ class PayloadMasker:
                     # 写入剩余的缓冲区数据包
                     remaining_packets = self.resource_manager.flush_buffer("packet_buffer")
                     if remaining_packets:
-                        self._write_packets_to_file(remaining_packets, writer)
+                        self._write_packets_to_file(remaining_packets, writer, sync_tracker)
+                    if self.output_sync_policy.fsync_on_close:
+                        sync_file(writer.f)
+
+            def process_file_raw():
+                self._process_file_raw(input_path, output_path, rule_lookup, stats)
 
             # Execute file processing with retry mechanism
-            self.error_handler.retry_operation(process_file, error_category=ErrorCategory.INPUT_ERROR)
+            use_raw_engine = self._should_use_raw_engine(input_path)
+            stats.performance_metrics["masking_engine"] = "raw" if use_raw_engine else "scapy"
+            if use_raw_engine:
+                self._checkpoint = self._create_checkpoint(input_path, output_path, keep_rules)
+            elif self.enable_checkpoints:
+                self.logger.warning(
+                    f"Masking checkpoints are ignored for {input_path}: only the raw engine can resume, "
+                    f"a retry of the scapy engine starts from the first packet"
+                )
+            self.error_handler.retry_operation(
+                process_file_raw if use_raw_engine else process_file,
+                error_category=ErrorCategory.INPUT_ERROR,
+            )
 
             # 3. 验证处理状态
             self.logger.info("Validating processing state...")
@@ -310,7 +396,7 @@ class PayloadMasker:
             # 4. 验证输出文件
             self.logger.info("Validating output file...")
             output_validation = self.data_validator.validate_output_file(
-                output_path, expected_packet_count=stats.processed_packets
+                output_path, expected_packet_count=stats.processed_packets, write_digest=self._output_digest
             )
 
             if not output_validation.is_valid:
@@ -403,13 +489,18 @@ class PayloadMasker:
         finally:
             # Clear current statistics reference
             self._current_stats = None
+            # Write the batched error log entries of this file
+            self.error_handler.flush_error_log()
 
         return stats
 
     def _preprocess_keep_rules(self, keep_rules: KeepRuleSet) -> Dict[str, Dict[str, Dict]]:
         """Preprocess keep rules to build efficient lookup structure
 
-        Based on TCP_MARKER_REFERENCE.md interval pre-computation algorithm, build optimized lookup structure for each flow direction.
+        Rules are read in columnar form (see ``marker.columnar``): the header_only and
+        full_preserve ranges of a flow direction are RangeViews sharing the rule columns,
+        and the stream_id and tuple_key keys of a flow resolve to the same rule data.
+        Only keys covering several interned flows get merged copies.
 
         Args:
             keep_rules: Keep rule set
@@ -417,79 +508,64 @@ class PayloadMasker:
         Returns:
             Dict[flow_id, Dict[direction, lookup_structure]]
         """
-        rule_lookup = defaultdict(lambda: defaultdict(lambda: {"header_only": [], "full_preserve": []}))
-
-        # Group rules by flow, direction and preservation strategy
-        for rule in keep_rules.rules:
-            preserve_strategy = rule.metadata.get("preserve_strategy", "full_preserve")
-
-            # Map strategy names: map 'full_message' to 'full_preserve'
-            if preserve_strategy == "full_message":
-                preserve_strategy = "full_preserve"
-            elif preserve_strategy not in ["header_only", "full_preserve"]:
-                # For unknown strategies, default to full_preserve
-                self.logger.warning(f"Unknown preserve strategy '{preserve_strategy}', using 'full_preserve' instead")
-                preserve_strategy = "full_preserve"
-
-            # Insert by stream_id
-            rule_lookup[rule.stream_id][rule.direction][preserve_strategy].append((rule.seq_start, rule.seq_end))
-            # Also insert by tuple_key (if provided) to tolerate stream_id numbering drift
-            tuple_key = None
-            meta = getattr(rule, "metadata", {}) or {}
-            tuple_key = meta.get("tuple_key")
-            if tuple_key:
-                rule_lookup[tuple_key][rule.direction][preserve_strategy].append((rule.seq_start, rule.seq_end))
-
-        # 为每个流方向构建优化的查找结构
-        processed_lookup = {}
-        for stream_id, directions in rule_lookup.items():
-            processed_lookup[stream_id] = {}
-
-            for direction, strategy_groups in directions.items():
-                # Process rules for different preservation strategies separately
-                header_only_ranges = strategy_groups["header_only"]
-                full_preserve_ranges = strategy_groups["full_preserve"]
-
-                # 处理full_preserve规则（可以合并）
-                if full_preserve_ranges:
-                    merged_full_ranges = self._merge_overlapping_ranges(full_preserve_ranges)
-                else:
-                    merged_full_ranges = []
-
-                # 构建分离的查找结构
-                all_ranges = header_only_ranges + merged_full_ranges
-                sorted_ranges = sorted(all_ranges)
-
-                # 构建边界点集合（保持向后兼容）
-                bounds = sorted(set(point for start, end in all_ranges for point in [start, end]))
-
-                # 构建保留区间集合（保持向后兼容）
-                keep_set = set(all_ranges)
-
-                processed_lookup[stream_id][direction] = {
-                    "bounds": bounds,
-                    "keep_set": keep_set,
-                    "sorted_ranges": sorted_ranges,
-                    "range_count": len(all_ranges),
-                    # 新增：分离的策略组
-                    "header_only_ranges": header_only_ranges,
-                    "full_preserve_ranges": merged_full_ranges,
-                }
+        columns = keep_rules.columnar()
+        if columns.unknown_strategies:
+            self.logger.warning(
+                f"{columns.unknown_strategies} rules with unknown preserve strategy, using 'full_preserve' instead"
+            )
 
-                total_original_ranges = len(header_only_ranges) + len(full_preserve_ranges)
-                self.logger.debug(
-                    f"Flow {stream_id}:{direction} - "
-                    f"original ranges: {total_original_ranges}, after merge: {len(all_ranges)}, "
-                    f"header_only: {len(header_only_ranges)}, full_preserve: {len(merged_full_ranges)}, "
-                    f"boundary points: {len(bounds)}"
-                )
+        # Lookup key (stream_id, and tuple_key if provided to tolerate stream_id numbering drift)
+        # -> direction -> interned flows
+        flows_by_key = defaultdict(lambda: defaultdict(list))
+        for flow, direction in dict.fromkeys((flow, direction) for flow, direction, _ in columns.groups):
+            stream_id, tuple_key = columns.flows[flow]
+            flows_by_key[stream_id][direction].append(flow)
+            if tuple_key and tuple_key != stream_id:
+                flows_by_key[tuple_key][direction].append(flow)
+
+        processed_lookup = {}
+        shared_rule_data: Dict[Tuple[Tuple[int, ...], int], Dict[str, Any]] = {}
+        for key, directions in flows_by_key.items():
+            processed_lookup[key] = {}
+            for direction, flows in directions.items():
+                shared_key = (tuple(flows), direction)
+                rule_data = shared_rule_data.get(shared_key)
+                if rule_data is None:
+                    rule_data = shared_rule_data[shared_key] = self._build_rule_data(columns, flows, direction)
+                processed_lookup[key][DIRECTIONS[direction]] = rule_data
 
         return processed_lookup
 
+    def _build_rule_data(self, columns: ColumnarKeepRules, flows: List[int], direction: int) -> Dict[str, Any]:
+        """Rule data of one flow direction from the column groups of ``flows``"""
+        header_views = [view for view in (columns.ranges(flow, direction, HEADER_ONLY) for flow in flows) if view]
+        full_views = [view for view in (columns.ranges(flow, direction, FULL_PRESERVE) for flow in flows) if view]
+
+        # Binary search and rule cursors need starts and ends both sorted. Views are sorted by start;
+        # ranges nested in a longer one (e.g. HTTP headers of varying length) break the end order
+        # and are merged. Kept bytes are the union of the ranges, so merging does not change them.
+        header_only_ranges = self._sorted_range_view(header_views)
+        full_preserve_ranges = self._sorted_range_view(full_views)
+
+        return {
+            "range_count": len(header_only_ranges) + len(full_preserve_ranges),
+            "header_only_ranges": header_only_ranges,
+            "full_preserve_ranges": full_preserve_ranges,
+        }
+
+    def _sorted_range_view(self, views: List[RangeView]) -> RangeView:
+        """One RangeView with sorted starts and ends (the single view itself when already sorted)"""
+        if len(views) == 1 and ends_sorted(views[0].ends):
+            return views[0]
+        return RangeView.from_pairs(self._merge_overlapping_ranges(list(chain.from_iterable(views))))
+
     def _debug_log_rule_miss(self, stream_id: str, tuple_key: str, direction: str, rule_lookup: Dict) -> None:
+        # Flows without keep rules are normal (they are fully masked), so this is a sampled trace
+        if not (self._trace.enabled and self._trace.sample()):
+            return
         try:
-            available_streams = list(rule_lookup.keys())
-            self.logger.warning(
+            available_streams = list(islice(rule_lookup, 11))
+            self._trace.log(
                 f"No rule for stream_id={stream_id}, tuple_key={tuple_key}, dir={direction}. "
                 f"Available keys={available_streams[:10]}{'...' if len(available_streams)>10 else ''}"
             )
@@ -543,74 +619,12 @@ class PayloadMasker:
                 # Non-TCP packet, return as-is
                 return packet, False
 
-            # Build stream identifier and tuple key (order-invariant)
-            stream_id = self._build_stream_id(ip_layer, tcp_layer)
-            tuple_key = self._build_tuple_key(ip_layer, tcp_layer)
-
-            # Determine flow direction
-            direction = self._determine_flow_direction(ip_layer, tcp_layer, stream_id)
-
-            # Add debug logging
-            src_info = f"{ip_layer.src}:{tcp_layer.sport}"
-            dst_info = f"{ip_layer.dst}:{tcp_layer.dport}"
-            self.logger.debug(
-                f"Processing packet: {src_info}->{dst_info}, stream_id={stream_id}, direction={direction}"
-            )
-
             # Get TCP payload
             payload = bytes(tcp_layer.payload) if tcp_layer.payload else b""
-            if not payload:
-                # No payload, return as-is
+            new_payload = self._compute_masked_payload(ip_layer, tcp_layer, payload, rule_lookup)
+            if new_payload is None:
                 return packet, False
 
-            # Use absolute sequence numbers directly, no 64-bit conversion
-            seq_start = tcp_layer.seq
-            seq_end = tcp_layer.seq + len(payload)
-
-            # Get matching rule data, with tuple-key fallback if stream_id mapping differs
-            rule_data = None
-            if tuple_key in rule_lookup and direction in rule_lookup[tuple_key]:
-                rule_data = rule_lookup[tuple_key][direction]
-                self.logger.debug(f"Found matching rule by tuple_key: {tuple_key}, direction={direction}")
-            elif stream_id in rule_lookup and direction in rule_lookup[stream_id]:
-                rule_data = rule_lookup[stream_id][direction]
-                self.logger.debug(f"Found matching rule by stream_id: {stream_id}, direction={direction}")
-            if rule_data is None and tuple_key in rule_lookup:
-                # Combine all directions under tuple_key as a direction-agnostic fallback
-                combined_header = []
-                combined_full = []
-                try:
-                    for dkey, groups in rule_lookup[tuple_key].items():
-                        combined_header.extend(groups.get("header_only", []))
-                        combined_full.extend(groups.get("full_preserve", []))
-                except Exception:
-                    pass
-                if combined_header or combined_full:
-                    rule_data = {
-                        "header_only_ranges": combined_header,
-                        "full_preserve_ranges": combined_full,
-                    }
-                    self.logger.debug(f"Using direction-agnostic fallback rule set for tuple_key={tuple_key}")
-
-            if rule_data is None:
-                # No matching rules, use empty rule data (will result in full masking)
-                rule_data = {"header_only_ranges": [], "full_preserve_ranges": []}
-                self._debug_log_rule_miss(stream_id, tuple_key, direction, rule_lookup)
-
-            # Apply keep rules (for cases with no rules, full masking will be executed)
-            new_payload = self._apply_keep_rules(payload, seq_start, seq_end, rule_data)
-
-            # Check if payload has changed
-            if new_payload is None or new_payload == payload:
-                # If _apply_keep_rules returns None or unmodified, but we need to ensure full masking
-                if rule_data["header_only_ranges"] == [] and rule_data["full_preserve_ranges"] == []:
-                    # No keep rules, execute full masking
-                    new_payload = b"\x00" * len(payload)
-                    self.logger.debug(f"Performing full masking: {len(payload)} bytes")
-                else:
-                    # Has rules but unmodified, return as-is
-                    return packet, False
-
             # Modify packet payload
             modified_packet = self._modify_packet_payload(packet, tcp_layer, new_payload)
             return modified_packet, True
@@ -619,78 +633,148 @@ class PayloadMasker:
             self.logger.warning(f"Packet processing failed: {e}")
             return packet, False
 
-    def _find_innermost_tcp(self, packet) -> Tuple[Optional[Any], Optional[Any]]:
-        """递归查找最内层的 TCP/IP 层
+    def _compute_masked_payload(self, ip_layer, tcp_layer, payload: bytes, rule_lookup: Dict) -> Optional[bytes]:
+        """Compute the masked payload of a TCP segment
 
-        支持多层封装剥离：VLAN/QinQ、MPLS、GRE、ERSPAN、NVGRE、VXLAN、GENEVE 等
+        Shared by the scapy path and the raw-bytes path: ``ip_layer`` only needs
+        ``src``/``dst`` and ``tcp_layer`` only ``sport``/``dport``/``seq``, so the raw
+        path passes its parsed header view for both.
 
         Args:
-            packet: 数据包
+            ip_layer: IP layer (or header view)
+            tcp_layer: TCP layer (or header view)
+            payload: TCP payload bytes
+            rule_lookup: Preprocessed rule lookup structure
 
         Returns:
-            Tuple[TCP层, IP层] 或 (None, None)
+            New payload, or None if the packet stays unchanged
         """
-        if not packet:
-            return (None, None)
+        flow = self._lookup_flow(ip_layer, tcp_layer, rule_lookup)
 
-        current = packet
-        ip_layer = None
-        tcp_layer = None
-        max_depth = 10  # 防止无限递归
-        depth = 0
+        if not payload:
+            # No payload, return as-is
+            return None
 
-        # Recursively traverse all layers, supporting multiple tunnel protocols
-        while current and depth < max_depth:
-            depth += 1
+        return self._mask_flow_payload(flow, payload, tcp_layer.seq)
 
-            # 检查是否找到 IP 层
-            if hasattr(current, "haslayer") and IP and current.haslayer(IP):
-                ip_layer = current[IP]
+    def _mask_flow_payload(self, flow: FlowEntry, payload: bytes, seq: int) -> Optional[bytes]:
+        """Mask a non-empty payload of a resolved flow direction
 
-            # 检查是否找到 TCP 层
-            if hasattr(current, "haslayer") and TCP and current.haslayer(TCP):
-                tcp_layer = current[TCP]
-                break
+        Args:
+            flow: Flow table entry of the segment
+            payload: TCP payload bytes
+            seq: Sequence number of the first payload byte
 
-            # Handle special tunnel protocols
-            if hasattr(current, "name"):
-                layer_name = current.name
-
-                # VXLAN 隧道
-                if layer_name == "VXLAN" and hasattr(current, "payload"):
-                    current = current.payload
-                    continue
-
-                # GENEVE 隧道
-                elif layer_name == "GENEVE" and hasattr(current, "payload"):
-                    current = current.payload
-                    continue
-
-                # GRE 隧道
-                elif layer_name == "GRE" and hasattr(current, "payload"):
-                    current = current.payload
-                    continue
-
-                # MPLS 标签
-                elif layer_name == "MPLS" and hasattr(current, "payload"):
-                    current = current.payload
-                    continue
-
-                # VLAN 标签
-                elif layer_name in ("Dot1Q", "Dot1AD") and hasattr(current, "payload"):
-                    current = current.payload
-                    continue
-
-            # 继续到下一层
-            if hasattr(current, "payload") and current.payload:
-                current = current.payload
+        Returns:
+            New payload, or None if the packet stays unchanged
+        """
+        # Use absolute sequence numbers directly, no 64-bit conversion
+        seq_start = seq
+        seq_end = seq + len(payload)
+        rule_data = flow.rule_data
+
+        # Apply keep rules (for cases with no rules, full masking will be executed)
+        if flow.cursor is None:
+            flow.cursor = RuleCursor(rule_data["header_only_ranges"], rule_data["full_preserve_ranges"])
+        new_payload = self._apply_keep_rules(payload, seq_start, seq_end, rule_data, flow.cursor)
+
+        # Check if payload has changed
+        if new_payload is None or new_payload == payload:
+            # If _apply_keep_rules returns None or unmodified, but we need to ensure full masking
+            if not flow.has_rules:
+                # No keep rules, execute full masking
+                new_payload = b"\x00" * len(payload)
+                if self._trace.enabled and self._trace.sample():
+                    self._trace.log(f"Performing full masking: flow {flow.stream_id}, {len(payload)} bytes")
             else:
-                break
+                # Has rules but unmodified, return as-is
+                return None
+
+        return new_payload
 
-        if depth >= max_depth:
-            self.logger.warning(f"Reached maximum recursion depth {max_depth}, possible circular reference")
+    def _lookup_flow(self, ip_layer, tcp_layer, rule_lookup: Dict) -> FlowEntry:
+        """Return the flow table entry of a segment's flow direction, creating it on first sight
 
-        return (tcp_layer, ip_layer) if tcp_layer and ip_layer else (None, None)
+        Args:
+            ip_layer: IP layer (or header view)
+            tcp_layer: TCP layer (or header view)
+            rule_lookup: Preprocessed rule lookup structure
+
+        Returns:
+            FlowEntry with stream id, direction and resolved rule data
+        """
+        flow_table = self._flow_table
+        if flow_table is None or flow_table.rule_lookup is not rule_lookup:
+            flow_table = self._flow_table = FlowTable(rule_lookup)
+
+        if isinstance(tcp_layer, TcpFrameInfo):
+            flow_key = tcp_layer.flow_key
+        else:
+            flow_key = pack_flow_key(str(ip_layer.src), str(ip_layer.dst), int(tcp_layer.sport), int(tcp_layer.dport))
+        flow = flow_table.get(flow_key)
+        if flow is None:
+            flow = flow_table.add(flow_key, self._resolve_flow(ip_layer, tcp_layer, rule_lookup))
+        return flow
+
+    def _resolve_flow(self, ip_layer, tcp_layer, rule_lookup: Dict) -> FlowEntry:
+        """Build stream id, canonical direction and rule data for a new flow direction"""
+        # Build stream identifier and tuple key (order-invariant)
+        stream_id = self._build_stream_id(ip_layer, tcp_layer)
+        tuple_key = self._build_tuple_key(ip_layer, tcp_layer)
+
+        # Determine flow direction
+        direction = self._determine_flow_direction(ip_layer, tcp_layer, stream_id)
+        trace = self._trace.enabled and self._trace.sample()
+        if trace:
+            self._trace.log(
+                f"New flow direction: {ip_layer.src}:{tcp_layer.sport}->{ip_layer.dst}:{tcp_layer.dport}, "
+                f"stream_id={stream_id}, direction={direction}"
+            )
+
+        # Get matching rule data, with tuple-key fallback if stream_id mapping differs.
+        # The preprocessed lookup has no per-direction "header_only"/"full_preserve"
+        # groups, so there is no direction-agnostic fallback to build.
+        rule_data = None
+        if tuple_key in rule_lookup and direction in rule_lookup[tuple_key]:
+            rule_data = rule_lookup[tuple_key][direction]
+            if trace:
+                self._trace.log(f"Found matching rule by tuple_key: {tuple_key}, direction={direction}")
+        elif stream_id in rule_lookup and direction in rule_lookup[stream_id]:
+            rule_data = rule_lookup[stream_id][direction]
+            if trace:
+                self._trace.log(f"Found matching rule by stream_id: {stream_id}, direction={direction}")
+
+        if rule_data is None:
+            # No matching rules, use empty rule data (will result in full masking)
+            rule_data = {"header_only_ranges": [], "full_preserve_ranges": []}
+            self._debug_log_rule_miss(stream_id, tuple_key, direction, rule_lookup)
+
+        has_rules = bool(rule_data["header_only_ranges"] or rule_data["full_preserve_ranges"])
+        return FlowEntry(stream_id, tuple_key, direction, rule_data, has_rules)
+
+    def _find_innermost_tcp(self, packet) -> Tuple[Optional[Any], Optional[Any]]:
+        """查找数据包中的 TCP/IP 层
+
+        VLAN/QinQ、MPLS、GRE、ERSPAN、NVGRE、VXLAN、GENEVE 等封装由 scapy 解析为
+        嵌套层，各取第一次出现的 TCP 层和 IPv4 层；每层只遍历一次（getlayer），
+        不再对每个封装层重复 haslayer 查找。
+
+        Args:
+            packet: 数据包
+
+        Returns:
+            Tuple[TCP层, IP层] 或 (None, None)
+        """
+        if packet is None or not TCP:
+            return (None, None)
+
+        tcp_layer = packet.getlayer(TCP)
+        if tcp_layer is None:
+            return (None, None)
+        ip_layer = packet.getlayer(IP)
+        if ip_layer is None:
+            return (None, None)
+        return (tcp_layer, ip_layer)
 
     def _build_tuple_key(self, ip_layer, tcp_layer) -> str:
         """Construct a stable 4-tuple key independent of encounter order.
@@ -740,7 +824,8 @@ class PayloadMasker:
         self.tuple_to_stream_id[tuple_key] = stream_id
         self.flow_id_counter += 1
 
-        self.logger.debug(f"Assigned new flow ID: {tuple_key} -> {stream_id}")
+        if self._trace.enabled and self._trace.sample():
+            self._trace.log(f"Assigned new flow ID: {tuple_key} -> {stream_id}")
 
         return stream_id
 
@@ -792,9 +877,12 @@ class PayloadMasker:
                 },
             }
 
-            self.logger.debug(
-                f"Established canonical flow direction info {stream_id}: forward={canonical_forward['src_ip']}:{canonical_forward['src_port']}->{canonical_forward['dst_ip']}:{canonical_forward['dst_port']}"
-            )
+            if self._trace.enabled and self._trace.sample():
+                self._trace.log(
+                    f"Established canonical flow direction info {stream_id}: "
+                    f"forward={canonical_forward['src_ip']}:{canonical_forward['src_port']}->"
+                    f"{canonical_forward['dst_ip']}:{canonical_forward['dst_port']}"
+                )
 
         # 判断当前包的方向
         fwd = self.flow_directions[stream_id]["forward"]
@@ -807,10 +895,18 @@ class PayloadMasker:
             return "forward"
         return "reverse"
 
-    def _apply_keep_rules(self, payload: bytes, seg_start: int, seg_end: int, rule_data: Dict) -> bytes:
+    def _apply_keep_rules(
+        self,
+        payload: bytes,
+        seg_start: int,
+        seg_end: int,
+        rule_data: Dict,
+        cursor: Optional[RuleCursor] = None,
+    ) -> bytes:
         """Apply keep rules to payload
 
         Core algorithm implementation based on TCP_MARKER_REFERENCE.md, using optimized binary search.
+        With a per-flow-direction ``cursor`` the overlapping rules are found by advancing the cursor instead.
 
         Modification note: Now always returns processed payload, implementing default full masking strategy.
         - If there are keep rules, selectively preserve according to rules
@@ -822,6 +918,7 @@ class PayloadMasker:
             seg_start: Segment start sequence number
             seg_end: Segment end sequence number
             rule_data: Rule data
+            cursor: Rule cursor of the segment's flow direction (optional)
 
         Returns:
             Processed payload (always returns, no longer returns None)
@@ -829,8 +926,12 @@ class PayloadMasker:
         if not payload:
             return b""
 
+        if cursor is not None:
+            header_overlapping, full_overlapping = cursor.overlapping(seg_start, seg_end)
+            return self._mask_with_intervals(payload, seg_start, seg_end, header_overlapping, full_overlapping)
+
         # 使用优化的查找算法
-        if "sorted_ranges" in rule_data and rule_data["range_count"] > 10:
+        if rule_data.get("range_count", 0) > 10:
             # 对于大量规则，使用二分查找优化
             return self._apply_keep_rules_optimized(payload, seg_start, seg_end, rule_data)
         else:
@@ -847,92 +948,13 @@ class PayloadMasker:
 
         修改说明：现在总是返回处理后的载荷，实现默认全掩码策略。
         """
-        # 使用预处理的分离策略组
-        header_only_ranges = rule_data.get("header_only_ranges", [])
-        full_preserve_ranges = rule_data.get("full_preserve_ranges", [])
-
-        # 创建全零缓冲区
-        buf = bytearray(len(payload))
-
-        # 处理header_only规则
-        header_range_infos = []
-        for keep_start, keep_end in header_only_ranges:
-            # 计算与当前段的重叠部分
-            overlap_start = max(keep_start, seg_start)
-            overlap_end = min(keep_end, seg_end)
-
-            if overlap_start < overlap_end:
-                # 计算在载荷中的偏移
-                offset_left = max(0, overlap_start - seg_start)
-                offset_right = min(len(payload), overlap_end - seg_start)
-
-                if offset_left < offset_right:
-                    header_range_infos.append(
-                        {
-                            "offset_left": offset_left,
-                            "offset_right": offset_right,
-                            "rule_range": (keep_start, keep_end),
-                        }
-                    )
-
-        # 处理full_preserve规则
-        full_range_infos = []
-        for keep_start, keep_end in full_preserve_ranges:
-            # 计算与当前段的重叠部分
-            overlap_start = max(keep_start, seg_start)
-            overlap_end = min(keep_end, seg_end)
-
-            if overlap_start < overlap_end:
-                # 计算在载荷中的偏移
-                offset_left = max(0, overlap_start - seg_start)
-                offset_right = min(len(payload), overlap_end - seg_start)
-
-                if offset_left < offset_right:
-                    full_range_infos.append(
-                        {
-                            "offset_left": offset_left,
-                            "offset_right": offset_right,
-                            "rule_range": (keep_start, keep_end),
-                        }
-                    )
-
-        # 创建保留映射，记录每个字节是否已被保留
-        preserved_map = [False] * len(payload)
-        preserved_bytes = 0
-
-        # 第一阶段：优先应用头部保留规则（最高优先级）
-        for range_info in header_range_infos:
-            offset_left = range_info["offset_left"]
-            offset_right = range_info["offset_right"]
-
-            # 头部保留规则无条件应用
-            buf[offset_left:offset_right] = payload[offset_left:offset_right]
-            for i in range(offset_left, offset_right):
-                preserved_map[i] = True
-            preserved_bytes += offset_right - offset_left
-
-        # 第二阶段：应用完全保留规则，但不能覆盖已保留的头部区域
-        for range_info in full_range_infos:
-            offset_left = range_info["offset_left"]
-            offset_right = range_info["offset_right"]
-
-            # 只保留未被头部规则占用的部分
-            for i in range(offset_left, offset_right):
-                if not preserved_map[i]:
-                    buf[i] = payload[i]
-                    preserved_map[i] = True
-                    preserved_bytes += 1
-
-        # 计算掩码字节数
-        masked_bytes = len(payload) - preserved_bytes
-
-        # 更新统计信息（如果有的话）
-        if hasattr(self, "_current_stats") and self._current_stats:
-            self._current_stats.preserved_bytes += preserved_bytes
-            self._current_stats.masked_bytes += masked_bytes
-
-        # 总是返回处理后的载荷（全零缓冲区 + 保留区间的原始数据）
-        return bytes(buf)
+        return self._mask_with_intervals(
+            payload,
+            seg_start,
+            seg_end,
+            rule_data.get("header_only_ranges", []),
+            rule_data.get("full_preserve_ranges", []),
+        )
 
     def _apply_keep_rules_optimized(self, payload: bytes, seg_start: int, seg_end: int, rule_data: Dict) -> bytes:
         """优化的保留规则应用（使用二分查找，适用于大量规则）
@@ -944,98 +966,48 @@ class PayloadMasker:
 
         修改说明：现在总是返回处理后的载荷，实现默认全掩码策略。
         """
-        # 使用预处理的分离策略组
-        header_only_ranges = rule_data.get("header_only_ranges", [])
-        full_preserve_ranges = rule_data.get("full_preserve_ranges", [])
-
-        # 创建全零缓冲区
-        buf = bytearray(len(payload))
-
-        # 使用二分查找找到可能重叠的header_only区间
-        header_overlapping = self._find_overlapping_ranges(header_only_ranges, seg_start, seg_end)
-
-        # 使用二分查找找到可能重叠的full_preserve区间
-        full_overlapping = self._find_overlapping_ranges(full_preserve_ranges, seg_start, seg_end)
-
-        # 处理header_only规则
-        header_range_infos = []
-        for keep_start, keep_end in header_overlapping:
-            # 计算与当前段的重叠部分
-            overlap_start = max(keep_start, seg_start)
-            overlap_end = min(keep_end, seg_end)
-
-            if overlap_start < overlap_end:
-                # 计算在载荷中的偏移
-                offset_left = max(0, overlap_start - seg_start)
-                offset_right = min(len(payload), overlap_end - seg_start)
-
-                if offset_left < offset_right:
-                    header_range_infos.append(
-                        {
-                            "offset_left": offset_left,
-                            "offset_right": offset_right,
-                            "rule_range": (keep_start, keep_end),
-                        }
-                    )
+        # 使用二分查找找到可能重叠的header_only / full_preserve区间
+        header_overlapping = self._find_overlapping_ranges(rule_data.get("header_only_ranges", []), seg_start, seg_end)
+        full_overlapping = self._find_overlapping_ranges(rule_data.get("full_preserve_ranges", []), seg_start, seg_end)
 
-        # 处理full_preserve规则
-        full_range_infos = []
-        for keep_start, keep_end in full_overlapping:
-            # 计算与当前段的重叠部分
-            overlap_start = max(keep_start, seg_start)
-            overlap_end = min(keep_end, seg_end)
-
-            if overlap_start < overlap_end:
-                # 计算在载荷中的偏移
-                offset_left = max(0, overlap_start - seg_start)
-                offset_right = min(len(payload), overlap_end - seg_start)
-
-                if offset_left < offset_right:
-                    full_range_infos.append(
-                        {
-                            "offset_left": offset_left,
-                            "offset_right": offset_right,
-                            "rule_range": (keep_start, keep_end),
-                        }
-                    )
-
-        # 创建保留映射，记录每个字节是否已被保留
-        preserved_map = [False] * len(payload)
-        preserved_bytes = 0
+        return self._mask_with_intervals(payload, seg_start, seg_end, header_overlapping, full_overlapping)
 
-        # 第一阶段：优先应用头部保留规则（最高优先级）
-        for range_info in header_range_infos:
-            offset_left = range_info["offset_left"]
-            offset_right = range_info["offset_right"]
+    def _mask_with_intervals(
+        self,
+        payload: bytes,
+        seg_start: int,
+        seg_end: int,
+        header_ranges: List[Tuple[int, int]],
+        full_ranges: List[Tuple[int, int]],
+    ) -> bytes:
+        """按保留区间构建掩码后的载荷
 
-            # 头部保留规则无条件应用
-            buf[offset_left:offset_right] = payload[offset_left:offset_right]
-            for i in range(offset_left, offset_right):
-                preserved_map[i] = True
-            preserved_bytes += offset_right - offset_left
+        头部保留区间优先：完全保留区间只贡献未被头部区间覆盖的部分（区间差），
+        两者的并集即最终保留区间，按区间切片拷贝到全零缓冲区。
 
-        # 第二阶段：应用完全保留规则，但不能覆盖已保留的头部区域
-        for range_info in full_range_infos:
-            offset_left = range_info["offset_left"]
-            offset_right = range_info["offset_right"]
+        Args:
+            payload: 原始载荷
+            seg_start: 段起始序列号
+            seg_end: 段结束序列号
+            header_ranges: header_only 保留区间（序列号空间）
+            full_ranges: full_preserve 保留区间（序列号空间）
 
-            # 只保留未被头部规则占用的部分
-            for i in range(offset_left, offset_right):
-                if not preserved_map[i]:
-                    buf[i] = payload[i]
-                    preserved_map[i] = True
-                    preserved_bytes += 1
+        Returns:
+            掩码后的载荷
+        """
+        header_keep = union_intervals(clip_to_segment(header_ranges, seg_start, seg_end))
+        full_keep = subtract_intervals(union_intervals(clip_to_segment(full_ranges, seg_start, seg_end)), header_keep)
+        keep = union_intervals(header_keep + full_keep)
 
-        # 计算掩码字节数
-        masked_bytes = len(payload) - preserved_bytes
+        preserved_bytes = covered_length(keep)
 
         # 更新统计信息（如果有的话）
         if hasattr(self, "_current_stats") and self._current_stats:
             self._current_stats.preserved_bytes += preserved_bytes
-            self._current_stats.masked_bytes += masked_bytes
+            self._current_stats.masked_bytes += len(payload) - preserved_bytes
 
-        # 总是返回处理后的载荷（全零缓冲区 + 保留区间的原始数据）
-        return bytes(buf)
+        # 全零缓冲区 + 保留区间的原始数据
+        return apply_keep_intervals(payload, keep)
 
     def _find_overlapping_ranges(
         self, sorted_ranges: List[Tuple[int, int]], seg_start: int, seg_end: int
@@ -1081,6 +1053,9 @@ class PayloadMasker:
     def _modify_packet_payload(self, packet, tcp_layer, new_payload: bytes):
         """修改数据包的 TCP 载荷
 
+        默认（payload_rewrite_mode="inplace"）直接在原始帧字节中覆写载荷并重算TCP校验和，
+        不复制scapy对象树；无法安全定位载荷时回退到 deepcopy 重建方式。
+
         Args:
             packet: 原始数据包
             tcp_layer: TCP 层
@@ -1094,6 +1069,11 @@ class PayloadMasker:
         if len(new_payload) != original_length:
             raise ValueError(f"Payload length cannot change: {original_length} -> {len(new_payload)}")
 
+        if self.payload_rewrite_mode == "inplace":
+            rewritten = self._rewrite_payload_inplace(packet, tcp_layer, new_payload)
+            if rewritten is not None:
+                return rewritten
+
         # 创建数据包副本
         import copy
 
@@ -1113,6 +1093,396 @@ class PayloadMasker:
 
         return modified_packet
 
+    def _rewrite_payload_inplace(self, packet, tcp_layer, new_payload: bytes):
+        """在原始帧字节中覆写TCP载荷并重算TCP校验和
+
+        TCP头部在帧中的偏移由解析时保留的原始字节推算：帧长度减去尾部填充
+        （Padding层）再减去TCP段长度。仅处理直接承载于IPv4且未分片的TCP段，
+        其余情况返回None由调用方回退到deepcopy方式。
+
+        Args:
+            packet: 原始数据包（由PcapReader解析，带有original字节）
+            tcp_layer: 最内层TCP层
+            new_payload: 新的载荷数据（长度与原载荷一致）
+
+        Returns:
+            承载改写后帧字节的Raw数据包，或None
+        """
+        raw_frame = getattr(packet, "original", None)
+        segment = getattr(tcp_layer, "original", None)
+        ip_layer = tcp_layer.underlayer
+        if not raw_frame or not segment or not isinstance(ip_layer, IP):
+            return None
+        if ip_layer.flags.MF or ip_layer.frag:
+            return None
+
+        # 填充字节总是位于帧尾部、TCP段之后
+        trailing = 0
+        layer = tcp_layer.payload
+        while layer:
+            if isinstance(layer, Padding):
+                trailing += len(layer.load)
+            layer = layer.payload
+
+        tcp_offset = len(raw_frame) - trailing - len(segment)
+        payload_offset = tcp_offset + tcp_layer.dataofs * 4
+        if (
+            tcp_offset < 0
+            or payload_offset + len(new_payload) > len(raw_frame)
+            or raw_frame[tcp_offset : tcp_offset + len(segment)] != segment
+        ):
+            return None
+
+        frame = bytearray(raw_frame)
+        ip_header = ip_layer.original
+        rewrite_tcp_payload(
+            frame,
+            tcp_offset,
+            tcp_offset + len(segment),
+            payload_offset,
+            new_payload,
+            ip_header[12:16],
+            ip_header[16:20],
+        )
+
+        rewritten = conf.raw_layer(bytes(frame))
+        rewritten.time = packet.time
+        for attr in ("wirelen", "comments", "sniffed_on", "direction"):
+            value = getattr(packet, attr, None)
+            if value is not None:
+                setattr(rewritten, attr, value)
+        return rewritten
+
+    def _should_use_raw_engine(self, input_path: str) -> bool:
+        """判断是否使用原始字节处理引擎
+
+        "auto" 模式下，仅当输入为可直接解析的 pcap/pcapng（非压缩）文件时启用。
+        """
+        if self.masking_engine == "scapy":
+            return False
+        capture_format = detect_capture_format(input_path)
+        if capture_format is None:
+            if self.masking_engine == "raw":
+                self.logger.warning(f"Raw engine cannot read {input_path}, using scapy engine")
+            return False
+        return True
+
+    def _resolve_masking_workers(self, input_path: str) -> int:
+        """Number of worker processes the raw engine should mask ``input_path`` with"""
+        setting = self.masking_workers
+        if setting != "auto":
+            try:
+                return max(1, int(setting))
+            except (TypeError, ValueError):
+                self.logger.warning(f"Invalid masking_workers setting {setting!r}, masking in-process")
+                return 1
+        if getattr(sys, "frozen", False):
+            # Packaged desktop builds cannot re-launch the interpreter for workers
+            return 1
+        try:
+            size = os.path.getsize(input_path)
+        except OSError:
+            return 1
+        if size < ProcessingConstants.PARALLEL_MASKING_MIN_BYTES:
+            return 1
+        # The main process keeps reading and classifying records
+        return max(1, (os.cpu_count() or 1) - 1)
+
+    def _create_checkpoint(
+        self, input_path: str, output_path: str, keep_rules: KeepRuleSet
+    ) -> Optional[MaskingCheckpoint]:
+        """Checkpoint of this run, or None when checkpoints are disabled or unavailable"""
+        if not self.enable_checkpoints:
+            return None
+        try:
+            return MaskingCheckpoint.for_run(input_path, output_path, keep_rules, self.checkpoint_config)
+        except OSError as e:
+            self.logger.warning(f"Masking checkpoints unavailable for {input_path}: {e}")
+            return None
+
+    def _restart_file_state(
+        self, stats: MaskingStats, state: Optional[Dict] = None, flows: Optional[List[str]] = None
+    ) -> int:
+        """Reset per-file flow state and counters, or restore them from a checkpoint state
+
+        Args:
+            stats: Statistics of the current file
+            state: Saved checkpoint state, None to start from the first packet
+            flows: Flow keys of the checkpoint journal, in stream id order
+
+        Returns:
+            Number of packets dissected with scapy so far
+        """
+        self.flow_directions.clear()
+        self.stream_id_cache.clear()
+        self.tuple_to_stream_id.clear()
+        self.flow_id_counter = 0
+        self._flow_table = None
+        if state is None:
+            stats.processed_packets = stats.modified_packets = 0
+            stats.preserved_bytes = stats.masked_bytes = 0
+            return 0
+
+        # Directions and flow table entries are derived again from the stream ids
+        self.tuple_to_stream_id.update((tuple_key, str(stream_id)) for stream_id, tuple_key in enumerate(flows))
+        self.flow_id_counter = len(flows)
+        counters = state["stats"]
+        stats.processed_packets = counters["processed_packets"]
+        stats.modified_packets = counters["modified_packets"]
+        stats.preserved_bytes = counters["preserved_bytes"]
+        stats.masked_bytes = counters["masked_bytes"]
+        return counters["dissected_packets"]
+
+    def _checkpoint_state(self, reader, writer, stats: MaskingStats, dissected_packets: int) -> Dict[str, Any]:
+        """Resumable state after the record just written"""
+        return {
+            "reader": reader.checkpoint(),
+            "writer": writer.checkpoint(),
+            "stats": {
+                "processed_packets": stats.processed_packets,
+                "modified_packets": stats.modified_packets,
+                "preserved_bytes": stats.preserved_bytes,
+                "masked_bytes": stats.masked_bytes,
+                "dissected_packets": dissected_packets,
+            },
+        }
+
+    def _process_file_raw(self, input_path: str, output_path: str, rule_lookup: Dict, stats: MaskingStats) -> None:
+        """以原始字节方式处理文件
+
+        直接从记录字节中解析 Ethernet/VLAN/MPLS/IPv4/TCP 头部：不含TCP段的记录原样写出，
+        普通TCP段在帧字节中覆写载荷，隧道、分片等复杂封装才交给scapy完整解析。
+        输出与scapy引擎逐字节一致。
+        """
+        workers = self._resolve_masking_workers(input_path)
+        stats.performance_metrics["masking_workers"] = workers
+        if workers > 1:
+            if self._checkpoint is not None:
+                self.logger.warning(
+                    f"Masking checkpoints are ignored for {input_path}: sharded masking ({workers} workers) "
+                    f"cannot resume, set masking_workers=1 to mask resumably"
+                )
+            self._process_file_sharded(input_path, output_path, rule_lookup, stats, workers)
+            return
+
+        checkpoint = self._checkpoint
+        state = checkpoint.load() if checkpoint is not None else None
+        flows = None
+        if state is not None and not RawPcapWriter.matches_checkpoint(output_path, state["writer"]):
+            self.logger.warning(f"Output {output_path} no longer matches its masking checkpoint, starting over")
+            state = None
+        elif state is not None:
+            try:
+                flows = checkpoint.load_flows()
+            except ValueError as e:
+                self.logger.warning(f"{e}, starting over")
+                state = None
+        if checkpoint is not None and state is None:
+            checkpoint.discard()
+        dissected_packets = self._restart_file_state(stats, state, flows)
+        if state is not None:
+            stats.performance_metrics["resumed_after_packet"] = stats.processed_packets
+            self.logger.info(f"Resuming {input_path} from checkpoint after packet {stats.processed_packets}")
+
+        classifier = FrameClassifier()
+
+        with (
+            RawCaptureReader(input_path, resume_from=state["reader"] if state else None) as reader,
+            RawPcapWriter(
+                output_path,
+                self.output_buffer_size,
+                sync_policy=self.output_sync_policy,
+                resume_from=state["writer"] if state else None,
+            ) as writer,
+        ):
+            self._output_digest = writer.digest
+            for record in reader:
+                stats.processed_packets += 1
+
+                if writer.linktype is None:
+                    writer.write_header(scapy_output_linktype(record.linktype, record.data))
+
+                data = record.data
+                try:
+                    verdict, info = classifier.classify(record.linktype, data)
+                    if verdict == TCP_SEGMENT:
+                        payload = data[info.payload_offset :]
+                        new_payload = self._compute_masked_payload(info, info, payload, rule_lookup)
+                        if new_payload is not None:
+                            frame = bytearray(data)
+                            rewrite_tcp_payload(
+                                frame,
+                                info.tcp_offset,
+                                info.segment_end,
+                                info.payload_offset,
+                                new_payload,
+                                data[info.ip_offset + 12 : info.ip_offset + 16],
+                                data[info.ip_offset + 16 : info.ip_offset + 20],
+                            )
+                            data = bytes(frame)
+                            stats.modified_packets += 1
+                    elif verdict != PASS_THROUGH:
+                        dissected_packets += 1
+                        packet = self._dissect_record(record)
+                        modified_packet, packet_modified = self._process_packet(packet, rule_lookup)
+                        if packet_modified:
+                            data = bytes(modified_packet)
+                            stats.modified_packets += 1
+
+                except Exception as e:
+                    # Handle single packet error, keep the original record
+                    self.error_handler.handle_error(
+                        e,
+                        ErrorSeverity.MEDIUM,
+                        ErrorCategory.PROCESSING_ERROR,
+                        {"packet_number": stats.processed_packets},
+                    )
+                    data = record.data
+
+                writer.write_record(data, record.sec, record.usec, record.wirelen)
+
+                if checkpoint is not None and checkpoint.due(stats.processed_packets):
+                    # Stream ids are assigned in order, the newest flows are the last dict entries
+                    new_flows = islice(reversed(self.tuple_to_stream_id), self.flow_id_counter - checkpoint.flow_count)
+                    checkpoint.save(
+                        self._checkpoint_state(reader, writer, stats, dissected_packets), reversed(list(new_flows))
+                    )
+
+                if stats.processed_packets % self.chunk_size == 0:
+                    self.logger.debug(f"Processed {stats.processed_packets} packets")
+
+        if checkpoint is not None:
+            # The file is complete, nothing left to resume
+            checkpoint.discard()
+            stats.performance_metrics["checkpoints_saved"] = checkpoint.saved
+        stats.performance_metrics["dissected_packets"] = dissected_packets
+        stats.performance_metrics["output_write_calls"] = writer.write_calls
+        self.logger.info(
+            f"Raw engine finished: {stats.processed_packets} packets, " f"{dissected_packets} dissected with scapy"
+        )
+
+    def _process_file_sharded(
+        self, input_path: str, output_path: str, rule_lookup: Dict, stats: MaskingStats, workers: int
+    ) -> None:
+        """按流分片在多个工作进程中处理文件
+
+        主进程按记录顺序读取、分类并解析流（流ID与方向的分配与单进程一致），带载荷的
+        普通TCP段按规范化四元组哈希分发到对应工作进程，其余记录仍在主进程处理。
+        OrderedMerger 按记录序号恢复原始顺序写出，输出与单进程逐字节一致。
+        """
+        classifier = FrameClassifier()
+        dissected_packets = 0
+
+        with (
+            RawCaptureReader(input_path) as reader,
+            RawPcapWriter(output_path, self.output_buffer_size, sync_policy=self.output_sync_policy) as writer,
+        ):
+            self._output_digest = writer.digest
+            merger = OrderedMerger(writer)
+
+            def merge_results(indices, rewritten, errors):
+                for index, message in errors:
+                    self.error_handler.handle_error(
+                        RuntimeError(message),
+                        ErrorSeverity.MEDIUM,
+                        ErrorCategory.PROCESSING_ERROR,
+                        {"packet_number": index + 1},
+                    )
+                stats.modified_packets += len(rewritten)
+                for index in indices:
+                    merger.complete(index, rewritten.get(index))
+                merger.release()
+
+            # Records held back behind segments that are still being masked
+            max_backlog = workers * MAX_SHARD_BACKLOG_PER_WORKER
+            with ShardPool(workers, self.config, merge_results) as pool:
+                for index, record in enumerate(reader):
+                    stats.processed_packets += 1
+
+                    if writer.linktype is None:
+                        writer.write_header(scapy_output_linktype(record.linktype, record.data))
+
+                    data = record.data
+                    sharded = False
+                    try:
+                        verdict, info = classifier.classify(record.linktype, data)
+                        if verdict == TCP_SEGMENT:
+                            flow = self._lookup_flow(info, info, rule_lookup)
+                            if info.payload_offset < len(data):
+                                pool.submit(index, data, info, flow)
+                                sharded = True
+                        elif verdict != PASS_THROUGH:
+                            dissected_packets += 1
+                            packet = self._dissect_record(record)
+                            modified_packet, packet_modified = self._process_packet(packet, rule_lookup)
+                            if packet_modified:
+                                data = bytes(modified_packet)
+                                stats.modified_packets += 1
+
+                    except Exception as e:
+                        # Handle single packet error, keep the original record
+                        self.error_handler.handle_error(
+                            e,
+                            ErrorSeverity.MEDIUM,
+                            ErrorCategory.PROCESSING_ERROR,
+                            {"packet_number": stats.processed_packets},
+                        )
+                        data = record.data
+
+                    merger.add(index, record, data, pending=sharded)
+
+                    if len(merger) > max_backlog:
+                        # A slow shard holds back the output: send what is queued and wait
+                        pool.flush()
+                        while len(merger) > max_backlog and pool.outstanding:
+                            pool.wait()
+                    else:
+                        pool.poll()
+
+                    if stats.processed_packets % self.chunk_size == 0:
+                        self.logger.debug(f"Processed {stats.processed_packets} packets")
+
+            merger.release()
+            stats.preserved_bytes += pool.preserved_bytes
+            stats.masked_bytes += pool.masked_bytes
+
+        stats.performance_metrics["dissected_packets"] = dissected_packets
+        stats.performance_metrics["output_write_calls"] = writer.write_calls
+        stats.performance_metrics["shard_batches"] = pool.batches_sent
+        self.logger.info(
+            f"Sharded raw engine finished: {stats.processed_packets} packets across {workers} workers, "
+            f"{dissected_packets} dissected with scapy"
+        )
+
+    @staticmethod
+    def _dissect_record(record):
+        """按链路类型用scapy解析记录（与PcapReader行为一致）"""
+        return dissect_record(record)
+
+    def _bind_writer_linktype(self, writer, packet) -> None:
+        """按首个读取的数据包确定输出链路类型
+
+        原地改写产生的是不绑定链路类型的Raw数据包，若它恰好是第一个写入的包，
+        PcapWriter会猜错链路类型。这里沿用PcapWriter自身的推断规则，提前根据
+        原始数据包的类型设定。
+        """
+        if hasattr(writer, "linktype"):
+            return
+        linktype = conf.l2types.layer2num.get(packet.__class__)
+        if linktype is not None:
+            writer.linktype = linktype
+
+    @staticmethod
+    def _write_packet(writer, packet) -> None:
+        """写入单个数据包
+
+        直接调用 write_packet，跳过 PcapWriter.write 对每个包的迭代封装与链路类型
+        一致性检查（原地改写产生的Raw包会触发误报的 Inconsistent linktypes 警告）。
+        """
+        if not writer.header_present:
+            writer.write_header(packet)
+        writer.write_packet(packet)
+
     # 注释：移除32位序列号回绕处理，直接使用绝对序列号
     # def logical_seq(self, seq32: int, flow_key: str) -> int:
     #     """处理32位序列号回绕，返回64位逻辑序号
@@ -1165,7 +1535,7 @@ class PayloadMasker:
         """
         try:
             for buffered_packet in packet_buffer:
-                writer.write(buffered_packet)
+                self._write_packet(writer, buffered_packet)
             packet_buffer.clear()
         except Exception as e:
             self.error_handler.handle_error(
@@ -1176,17 +1546,23 @@ class PayloadMasker:
             )
             raise
 
-    def _write_packets_to_file(self, packets: list, writer):
+    def _write_packets_to_file(self, packets: list, writer, sync_tracker: Optional[SyncTracker] = None):
         """统一的数据包写入方法
 
         Args:
             packets: 数据包列表
             writer: PcapWriter实例
+            sync_tracker: 按输出同步策略计数，到达间隔时 fsync 输出文件
         """
         try:
+            start = writer.f.tell() if sync_tracker is not None else 0
             for packet in packets:
-                writer.write(packet)
+                self._write_packet(writer, packet)
+            if isinstance(writer.f, DigestingFile):
+                writer.f.digest.records += len(packets)
             self.logger.debug(f"Written {len(packets)} packets to file")
+            if sync_tracker is not None and sync_tracker.record(writer.f.tell() - start, len(packets)):
+                sync_file(writer.f)
         except Exception as e:
             self.error_handler.handle_error(
                 e,
@@ -1278,7 +1654,9 @@ class PayloadMasker:
                 if hasattr(self, "flow_directions"):
                     self.flow_directions.clear()
                     self.stream_id_cache.clear()
-                    self.logger.info("Cleared flow direction state to recover processing")
+                    self._flow_table = None
+                    if error_info.sampled:
+                        self.logger.info("Cleared flow direction state to recover processing")
                     return True
                 return False
             except Exception:
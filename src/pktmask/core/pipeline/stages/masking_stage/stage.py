@@ -34,6 +34,8 @@ class MaskingStage(StageBase):
                 - protocol: Protocol type ("tls", "http", "auto")
                 - marker_config: Marker module configuration
                 - masker_config: Masker module configuration
+                - rule_cache: Keep rule cache configuration
+                  (enabled, directory, max_bytes; disabled by default)
         """
         super().__init__(config)
         self.logger = get_logger("mask_stage")
@@ -46,6 +48,8 @@ class MaskingStage(StageBase):
         # Module instances (lazy initialization)
         self.marker = None
         self.masker = None
+        self.rule_cache = None
+        self._rule_cache_status = "disabled"
 
         # Optional configuration validator
         self.config_validator = None
@@ -80,6 +84,8 @@ class MaskingStage(StageBase):
             # Create Masker module
             self.masker = self._create_masker()
 
+            self.rule_cache = self._create_rule_cache()
+
             self._initialized = True
             self.logger.info("MaskingStage initialization successful")
             return True
@@ -135,7 +141,9 @@ class MaskingStage(StageBase):
         try:
             # Phase 1: Call Marker module to generate KeepRuleSet
             self.logger.debug("Phase 1: Generate keep rules")
-            keep_rules = self.marker.analyze_file(str(working_input_path), self.config)
+            keep_rules = self._analyze_with_cache(working_input_path)
+            # Only the columnar form is needed from here on: drop the per-rule objects
+            keep_rules.compact()
 
             # Phase 2: Call Masker module to apply rules
             self.logger.debug("Phase 2: Apply masking rules")
@@ -294,6 +302,10 @@ class MaskingStage(StageBase):
     def _create_marker(self):
         """Create Marker module instance supporting tls|http|auto"""
         if self.protocol == "tls":
+            if self.marker_config.get("tls_engine") == "native":
+                from .marker.native_tls_marker import NativeTLSProtocolMarker
+
+                return NativeTLSProtocolMarker(self.marker_config)
             from .marker.tls_marker import TLSProtocolMarker
 
             return TLSProtocolMarker(self.marker_config)
@@ -308,6 +320,55 @@ class MaskingStage(StageBase):
         else:
             raise ValueError(f"Unsupported protocol: {self.protocol}")
 
+    def _create_rule_cache(self):
+        """Create the keep rule cache (None when disabled or unusable)"""
+        from .marker.rule_cache import KeepRuleCache
+
+        try:
+            return KeepRuleCache.from_config(self.config.get("rule_cache", {}))
+        except Exception as e:
+            self.logger.warning(f"Keep rule cache disabled: {e}")
+            return None
+
+    def _analyze_with_cache(self, working_input_path: Path):
+        """Run the Marker, reusing cached keep rules of a byte-identical masking input
+
+        The key is the content of ``working_input_path``, i.e. the capture after the
+        upstream deduplication/anonymization stages, so entries are only reused when
+        those stages produced the same file as before.
+        """
+        fingerprint = None
+        if self.rule_cache is not None and hasattr(self.marker, "cache_fingerprint"):
+            fingerprint = self.marker.cache_fingerprint()
+        if not isinstance(fingerprint, dict):
+            self._rule_cache_status = "disabled"
+            return self.marker.analyze_file(str(working_input_path), self.config)
+
+        try:
+            key = self.rule_cache.key_for(str(working_input_path), fingerprint)
+            keep_rules = self.rule_cache.get(key)
+        except OSError as e:
+            self.logger.warning(f"Keep rule cache lookup failed: {e}")
+            self._rule_cache_status = "error"
+            return self.marker.analyze_file(str(working_input_path), self.config)
+
+        if keep_rules is not None:
+            self._rule_cache_status = "hit"
+            if "pcap_path" in keep_rules.metadata:
+                keep_rules.metadata["pcap_path"] = str(working_input_path)
+            self.logger.info(f"Keep rules loaded from cache: {len(keep_rules.rules)} rules")
+            return keep_rules
+
+        self._rule_cache_status = "miss"
+        keep_rules = self.marker.analyze_file(str(working_input_path), self.config)
+        # 分析失败的结果（tshark 异常等）不缓存
+        if not keep_rules.metadata.get("analysis_failed"):
+            try:
+                self.rule_cache.put(key, keep_rules)
+            except OSError as e:
+                self.logger.warning(f"Failed to store keep rules in cache: {e}")
+        return keep_rules
+
     def _create_masker(self):
         """Create Masker module instance
 
@@ -347,9 +408,17 @@ class MaskingStage(StageBase):
                 "fallback_used": masking_stats.fallback_used,
                 "fallback_mode": masking_stats.fallback_mode,
                 "fallback_details": masking_stats.fallback_details,
+                "rule_cache": self._rule_cache_metrics(),
             },
         )
 
+    def _rule_cache_metrics(self) -> Dict[str, Any]:
+        """Rule cache outcome of the last file plus counters of this stage instance"""
+        metrics: Dict[str, Any] = {"status": self._rule_cache_status}
+        if self.rule_cache is not None:
+            metrics.update(self.rule_cache.stats())
+        return metrics
+
     def get_display_name(self) -> str:
         """获取显示名称"""
         return "Mask Payloads"
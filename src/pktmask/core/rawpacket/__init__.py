@@ -0,0 +1,23 @@
+"""
+Raw packet helpers
+
+Byte-level helpers for working on captured frames without building scapy
+packet trees: checksum computation for in-place payload rewrites and
+incremental checksum updates for in-place address rewrites.
+"""
+
+from .checksum import (
+    internet_checksum,
+    ones_complement_sum,
+    pseudo_header_sum,
+    transport_checksum,
+    update_checksum,
+)
+
+__all__ = [
+    "ones_complement_sum",
+    "internet_checksum",
+    "pseudo_header_sum",
+    "transport_checksum",
+    "update_checksum",
+]
@@ -0,0 +1,77 @@
+"""
+Internet checksum helpers (RFC 1071)
+
+Operates directly on raw header bytes so that callers can patch frames in place
+instead of rebuilding scapy packets to get checksums recomputed.
+"""
+
+from __future__ import annotations
+
+from typing import Union
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+
+def ones_complement_sum(data: BytesLike, initial: int = 0) -> int:
+    """Return the folded 16-bit one's complement sum of ``data``.
+
+    Uses the identity ``sum(words) ≡ int(data) (mod 0xFFFF)`` so the whole
+    buffer is summed by a single big-integer operation instead of a Python loop.
+
+    Args:
+        data: Bytes to sum; an odd trailing byte is padded with zero
+        initial: Folded partial sum to continue from
+
+    Returns:
+        Folded sum in the range 0..0xFFFF (0 only if every word is zero)
+    """
+    if len(data) % 2:
+        data = bytes(data) + b"\x00"
+    total = int.from_bytes(data, "big") + initial
+    if total == 0:
+        return 0
+    folded = total % 0xFFFF
+    return folded or 0xFFFF
+
+
+def internet_checksum(data: BytesLike, initial: int = 0) -> int:
+    """Return the RFC 1071 checksum of ``data`` (checksum field assumed zeroed)."""
+    return ~ones_complement_sum(data, initial) & 0xFFFF
+
+
+def pseudo_header_sum(src: BytesLike, dst: BytesLike, proto: int, length: int) -> int:
+    """Return the folded sum of the IPv4/IPv6 pseudo header.
+
+    Args:
+        src: Source address bytes (4 or 16)
+        dst: Destination address bytes (4 or 16)
+        proto: Upper-layer protocol number
+        length: Upper-layer segment length in bytes
+    """
+    return ones_complement_sum(bytes(src) + bytes(dst), proto + length)
+
+
+def transport_checksum(src: BytesLike, dst: BytesLike, proto: int, segment: BytesLike) -> int:
+    """Compute a TCP/UDP checksum over ``segment`` (checksum field must be zeroed).
+
+    A UDP result of zero is transmitted as 0xFFFF as required by RFC 768.
+    """
+    checksum = internet_checksum(segment, pseudo_header_sum(src, dst, proto, len(segment)))
+    if proto == IPPROTO_UDP and checksum == 0:
+        return 0xFFFF
+    return checksum
+
+
+def update_checksum(checksum: int, old: BytesLike, new: BytesLike) -> int:
+    """Incrementally update a checksum after ``old`` bytes were replaced by ``new``.
+
+    Implements ``HC' = ~(~HC + ~m + m')`` from RFC 1624 (eqn. 3). ``old`` and
+    ``new`` must have the same even length and start at the same word
+    alignment. The result equals a full recomputation whenever ``checksum``
+    was correct; an incorrect checksum stays incorrect by the same amount.
+    """
+    partial = (~checksum & 0xFFFF) + (~ones_complement_sum(old) & 0xFFFF)
+    return ~ones_complement_sum(new, partial) & 0xFFFF
@@ -0,0 +1,221 @@
+"""
+Packet digest stores for deduplication
+
+Keeps fixed-size binary digests instead of hex strings:
+
+- :class:`CompactDigestSet` stores every digest in one open-addressing
+  ``bytearray`` table, roughly ``digest_size / load_factor`` bytes per entry
+  instead of ~90 bytes for a ``bytes`` digest in a Python ``set``; lookups probe
+  the table in Python and are an order of magnitude slower than a ``set``, so
+  it is only worth it when the digests of a capture do not fit in memory
+- :class:`WindowedDigestSet` only remembers digests seen within a time window
+- :class:`LRUDigestSet` remembers a bounded number of recent digests
+
+All stores share ``add(digest, timestamp) -> bool`` which records the digest
+and returns True if it was new (i.e. the packet should be kept).
+"""
+
+from __future__ import annotations
+
+import hashlib
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Dict, Tuple
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# Hash functions producing binary digests, keyed by dedup ``algorithm`` name
+_DIGEST_FUNCTIONS: Dict[str, Callable[[bytes], bytes]] = {
+    "md5": lambda data: hashlib.md5(data).digest(),
+    "sha1": lambda data: hashlib.sha1(data).digest(),
+    "sha256": lambda data: hashlib.sha256(data).digest(),
+    "blake2b-64": lambda data: hashlib.blake2b(data, digest_size=8).digest(),
+    "blake2b-128": lambda data: hashlib.blake2b(data, digest_size=16).digest(),
+}
+if xxhash is not None:
+    _DIGEST_FUNCTIONS["xxh64"] = lambda data: xxhash.xxh64_digest(data)
+    _DIGEST_FUNCTIONS["xxh3-128"] = lambda data: xxhash.xxh3_128_digest(data)
+
+# Substitutes when the optional xxhash package is not installed
+_XXHASH_FALLBACKS = {"xxh64": "blake2b-64", "xxh3-128": "blake2b-128"}
+
+
+def get_digest_function(algorithm: str) -> Tuple[str, Callable[[bytes], bytes]]:
+    """Resolve a digest function by name.
+
+    Unknown names fall back to MD5 and xxhash names fall back to BLAKE2b of the
+    same width when xxhash is unavailable.
+
+    Returns:
+        (effective algorithm name, function returning the binary digest)
+    """
+    if algorithm not in _DIGEST_FUNCTIONS:
+        algorithm = _XXHASH_FALLBACKS.get(algorithm, "md5")
+    return algorithm, _DIGEST_FUNCTIONS[algorithm]
+
+
+class CompactDigestSet:
+    """Open-addressing hash set of fixed-size binary digests
+
+    Digests are assumed to be uniformly distributed (they are hash outputs), so
+    their leading bytes are used directly as the table index. An all-zero slot
+    marks an empty bucket; the all-zero digest itself is tracked separately.
+    """
+
+    def __init__(self, digest_size: int, initial_capacity: int = 1 << 16, max_load_factor: float = 0.7):
+        if digest_size <= 0:
+            raise ValueError("digest_size must be positive")
+        self.digest_size = digest_size
+        self.max_load_factor = max_load_factor
+        self._empty = bytes(digest_size)
+        self._index_bytes = min(digest_size, 8)
+        self._initial_capacity = max(8, 1 << (initial_capacity - 1).bit_length())
+        self._allocate(self._initial_capacity)
+        self._count = 0
+        self._has_empty_digest = False
+
+    def _allocate(self, capacity: int) -> None:
+        self._capacity = capacity
+        self._mask = capacity - 1
+        self._table = bytearray(capacity * self.digest_size)
+        self._grow_at = int(capacity * self.max_load_factor)
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    @property
+    def memory_bytes(self) -> int:
+        """Bytes held by the digest table."""
+        return len(self._table)
+
+    def clear(self) -> None:
+        self._allocate(self._initial_capacity)
+        self._count = 0
+        self._has_empty_digest = False
+
+    def __contains__(self, digest: bytes) -> bool:
+        if digest == self._empty:
+            return self._has_empty_digest
+        return self._find_slot(digest)[1]
+
+    def add(self, digest: bytes, timestamp: float = 0.0) -> bool:
+        """Insert ``digest``; return True if it was not present."""
+        if len(digest) != self.digest_size:
+            raise ValueError(f"Expected {self.digest_size}-byte digest, got {len(digest)}")
+        if digest == self._empty:
+            if self._has_empty_digest:
+                return False
+            self._has_empty_digest = True
+            self._count += 1
+            return True
+
+        offset, found = self._find_slot(digest)
+        if found:
+            return False
+        size = self.digest_size
+        self._table[offset : offset + size] = digest
+        self._count += 1
+        if self._count >= self._grow_at:
+            self._resize(self._capacity * 2)
+        return True
+
+    def _find_slot(self, digest: bytes) -> Tuple[int, bool]:
+        size = self.digest_size
+        table = self._table
+        empty = self._empty
+        mask = self._mask
+        index = int.from_bytes(digest[: self._index_bytes], "little") & mask
+        while True:
+            offset = index * size
+            slot = table[offset : offset + size]
+            if slot == digest:
+                return offset, True
+            if slot == empty:
+                return offset, False
+            index = (index + 1) & mask
+
+    def _resize(self, capacity: int) -> None:
+        old_table = self._table
+        size = self.digest_size
+        empty = self._empty
+        self._allocate(capacity)
+        for offset in range(0, len(old_table), size):
+            digest = bytes(old_table[offset : offset + size])
+            if digest != empty:
+                new_offset, _ = self._find_slot(digest)
+                self._table[new_offset : new_offset + size] = digest
+
+
+class WindowedDigestSet:
+    """Treat a packet as duplicate only if the same digest was kept within ``window``
+
+    Suited to SPAN/mirror duplicates that arrive microseconds to milliseconds
+    apart. Memory is bounded by the number of packets inside one window.
+    Timestamps are expected to be non-decreasing (capture order).
+    """
+
+    def __init__(self, window_seconds: float):
+        self.window_seconds = window_seconds
+        self._last_seen: Dict[bytes, float] = {}
+        self._order: Deque[Tuple[float, bytes]] = deque()
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    def clear(self) -> None:
+        self._last_seen.clear()
+        self._order.clear()
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._last_seen
+
+    def add(self, digest: bytes, timestamp: float = 0.0) -> bool:
+        horizon = timestamp - self.window_seconds
+        order = self._order
+        last_seen = self._last_seen
+        while order and order[0][0] < horizon:
+            seen_at, old_digest = order.popleft()
+            if last_seen.get(old_digest) == seen_at:
+                del last_seen[old_digest]
+
+        seen_at = last_seen.get(digest)
+        if seen_at is not None and seen_at >= horizon:
+            return False
+        last_seen[digest] = timestamp
+        order.append((timestamp, digest))
+        return True
+
+
+class LRUDigestSet:
+    """Remember at most ``max_entries`` most recently seen digests"""
+
+    def __init__(self, max_entries: int):
+        if max_entries <= 0:
+            raise ValueError("max_entries must be positive")
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[bytes, None]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __contains__(self, digest: bytes) -> bool:
+        return digest in self._entries
+
+    def add(self, digest: bytes, timestamp: float = 0.0) -> bool:
+        entries = self._entries
+        if digest in entries:
+            entries.move_to_end(digest)
+            return False
+        entries[digest] = None
+        if len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        return True
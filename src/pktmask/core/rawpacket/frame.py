@@ -0,0 +1,392 @@
+"""
+Raw frame classification
+
+Locates the IPv4/TCP headers of captured frames directly in the record bytes so
+that the masking fast path only needs scapy for exotic encapsulations. Ethernet
+(including 802.3/LLC), Linux cooked capture (SLL and SLL2) and raw IP link
+types are walked; other link types are left to scapy.
+
+Which protocol follows a header is decided by asking scapy's own layer
+bindings (cached per key), so a frame is classified exactly as a full scapy
+dissection would see it:
+
+- ``PASS_THROUGH``: no IPv4 TCP segment inside, the record can be copied as-is
+- ``TCP_SEGMENT``: plain Ethernet/VLAN/MPLS + IPv4 + TCP, offsets are returned
+- ``NEEDS_DISSECTION``: tunnels, fragments, malformed or unknown headers
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+from typing import Dict, Optional, Tuple
+
+from .checksum import IPPROTO_TCP, transport_checksum
+
+try:
+    from scapy.all import IP, LLC, UDP, CookedLinux, CookedLinuxV2, Dot1AD, Dot1Q, Ether, IPv6
+    from scapy.config import conf
+    from scapy.layers.inet6 import IPv46
+
+    SCAPY_AVAILABLE = True
+except ImportError:
+    IP = IPv6 = IPv46 = LLC = UDP = CookedLinux = CookedLinuxV2 = Dot1AD = Dot1Q = Ether = conf = None
+    SCAPY_AVAILABLE = False
+
+PASS_THROUGH = 0
+TCP_SEGMENT = 1
+NEEDS_DISSECTION = 2
+# Returned by FrameClassifier.locate_ip_header when an IP header was found
+IP_HEADER = 3
+
+DLT_EN10MB = 1
+
+# Layers that never carry an IPv4 TCP segment further down
+_LEAF_LAYERS = frozenset(
+    {
+        "ARP",
+        "Padding",
+        "Raw",
+        "STP",
+        # IPv4 payloads (ICMP errors quote TCP headers as TCPerror, which the
+        # masker never rewrites)
+        "ICMP",
+        "IGMP",
+        "SCTP",
+        "VRRP",
+        "VRRPv3",
+        "ESP",
+        # UDP applications
+        "BOOTP",
+        "CLDAP",
+        "DNS",
+        "HSRP",
+        "HSRPv2",
+        "ISAKMP",
+        "Kerberos",
+        "Kpasswd",
+        "MGCP",
+        "NBNSHeader",
+        "NBTDatagram",
+        "NetflowHeader",
+        "NTP",
+        "Radius",
+        "RIP",
+        "SNMP",
+        "TFTP",
+        "_dhcp6_dispatcher",
+        "_LLMNR",
+    }
+)
+
+# IPv6 next headers after which scapy cannot reach an IPv4 layer
+_IPV6_LEAF_HEADERS = frozenset({6, 58, 59})
+
+_MAX_ENCAPSULATION_DEPTH = 10
+# 802.3 header (Dot3) plus the 3-byte LLC header scapy dissects below it
+_LLC_END = 17
+_UDP_CACHE_LIMIT = 1 << 16
+
+_unpack_tcp_ports_seq = struct.Struct("!HHI").unpack_from
+_unpack_ushort = struct.Struct("!H").unpack_from
+_pack_ports = struct.Struct("!HH").pack
+
+
+class TcpFrameInfo:
+    """Header view of a plain IPv4/TCP frame
+
+    Exposes the same ``src``/``dst``/``sport``/``dport``/``seq`` attributes as the
+    scapy IP and TCP layers, plus the byte offsets needed to patch the frame.
+    ``payload_offset`` runs to the end of the record, trailing link-layer
+    padding included, which matches ``bytes(tcp.payload)`` on a scapy packet.
+    ``flow_key`` is the packed directional 4-tuple (source address, destination
+    address, source port, destination port); ``src``/``dst`` are only formatted
+    when asked for.
+    """
+
+    __slots__ = ("flow_key", "sport", "dport", "seq", "ip_offset", "tcp_offset", "payload_offset", "segment_end")
+
+    def __init__(self, flow_key, sport, dport, seq, ip_offset, tcp_offset, payload_offset, segment_end):
+        self.flow_key = flow_key
+        self.sport = sport
+        self.dport = dport
+        self.seq = seq
+        self.ip_offset = ip_offset
+        self.tcp_offset = tcp_offset
+        self.payload_offset = payload_offset
+        self.segment_end = segment_end
+
+    @property
+    def src(self) -> str:
+        return socket.inet_ntoa(self.flow_key[0:4])
+
+    @property
+    def dst(self) -> str:
+        return socket.inet_ntoa(self.flow_key[4:8])
+
+
+def pack_flow_key(src: str, dst: str, sport: int, dport: int) -> bytes:
+    """Packed directional IPv4 4-tuple, same layout as ``TcpFrameInfo.flow_key``"""
+    return socket.inet_aton(src) + socket.inet_aton(dst) + _pack_ports(sport, dport)
+
+
+def rewrite_tcp_payload(
+    frame: bytearray,
+    tcp_offset: int,
+    segment_end: int,
+    payload_offset: int,
+    new_payload: bytes,
+    src_addr: bytes,
+    dst_addr: bytes,
+) -> None:
+    """Overwrite a TCP payload inside ``frame`` and recompute the TCP checksum.
+
+    Args:
+        frame: Frame bytes, modified in place
+        tcp_offset: Offset of the TCP header
+        segment_end: End of the TCP segment as delimited by the IP total length
+        payload_offset: Offset of the first payload byte
+        new_payload: Replacement bytes (same length as the region they replace)
+        src_addr: IP source address bytes for the pseudo header
+        dst_addr: IP destination address bytes for the pseudo header
+    """
+    frame[payload_offset : payload_offset + len(new_payload)] = new_payload
+    frame[tcp_offset + 16 : tcp_offset + 18] = b"\x00\x00"
+    checksum = transport_checksum(src_addr, dst_addr, IPPROTO_TCP, memoryview(frame)[tcp_offset:segment_end])
+    frame[tcp_offset + 16 : tcp_offset + 18] = checksum.to_bytes(2, "big")
+
+
+class FrameClassifier:
+    """Classify Ethernet frames without building scapy packets"""
+
+    def __init__(self):
+        if not SCAPY_AVAILABLE:
+            raise RuntimeError("Scapy unavailable, cannot resolve layer bindings")
+        self._link_cache: Dict[int, Optional[type]] = {}
+        self._next_layer_cache: Dict[Tuple[type, int], str] = {}
+        self._llc_cache: Dict[Tuple[int, int, int], str] = {}
+        # First layer of each walkable link layer: header length, offset and
+        # field name of the protocol number announcing the next layer
+        self._link_headers = {
+            Ether: (14, 12, "type"),
+            CookedLinux: (16, 14, "proto"),
+            CookedLinuxV2: (20, 0, "proto"),
+        }
+        self._ip_proto_cache: Dict[int, str] = {}
+        self._udp_cache: Dict[Tuple[int, int], bool] = {}
+
+    def classify(self, linktype: int, data: bytes) -> Tuple[int, Optional[TcpFrameInfo]]:
+        """Classify a record.
+
+        Args:
+            linktype: Record link type
+            data: Record bytes
+
+        Returns:
+            (verdict, TcpFrameInfo for TCP_SEGMENT verdicts else None)
+        """
+        verdict, version, offset = self.locate_ip_header(linktype, data)
+        if verdict != IP_HEADER:
+            return verdict, None
+        if version == 4:
+            return self._classify_ipv4(data, offset)
+        return self._classify_ipv6(data, offset)
+
+    def locate_ip_header(self, linktype: int, data: bytes) -> Tuple[int, int, int]:
+        """Find the outermost IP header below the link/VLAN/MPLS headers.
+
+        Args:
+            linktype: Record link type
+            data: Record bytes
+
+        Returns:
+            (IP_HEADER, IP version, header offset) if found, otherwise
+            (PASS_THROUGH, 0, 0) for frames without an IP layer or
+            (NEEDS_DISSECTION, 0, 0) for frames that need scapy
+        """
+        layer_cls = self._link_layer(linktype)
+        if layer_cls is None or not data:
+            return NEEDS_DISSECTION, 0, 0
+        if layer_cls is IPv46:
+            # Raw IP: scapy picks IPv4 or IPv6 from the version nibble
+            return IP_HEADER, 6 if data[0] >> 4 == 6 else 4, 0
+        if layer_cls is IP:
+            return IP_HEADER, 4, 0
+        if layer_cls is IPv6:
+            return IP_HEADER, 6, 0
+
+        offset, field_offset, field = self._link_headers[layer_cls]
+        if len(data) < offset:
+            return NEEDS_DISSECTION, 0, 0
+        ethertype = _unpack_ushort(data, field_offset)[0]
+        if layer_cls is Ether and ethertype <= 1500:
+            # 802.3 length field, scapy dissects it as Dot3/LLC
+            return self._locate_below_llc(data)
+
+        for _ in range(_MAX_ENCAPSULATION_DEPTH):
+            name = self._next_layer(layer_cls, ethertype, field)
+            if name == "IP":
+                return IP_HEADER, 4, offset
+            if name == "IPv6":
+                return IP_HEADER, 6, offset
+            if name in ("Dot1Q", "Dot1AD"):
+                if len(data) < offset + 4:
+                    return NEEDS_DISSECTION, 0, 0
+                layer_cls = Dot1Q if name == "Dot1Q" else Dot1AD
+                field = "type"
+                ethertype = _unpack_ushort(data, offset + 2)[0]
+                offset += 4
+                continue
+            if name == "MPLS":
+                return self._locate_below_mpls(data, offset)
+            if name in _LEAF_LAYERS:
+                return PASS_THROUGH, 0, 0
+            return NEEDS_DISSECTION, 0, 0
+        return NEEDS_DISSECTION, 0, 0
+
+    def _link_layer(self, linktype: int) -> Optional[type]:
+        """scapy class of the first layer of ``linktype`` records, None if it cannot be walked"""
+        try:
+            return self._link_cache[linktype]
+        except KeyError:
+            pass
+        layer_cls = conf.l2types.num2layer.get(linktype)
+        if layer_cls not in self._link_headers and layer_cls not in (IPv46, IP, IPv6):
+            layer_cls = None
+        self._link_cache[linktype] = layer_cls
+        return layer_cls
+
+    def _next_layer(self, layer_cls, ethertype: int, field: str = "type") -> str:
+        key = (layer_cls, ethertype)
+        name = self._next_layer_cache.get(key)
+        if name is None:
+            name = layer_cls(**{field: ethertype}).guess_payload_class(b"").__name__
+            self._next_layer_cache[key] = name
+        return name
+
+    def _locate_below_llc(self, data: bytes) -> Tuple[int, int, int]:
+        # Dot3 always continues with LLC; the layer bound to its SAPs and control
+        # field decides the rest. SNAP (and anything else that may lead to IP) is
+        # left to scapy because Dot3 trims the payload to its length field.
+        if len(data) < _LLC_END:
+            return NEEDS_DISSECTION, 0, 0
+        key = (data[14], data[15], data[16])
+        name = self._llc_cache.get(key)
+        if name is None:
+            name = LLC(dsap=key[0], ssap=key[1], ctrl=key[2]).guess_payload_class(b"").__name__
+            self._llc_cache[key] = name
+        if name in _LEAF_LAYERS:
+            return PASS_THROUGH, 0, 0
+        return NEEDS_DISSECTION, 0, 0
+
+    @staticmethod
+    def _locate_below_mpls(data: bytes, offset: int) -> Tuple[int, int, int]:
+        # Same payload guess as scapy.contrib.mpls: walk to the bottom of the
+        # label stack, then look at the IP version nibble
+        for _ in range(_MAX_ENCAPSULATION_DEPTH):
+            if len(data) < offset + 4:
+                return NEEDS_DISSECTION, 0, 0
+            bottom = data[offset + 2] & 1
+            offset += 4
+            if bottom:
+                break
+        else:
+            return NEEDS_DISSECTION, 0, 0
+
+        if len(data) <= offset:
+            return PASS_THROUGH, 0, 0
+        version = data[offset] >> 4
+        if version in (4, 6):
+            return IP_HEADER, version, offset
+        return NEEDS_DISSECTION, 0, 0
+
+    def _classify_ipv4(self, data: bytes, offset: int) -> Tuple[int, Optional[TcpFrameInfo]]:
+        if len(data) < offset + 20:
+            return NEEDS_DISSECTION, None
+        version_ihl = data[offset]
+        header_len = (version_ihl & 0x0F) * 4
+        total_len = _unpack_ushort(data, offset + 2)[0]
+        if version_ihl >> 4 != 4 or header_len < 20 or total_len < header_len or offset + total_len > len(data):
+            return NEEDS_DISSECTION, None
+
+        flags_frag = _unpack_ushort(data, offset + 6)[0]
+        if flags_frag & 0x1FFF:
+            # Non-first fragment: scapy leaves the payload undissected
+            return PASS_THROUGH, None
+        if flags_frag & 0x2000:
+            return NEEDS_DISSECTION, None
+
+        transport = offset + header_len
+        segment_end = offset + total_len
+        name = self.ip_payload_name(data[offset + 9])
+        if name == "TCP":
+            return self._classify_tcp(data, offset, transport, segment_end)
+        if name == "UDP":
+            return self._classify_udp(data, transport)
+        if name in _LEAF_LAYERS:
+            return PASS_THROUGH, None
+        return NEEDS_DISSECTION, None
+
+    def ip_payload_name(self, proto: int) -> str:
+        """Name of the scapy layer that follows an IPv4 header with protocol ``proto``"""
+        name = self._ip_proto_cache.get(proto)
+        if name is None:
+            name = IP(proto=proto).guess_payload_class(b"").__name__
+            self._ip_proto_cache[proto] = name
+        return name
+
+    def _classify_ipv6(self, data: bytes, offset: int) -> Tuple[int, Optional[TcpFrameInfo]]:
+        # IPv6 TCP is never masked (the masker only follows IPv4), so the only
+        # question is whether an IPv4 layer could be tunnelled further down
+        if len(data) < offset + 40:
+            return NEEDS_DISSECTION, None
+        next_header = data[offset + 6]
+        if next_header in _IPV6_LEAF_HEADERS:
+            return PASS_THROUGH, None
+        if next_header == 17:
+            return self._classify_udp(data, offset + 40)
+        return NEEDS_DISSECTION, None
+
+    def _classify_udp(self, data: bytes, offset: int) -> Tuple[int, Optional[TcpFrameInfo]]:
+        if len(data) < offset + 8:
+            return NEEDS_DISSECTION, None
+        return (PASS_THROUGH if self.udp_payload_is_leaf(data, offset) else NEEDS_DISSECTION), None
+
+    def udp_payload_is_leaf(self, data: bytes, offset: int) -> bool:
+        """Whether scapy dissects the payload of the UDP header at ``offset`` as a leaf layer
+
+        Leaf layers never contain further IP headers. The caller must ensure the
+        8-byte UDP header is present.
+        """
+        ports = (_unpack_ushort(data, offset)[0], _unpack_ushort(data, offset + 2)[0])
+        is_leaf = self._udp_cache.get(ports)
+        if is_leaf is None:
+            name = UDP(sport=ports[0], dport=ports[1]).guess_payload_class(b"").__name__
+            is_leaf = name in _LEAF_LAYERS
+            if len(self._udp_cache) >= _UDP_CACHE_LIMIT:
+                self._udp_cache.clear()
+            self._udp_cache[ports] = is_leaf
+        return is_leaf
+
+    @staticmethod
+    def _classify_tcp(
+        data: bytes, ip_offset: int, tcp_offset: int, segment_end: int
+    ) -> Tuple[int, Optional[TcpFrameInfo]]:
+        if segment_end - tcp_offset < 20:
+            return NEEDS_DISSECTION, None
+        header_len = (data[tcp_offset + 12] >> 4) * 4
+        if header_len < 20 or tcp_offset + header_len > segment_end:
+            return NEEDS_DISSECTION, None
+
+        sport, dport, seq = _unpack_tcp_ports_seq(data, tcp_offset)
+        info = TcpFrameInfo(
+            data[ip_offset + 12 : ip_offset + 20] + data[tcp_offset : tcp_offset + 4],
+            sport,
+            dport,
+            seq,
+            ip_offset,
+            tcp_offset,
+            tcp_offset + header_len,
+            segment_end,
+        )
+        return TCP_SEGMENT, info
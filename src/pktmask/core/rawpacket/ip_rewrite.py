@@ -0,0 +1,200 @@
+"""
+In-place IP address rewriting
+
+Replaces IPv4/IPv6 source and destination addresses directly in the frame
+bytes and patches the affected checksums incrementally (RFC 1624), so the cost
+per packet does not depend on the payload size.
+
+The rewrite mirrors ``HierarchicalAnonymizationStrategy.anonymize_packet``:
+the outermost IPv4 header and the outermost IPv6 header are rewritten and
+every checksum scapy would recompute comes out the same, provided the original
+checksums were correct. Frames whose layout scapy would interpret differently
+(tunnels, first fragments, IPv6 extension headers, ...) are reported as
+unsupported so the caller can fall back to scapy.
+"""
+
+from __future__ import annotations
+
+import socket
+import struct
+from typing import Dict, Mapping, Optional, Set
+
+from .checksum import IPPROTO_TCP, IPPROTO_UDP, transport_checksum, update_checksum
+from .frame import IP_HEADER, PASS_THROUGH, FrameClassifier
+
+IPPROTO_ICMPV6 = 58
+IPPROTO_NONE = 59
+
+_unpack_ushort = struct.Struct("!H").unpack_from
+_pack_ushort = struct.Struct("!H").pack_into
+
+# Offset of the pseudo-header checksum field of each transport rewritten in place
+_CHECKSUM_OFFSET = {IPPROTO_TCP: 16, IPPROTO_UDP: 6}
+# Minimum header length scapy needs to dissect the transport header
+_MIN_HEADER_LEN = {IPPROTO_TCP: 20, IPPROTO_UDP: 8, IPPROTO_ICMPV6: 4}
+
+
+class AddressRewriter:
+    """Rewrite IP addresses of captured frames in place using an address mapping"""
+
+    def __init__(self, ip_map: Mapping[str, str]):
+        """
+        Args:
+            ip_map: Original address string -> anonymized address string
+        """
+        self._ipv4: Dict[bytes, bytes] = {}
+        self._ipv6: Dict[bytes, bytes] = {}
+        # Packed addresses whose mapped value cannot be packed; frames carrying
+        # them are left to scapy so that the outcome stays identical
+        self._unsupported: Set[bytes] = set()
+        for original, anonymized in ip_map.items():
+            for family, table in ((socket.AF_INET, self._ipv4), (socket.AF_INET6, self._ipv6)):
+                try:
+                    key = socket.inet_pton(family, original)
+                except (OSError, TypeError):
+                    continue
+                try:
+                    table[key] = socket.inet_pton(family, anonymized)
+                except (OSError, TypeError):
+                    self._unsupported.add(key)
+                break
+        self._classifier = FrameClassifier()
+
+    def rewrite(self, linktype: int, frame: bytearray) -> Optional[bool]:
+        """Rewrite the addresses of ``frame`` in place.
+
+        Args:
+            linktype: Record link type
+            frame: Frame bytes, modified in place
+
+        Returns:
+            True if an address was replaced, False if the frame is unchanged, or
+            None if the frame must be handled by scapy (``frame`` is untouched)
+        """
+        verdict, version, offset = self._classifier.locate_ip_header(linktype, frame)
+        if verdict == PASS_THROUGH:
+            return False
+        if verdict != IP_HEADER:
+            return None
+        if version == 4:
+            return self._rewrite_ipv4(frame, offset)
+        return self._rewrite_ipv6(frame, offset)
+
+    def _lookup(self, table: Dict[bytes, bytes], address: bytes) -> Optional[bytes]:
+        if address in self._unsupported:
+            raise LookupError
+        return table.get(address)
+
+    def _rewrite_ipv4(self, frame: bytearray, offset: int) -> Optional[bool]:
+        if len(frame) < offset + 20:
+            return None
+        version_ihl = frame[offset]
+        header_len = (version_ihl & 0x0F) * 4
+        total_len = _unpack_ushort(frame, offset + 2)[0]
+        if version_ihl >> 4 != 4 or header_len < 20 or total_len < header_len or offset + total_len > len(frame):
+            return None
+
+        flags_frag = _unpack_ushort(frame, offset + 6)[0]
+        proto = frame[offset + 9]
+        transport = offset + header_len
+        segment_end = offset + total_len
+        if flags_frag & 0x1FFF:
+            # Non-first fragment: scapy keeps the payload as Raw
+            proto = None
+        elif flags_frag & 0x2000:
+            # First fragment: scapy would checksum the partial transport segment
+            return None
+        elif not self._ipv4_payload_supported(frame, proto, transport, segment_end):
+            return None
+
+        old_addresses = bytes(frame[offset + 12 : offset + 20])
+        try:
+            new_src = self._lookup(self._ipv4, old_addresses[:4])
+            new_dst = self._lookup(self._ipv4, old_addresses[4:])
+        except LookupError:
+            return None
+        if new_src is None and new_dst is None:
+            return False
+        new_addresses = (new_src or old_addresses[:4]) + (new_dst or old_addresses[4:])
+
+        frame[offset + 12 : offset + 20] = new_addresses
+        checksum = _unpack_ushort(frame, offset + 10)[0]
+        _pack_ushort(frame, offset + 10, update_checksum(checksum, old_addresses, new_addresses))
+        if proto in _CHECKSUM_OFFSET:
+            self._update_transport(frame, proto, transport, old_addresses, new_addresses, 4)
+        return True
+
+    def _ipv4_payload_supported(self, frame: bytearray, proto: int, transport: int, segment_end: int) -> bool:
+        name = self._classifier.ip_payload_name(proto)
+        if name in ("TCP", "UDP"):
+            if segment_end - transport < _MIN_HEADER_LEN[proto]:
+                return False
+            if name == "TCP":
+                return True
+            return self._udp_supported(frame, transport, segment_end)
+        # ICMP checksums do not cover the addresses; unbound protocols stay Raw
+        return name in ("ICMP", "Raw")
+
+    def _udp_supported(self, frame: bytearray, transport: int, segment_end: int) -> bool:
+        udp_len = _unpack_ushort(frame, transport + 4)[0]
+        return 8 <= udp_len <= segment_end - transport and self._classifier.udp_payload_is_leaf(frame, transport)
+
+    def _rewrite_ipv6(self, frame: bytearray, offset: int) -> Optional[bool]:
+        if len(frame) < offset + 40 or frame[offset] >> 4 != 6:
+            return None
+        payload_len = _unpack_ushort(frame, offset + 4)[0]
+        next_header = frame[offset + 6]
+        transport = offset + 40
+        segment_end = transport + payload_len
+        if segment_end > len(frame):
+            return None
+        if next_header in _MIN_HEADER_LEN:
+            if payload_len < _MIN_HEADER_LEN[next_header]:
+                return None
+            if next_header == IPPROTO_UDP and not self._udp_supported(frame, transport, segment_end):
+                return None
+        elif next_header != IPPROTO_NONE:
+            # Extension headers and tunnels are left to scapy
+            return None
+
+        old_addresses = bytes(frame[offset + 8 : offset + 40])
+        try:
+            new_src = self._lookup(self._ipv6, old_addresses[:16])
+            new_dst = self._lookup(self._ipv6, old_addresses[16:])
+        except LookupError:
+            return None
+        if new_src is None and new_dst is None:
+            return False
+        new_addresses = (new_src or old_addresses[:16]) + (new_dst or old_addresses[16:])
+
+        frame[offset + 8 : offset + 40] = new_addresses
+        # The ICMPv6 checksum field is named ``cksum``, so anonymize_packet never
+        # has scapy recompute it; it is left untouched here as well
+        if next_header in _CHECKSUM_OFFSET:
+            self._update_transport(frame, next_header, transport, old_addresses, new_addresses, 16)
+        return True
+
+    @staticmethod
+    def _update_transport(
+        frame: bytearray,
+        proto: int,
+        transport: int,
+        old_addresses: bytes,
+        new_addresses: bytes,
+        address_len: int,
+    ) -> None:
+        """Patch the pseudo-header checksum of the transport header at ``transport``"""
+        field = transport + _CHECKSUM_OFFSET[proto]
+        checksum = _unpack_ushort(frame, field)[0]
+        if proto == IPPROTO_UDP:
+            if checksum == 0:
+                # No checksum transmitted; scapy computes a full one on rebuild
+                udp_end = transport + _unpack_ushort(frame, transport + 4)[0]
+                src, dst = new_addresses[:address_len], new_addresses[address_len:]
+                _pack_ushort(frame, field, transport_checksum(src, dst, proto, bytes(frame[transport:udp_end])))
+                return
+            checksum = update_checksum(checksum, old_addresses, new_addresses)
+            # A computed UDP checksum of zero is transmitted as all ones
+            _pack_ushort(frame, field, checksum or 0xFFFF)
+            return
+        _pack_ushort(frame, field, update_checksum(checksum, old_addresses, new_addresses))
@@ -0,0 +1,569 @@
+"""
+Raw pcap/pcapng record I/O
+
+Reads capture records as plain bytes plus the metadata needed to write them
+back, without dissecting frames. Output is always libpcap (microsecond), laid
+out exactly as scapy's ``PcapWriter`` writes it so that records passed through
+here are byte-identical to records written from dissected scapy packets.
+"""
+
+from __future__ import annotations
+
+import os
+import struct
+import time
+import zlib
+from decimal import Decimal
+from typing import BinaryIO, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Maximum bytes kept per record; scapy readers truncate records to this size
+MAX_RECORD_SIZE = 0xFFFF
+DLT_EN10MB = 1
+
+PCAP_MAGIC_USEC = 0xA1B2C3D4
+PCAP_MAGIC_NSEC = 0xA1B23C4D
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_BYTE_ORDER_MAGIC = 0x1A2B3C4D
+
+_PCAPNG_IDB = 1
+_PCAPNG_PB = 2
+_PCAPNG_SPB = 3
+_PCAPNG_EPB = 6
+_PCAPNG_OPT_TSRESOL = 9
+_DEFAULT_TSRESOL = 1000000
+_NSEC = Decimal(10) ** -9
+
+
+class CaptureRecord(NamedTuple):
+    """A single capture record
+
+    ``sec``/``usec`` are the values a libpcap (microsecond) writer stores for
+    the record's timestamp.
+    """
+
+    linktype: int
+    sec: int
+    usec: int
+    wirelen: int
+    data: bytes
+
+
+def _decimal_to_pcap_time(timestamp: Decimal) -> Tuple[int, int]:
+    """Split a timestamp the way scapy's PcapWriter does."""
+    whole = int(timestamp)
+    return int(float(timestamp)), int(round((timestamp - whole) * 1000000))
+
+
+def scapy_output_linktype(linktype: int, data: Optional[bytes] = None) -> int:
+    """Return the link type scapy's PcapWriter writes for packets read with ``linktype``.
+
+    scapy derives the output link type from the class of the first written
+    packet, so link types sharing a dissector class collapse to one value and
+    unknown ones become Ethernet. Passing the first record's ``data`` resolves
+    dispatching dissectors the same way (raw IP records become IP or IPv6).
+    """
+    from scapy.config import conf
+
+    layer_cls = conf.l2types.num2layer.get(linktype)
+    if layer_cls is None:
+        return DLT_EN10MB
+    if data and hasattr(layer_cls, "dispatch_hook"):
+        layer_cls = layer_cls.dispatch_hook(data)
+    return conf.l2types.layer2num.get(layer_cls, DLT_EN10MB)
+
+
+def dissect_record(record: CaptureRecord):
+    """Build the scapy packet ``PcapReader`` would return for ``record``."""
+    from scapy.config import conf
+
+    layer_cls = conf.l2types.num2layer.get(record.linktype, conf.raw_layer)
+    try:
+        packet = layer_cls(record.data)
+    except Exception:
+        packet = conf.raw_layer(record.data)
+    packet.wirelen = record.wirelen
+    return packet
+
+
+def detect_capture_format(path: str) -> Optional[str]:
+    """Return ``"pcap"``, ``"pcapng"`` or None for unsupported/compressed files."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    if len(head) < 4:
+        return None
+    if head == struct.pack("<I", PCAPNG_SHB):
+        return "pcapng"
+    for endian in "<>":
+        if struct.unpack(endian + "I", head)[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+            return "pcap"
+    return None
+
+
+def count_pcap_records(path: str) -> int:
+    """Count the records of a libpcap file by walking the record headers
+
+    Only the 16-byte record headers are read; record data is skipped with a
+    seek. Raises ValueError for non-libpcap files and truncated records.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(24)
+        if len(header) < 24:
+            raise ValueError(f"Truncated pcap header: {path}")
+        for endian in "<>":
+            if struct.unpack(endian + "I", header[:4])[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC):
+                break
+        else:
+            raise ValueError(f"Not a libpcap file: {path}")
+        record_header = struct.Struct(endian + "IIII")
+
+        count = 0
+        offset = 24
+        while offset < file_size:
+            head = f.read(16)
+            if len(head) < 16:
+                raise ValueError(f"Truncated record header at offset {offset}")
+            caplen = record_header.unpack(head)[2]
+            offset += 16 + caplen
+            if offset > file_size:
+                raise ValueError(f"Truncated record data at offset {offset - caplen}")
+            f.seek(offset)
+            count += 1
+    return count
+
+
+class RawCaptureReader:
+    """Iterate :class:`CaptureRecord` objects from a pcap or pcapng file
+
+    Mirrors scapy's ``PcapReader``/``PcapNgReader`` record semantics: records are
+    truncated to :data:`MAX_RECORD_SIZE`, pcapng timestamps honour ``if_tsresol``
+    and non-packet blocks are skipped.
+
+    Between records, :meth:`checkpoint` returns the reader position; a reader
+    created with ``resume_from`` set to it continues with the next record.
+    """
+
+    def __init__(self, path: str, buffer_size: int = 1 << 20, resume_from: Optional[Dict] = None):
+        self.path = path
+        self.format = detect_capture_format(path)
+        if self.format is None:
+            raise ValueError(f"Not a pcap/pcapng file: {path}")
+        self._f: BinaryIO = open(path, "rb", buffer_size)
+        self._resume_from = resume_from
+        # pcapng section state, kept on the reader so that it can be checkpointed
+        self._endian = "<"
+        self._interfaces: List[Tuple[int, int, int]] = []
+
+    def __enter__(self) -> "RawCaptureReader":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._f.close()
+
+    def checkpoint(self) -> Dict:
+        """Position after the last record returned, as a JSON-serializable dict"""
+        return {
+            "format": self.format,
+            "offset": self._f.tell(),
+            "endian": self._endian,
+            "interfaces": [list(interface) for interface in self._interfaces],
+        }
+
+    def _resume(self) -> None:
+        state = self._resume_from
+        if state is None:
+            return
+        if state["format"] != self.format:
+            raise ValueError(f"Checkpoint of a {state['format']} file cannot resume {self.format} input")
+        self._endian = state["endian"]
+        self._interfaces = [tuple(interface) for interface in state["interfaces"]]
+        self._f.seek(state["offset"])
+
+    def __iter__(self) -> Iterator[CaptureRecord]:
+        if self.format == "pcap":
+            return self._iter_pcap()
+        return self._iter_pcapng()
+
+    def _iter_pcap(self) -> Iterator[CaptureRecord]:
+        f = self._f
+        header = f.read(24)
+        if len(header) < 24:
+            return
+        endian = "<" if struct.unpack("<I", header[:4])[0] in (PCAP_MAGIC_USEC, PCAP_MAGIC_NSEC) else ">"
+        magic = struct.unpack(endian + "I", header[:4])[0]
+        nano = magic == PCAP_MAGIC_NSEC
+        linktype = struct.unpack(endian + "I", header[20:24])[0]
+        record_header = struct.Struct(endian + "IIII")
+        read = f.read
+        self._resume()
+
+        while True:
+            hdr = read(16)
+            if len(hdr) < 16:
+                return
+            sec, frac, caplen, wirelen = record_header.unpack(hdr)
+            data = read(caplen)
+            if len(data) > MAX_RECORD_SIZE:
+                data = data[:MAX_RECORD_SIZE]
+            if nano:
+                sec, frac = _decimal_to_pcap_time(sec + _NSEC * frac)
+            yield CaptureRecord(linktype, sec, frac, wirelen, data)
+            if len(data) < min(caplen, MAX_RECORD_SIZE):
+                # Truncated file: keep the partial record and stop, as scapy does
+                return
+
+    def _iter_pcapng(self) -> Iterator[CaptureRecord]:
+        f = self._f
+        self._resume()
+        # (linktype, snaplen, tsresol) per interface; like scapy, interface ids
+        # keep counting across sections
+        interfaces = self._interfaces
+
+        while True:
+            endian = self._endian
+            head = f.read(8)
+            if len(head) < 8:
+                return
+            block_type = struct.unpack(endian + "I", head[:4])[0]
+            if block_type == PCAPNG_SHB:
+                # The byte-order magic decides how this section (including
+                # this block's length) is encoded
+                bom = f.read(4)
+                if len(bom) < 4:
+                    return
+                endian = self._endian = "<" if struct.unpack("<I", bom)[0] == PCAPNG_BYTE_ORDER_MAGIC else ">"
+                block_len = struct.unpack(endian + "I", head[4:8])[0]
+                if block_len < 28 or len(f.read(block_len - 12)) < block_len - 12:
+                    return
+                continue
+
+            block_type = struct.unpack(endian + "I", head[:4])[0]
+            block_len = struct.unpack(endian + "I", head[4:8])[0]
+            if block_len < 12:
+                return
+            body = f.read(block_len - 8)
+            if len(body) < block_len - 8:
+                return
+            body = body[:-4]
+
+            if block_type == _PCAPNG_IDB:
+                interfaces.append(self._parse_idb(body, endian))
+            elif block_type == _PCAPNG_EPB:
+                record = self._parse_packet_block(body, endian, interfaces, "5I")
+                if record is not None:
+                    yield record
+            elif block_type == _PCAPNG_PB:
+                record = self._parse_packet_block(body, endian, interfaces, "HH4I")
+                if record is not None:
+                    yield record
+            elif block_type == _PCAPNG_SPB:
+                if not interfaces or len(body) < 4:
+                    continue
+                linktype, snaplen, _ = interfaces[0]
+                wirelen = struct.unpack(endian + "I", body[:4])[0]
+                caplen = min(wirelen, snaplen)
+                # Simple packet blocks carry no timestamp; scapy stamps them
+                # with the time they were read
+                sec, usec = _decimal_to_pcap_time(Decimal(time.time()))
+                yield CaptureRecord(linktype, sec, usec, wirelen, body[4 : 4 + caplen][:MAX_RECORD_SIZE])
+
+    @staticmethod
+    def _parse_idb(body: bytes, endian: str) -> Tuple[int, int, int]:
+        linktype, snaplen = struct.unpack(endian + "HxxI", body[:8])
+        options = _parse_pcapng_options(body[8:], endian)
+        tsresol = _DEFAULT_TSRESOL
+        value = options.get(_PCAPNG_OPT_TSRESOL)
+        if value is not None and len(value) == 1:
+            tsresol = (2 if value[0] & 128 else 10) ** (value[0] & 127)
+        return linktype, snaplen, tsresol
+
+    @staticmethod
+    def _parse_packet_block(
+        body: bytes, endian: str, interfaces: List[Tuple[int, int, int]], layout: str
+    ) -> Optional[CaptureRecord]:
+        if len(body) < 20:
+            return None
+        if layout == "5I":
+            intid, tshigh, tslow, caplen, wirelen = struct.unpack(endian + "5I", body[:20])
+        else:
+            intid, _, tshigh, tslow, caplen, wirelen = struct.unpack(endian + "HH4I", body[:20])
+        if intid >= len(interfaces):
+            return None
+        linktype, _, tsresol = interfaces[intid]
+        sec, usec = _decimal_to_pcap_time(Decimal((tshigh << 32) + tslow) / tsresol)
+        return CaptureRecord(linktype, sec, usec, wirelen, body[20 : 20 + caplen][:MAX_RECORD_SIZE])
+
+
+def _parse_pcapng_options(data: bytes, endian: str) -> Dict[int, bytes]:
+    """Parse pcapng options, keeping the first value of repeated codes."""
+    options: Dict[int, bytes] = {}
+    offset = 0
+    while offset + 4 <= len(data):
+        code, length = struct.unpack(endian + "HH", data[offset : offset + 4])
+        if code == 0:
+            break
+        options.setdefault(code, data[offset + 4 : offset + 4 + length])
+        offset += 4 + length + (-length) % 4
+    return options
+
+
+class SyncPolicy:
+    """When buffered capture output is forced to stable storage
+
+    ``every_bytes``/``every_packets`` of 0 disable the periodic sync, so by
+    default a file is only flushed and fsynced once, when it is closed.
+    """
+
+    __slots__ = ("every_bytes", "every_packets", "fsync_on_close")
+
+    def __init__(self, every_bytes: int = 0, every_packets: int = 0, fsync_on_close: bool = True):
+        self.every_bytes = max(0, int(every_bytes))
+        self.every_packets = max(0, int(every_packets))
+        self.fsync_on_close = fsync_on_close
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "SyncPolicy":
+        """Build from ``sync_every_bytes``/``sync_every_packets``/``fsync_on_close`` keys"""
+        return cls(
+            config.get("sync_every_bytes", 0),
+            config.get("sync_every_packets", 0),
+            config.get("fsync_on_close", True),
+        )
+
+    @property
+    def periodic(self) -> bool:
+        return bool(self.every_bytes or self.every_packets)
+
+
+def sync_file(f: BinaryIO) -> None:
+    """Flush a file object and fsync it, ignoring files without a descriptor"""
+    f.flush()
+    try:
+        os.fsync(f.fileno())
+    except (AttributeError, OSError, ValueError):
+        pass
+
+
+class SyncTracker:
+    """Counts output since the last sync and reports when a :class:`SyncPolicy` interval is due"""
+
+    __slots__ = ("policy", "_bytes", "_packets")
+
+    def __init__(self, policy: SyncPolicy):
+        self.policy = policy
+        self._bytes = 0
+        self._packets = 0
+
+    def record(self, nbytes: int, packets: int = 1) -> bool:
+        """Account for written output; True when the file should be synced now"""
+        policy = self.policy
+        if not policy.periodic:
+            return False
+        self._bytes += nbytes
+        self._packets += packets
+        if (policy.every_bytes and self._bytes >= policy.every_bytes) or (
+            policy.every_packets and self._packets >= policy.every_packets
+        ):
+            self._bytes = self._packets = 0
+            return True
+        return False
+
+
+class WriteDigest:
+    """Counters collected while a capture file is written
+
+    ``bytes_written`` and ``crc32`` cover every byte handed to the file, global
+    header included, so they describe the finished file without reading it back.
+    """
+
+    __slots__ = ("records", "bytes_written", "crc32")
+
+    def __init__(self):
+        self.records = 0
+        self.bytes_written = 0
+        self.crc32 = 0
+
+    def update(self, data) -> None:
+        self.bytes_written += len(data)
+        self.crc32 = zlib.crc32(data, self.crc32)
+
+    @property
+    def checksum(self) -> str:
+        return f"{self.crc32:08x}"
+
+    def to_dict(self) -> Dict[str, object]:
+        return {"records_written": self.records, "bytes_written": self.bytes_written, "write_crc32": self.checksum}
+
+
+class DigestingFile:
+    """File object wrapper that feeds everything written through a :class:`WriteDigest`
+
+    Used for scapy's ``PcapWriter``, which writes headers and records with
+    ``self.f.write``; every other attribute goes to the wrapped file.
+    """
+
+    def __init__(self, f: BinaryIO, digest: WriteDigest):
+        self._f = f
+        self.digest = digest
+
+    def write(self, data) -> int:
+        self.digest.update(data)
+        return self._f.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+
+class RawPcapWriter:
+    """Write records as a libpcap (microsecond) file
+
+    The global header is written lazily with the link type of the first record,
+    or Ethernet if the file ends up empty, as scapy's ``PcapWriter`` does.
+
+    Records are serialized into an in-memory buffer that is handed to the OS in
+    ``buffer_size`` chunks, so a file costs few large ``write()`` calls. The
+    file is fsynced on close and, if ``sync_policy`` asks for it, every N bytes
+    or packets. ``digest`` counts the records and bytes written.
+
+    :meth:`checkpoint` syncs the file and returns its state; a writer created
+    with ``resume_from`` set to it truncates whatever was written after that
+    point and appends from there. :meth:`matches_checkpoint` tells whether the
+    file on disk still starts with the bytes the checkpoint describes.
+    """
+
+    _HEADER = struct.Struct("=IHHIIII")
+    _RECORD = struct.Struct("=IIII")
+
+    def __init__(
+        self,
+        path: str,
+        buffer_size: int = 1 << 20,
+        snaplen: int = MAX_RECORD_SIZE,
+        sync_policy: Optional[SyncPolicy] = None,
+        resume_from: Optional[Dict] = None,
+    ):
+        self.path = path
+        self.snaplen = snaplen
+        self.linktype: Optional[int] = None
+        self.digest = WriteDigest()
+        self.write_calls = 0
+        self.buffer_size = max(1, buffer_size)
+        self.sync_policy = sync_policy if sync_policy is not None else SyncPolicy(fsync_on_close=False)
+        self._sync_tracker = SyncTracker(self.sync_policy)
+        self._buffer = bytearray()
+        if resume_from is None:
+            self._f: BinaryIO = open(path, "wb", buffering=0)
+        else:
+            self._f = self._open_resumed(path, resume_from)
+
+    @staticmethod
+    def matches_checkpoint(path: str, state: Dict, block_size: int = 1 << 20) -> bool:
+        """Whether ``path`` holds at least the checkpointed bytes and their CRC32 matches
+
+        The output may have been rewritten, replaced or partly copied since the
+        checkpoint was saved; appending to such a file would corrupt it.
+        """
+        remaining = state["offset"]
+        crc32 = 0
+        try:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size < remaining:
+                    return False
+                while remaining:
+                    block = f.read(min(block_size, remaining))
+                    if not block:
+                        return False
+                    crc32 = zlib.crc32(block, crc32)
+                    remaining -= len(block)
+        except OSError:
+            return False
+        return crc32 == state["crc32"]
+
+    def _open_resumed(self, path: str, state: Dict) -> BinaryIO:
+        offset = state["offset"]
+        f = open(path, "r+b", buffering=0)
+        try:
+            if os.fstat(f.fileno()).st_size < offset:
+                raise ValueError(f"Output file {path} is shorter than its checkpoint ({offset} bytes)")
+            f.truncate(offset)
+            f.seek(offset)
+        except Exception:
+            f.close()
+            raise
+        self.linktype = state["linktype"]
+        self.digest.records = state["records"]
+        self.digest.bytes_written = offset
+        self.digest.crc32 = state["crc32"]
+        return f
+
+    def checkpoint(self) -> Dict:
+        """Sync the records written so far and return the state to resume after them"""
+        self.sync()
+        return {
+            "offset": self.digest.bytes_written,
+            "linktype": self.linktype,
+            "records": self.digest.records,
+            "crc32": self.digest.crc32,
+        }
+
+    def __enter__(self) -> "RawPcapWriter":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def write_header(self, linktype: int) -> None:
+        self.linktype = linktype
+        self._buffer += self._HEADER.pack(PCAP_MAGIC_USEC, 2, 4, 0, 0, self.snaplen, linktype)
+
+    def write_record(self, data: bytes, sec: int, usec: int, wirelen: int) -> None:
+        if self.linktype is None:
+            self.write_header(DLT_EN10MB)
+        buffer = self._buffer
+        buffer += self._RECORD.pack(sec, usec, len(data), wirelen)
+        buffer += data
+        self.digest.records += 1
+        if self._sync_tracker.record(16 + len(data)):
+            self.sync()
+        elif len(buffer) >= self.buffer_size:
+            self._drain()
+
+    @property
+    def records_written(self) -> int:
+        return self.digest.records
+
+    def _drain(self) -> None:
+        if self._buffer:
+            self.digest.update(self._buffer)
+            view = memoryview(self._buffer)
+            while view:
+                # Raw files may accept fewer bytes than offered
+                written = self._f.write(view)
+                self.write_calls += 1
+                view = view[written:]
+            view.release()
+            self._buffer.clear()
+
+    def flush(self) -> None:
+        self._drain()
+
+    def sync(self) -> None:
+        """Write out buffered records and fsync the file"""
+        self._drain()
+        sync_file(self._f)
+
+    def close(self) -> None:
+        if self._f.closed:
+            return
+        try:
+            if self.linktype is None:
+                self.write_header(DLT_EN10MB)
+            if self.sync_policy.fsync_on_close:
+                self.sync()
+            else:
+                self._drain()
+        finally:
+            self._f.close()
@@ -1,13 +1,17 @@
 import ipaddress
 import os
 import random
+import sys
 from abc import ABC, abstractmethod
-from typing import Dict, List, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Set, Tuple
 
 from scapy.all import IP, IPv6, PcapNgReader, PcapReader
 
 from ..common.constants import ProcessingConstants
 from ..infrastructure.logging import get_logger
+from .ip_mapping import IPv4HierarchyMapper, IPv6HierarchyMapper, encode_addresses
 
 
 class AnonymizationStrategy(ABC):
@@ -302,21 +306,91 @@ def _generate_unique_ipv6_segment(original_seg: str, seed_base: str) -> str:
     return format(result, "x").zfill(n)
 
 
+def _new_ip_stats() -> Dict[str, int]:
+    return {
+        "total_packets_scanned": 0,
+        "ipv4_packets": 0,
+        "ipv6_packets": 0,
+        "multi_ip_packets": 0,
+    }
+
+
+def _extract_packet_ips(packet, ip_stats: Dict[str, int]) -> List[Tuple[str, str, str]]:
+    """Extract IP addresses directly from packet using scapy
+
+    Args:
+        packet: Scapy packet object
+        ip_stats: Statistics counters updated in place
+
+    Returns:
+        List of (src_ip, dst_ip, ip_version) tuples
+    """
+    ips = []
+
+    # Process IPv4 layers
+    has_ipv4 = packet.haslayer(IP)
+    if has_ipv4:
+        ip_layer = packet.getlayer(IP)
+        ips.append((ip_layer.src, ip_layer.dst, "ipv4"))
+        ip_stats["ipv4_packets"] += 1
+
+    # Process IPv6 layers
+    has_ipv6 = packet.haslayer(IPv6)
+    if has_ipv6:
+        ip_layer = packet.getlayer(IPv6)
+        ips.append((ip_layer.src, ip_layer.dst, "ipv6"))
+        ip_stats["ipv6_packets"] += 1
+
+    # Track multi-IP packets (both IPv4 and IPv6)
+    if has_ipv4 and has_ipv6:
+        ip_stats["multi_ip_packets"] += 1
+
+    return ips
+
+
+def _scan_file_addresses(file_path: str) -> Tuple[Dict[str, int], Dict[str, int], Optional[str]]:
+    """Count how often each address occurs (as source or destination) in one file.
+
+    Module-level so that it can run in prescan worker processes. A read error
+    keeps the counts gathered up to that point, like the serial scan did.
+
+    Returns:
+        Tuple of (address -> occurrences, IP statistics, error message or None)
+    """
+    address_counts: Dict[str, int] = {}
+    ip_stats = _new_ip_stats()
+    error = None
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        reader_class = PcapNgReader if ext == ".pcapng" else PcapReader
+        with reader_class(file_path) as reader:
+            for packet in reader:
+                ip_stats["total_packets_scanned"] += 1
+                for src_ip, dst_ip, _ in _extract_packet_ips(packet, ip_stats):
+                    address_counts[src_ip] = address_counts.get(src_ip, 0) + 1
+                    address_counts[dst_ip] = address_counts.get(dst_ip, 0) + 1
+    except Exception as e:
+        error = f"Error scanning file {file_path}: {str(e)}"
+    return address_counts, ip_stats, error
+
+
 class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
     """
     Hierarchical IP anonymization strategy based on network segment frequency.
     This strategy pre-scans files to preserve subnet structure.
     """
 
-    def __init__(self):
+    def __init__(self, prescan_workers: Optional[int] = None):
+        """
+        Args:
+            prescan_workers: Worker processes for the address prescan. None picks
+                one per CPU for directories larger than
+                ``ProcessingConstants.PRESCAN_PARALLEL_MIN_BYTES``; 1 scans serially.
+        """
         self._ip_map: Dict[str, str] = {}
+        self.prescan_workers = prescan_workers
         # Direct IP processing statistics (no adapter layer needed)
-        self._ip_stats = {
-            "total_packets_scanned": 0,
-            "ipv4_packets": 0,
-            "ipv6_packets": 0,
-            "multi_ip_packets": 0,
-        }
+        self._ip_stats = _new_ip_stats()
 
     def _extract_ips_from_packet(self, packet) -> List[Tuple[str, str, str]]:
         """Extract IP addresses directly from packet using scapy
@@ -327,35 +401,12 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
         Returns:
             List of (src_ip, dst_ip, ip_version) tuples
         """
-        ips = []
-
-        # Process IPv4 layers
-        if packet.haslayer(IP):
-            ip_layer = packet.getlayer(IP)
-            ips.append((ip_layer.src, ip_layer.dst, "ipv4"))
-            self._ip_stats["ipv4_packets"] += 1
-
-        # Process IPv6 layers
-        if packet.haslayer(IPv6):
-            ip_layer = packet.getlayer(IPv6)
-            ips.append((ip_layer.src, ip_layer.dst, "ipv6"))
-            self._ip_stats["ipv6_packets"] += 1
-
-        # Track multi-IP packets (both IPv4 and IPv6)
-        if packet.haslayer(IP) and packet.haslayer(IPv6):
-            self._ip_stats["multi_ip_packets"] += 1
-
-        return ips
+        return _extract_packet_ips(packet, self._ip_stats)
 
     def reset(self):
         self._ip_map = {}
         # Reset IP processing statistics
-        self._ip_stats = {
-            "total_packets_scanned": 0,
-            "ipv4_packets": 0,
-            "ipv6_packets": 0,
-            "multi_ip_packets": 0,
-        }
+        self._ip_stats = _new_ip_stats()
 
     def get_ip_map(self) -> Dict[str, str]:
         return self._ip_map
@@ -382,8 +433,8 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
         ) = ({}, {}, {}, {}, {}, {}, {})
         unique_ips = set()
 
-        def process_ipv4_address(ip_str: str):
-            """处理单个IPv4地址的频率统计"""
+        def process_ipv4_address(ip_str: str, count: int):
+            """处理单个IPv4地址的频率统计（count为出现次数）"""
             unique_ips.add(ip_str)
             try:
                 ipaddress.IPv4Address(ip_str)
@@ -393,12 +444,12 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
             if len(parts) != 4:
                 return
             # 统计各级频率
-            freq_ipv4_1[parts[0]] = freq_ipv4_1.get(parts[0], 0) + 1
-            freq_ipv4_2[".".join(parts[:2])] = freq_ipv4_2.get(".".join(parts[:2]), 0) + 1
-            freq_ipv4_3[".".join(parts[:3])] = freq_ipv4_3.get(".".join(parts[:3]), 0) + 1
+            freq_ipv4_1[parts[0]] = freq_ipv4_1.get(parts[0], 0) + count
+            freq_ipv4_2[".".join(parts[:2])] = freq_ipv4_2.get(".".join(parts[:2]), 0) + count
+            freq_ipv4_3[".".join(parts[:3])] = freq_ipv4_3.get(".".join(parts[:3]), 0) + count
 
-        def process_ipv6_address(ip_str: str):
-            """处理单个IPv6地址的频率统计"""
+        def process_ipv6_address(ip_str: str, count: int):
+            """处理单个IPv6地址的频率统计（count为出现次数）"""
             unique_ips.add(ip_str)
             try:
                 ip_obj = ipaddress.IPv6Address(ip_str)
@@ -408,43 +459,31 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
             if len(parts) != 8:
                 return
             # 统计各级前缀频率
-            freq_ipv6_1[parts[0]] = freq_ipv6_1.get(parts[0], 0) + 1
-            freq_ipv6_2[":".join(parts[:2])] = freq_ipv6_2.get(":".join(parts[:2]), 0) + 1
-            freq_ipv6_3[":".join(parts[:3])] = freq_ipv6_3.get(":".join(parts[:3]), 0) + 1
-            freq_ipv6_4[":".join(parts[:4])] = freq_ipv6_4.get(":".join(parts[:4]), 0) + 1
-            freq_ipv6_5[":".join(parts[:5])] = freq_ipv6_5.get(":".join(parts[:5]), 0) + 1
-            freq_ipv6_6[":".join(parts[:6])] = freq_ipv6_6.get(":".join(parts[:6]), 0) + 1
-            freq_ipv6_7[":".join(parts[:7])] = freq_ipv6_7.get(":".join(parts[:7]), 0) + 1
-
-        # Direct IP processing without adapter layer
-        for f in files_to_process:
-            file_path = os.path.join(subdir_path, f)
-            ext = os.path.splitext(f)[1].lower()
-            try:
-                reader_class = PcapNgReader if ext == ".pcapng" else PcapReader
-                with reader_class(file_path) as reader:
-                    for packet in reader:
-                        self._ip_stats["total_packets_scanned"] += 1
-
-                        # Direct IP extraction using scapy
-                        ip_pairs = self._extract_ips_from_packet(packet)
-
-                        for src_ip, dst_ip, ip_version in ip_pairs:
-                            # 处理IPv4地址
-                            if "." in src_ip:
-                                process_ipv4_address(src_ip)
-                            elif ":" in src_ip:
-                                process_ipv6_address(src_ip)
-
-                            if "." in dst_ip:
-                                process_ipv4_address(dst_ip)
-                            elif ":" in dst_ip:
-                                process_ipv6_address(dst_ip)
-
-                        # No fallback needed - direct scapy extraction handles all cases
-
-            except Exception as e:
-                error_log.append(f"Error scanning file {file_path}: {str(e)}")
+            freq_ipv6_1[parts[0]] = freq_ipv6_1.get(parts[0], 0) + count
+            freq_ipv6_2[":".join(parts[:2])] = freq_ipv6_2.get(":".join(parts[:2]), 0) + count
+            freq_ipv6_3[":".join(parts[:3])] = freq_ipv6_3.get(":".join(parts[:3]), 0) + count
+            freq_ipv6_4[":".join(parts[:4])] = freq_ipv6_4.get(":".join(parts[:4]), 0) + count
+            freq_ipv6_5[":".join(parts[:5])] = freq_ipv6_5.get(":".join(parts[:5]), 0) + count
+            freq_ipv6_6[":".join(parts[:6])] = freq_ipv6_6.get(":".join(parts[:6]), 0) + count
+            freq_ipv6_7[":".join(parts[:7])] = freq_ipv6_7.get(":".join(parts[:7]), 0) + count
+
+        # 逐文件统计地址出现次数（可并行），再按文件顺序合并，结果与串行扫描一致
+        file_paths = [os.path.join(subdir_path, f) for f in files_to_process]
+        address_counts: Dict[str, int] = {}
+        for file_counts, file_stats, error in self._scan_files(file_paths):
+            for key, value in file_stats.items():
+                self._ip_stats[key] += value
+            if error:
+                error_log.append(error)
+            for address, count in file_counts.items():
+                address_counts[address] = address_counts.get(address, 0) + count
+
+        # 每个唯一地址只解析一次，按出现次数累加前缀频率
+        for address, count in address_counts.items():
+            if "." in address:
+                process_ipv4_address(address, count)
+            elif ":" in address:
+                process_ipv6_address(address, count)
 
         # Record frequency statistics and performance metrics
         end_time = time.time()
@@ -499,6 +538,37 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
             unique_ips,
         )
 
+    def _resolve_prescan_workers(self, file_paths: List[str]) -> int:
+        """Number of prescan worker processes to use for ``file_paths``"""
+        if len(file_paths) < 2:
+            return 1
+        if self.prescan_workers is not None:
+            return max(1, min(self.prescan_workers, len(file_paths)))
+        if getattr(sys, "frozen", False):
+            # Packaged desktop builds cannot re-launch the interpreter for workers
+            return 1
+        total_size = 0
+        for path in file_paths:
+            try:
+                total_size += os.path.getsize(path)
+            except OSError:
+                pass
+        if total_size < ProcessingConstants.PRESCAN_PARALLEL_MIN_BYTES:
+            return 1
+        return max(1, min(os.cpu_count() or 1, len(file_paths)))
+
+    def _scan_files(self, file_paths: List[str]) -> List[Tuple[Dict[str, int], Dict[str, int], Optional[str]]]:
+        """Scan files serially or across a process pool, returning results in file order"""
+        workers = self._resolve_prescan_workers(file_paths)
+        if workers > 1:
+            try:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    return list(executor.map(_scan_file_addresses, file_paths))
+            except (OSError, BrokenProcessPool) as e:
+                logger = get_logger("anonymization.strategy")
+                logger.warning(f"Parallel address prescan unavailable ({e}), scanning serially")
+        return [_scan_file_addresses(path) for path in file_paths]
+
     def create_mapping(self, files_to_process: List[str], subdir_path: str, error_log: List[str]) -> Dict[str, str]:
         """
         Create IP mapping, ensuring no conflicts
@@ -511,34 +581,31 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
 
         freqs_ipv4, freqs_ipv6, all_ips = self._prescan_addresses(files_to_process, subdir_path, error_log)
 
-        mapping = {}
-        maps_ipv4 = ({}, {}, {})
-        maps_ipv6 = ({}, {}, {}, {}, {}, {}, {})
-
-        # Track used segment values to ensure uniqueness
-        used_segments = (set(), set(), set())  # (A-segment, A.B-segment, A.B.C-segment)
-
-        sorted_ips = sorted(all_ips, key=ip_sort_key)
+        # Plain IPv4/IPv6 addresses go through the integer-encoded engine in
+        # sorted order, the rest through the per-address generator; the result
+        # (including its order) is the same as mapping in ip_sort_key order.
+        ipv4_addresses, ipv6_addresses, other_addresses = encode_addresses(all_ips)
+        ipv4_mapper = IPv4HierarchyMapper(*freqs_ipv4)
+        ipv6_mapper = IPv6HierarchyMapper(freqs_ipv6)
+        maps_ipv4 = ipv4_mapper.maps
+        maps_ipv6 = ipv6_mapper.maps
 
         # Record mapping generation start information
         logger = get_logger("anonymization.strategy")
-        ipv4_count = sum(1 for ip in sorted_ips if "." in ip)
-        logger.info(f"Starting mapping generation - IPv4 addresses: {ipv4_count}, total IPs: {len(sorted_ips)}")
+        logger.info(f"Starting mapping generation - IPv4 addresses: {len(ipv4_addresses)}, total IPs: {len(all_ips)}")
 
-        for ip in sorted_ips:
+        mapping = {}
+        for ip, mapped_ip, error in ipv4_mapper.map_sorted(ipv4_addresses) + ipv6_mapper.map_sorted(ipv6_addresses):
+            if error is None:
+                mapping[ip] = mapped_ip
+            else:
+                error_log.append(f"Pre-calculate mapping error for IP {ip}: {error}")
+
+        # Leftovers are invalid strings or IPv6 with a scope / embedded dotted quad
+        for ip in sorted(other_addresses, key=ip_sort_key):
             try:
-                ip_obj = ipaddress.ip_address(ip)
-                if ip_obj.version == 4:
-                    mapping[ip] = _generate_new_ipv4_address_hierarchical(
-                        ip,
-                        freqs_ipv4[0],
-                        freqs_ipv4[1],
-                        freqs_ipv4[2],
-                        maps_ipv4,
-                        used_segments,
-                    )
-                else:
-                    mapping[ip] = _generate_new_ipv6_address_hierarchical(ip, freqs_ipv6, maps_ipv6)
+                ipaddress.ip_address(ip)
+                mapping[ip] = _generate_new_ipv6_address_hierarchical(ip, freqs_ipv6, maps_ipv6)
             except Exception as e:
                 error_log.append(f"Pre-calculate mapping error for IP {ip}: {str(e)}")
 
@@ -546,8 +613,9 @@ class HierarchicalAnonymizationStrategy(AnonymizationStrategy):
         logger.info(
             f"Hierarchical mapping generation completed: A-segment mappings={len(maps_ipv4[0])}, A.B-segment mappings={len(maps_ipv4[1])}, A.B.C-segment mappings={len(maps_ipv4[2])}"
         )
+        pool_a, pool_b, pool_c = ipv4_mapper.pools
         logger.debug(
-            f"Unique segment count statistics: A-segment={len(used_segments[0])}, A.B-segment={len(used_segments[1])}, A.B.C-segment={len(used_segments[2])}"
+            f"Unique segment count statistics: A-segment={pool_a.used_count}, A.B-segment={pool_b.used_count}, A.B.C-segment={pool_c.used_count}"
         )
 
         # 验证高频网段的一致性映射
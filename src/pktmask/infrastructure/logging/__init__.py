@@ -11,6 +11,7 @@ from .logger import (
     reconfigure_logging,
     set_log_level,
 )
+from .trace import HotPathTracer
 
 __all__ = [
     "PktMaskLogger",
@@ -19,4 +20,5 @@ __all__ = [
     "log_exception",
     "set_log_level",
     "reconfigure_logging",
+    "HotPathTracer",
 ]
@@ -0,0 +1,77 @@
+"""
+Sampled hot-path tracing
+
+Per-packet and per-flow diagnostics must not cost anything when nobody reads
+them. The "pktmask" logger always runs at DEBUG (the rotating file handler
+records everything), so a plain ``logger.debug(f"...")`` in a packet loop
+formats its message and builds a LogRecord for every packet.
+
+Hot paths use a HotPathTracer instead and guard each message with one
+attribute check, so the f-string is only built for sampled events:
+
+    if self._trace.enabled and self._trace.sample():
+        self._trace.log(f"Assigned new flow ID: {tuple_key} -> {stream_id}")
+
+Tracing is off unless the ``PKTMASK_TRACE`` environment variable is set when
+the process starts. ``PKTMASK_TRACE=1`` traces every event, ``PKTMASK_TRACE=N``
+traces one event in N (the 1st, the N+1th, ...) per tracer.
+"""
+
+import logging
+import os
+from typing import Optional
+
+TRACE_ENV_VAR = "PKTMASK_TRACE"
+
+
+def trace_sample_rate_from_env() -> int:
+    """Sample rate configured by PKTMASK_TRACE (0 = tracing disabled)"""
+    value = os.environ.get(TRACE_ENV_VAR, "").strip().lower()
+    if value in ("", "0", "false", "no", "off"):
+        return 0
+    if value in ("true", "yes", "on"):
+        return 1
+    try:
+        return max(0, int(value))
+    except ValueError:
+        return 0
+
+
+# Read once at import time: a disabled tracer stays disabled for the whole run
+TRACE_SAMPLE_RATE = trace_sample_rate_from_env()
+
+
+class HotPathTracer:
+    """1-in-N sampled debug messages for code that runs once per packet or flow"""
+
+    __slots__ = ("logger", "level", "sample_every", "enabled", "events", "emitted")
+
+    def __init__(self, logger: logging.Logger, sample_every: Optional[int] = None, level: int = logging.DEBUG):
+        """
+        Args:
+            logger: Logger receiving the sampled messages
+            sample_every: Trace one event in N; 0 disables. Defaults to PKTMASK_TRACE.
+            level: Log level of the sampled messages
+        """
+        if sample_every is None:
+            sample_every = TRACE_SAMPLE_RATE
+        self.logger = logger
+        self.level = level
+        self.sample_every = max(0, int(sample_every))
+        self.enabled = self.sample_every > 0 and logger.isEnabledFor(level)
+        # Only counted while enabled
+        self.events = 0
+        self.emitted = 0
+
+    def sample(self) -> bool:
+        """Count one event; True if it is the one in N to be logged"""
+        self.events += 1
+        if (self.events - 1) % self.sample_every:
+            return False
+        self.emitted += 1
+        return True
+
+    def log(self, message: str) -> None:
+        if self.sample_every > 1:
+            message = f"{message} [trace sample {self.emitted}, event {self.events}, 1/{self.sample_every}]"
+        self.logger.log(self.level, message, stacklevel=2)
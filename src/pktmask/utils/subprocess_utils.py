@@ -5,7 +5,7 @@ Windows subprocess utilities to prevent cmd window popup
 import platform
 import subprocess
 from pathlib import Path
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 
 def get_subprocess_creation_flags() -> int:
@@ -83,6 +83,56 @@ def run_hidden_subprocess(
     return subprocess.run(cmd, **subprocess_args)
 
 
+def popen_hidden_subprocess(
+    cmd: List[str],
+    stdout: Any = subprocess.PIPE,
+    stderr: Any = subprocess.PIPE,
+    text: bool = True,
+    encoding: str = "utf-8",
+    errors: str = "replace",
+    env: Optional[Dict[str, str]] = None,
+    cwd: Optional[Union[str, Path]] = None,
+    **kwargs,
+) -> subprocess.Popen:
+    """
+    Start a subprocess for streaming output, with Windows-specific flags to prevent cmd window popup.
+
+    Unlike run_hidden_subprocess, output is not buffered in memory; the caller reads
+    from the returned process' pipes and is responsible for waiting on it.
+
+    Args:
+        cmd: Command to execute as list of strings
+        stdout: stdout target (pipe by default)
+        stderr: stderr target (pipe by default)
+        text: Whether pipes are opened in text mode
+        encoding: Text encoding for output
+        errors: How to handle encoding errors
+        env: Environment variables
+        cwd: Working directory
+        **kwargs: Additional arguments for subprocess.Popen
+
+    Returns:
+        Popen instance
+    """
+    popen_args = {
+        "stdout": stdout,
+        "stderr": stderr,
+        "text": text,
+        "env": env,
+        "cwd": cwd,
+        **kwargs,
+    }
+    if text:
+        popen_args["encoding"] = encoding
+        popen_args["errors"] = errors
+
+    creation_flags = get_subprocess_creation_flags()
+    if creation_flags:
+        popen_args["creationflags"] = creation_flags
+
+    return subprocess.Popen(cmd, **popen_args)
+
+
 def run_tshark_command(
     tshark_path: str, args: List[str], timeout: Optional[float] = 300, **kwargs
 ) -> subprocess.CompletedProcess:
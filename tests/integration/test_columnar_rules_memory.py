@@ -0,0 +1,65 @@
+"""
+列式保留规则内存基准测试
+
+对比逐条 KeepRule 对象与压缩后的列式存储、以及 Masker 预处理查找结构的内存占用。
+"""
+
+import gc
+import time
+import tracemalloc
+
+import pytest
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRule, KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+
+FLOWS = 1_000
+RECORDS_PER_FLOW = 500
+
+
+def _build_rule_set():
+    rule_set = KeepRuleSet()
+    for flow in range(FLOWS):
+        tuple_key = f"10.0.{flow // 256}.{flow % 256}:40000-10.1.0.1:443"
+        for record in range(RECORDS_PER_FLOW):
+            start = 1000 + record * 1400
+            rule_set.add_rule(
+                KeepRule(
+                    str(flow),
+                    "reverse",
+                    start,
+                    start + 5,
+                    "tls_applicationdata_header",
+                    {"preserve_strategy": "header_only", "tuple_key": tuple_key, "tls_content_type": 23},
+                )
+            )
+    return rule_set
+
+
+def _measure(func):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, elapsed
+
+
+@pytest.mark.performance
+def test_columnar_rules_memory():
+    rule_count = FLOWS * RECORDS_PER_FLOW
+    rule_set, objects_bytes, _ = _measure(_build_rule_set)
+    columns, columns_bytes, compact_time = _measure(rule_set.compact)
+    lookup, lookup_bytes, lookup_time = _measure(lambda: PayloadMasker({})._preprocess_keep_rules(rule_set))
+
+    print(f"KeepRule objects:   {objects_bytes / rule_count:8.1f} bytes/rule")
+    print(f"columnar:           {columns_bytes / rule_count:8.1f} bytes/rule ({compact_time:.2f}s)")
+    print(f"masker lookup:      {lookup_bytes / rule_count:8.1f} bytes/rule ({lookup_time:.2f}s)")
+
+    assert len(columns) == rule_count
+    assert len(lookup) == 2 * FLOWS
+    assert columns_bytes * 10 < objects_bytes
+    # Lookup views share the columns: only per-flow dicts are allocated
+    assert lookup_bytes < columns_bytes
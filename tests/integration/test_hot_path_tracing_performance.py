@@ -0,0 +1,108 @@
+"""
+热路径调试日志开销基准测试
+
+对比逐包 logger.debug(f"...")（旧写法，pktmask 日志器始终为 DEBUG 级别）与
+HotPathTracer 守卫写法（关闭 / 1/N 采样 / 全量）的开销。耗时只输出不断言
+（共享的 CI 机器上墙钟时间比例不稳定），断言只检查采样计数。
+"""
+
+import logging
+import time
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.infrastructure.logging import HotPathTracer
+
+EVENTS = 200_000
+
+
+class _DiscardingHandler(logging.Handler):
+    """Formats every record like the rotating file handler, then drops it"""
+
+    def emit(self, record):
+        self.format(record)
+
+
+@pytest.fixture
+def debug_logger():
+    logger = logging.getLogger("pktmask.benchmark.hot_path")
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    handler = _DiscardingHandler(logging.DEBUG)
+    handler.setFormatter(logging.Formatter("%(asctime)s - %(name)s - %(funcName)s:%(lineno)d - %(message)s"))
+    logger.addHandler(handler)
+    yield logger
+    logger.removeHandler(handler)
+    logger.propagate = True
+
+
+def _per_event_ns(func) -> float:
+    start = time.perf_counter()
+    func()
+    return (time.perf_counter() - start) / EVENTS * 1e9
+
+
+@pytest.mark.performance
+def test_guarded_tracing_overhead(debug_logger):
+    src, dst, sport, dport, stream_id = "10.0.0.1", "10.0.0.2", 40000, 443, "17"
+
+    def unguarded():
+        for _ in range(EVENTS):
+            debug_logger.debug(f"New flow direction: {src}:{sport}->{dst}:{dport}, stream_id={stream_id}")
+
+    def traced(tracer):
+        def run():
+            for _ in range(EVENTS):
+                if tracer.enabled and tracer.sample():
+                    tracer.log(f"New flow direction: {src}:{sport}->{dst}:{dport}, stream_id={stream_id}")
+
+        return run
+
+    tracers = {
+        "tracer disabled": HotPathTracer(debug_logger, 0),
+        "tracer 1/1000": HotPathTracer(debug_logger, 1000),
+        "tracer every event": HotPathTracer(debug_logger, 1),
+    }
+    results = {"logger.debug f-string (before)": _per_event_ns(unguarded)}
+    results.update((name, _per_event_ns(traced(tracer))) for name, tracer in tracers.items())
+    for name, cost in results.items():
+        print(f"{name:32s} {cost:10.1f} ns/event")
+
+    # A disabled tracer does not even count events; sampling emits one event in N
+    counts = {name: (tracer.events, tracer.emitted) for name, tracer in tracers.items()}
+    assert counts == {
+        "tracer disabled": (0, 0),
+        "tracer 1/1000": (EVENTS, EVENTS // 1000),
+        "tracer every event": (EVENTS, EVENTS),
+    }
+
+
+@pytest.mark.performance
+def test_masking_with_tracing_disabled_vs_enabled(tmp_path):
+    packets = [
+        Ether()
+        / IP(src=f"10.{flow // 65536}.{flow // 256 % 256}.{flow % 256}", dst="10.255.0.1")
+        / TCP(sport=40000, dport=443, seq=1)
+        / Raw(b"x" * 64)
+        for flow in range(20_000)
+    ]
+    input_path = tmp_path / "flows.pcap"
+    wrpcap(str(input_path), packets)
+
+    timings, emitted = {}, {}
+    for rate in (0, 1000, 1):
+        masker = PayloadMasker(
+            {"masking_engine": "raw", "enable_performance_monitoring": False, "trace_sample_rate": rate}
+        )
+        start = time.perf_counter()
+        stats = masker.apply_masking(str(input_path), str(tmp_path / f"out_{rate}.pcap"), KeepRuleSet())
+        timings[rate] = time.perf_counter() - start
+        assert stats.success
+        emitted[rate] = masker._trace.emitted
+        print(f"PKTMASK_TRACE={rate:<5d} {timings[rate]:.3f}s, traced events emitted: {emitted[rate]}")
+
+    assert emitted[0] == 0
+    assert 0 < emitted[1000] * 1000 <= emitted[1] + 1000
@@ -0,0 +1,52 @@
+"""
+TLS标记器载荷重组性能测试
+
+长连接的重组与记录解析耗时应随段数线性增长（此前逐段拼接 bytes 与线性扫描序列号映射为二次复杂度）。
+"""
+
+import time
+
+import pytest
+
+from pktmask.core.pipeline.stages.masking_stage.marker.tls_marker import TCP_FLOW_FIELDS, TLSProtocolMarker
+from pktmask.core.pipeline.stages.masking_stage.marker.tshark_fields import TsharkFieldDecoder
+
+SEGMENT_SIZE = 1460
+
+
+def _flow_packets(segment_count):
+    """ApplicationData records of one segment each, as tshark field records"""
+    decoder = TsharkFieldDecoder(TCP_FLOW_FIELDS)
+    record = (bytes.fromhex("17030305af") + b"\x00" * (SEGMENT_SIZE - 5)).hex()
+    return [
+        decoder.decode_layers(
+            {
+                "tcp.seq": [str(1 + index * SEGMENT_SIZE)],
+                "tcp.seq_raw": [str(1000 + index * SEGMENT_SIZE)],
+                "tcp.payload": [record],
+            }
+        )
+        for index in range(segment_count)
+    ]
+
+
+def _reassemble_and_parse(marker, packets):
+    start = time.perf_counter()
+    reassembled = marker._reassemble_tcp_payloads(packets, {"forward": {"packets": packets}})["forward"]
+    records = marker._parse_tls_records_from_payload(reassembled["payload"], "0", "forward", reassembled["seq_mapping"])
+    return time.perf_counter() - start, records
+
+
+@pytest.mark.performance
+def test_reassembly_scales_linearly():
+    marker = TLSProtocolMarker({})
+    timings = {}
+    for segment_count in (5_000, 20_000):
+        elapsed, records = _reassemble_and_parse(marker, _flow_packets(segment_count))
+        assert len(records) == segment_count
+        assert records[-1]["tls_header_seq_start"] == 1000 + (segment_count - 1) * SEGMENT_SIZE
+        timings[segment_count] = elapsed
+        print(f"{segment_count:6d} segments ({segment_count * SEGMENT_SIZE / 2**20:.1f} MiB): {elapsed:.3f}s")
+
+    # 4x the data may take at most ~2x the per-segment time (quadratic would be 16x)
+    assert timings[20_000] < timings[5_000] * 8
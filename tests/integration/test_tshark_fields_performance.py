@@ -0,0 +1,88 @@
+"""
+tshark 字段输出解码性能测试
+
+TLS扫描的 ``-T fields`` 输出应远小于等价的 ``-T json`` 输出。两种输出分别经过标记器的
+实际解码路径（解码为记录、按帧号归并、生成回退保留规则），规则结果必须一致；
+耗时只打印用于比较，不作断言。
+"""
+
+import io
+import json
+import time
+
+import pytest
+
+from pktmask.core.pipeline.stages.masking_stage.marker.tls_marker import TLS_RECORD_SCAN_FIELDS, TLSProtocolMarker
+from pktmask.core.pipeline.stages.masking_stage.marker.tshark_stream import iter_json_array
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRuleSet
+
+PACKET_COUNT = 20_000
+PAYLOAD_SIZE = 64
+
+
+def _layers(index):
+    layers = {
+        "frame.number": [str(index + 1)],
+        "frame.protocols": ["eth:ethertype:ip:tcp:tls" if index % 4 == 0 else "eth:ethertype:ip:tcp"],
+        "frame.time_relative": [f"{index * 0.001:.9f}"],
+        "ip.src": ["10.0.0.1"],
+        "ip.dst": ["10.0.0.2"],
+        "tcp.srcport": [str(40000 + index % 100)],
+        "tcp.dstport": ["443"],
+        "tcp.stream": [str(index % 100)],
+        "tcp.seq": [str(1 + index * PAYLOAD_SIZE)],
+        "tcp.seq_raw": [str(100000 + index * PAYLOAD_SIZE)],
+        "tcp.len": [str(PAYLOAD_SIZE)],
+        "tcp.payload": [(bytes.fromhex("1703030040") + b"\x00" * (PAYLOAD_SIZE - 5)).hex()],
+    }
+    if index % 4 == 0:
+        layers.update(
+            {"tls.record.content_type": ["23"], "tls.record.length": ["64"], "tls.record.version": ["0x0303"]}
+        )
+    return layers
+
+
+def _tshark_json(packets):
+    # tshark -T json 输出格式：带缩进的 _index/_type/_score/_source 包装
+    return json.dumps(
+        [{"_index": "packets", "_type": "doc", "_score": None, "_source": {"layers": layers}} for layers in packets],
+        indent=2,
+    )
+
+
+def _tshark_fields(packets):
+    return "".join(
+        "\t".join(",".join(layers.get(field, [])) for field in TLS_RECORD_SCAN_FIELDS) + "\n" for layers in packets
+    )
+
+
+def _decode_and_generate_rules(tshark_output, text):
+    """标记器的实际路径：解码重组扫描输出 -> 按帧号归并 -> 生成回退保留规则"""
+    marker = TLSProtocolMarker({"tshark_output": tshark_output})
+    start = time.perf_counter()
+    if tshark_output == "json":
+        records = marker._records_from_json(iter_json_array(io.StringIO(text)), TLS_RECORD_SCAN_FIELDS)
+    else:
+        records = marker._field_decoder(TLS_RECORD_SCAN_FIELDS).iter_records(io.StringIO(text))
+    ruleset = KeepRuleSet()
+    marker._generate_fallback_rules_from_packets(marker._merge_tls_scan_streams(records, iter(())), {}, ruleset)
+    elapsed = time.perf_counter() - start
+    return elapsed, [(r.stream_id, r.direction, r.seq_start, r.seq_end, r.rule_type) for r in ruleset.rules]
+
+
+@pytest.mark.performance
+def test_fields_output_smaller_than_json_with_same_rules():
+    packets = [_layers(index) for index in range(PACKET_COUNT)]
+    json_text, fields_text = _tshark_json(packets), _tshark_fields(packets)
+
+    json_elapsed, from_json = _decode_and_generate_rules("json", json_text)
+    fields_elapsed, from_fields = _decode_and_generate_rules("fields", fields_text)
+
+    print(
+        f"json: {len(json_text) / 2**20:.1f} MiB {json_elapsed:.3f}s, "
+        f"fields: {len(fields_text) / 2**20:.1f} MiB {fields_elapsed:.3f}s"
+    )
+    assert from_fields == from_json
+    assert len(from_fields) == PACKET_COUNT // 4
+    assert all(rule_type == "tls_applicationdata_header" for *_, rule_type in from_fields)
+    assert len(fields_text) * 3 < len(json_text)
@@ -0,0 +1,85 @@
+"""
+Shared fixtures for unit tests that write captures and compare pipeline outputs
+"""
+
+import logging
+
+import pytest
+from scapy.all import wrpcap, wrpcapng
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRule, KeepRuleSet
+
+# preserve_strategy recorded with each keep rule type
+RULE_STRATEGIES = {
+    "tls_applicationdata_header": "header_only",
+    "tls_handshake": "full_preserve",
+}
+
+
+@pytest.fixture
+def write_capture(tmp_path):
+    """Write packets to a pcap/pcapng file in tmp_path, stamping increasing timestamps
+
+    ``write_capture(packets, name="input.pcap", interval=0.001, container="pcap", **wrpcap_kwargs)``
+    returns the file path. Packets are stamped in place, starting at 1700000000.
+    """
+
+    def write(packets, name="input.pcap", interval=0.001, container="pcap", **kwargs):
+        for index, packet in enumerate(packets):
+            packet.time = 1700000000 + index * interval
+        path = tmp_path / name
+        (wrpcapng if container == "pcapng" else wrpcap)(str(path), packets, **kwargs)
+        return path
+
+    return write
+
+
+@pytest.fixture
+def keep_rule_set():
+    """Build a KeepRuleSet from ``(stream_id, direction, seq_start, seq_end, tuple_key[, rule_type])`` tuples
+
+    The rule type defaults to ``tls_applicationdata_header``.
+    """
+
+    def build(specs):
+        rule_set = KeepRuleSet()
+        for stream_id, direction, seq_start, seq_end, tuple_key, *rule_type in specs:
+            rule_type = rule_type[0] if rule_type else "tls_applicationdata_header"
+            rule_set.rules.append(
+                KeepRule(
+                    stream_id=stream_id,
+                    direction=direction,
+                    seq_start=seq_start,
+                    seq_end=seq_end,
+                    rule_type=rule_type,
+                    metadata={"preserve_strategy": RULE_STRATEGIES[rule_type], "tuple_key": tuple_key},
+                )
+            )
+        return rule_set
+
+    return build
+
+
+@pytest.fixture
+def quiet_logging():
+    """Silence pipeline warnings for the duration of a test"""
+    logging.disable(logging.WARNING)
+    yield
+    logging.disable(logging.NOTSET)
+
+
+@pytest.fixture
+def run_variants(tmp_path):
+    """Run ``run(variant, output_path)`` for each variant and check that all outputs are byte-identical
+
+    Outputs are written to ``tmp_path / f"{variant}.pcap"``; returns the run results by variant.
+    """
+
+    def run_all(run, variants):
+        results = {variant: run(variant, tmp_path / f"{variant}.pcap") for variant in variants}
+        outputs = {variant: (tmp_path / f"{variant}.pcap").read_bytes() for variant in variants}
+        first = outputs[variants[0]]
+        assert all(output == first for output in outputs.values()), f"outputs differ: {list(variants)}"
+        return results
+
+    return run_all
@@ -0,0 +1,54 @@
+"""
+Directory address prescan tests
+
+The parallel prescan must build exactly the mapping the serial one does.
+"""
+
+import pytest
+from scapy.all import IP, TCP, UDP, Ether, IPv6, wrpcap, wrpcapng
+
+from pktmask.core.strategy import HierarchicalAnonymizationStrategy
+
+
+def _write_directory(tmp_path):
+    eth = Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb")
+    files = []
+    for index in range(4):
+        packets = [eth / IP(src=f"10.{index}.{host % 3}.{host + 1}", dst="192.168.7.1") / TCP() for host in range(20)]
+        packets.append(eth / IPv6(src=f"2001:db8:{index}::1", dst="2001:db8::ff") / UDP())
+        path = tmp_path / (f"capture{index}.pcapng" if index % 2 else f"capture{index}.pcap")
+        (wrpcapng if index % 2 else wrpcap)(str(path), packets)
+        files.append(str(path))
+    broken = tmp_path / "broken.pcap"
+    broken.write_bytes(b"not a capture")
+    files.append(str(broken))
+    return files
+
+
+def _build(files, workers):
+    strategy = HierarchicalAnonymizationStrategy(prescan_workers=workers)
+    strategy.build_mapping_from_directory(files)
+    return list(strategy.get_ip_map().items()), dict(strategy._ip_stats)
+
+
+@pytest.mark.unit
+def test_parallel_prescan_matches_serial(tmp_path):
+    files = _write_directory(tmp_path)
+
+    serial_mapping, serial_stats = _build(files, 1)
+    parallel_mapping, parallel_stats = _build(files, 3)
+
+    assert parallel_mapping == serial_mapping
+    assert parallel_stats == serial_stats
+    assert serial_stats["total_packets_scanned"] == 84
+    assert len(serial_mapping) == 20 * 4 + 1 + 4 + 1
+
+
+@pytest.mark.unit
+def test_prescan_worker_resolution(tmp_path):
+    files = _write_directory(tmp_path)
+
+    assert HierarchicalAnonymizationStrategy(prescan_workers=8)._resolve_prescan_workers(files) == len(files)
+    assert HierarchicalAnonymizationStrategy(prescan_workers=8)._resolve_prescan_workers(files[:1]) == 1
+    # Small directories are not worth starting worker processes for
+    assert HierarchicalAnonymizationStrategy()._resolve_prescan_workers(files) == 1
@@ -0,0 +1,106 @@
+"""
+In-place IP address rewrite tests
+
+The raw rewrite engine must produce the same bytes as rebuilding packets with
+scapy, for frames it patches itself and for frames it hands back to scapy.
+"""
+
+import os
+
+import pytest
+from scapy.all import (
+    ARP,
+    GRE,
+    ICMP,
+    IP,
+    TCP,
+    UDP,
+    VXLAN,
+    Dot1Q,
+    Ether,
+    ICMPv6EchoRequest,
+    IPv6,
+    IPv6ExtHdrHopByHop,
+    Raw,
+    wrpcap,
+)
+
+from pktmask.core.pipeline.stages.anonymization_stage import AnonymizationStage
+from pktmask.core.rawpacket import internet_checksum, update_checksum
+from pktmask.core.rawpacket.ip_rewrite import AddressRewriter
+
+
+def _eth(**kwargs):
+    return Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb", **kwargs)
+
+
+FRAMES = [
+    _eth() / IP(src="192.168.1.10", dst="10.0.0.1") / TCP(sport=1000, dport=443, flags="PA") / Raw(b"A" * 100),
+    # Short frame with Ethernet padding
+    _eth() / IP(src="10.0.0.1", dst="192.168.1.10") / TCP(sport=443, dport=1000) / Raw(b"\x16\x03"),
+    _eth() / Dot1Q(vlan=7) / IP(src="192.168.1.11", dst="8.8.8.8") / UDP(sport=53, dport=53) / Raw(b"dns"),
+    # UDP without checksum: scapy computes one on rebuild
+    _eth() / IP(src="192.168.1.11", dst="8.8.4.4") / UDP(sport=5000, dport=5001, chksum=0) / Raw(b"zero"),
+    _eth() / IP(src="192.168.1.10", dst="8.8.8.8") / ICMP() / Raw(b"ping"),
+    _eth() / IP(src="192.168.1.10", dst="8.8.8.8", proto=253) / Raw(b"experimental"),
+    _eth() / IP(src="192.168.1.10", dst="10.0.0.1", frag=20) / Raw(b"F" * 40),
+    _eth() / IP(src="192.168.1.10", dst="10.0.0.1", flags="MF") / TCP(sport=1, dport=2) / Raw(b"G" * 40),
+    _eth() / IPv6(src="2001:db8::1", dst="2001:db8::2") / TCP(sport=1, dport=2) / Raw(b"v6"),
+    _eth() / IPv6(src="2001:db8::2", dst="2001:db8:1::9") / UDP(sport=1, dport=2) / Raw(b"v6udp"),
+    _eth() / IPv6(src="2001:db8::1", dst="2001:db8::2") / ICMPv6EchoRequest(data=b"echo"),
+    _eth() / IPv6(src="2001:db8::1", dst="2001:db8::2") / IPv6ExtHdrHopByHop() / UDP(sport=1, dport=2),
+    _eth() / IP(src="1.1.1.1", dst="2.2.2.2") / GRE() / IP(src="10.0.0.1", dst="10.0.0.2") / TCP() / Raw(b"D"),
+    _eth() / IP(src="1.1.1.1", dst="2.2.2.2") / UDP(sport=1, dport=4789) / VXLAN() / _eth() / IP() / TCP(),
+    _eth() / ARP(),
+]
+
+
+@pytest.fixture
+def capture(tmp_path):
+    packets = []
+    for index, frame in enumerate(FRAMES):
+        frame.time = 1700000000 + index * 0.0013
+        packets.append(frame)
+    path = tmp_path / "input.pcap"
+    wrpcap(str(path), packets)
+    return path
+
+
+def _anonymize(engine, input_path, output_path):
+    stage = AnonymizationStage({"rewrite_engine": engine})
+    assert stage.initialize()
+    return stage.process_file(input_path, output_path)
+
+
+@pytest.mark.unit
+def test_raw_engine_output_matches_scapy_engine(capture, tmp_path):
+    scapy_stats = _anonymize("scapy", capture, tmp_path / "scapy.pcap")
+    raw_stats = _anonymize("raw", capture, tmp_path / "raw.pcap")
+
+    assert raw_stats.extra_metrics["rewrite_engine"] == "raw"
+    assert scapy_stats.extra_metrics["rewrite_engine"] == "scapy"
+    assert (tmp_path / "raw.pcap").read_bytes() == (tmp_path / "scapy.pcap").read_bytes()
+    assert raw_stats.packets_modified == scapy_stats.packets_modified == len(FRAMES) - 1
+
+
+@pytest.mark.unit
+def test_rewriter_falls_back_for_unsupported_frames():
+    rewriter = AddressRewriter({"192.168.1.10": "172.16.5.10", "2001:db8::1": "2001:db9::1"})
+    results = [rewriter.rewrite(1, bytearray(bytes(frame))) for frame in FRAMES]
+
+    # First fragments, IPv6 extension headers and tunnels are left to scapy
+    assert [index for index, result in enumerate(results) if result is None] == [7, 11, 12, 13]
+    assert results[0] is True
+    assert results[2] is False
+    assert results[14] is False
+
+
+@pytest.mark.unit
+def test_update_checksum_matches_full_recomputation():
+    for _ in range(200):
+        data = bytearray(os.urandom(40))
+        checksum = internet_checksum(data)
+        old = bytes(data[12:20])
+        new = os.urandom(8)
+        data[12:20] = new
+        assert update_checksum(checksum, old, new) == internet_checksum(data)
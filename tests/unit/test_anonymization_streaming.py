@@ -0,0 +1,66 @@
+"""
+AnonymizationStage streaming mode tests
+"""
+
+import pytest
+from scapy.all import IP, TCP, UDP, Ether, IPv6, Raw
+
+from pktmask.core.pipeline.stages.anonymization_stage import AnonymizationStage
+
+
+def _packets():
+    eth = Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb")
+    return [
+        eth / IP(src="192.168.1.10", dst="10.0.0.1") / TCP(sport=1000, dport=443) / Raw(b"hello"),
+        eth / IP(src="10.0.0.1", dst="192.168.1.10") / TCP(sport=443, dport=1000) / Raw(b"world"),
+        eth / IP(src="192.168.1.11", dst="8.8.8.8") / UDP(sport=53, dport=53) / Raw(b"dns"),
+        eth / IPv6(src="2001:db8::1", dst="2001:db8::2") / UDP(sport=1, dport=2),
+    ]
+
+
+def _anonymize(input_path):
+    def run(mode, output_path):
+        stage = AnonymizationStage({"processing_mode": mode})
+        assert stage.initialize()
+        return stage.process_file(input_path, output_path)
+
+    return run
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("container", ["pcap", "pcapng"])
+def test_streaming_output_matches_in_memory(write_capture, run_variants, container):
+    input_path = write_capture(_packets(), f"input.{container}", interval=0.25, container=container)
+
+    stats = run_variants(_anonymize(input_path), ["in_memory", "streaming"])
+
+    assert stats["streaming"].packets_processed == stats["in_memory"].packets_processed == 4
+    assert stats["streaming"].packets_modified == stats["in_memory"].packets_modified == 4
+    assert stats["streaming"].extra_metrics["ip_mappings"] == stats["in_memory"].extra_metrics["ip_mappings"]
+
+
+@pytest.mark.unit
+def test_prepared_directory_mapping_is_reused(write_capture, tmp_path, monkeypatch):
+    first = write_capture(_packets()[:2], "a.pcap", interval=0.25)
+    second = write_capture(_packets()[2:], "b.pcap", interval=0.25)
+
+    stage = AnonymizationStage({})
+    stage.prepare_for_directory(tmp_path, [str(first), str(second)])
+    directory_mapping = dict(stage.get_ip_mappings())
+
+    def fail_rebuild(files):
+        raise AssertionError("mapping rebuilt for a prepared file")
+
+    monkeypatch.setattr(stage._strategy, "build_mapping_from_directory", fail_rebuild)
+    stats = stage.process_file(first, tmp_path / "out.pcap")
+
+    assert stats.extra_metrics["ip_mappings"] == directory_mapping
+    assert "8.8.8.8" in directory_mapping
+
+
+@pytest.mark.unit
+def test_streaming_empty_capture_creates_empty_file(write_capture, tmp_path):
+    stats = _anonymize(write_capture([], "empty.pcap"))("streaming", tmp_path / "out.pcap")
+
+    assert (tmp_path / "out.pcap").read_bytes() == b""
+    assert stats.packets_processed == 0
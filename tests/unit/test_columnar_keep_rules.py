@@ -0,0 +1,159 @@
+"""
+Columnar keep rule tests
+
+Rules compacted into columns keep everything the masker needs: ranges are
+grouped per flow direction and strategy, sorted, shared with the masker as
+zero-copy views and saved/loaded losslessly. Masking with a compacted rule set
+gives the same output as with KeepRule objects.
+"""
+
+import pickle
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker.columnar import (
+    FULL_PRESERVE,
+    HEADER_ONLY,
+    ColumnarKeepRules,
+    RangeView,
+)
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRule, KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.checkpoint import keep_rules_fingerprint
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+
+TUPLE_KEY = "10.0.0.1:40000-10.0.0.2:443"
+
+
+def _rule(start, end, strategy="full_message", direction="forward", stream_id="0", tuple_key=TUPLE_KEY):
+    metadata = {"preserve_strategy": strategy}
+    if tuple_key:
+        metadata["tuple_key"] = tuple_key
+    return KeepRule(stream_id, direction, start, end, "tls_handshake", metadata)
+
+
+def _rule_set():
+    return KeepRuleSet(
+        rules=[
+            _rule(1105, 1110, "header_only"),
+            _rule(1000, 1105),
+            _rule(1001, 1006, "header_only"),
+            _rule(5000, 5100, direction="reverse"),
+            _rule(300, 400, "something_else", stream_id="1", tuple_key=None),
+        ]
+    )
+
+
+@pytest.mark.unit
+def test_rules_grouped_and_sorted_per_flow_direction():
+    columns = _rule_set().columnar()
+
+    assert columns.flows == [("0", TUPLE_KEY), ("1", "")]
+    assert list(columns.ranges(0, 0, HEADER_ONLY)) == [(1001, 1006), (1105, 1110)]
+    assert list(columns.ranges(0, 0, FULL_PRESERVE)) == [(1000, 1105)]
+    assert list(columns.ranges(0, 1, FULL_PRESERVE)) == [(5000, 5100)]
+    assert columns.ranges(0, 1, HEADER_ONLY) is None
+    assert columns.unknown_strategies == 1
+    assert len(columns) == 5
+    assert columns.nbytes() == 5 * 22
+    assert ("1", "forward", 300, 400, "full_preserve", "") in list(columns.rows())
+
+
+@pytest.mark.unit
+def test_range_view_shares_columns_and_pickles():
+    columns = _rule_set().columnar()
+    view = columns.ranges(0, 0, HEADER_ONLY)
+
+    assert view.starts.obj is columns.seq_start
+    assert view[1] == (1105, 1110)
+    assert view[1:] == [(1105, 1110)]
+    assert view == [(1001, 1006), (1105, 1110)]
+
+    copy = pickle.loads(pickle.dumps(view))
+    assert isinstance(copy, RangeView)
+    assert copy == view
+
+
+@pytest.mark.unit
+def test_save_load_round_trip(tmp_path):
+    columns = _rule_set().columnar()
+    path = tmp_path / "rules.pmkc"
+    columns.save(str(path))
+    loaded = ColumnarKeepRules.load(str(path))
+
+    assert loaded.flows == columns.flows
+    assert loaded.groups == columns.groups
+    assert list(loaded.rows()) == list(columns.rows())
+    assert loaded.unknown_strategies == 1
+
+    data = columns.to_bytes()
+    for bad in (b"", b"XXXX" + data[4:], data[:-1]):
+        with pytest.raises(ValueError):
+            ColumnarKeepRules.from_bytes(bad)
+
+
+@pytest.mark.unit
+def test_compact_rule_set():
+    rule_set = _rule_set()
+    fingerprint = keep_rules_fingerprint(rule_set)
+    columns = rule_set.compact()
+
+    assert rule_set.rules == [] and rule_set.columns is columns
+    assert rule_set.columnar() is columns
+    assert rule_set.rule_count == 5
+    assert keep_rules_fingerprint(rule_set) == fingerprint
+    with pytest.raises(ValueError):
+        rule_set.add_rule(_rule(1, 2))
+
+
+@pytest.mark.unit
+def test_masker_lookup_shares_rule_data_between_keys():
+    masker = PayloadMasker({})
+    lookup = masker._preprocess_keep_rules(_rule_set())
+
+    forward = lookup[TUPLE_KEY]["forward"]
+    assert lookup["0"]["forward"] is forward
+    assert isinstance(forward["header_only_ranges"], RangeView)
+    assert forward["header_only_ranges"] == [(1001, 1006), (1105, 1110)]
+    assert forward["full_preserve_ranges"] == [(1000, 1105)]
+    assert lookup["1"]["forward"]["full_preserve_ranges"] == [(300, 400)]
+
+    # Overlapping full-preserve ranges are merged, so their ends stay sorted
+    overlapping = KeepRuleSet(rules=[_rule(0, 100), _rule(10, 20), _rule(100, 150)])
+    merged = masker._preprocess_keep_rules(overlapping)[TUPLE_KEY]["forward"]
+    assert merged["full_preserve_ranges"] == [(0, 150)]
+
+
+@pytest.mark.unit
+def test_masking_with_compacted_rules_is_identical(tmp_path):
+    client, server = ("10.0.0.1", 40000), ("10.0.0.2", 443)
+    packets = []
+    for index in range(6):
+        src, dst = (client, server) if index % 2 == 0 else (server, client)
+        packets.append(
+            Ether()
+            / IP(src=src[0], dst=dst[0])
+            / TCP(sport=src[1], dport=dst[1], seq=1000 + index // 2 * 100, flags="PA")
+            / Raw(bytes(range(1, 101)))
+        )
+    input_path = tmp_path / "in.pcap"
+    wrpcap(str(input_path), packets)
+    rules = [
+        _rule(1000, 1005, "header_only"),
+        _rule(1050, 1120),
+        _rule(1130, 1135, "header_only", direction="reverse"),
+    ]
+
+    outputs = []
+    for compact in (False, True):
+        rule_set = KeepRuleSet(rules=list(rules))
+        if compact:
+            rule_set.compact()
+        output_path = tmp_path / f"out_{compact}.pcap"
+        masker = PayloadMasker({"masking_engine": "raw", "enable_performance_monitoring": False})
+        stats = masker.apply_masking(str(input_path), str(output_path), rule_set)
+        assert stats.success
+        outputs.append((output_path.read_bytes(), stats.preserved_bytes))
+
+    assert outputs[0] == outputs[1]
+    assert outputs[0][1] == 5 + 70 + 5
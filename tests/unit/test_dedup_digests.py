@@ -0,0 +1,99 @@
+"""
+Deduplication digest store tests
+"""
+
+import hashlib
+
+import pytest
+from scapy.all import IP, UDP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.deduplication_stage import DeduplicationStage
+from pktmask.core.rawpacket.digests import (
+    CompactDigestSet,
+    LRUDigestSet,
+    WindowedDigestSet,
+    get_digest_function,
+)
+
+
+@pytest.mark.unit
+def test_compact_digest_set_grows_and_matches_set():
+    digests = [hashlib.md5(str(i % 3000).encode()).digest() for i in range(5000)]
+    digests.append(bytes(16))
+    digests.append(bytes(16))
+    store = CompactDigestSet(16, initial_capacity=8)
+    reference = set()
+
+    for digest in digests:
+        assert store.add(digest) == (digest not in reference)
+        reference.add(digest)
+
+    assert len(store) == len(reference) == 3001
+    assert all(digest in store for digest in reference)
+    assert hashlib.md5(b"missing").digest() not in store
+    assert store.capacity * store.max_load_factor > len(store)
+
+
+@pytest.mark.unit
+def test_windowed_digest_set_only_drops_close_repeats():
+    store = WindowedDigestSet(0.010)
+    assert store.add(b"a", 1.000)
+    assert not store.add(b"a", 1.004)
+    assert not store.add(b"a", 1.010)
+    # Window is measured from the last kept copy
+    assert store.add(b"a", 1.011)
+    assert store.add(b"b", 5.0)
+    assert len(store) == 1
+
+
+@pytest.mark.unit
+def test_lru_digest_set_evicts_least_recent():
+    store = LRUDigestSet(2)
+    assert store.add(b"a")
+    assert store.add(b"b")
+    assert not store.add(b"a")
+    assert store.add(b"c")
+    assert b"b" not in store
+    assert store.add(b"b")
+
+
+@pytest.mark.unit
+def test_xxhash_names_resolve_to_available_function():
+    name, digest = get_digest_function("xxh64")
+    assert name in ("xxh64", "blake2b-64")
+    assert len(digest(b"packet")) == 8
+    assert get_digest_function("unknown")[0] == "md5"
+
+
+def _mirror_capture(path):
+    base = Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb") / IP(src="10.0.0.1", dst="10.0.0.2")
+    packet = base / UDP(sport=5000, dport=5001) / Raw(b"keepalive")
+    times = [0.0, 0.0004, 1.0, 1.0003, 2.0]
+    packets = []
+    for timestamp in times:
+        copy = packet.copy()
+        copy.time = 1700000000 + timestamp
+        packets.append(copy)
+    wrpcap(str(path), packets)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "config, expected_unique",
+    [
+        ({}, 1),
+        ({"digest_store": "compact"}, 1),
+        ({"algorithm": "blake2b-64"}, 1),
+        ({"dedup_scope": "window", "dedup_window_ms": 1}, 3),
+        ({"dedup_scope": "lru", "dedup_max_entries": 1}, 1),
+    ],
+)
+def test_stage_digest_store_modes(tmp_path, config, expected_unique):
+    input_path = tmp_path / "mirror.pcap"
+    _mirror_capture(input_path)
+    for mode in ("streaming", "in_memory"):
+        stage = DeduplicationStage({"processing_mode": mode, **config})
+        assert stage.initialize()
+        stats = stage.process_file(input_path, tmp_path / f"{mode}.pcap")
+        assert stats.extra_metrics["unique_packets"] == expected_unique
+    assert (tmp_path / "streaming.pcap").read_bytes() == (tmp_path / "in_memory.pcap").read_bytes()
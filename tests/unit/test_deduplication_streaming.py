@@ -0,0 +1,51 @@
+"""
+DeduplicationStage streaming mode tests
+
+Streaming deduplication hashes raw records and must write exactly the same
+file as the in-memory (rdpcap/wrpcap) mode.
+"""
+
+import pytest
+from scapy.all import IP, TCP, UDP, Ether, Raw
+
+from pktmask.core.pipeline.stages.deduplication_stage import DeduplicationStage
+
+
+def _packets():
+    base = Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb") / IP(src="10.0.0.1", dst="10.0.0.2")
+    unique = [
+        base / TCP(sport=1000, dport=443, seq=1) / Raw(b"hello"),
+        base / TCP(sport=1000, dport=443, seq=6) / Raw(b"world"),
+        base / UDP(sport=53, dport=53) / Raw(b"dns"),
+    ]
+    # Mirror-port style duplicates (stamped with different timestamps when written)
+    return [unique[which].copy() for which in [0, 1, 0, 2, 1, 1, 2]]
+
+
+def _deduplicate(input_path):
+    def run(mode, output_path):
+        stage = DeduplicationStage({"processing_mode": mode})
+        assert stage.initialize()
+        return stage.process_file(input_path, output_path)
+
+    return run
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("container", ["pcap", "pcapng"])
+def test_streaming_output_matches_in_memory(write_capture, run_variants, container):
+    input_path = write_capture(_packets(), f"input.{container}", interval=0.000537, container=container)
+
+    stats = run_variants(_deduplicate(input_path), ["in_memory", "streaming"])
+
+    assert stats["streaming"].packets_processed == stats["in_memory"].packets_processed == 7
+    assert stats["streaming"].packets_modified == stats["in_memory"].packets_modified == 4
+    assert stats["streaming"].extra_metrics["unique_packets"] == 3
+
+
+@pytest.mark.unit
+def test_streaming_empty_capture_creates_empty_file(write_capture, run_variants, tmp_path):
+    stats = run_variants(_deduplicate(write_capture([], "empty.pcap")), ["in_memory", "streaming"])
+
+    assert (tmp_path / "streaming.pcap").read_bytes() == b""
+    assert stats["streaming"].packets_processed == stats["in_memory"].packets_processed == 0
@@ -0,0 +1,102 @@
+"""
+ErrorRecoveryHandler aggregation tests
+
+Repeated errors are counted per (category, exception type, site) and per
+file; only a bounded sample keeps full records, and the error log file is
+written in batches.
+"""
+
+import traceback
+
+import pytest
+
+from pktmask.core.pipeline.stages.masking_stage.masker import error_handler
+from pktmask.core.pipeline.stages.masking_stage.masker.error_handler import (
+    ErrorCategory,
+    ErrorRecoveryHandler,
+    ErrorSeverity,
+)
+
+
+def _fail(value):
+    raise ValueError(f"bad frame {value}")
+
+
+def _report(handler, value):
+    try:
+        _fail(value)
+    except ValueError as e:
+        return handler.handle_error(e, ErrorSeverity.MEDIUM, ErrorCategory.PROCESSING_ERROR, {"packet_number": value})
+
+
+@pytest.mark.unit
+def test_repeated_errors_are_aggregated(monkeypatch):
+    handler = ErrorRecoveryHandler({"error_samples_per_group": 3, "max_error_history": 50})
+    formatted = []
+    format_exc = traceback.format_exc
+    monkeypatch.setattr(error_handler.traceback, "format_exc", lambda: formatted.append(1) or format_exc())
+
+    infos = [_report(handler, index) for index in range(1000)]
+    handler.handle_error("disk full", ErrorSeverity.HIGH, ErrorCategory.OUTPUT_ERROR)
+
+    assert handler.total_errors == 1001
+    assert handler.suppressed_errors == 997
+    assert len(formatted) == 3
+    assert [info.sampled for info in infos[:4]] == [True, True, True, False]
+    assert infos[3].traceback_str is None
+    assert len(handler.error_history) == 4
+
+    summary = handler.get_error_summary()
+    top = summary["error_groups"][0]
+    assert (top["category"], top["error_type"], top["count"]) == ("processing_error", "ValueError", 1000)
+    assert top["site"].startswith("test_error_aggregation.py:_fail:")
+    assert top["first_message"] == "bad frame 0"
+    assert summary["errors_by_category"][ErrorCategory.PROCESSING_ERROR] == 1000
+
+
+@pytest.mark.unit
+def test_history_is_bounded():
+    handler = ErrorRecoveryHandler({"error_samples_per_group": 10**6, "max_error_history": 20})
+    for index in range(100):
+        _report(handler, index)
+    assert len(handler.error_history) == 20
+    assert handler.error_history[-1].message == "bad frame 99"
+
+
+@pytest.mark.unit
+def test_error_log_file_is_written_in_batches(tmp_path):
+    log_file = tmp_path / "errors.log"
+    handler = ErrorRecoveryHandler(
+        {"error_log_file": str(log_file), "error_log_batch_size": 4, "error_samples_per_group": 6}
+    )
+
+    for index in range(3):
+        _report(handler, index)
+    assert not log_file.exists()
+    _report(handler, 3)
+    assert log_file.read_text(encoding="utf-8").count("Message: bad frame") == 4
+
+    for index in range(4, 50):
+        _report(handler, index)
+    handler.flush_error_log()
+    content = log_file.read_text(encoding="utf-8")
+    assert content.count("Message: bad frame") == 6
+    assert "50x [processing_error] ValueError" in content
+
+
+@pytest.mark.unit
+def test_repeated_error_summary_is_per_file(tmp_path):
+    log_file = tmp_path / "errors.log"
+    handler = ErrorRecoveryHandler({"error_log_file": str(log_file), "error_samples_per_group": 2})
+
+    for count in (10, 7):
+        handler.reset()
+        for index in range(count):
+            _report(handler, index)
+        handler.flush_error_log()
+
+    content = log_file.read_text(encoding="utf-8")
+    assert content.count("Repeated errors") == 2
+    assert "10x [processing_error]" in content and "7x [processing_error]" in content
+    assert "17x" not in content
+    assert handler.get_error_summary()["error_groups"][0]["count"] == 7
@@ -0,0 +1,89 @@
+"""
+Hot-path tracing tests
+
+Per-packet diagnostics are only formatted for the 1-in-N sampled events, and
+not at all unless tracing is switched on.
+"""
+
+import logging
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.infrastructure.logging import HotPathTracer
+from pktmask.infrastructure.logging.trace import TRACE_ENV_VAR, trace_sample_rate_from_env
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.DEBUG)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def trace_logger():
+    logger = logging.getLogger("pktmask.test_hot_path_tracing")
+    logger.setLevel(logging.DEBUG)
+    handler = _ListHandler()
+    logger.addHandler(handler)
+    yield logger, handler.messages
+    logger.removeHandler(handler)
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "value, rate",
+    [("", 0), ("0", 0), ("off", 0), ("on", 1), ("1", 1), ("1000", 1000), ("-5", 0), ("many", 0)],
+)
+def test_sample_rate_from_env(monkeypatch, value, rate):
+    monkeypatch.setenv(TRACE_ENV_VAR, value)
+    assert trace_sample_rate_from_env() == rate
+
+
+@pytest.mark.unit
+def test_tracer_samples_one_in_n(trace_logger):
+    logger, messages = trace_logger
+    tracer = HotPathTracer(logger, 10)
+
+    for index in range(35):
+        if tracer.enabled and tracer.sample():
+            tracer.log(f"event {index}")
+
+    assert (tracer.events, tracer.emitted) == (35, 4)
+    assert [message.split(" [")[0] for message in messages] == ["event 0", "event 10", "event 20", "event 30"]
+    assert messages[1] == "event 10 [trace sample 2, event 11, 1/10]"
+
+
+@pytest.mark.unit
+def test_disabled_tracer_is_inert(trace_logger):
+    logger, messages = trace_logger
+    assert not HotPathTracer(logger, 0).enabled
+
+    logger.setLevel(logging.INFO)
+    assert not HotPathTracer(logger, 1).enabled
+
+
+@pytest.mark.unit
+def test_masker_traces_new_flows_when_enabled(tmp_path, caplog):
+    packets = [
+        Ether() / IP(src="10.0.0.1", dst=f"10.0.1.{flow}") / TCP(sport=1000, dport=80, seq=1) / Raw(b"x" * 20)
+        for flow in range(1, 9)
+    ]
+    input_path = tmp_path / "in.pcap"
+    wrpcap(str(input_path), packets)
+
+    for rate, expected in ((0, 0), (1, 8)):
+        masker = PayloadMasker(
+            {"masking_engine": "raw", "enable_performance_monitoring": False, "trace_sample_rate": rate}
+        )
+        logger = masker.logger.name
+        caplog.clear()
+        with caplog.at_level(logging.DEBUG, logger=logger):
+            masker.apply_masking(str(input_path), str(tmp_path / f"out{rate}.pcap"), KeepRuleSet())
+        assigned = [r for r in caplog.records if r.name == logger and "Assigned new flow ID" in r.getMessage()]
+        assert len(assigned) == expected
@@ -0,0 +1,99 @@
+"""
+Hierarchical IP mapping engine tests
+
+The integer-encoded engine must produce exactly the mapping (and mapping
+order) of the per-address generators it replaces.
+"""
+
+import ipaddress
+import random
+
+import pytest
+
+from pktmask.core.ip_mapping import IPv4HierarchyMapper, IPv6HierarchyMapper, encode_addresses
+from pktmask.core.strategy import (
+    _generate_new_ipv4_address_hierarchical,
+    _generate_new_ipv6_address_hierarchical,
+    ip_sort_key,
+)
+
+
+def _frequencies(counts):
+    freqs_ipv4 = ({}, {}, {})
+    freqs_ipv6 = tuple({} for _ in range(7))
+    for address, count in counts.items():
+        if "." in address:
+            parts = address.split(".")
+            for level in range(3):
+                key = ".".join(parts[: level + 1])
+                freqs_ipv4[level][key] = freqs_ipv4[level].get(key, 0) + count
+        else:
+            parts = ipaddress.IPv6Address(address).exploded.split(":")
+            for level in range(7):
+                key = ":".join(parts[: level + 1])
+                freqs_ipv6[level][key] = freqs_ipv6[level].get(key, 0) + count
+    return freqs_ipv4, freqs_ipv6
+
+
+def _legacy_mapping(addresses, freqs_ipv4, freqs_ipv6):
+    mapping = {}
+    maps_ipv4, maps_ipv6 = ({}, {}, {}), tuple({} for _ in range(7))
+    used_segments = (set(), set(), set())
+    for ip in sorted(addresses, key=ip_sort_key):
+        try:
+            if ipaddress.ip_address(ip).version == 4:
+                mapping[ip] = _generate_new_ipv4_address_hierarchical(ip, *freqs_ipv4, maps_ipv4, used_segments)
+            else:
+                mapping[ip] = _generate_new_ipv6_address_hierarchical(ip, freqs_ipv6, maps_ipv6)
+        except ValueError:
+            pass
+    return mapping
+
+
+def _engine_mapping(addresses, freqs_ipv4, freqs_ipv6):
+    ipv4, ipv6, remaining = encode_addresses(addresses)
+    assert remaining == []
+    results = IPv4HierarchyMapper(*freqs_ipv4).map_sorted(ipv4)
+    results += IPv6HierarchyMapper(freqs_ipv6).map_sorted(ipv6)
+    return {ip: mapped for ip, mapped, error in results if error is None}
+
+
+@pytest.mark.unit
+def test_engine_matches_per_address_generators():
+    rng = random.Random(7)
+    counts = {}
+    for _ in range(3000):
+        if rng.random() < 0.7:
+            # Enough distinct A.B and A.B.C prefixes to exhaust every segment level
+            address = f"{rng.choice([0, 10, 192, rng.randint(1, 255)])}.{rng.randint(0, 255)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        else:
+            address = str(ipaddress.IPv6Address((0x20010DB8 << 96) | rng.getrandbits(20)))
+        counts[address] = counts.get(address, 0) + rng.choice([1, 1, 2])
+    freqs_ipv4, freqs_ipv6 = _frequencies(counts)
+
+    expected = _legacy_mapping(set(counts), freqs_ipv4, freqs_ipv6)
+    actual = _engine_mapping(set(counts), freqs_ipv4, freqs_ipv6)
+
+    assert list(actual.items()) == list(expected.items())
+
+
+@pytest.mark.unit
+def test_engine_reports_out_of_range_first_segment():
+    freqs_ipv4, _ = _frequencies({"0.1.2.3": 2, "0.1.2.4": 1})
+    ipv4, _, _ = encode_addresses(["0.1.2.4", "0.1.2.3"])
+
+    results = IPv4HierarchyMapper(*freqs_ipv4).map_sorted(ipv4)
+
+    assert [(ip, mapped) for ip, mapped, _ in results] == [("0.1.2.3", None), ("0.1.2.4", None)]
+    assert all(error == "Segment out of range: 0" for _, _, error in results)
+
+
+@pytest.mark.unit
+def test_encode_addresses_leaves_special_forms_to_generators():
+    ipv4, ipv6, remaining = encode_addresses(
+        ["10.0.0.2", "10.0.0.1", "2001:db8::1", "::ffff:1.2.3.4", "fe80::1%eth0", "bogus"]
+    )
+
+    assert [ip for _, ip in ipv4] == ["10.0.0.1", "10.0.0.2"]
+    assert [ip for _, ip in ipv6] == ["2001:db8::1"]
+    assert remaining == ["::ffff:1.2.3.4", "fe80::1%eth0", "bogus"]
@@ -0,0 +1,137 @@
+"""
+Keep-interval masking tests
+
+The interval engine must produce the bytes the per-byte preserved_map loops
+produced: header_only and full_preserve ranges are kept, everything else is
+zeroed, and every payload byte is counted once as preserved or masked. Nested
+header-only ranges (unsorted ends) must not hide the ranges around them.
+"""
+
+import random
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, rdpcap, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRule, KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.keep_intervals import (
+    RuleCursor,
+    apply_keep_intervals,
+    clip_to_segment,
+    subtract_intervals,
+    union_intervals,
+)
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.core.pipeline.stages.masking_stage.masker.stats import MaskingStats
+
+
+def _reference(payload, seg_start, header_ranges, full_ranges):
+    """Per-byte reference: keep every byte covered by any rule"""
+    buf = bytearray(len(payload))
+    kept = 0
+    for offset in range(len(payload)):
+        seq = seg_start + offset
+        if any(start <= seq < end for start, end in header_ranges + full_ranges):
+            buf[offset] = payload[offset]
+            kept += 1
+    return bytes(buf), kept
+
+
+@pytest.mark.unit
+def test_interval_algebra():
+    assert clip_to_segment([(90, 105), (120, 130), (108, 108)], 100, 125) == [(0, 5), (20, 25)]
+    assert union_intervals([(5, 9), (0, 3), (3, 4), (8, 12)]) == [(0, 4), (5, 12)]
+    assert subtract_intervals([(0, 10), (20, 30)], [(2, 4), (8, 22), (29, 40)]) == [(0, 2), (4, 8), (22, 29)]
+    assert apply_keep_intervals(b"abcdef", [(1, 2), (4, 6)]) == b"\x00b\x00\x00ef"
+    assert apply_keep_intervals(b"abc", []) == b"\x00\x00\x00"
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("rule_count", [3, 30])
+def test_apply_keep_rules_matches_per_byte_reference(rule_count):
+    rng = random.Random(rule_count)
+    masker = PayloadMasker({})
+    for _ in range(200):
+        seg_start = rng.randint(1000, 2000)
+        payload = bytes(rng.randint(1, 255) for _ in range(rng.randint(1, 200)))
+        header = sorted((s, s + 5) for s in (rng.randint(seg_start - 50, seg_start + 250) for _ in range(rule_count)))
+        starts = [rng.randint(seg_start - 50, seg_start + 250) for _ in range(rule_count)]
+        full = masker._merge_overlapping_ranges([(s, s + rng.randint(1, 80)) for s in starts])
+        rule_data = {
+            "sorted_ranges": sorted(header + full),
+            "range_count": len(header) + len(full),
+            "header_only_ranges": header,
+            "full_preserve_ranges": full,
+        }
+        masker._current_stats = MaskingStats(success=True)
+
+        result = masker._apply_keep_rules(payload, seg_start, seg_start + len(payload), rule_data)
+
+        expected, kept = _reference(payload, seg_start, header, full)
+        assert result == expected
+        assert masker._current_stats.preserved_bytes == kept
+        assert masker._current_stats.masked_bytes == len(payload) - kept
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("base", [1000, 2**32 - 3000])
+def test_rule_cursor_matches_full_scan(base):
+    rng = random.Random(base)
+    header = [(base + 400 * i, base + 400 * i + 5) for i in range(40)]
+    full = [(base + 400 * i + 100, base + 400 * i + 250) for i in range(40)]
+    cursor = RuleCursor(header, full)
+
+    position = base
+    for _ in range(300):
+        # Mostly in-order segments, with some retransmissions and jumps back
+        start = position - rng.randint(0, 2000) if rng.random() < 0.1 else position
+        end = start + rng.randint(1, 1460)
+        position = max(position, end)
+
+        expected_header = [r for r in header if r[1] > start and r[0] < end]
+        expected_full = [r for r in full if r[1] > start and r[0] < end]
+        assert cursor.overlapping(start, end) == (expected_header, expected_full)
+    assert cursor.reseeks > 0
+
+
+@pytest.mark.unit
+def test_rule_cursor_restarts_after_sequence_wrap():
+    header = [(10, 15), (2**32 - 100, 2**32 - 95)]
+    cursor = RuleCursor(header, [])
+
+    assert cursor.overlapping(2**32 - 200, 2**32 - 50) == ([(2**32 - 100, 2**32 - 95)], [])
+    # Sequence numbers wrapped: the cursor seeks back instead of scanning on
+    assert cursor.overlapping(0, 100) == ([(10, 15)], [])
+    assert cursor.reseeks == 1
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("engine", ["scapy", "raw"])
+def test_nested_header_only_ranges_are_kept(tmp_path, engine):
+    # HTTP header ranges differ in length: a long range containing shorter ones leaves the ends unsorted
+    client, server = ("10.0.0.1", 40000), ("10.0.0.2", 80)
+    tuple_key = f"{client[0]}:{client[1]}-{server[0]}:{server[1]}"
+    header = [(1000, 1300), (1010, 1020), (1100, 1150), (1250, 1260), (1350, 1355)]
+    rules = KeepRuleSet(
+        rules=[
+            KeepRule(
+                "0", "forward", start, end, "http_header", {"preserve_strategy": "header_only", "tuple_key": tuple_key}
+            )
+            for start, end in header
+        ]
+    )
+    # The first segment starts inside the long range, after the nested ones ended
+    seg_starts = [1200, 1300, 1000, 1100]
+    payloads = [bytes(range(1, 101)) for _ in seg_starts]
+    packets = [
+        Ether() / IP(src=client[0], dst=server[0]) / TCP(sport=client[1], dport=server[1], seq=seq, flags="PA") / Raw(p)
+        for seq, p in zip(seg_starts, payloads)
+    ]
+    input_path, output_path = tmp_path / "in.pcap", tmp_path / "out.pcap"
+    wrpcap(str(input_path), packets)
+
+    masker = PayloadMasker({"masking_engine": engine, "enable_performance_monitoring": False})
+    stats = masker.apply_masking(str(input_path), str(output_path), rules)
+
+    assert stats.success
+    for seq, payload, packet in zip(seg_starts, payloads, rdpcap(str(output_path))):
+        assert bytes(packet[Raw].load) == _reference(payload, seq, header, [])[0]
@@ -0,0 +1,53 @@
+"""
+PayloadMasker flow table tests
+
+Raw header views and scapy layers of the same segment must resolve to the same
+flow entry, with the stream ids and directions the string-based helpers assign.
+"""
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw
+
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.core.rawpacket.frame import FrameClassifier
+
+
+def _segment(src, dst, sport, dport):
+    return Ether() / IP(src=src, dst=dst) / TCP(sport=sport, dport=dport) / Raw(b"x")
+
+
+@pytest.mark.unit
+def test_flow_entries_match_string_helpers():
+    masker = PayloadMasker({})
+    reference = PayloadMasker({})
+    rules = {"header_only_ranges": [(0, 5)], "full_preserve_ranges": []}
+    rule_lookup = {"10.0.0.10:443-10.0.0.9:40000": {"reverse": rules}}
+    classifier = FrameClassifier()
+
+    segments = [
+        ("10.0.0.9", "10.0.0.10", 40000, 443),
+        ("10.0.0.10", "10.0.0.9", 443, 40000),
+        ("10.0.0.9", "10.0.0.10", 40000, 443),
+        ("192.168.1.1", "192.168.1.2", 1, 2),
+    ]
+    for src, dst, sport, dport in segments:
+        packet = _segment(src, dst, sport, dport)
+        _, info = classifier.classify(1, bytes(packet))
+
+        raw_flow = masker._lookup_flow(info, info, rule_lookup)
+        scapy_flow = masker._lookup_flow(packet[IP], packet[TCP], rule_lookup)
+
+        stream_id = reference._build_stream_id(packet[IP], packet[TCP])
+        assert raw_flow is scapy_flow
+        assert raw_flow.stream_id == stream_id
+        assert raw_flow.tuple_key == reference._build_tuple_key(packet[IP], packet[TCP])
+        assert raw_flow.direction == reference._determine_flow_direction(packet[IP], packet[TCP], stream_id)
+
+    assert len(masker._flow_table) == 3
+    # Lexical endpoint order: "10.0.0.10:443" sorts before "10.0.0.9:40000"
+    forward_packet = _segment("10.0.0.10", "10.0.0.9", 443, 40000)
+    reverse_packet = _segment("10.0.0.9", "10.0.0.10", 40000, 443)
+    forward = masker._lookup_flow(forward_packet[IP], forward_packet[TCP], rule_lookup)
+    reverse = masker._lookup_flow(reverse_packet[IP], reverse_packet[TCP], rule_lookup)
+    assert (forward.direction, forward.has_rules) == ("forward", False)
+    assert (reverse.direction, reverse.has_rules) == ("reverse", True)
@@ -0,0 +1,227 @@
+"""
+Checkpointed masking tests
+
+A retry after an I/O error resumes from the last checkpoint and still writes
+exactly the output of an uninterrupted run. An output file that no longer
+matches its checkpoint is written again from the first packet. Flow keys go to
+an append-only journal instead of every checkpoint, and engines that cannot
+resume say so.
+"""
+
+import json
+import logging
+import os
+
+import pytest
+from scapy.all import IP, TCP, UDP, Ether, Raw
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.checkpoint import MaskingCheckpoint
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.core.rawpacket.pcap_io import RawCaptureReader, RawPcapWriter
+
+
+def _packets(count):
+    packets = []
+    for index in range(count):
+        if index % 7 == 0:
+            packet = Ether() / IP(src="10.0.0.5", dst="10.0.0.6") / UDP(sport=5, dport=6) / Raw(b"u")
+        else:
+            flow = index % 5
+            packet = (
+                Ether()
+                / IP(src=f"10.0.1.{flow + 1}", dst="10.0.2.1")
+                / TCP(sport=1000 + flow, dport=443, seq=100 * index)
+                / Raw(bytes([index % 256]) * 100)
+            )
+        packets.append(packet)
+    return packets
+
+
+@pytest.fixture
+def keep_rules(keep_rule_set):
+    return keep_rule_set(
+        [(str(flow), "forward", 0, 10**6, f"10.0.1.{flow + 1}:{1000 + flow}-10.0.2.1:443") for flow in range(0, 5, 2)]
+    )
+
+
+def _masker(checkpoint_dir, **config):
+    return PayloadMasker(
+        {
+            "masking_engine": "raw",
+            "enable_performance_monitoring": False,
+            "checkpoint": {"enabled": True, "directory": str(checkpoint_dir), "interval_packets": 50},
+            "error_handler": {"retry_delay": 0},
+            **config,
+        }
+    )
+
+
+@pytest.fixture
+def run(keep_rules, quiet_logging):
+    def mask(input_path, output_path, checkpoint_dir):
+        return _masker(checkpoint_dir).apply_masking(str(input_path), str(output_path), keep_rules)
+
+    return mask
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("container", ["pcap", "pcapng"])
+def test_reader_resumes_from_checkpoint(write_capture, container):
+    path = write_capture(_packets(40), "input", interval=0.01, container=container)
+
+    with RawCaptureReader(str(path)) as reader:
+        records = iter(reader)
+        head = [next(records) for _ in range(15)]
+        state = reader.checkpoint()
+        tail = list(records)
+    with RawCaptureReader(str(path), resume_from=state) as reader:
+        assert list(reader) == tail
+    assert len(head) + len(tail) == 40
+
+
+@pytest.mark.unit
+def test_writer_resume_truncates_unsaved_records(tmp_path):
+    path = tmp_path / "out.pcap"
+    with RawPcapWriter(str(path)) as writer:
+        writer.write_record(b"a" * 30, 1, 0, 30)
+        state = writer.checkpoint()
+        writer.write_record(b"lost", 2, 0, 4)
+    with RawPcapWriter(str(path), resume_from=state) as writer:
+        writer.write_record(b"b" * 20, 3, 0, 20)
+
+    with RawPcapWriter(str(tmp_path / "clean.pcap")) as clean:
+        clean.write_record(b"a" * 30, 1, 0, 30)
+        clean.write_record(b"b" * 20, 3, 0, 20)
+    assert path.read_bytes() == (tmp_path / "clean.pcap").read_bytes()
+    assert (writer.digest.records, writer.digest.crc32) == (clean.digest.records, clean.digest.crc32)
+
+
+@pytest.mark.unit
+def test_retry_resumes_from_last_checkpoint(write_capture, run, tmp_path, monkeypatch):
+    input_path = write_capture(_packets(300), interval=0.01)
+    checkpoint_dir = tmp_path / "checkpoints"
+    clean = run(input_path, tmp_path / "clean.pcap", checkpoint_dir)
+
+    # The first attempt fails with an I/O error while writing packet 170
+    original_write = RawPcapWriter.write_record
+    calls = {"count": 0}
+    saved = {}
+
+    def flaky_write(self, *args):
+        calls["count"] += 1
+        if calls["count"] == 170:
+            (path,) = checkpoint_dir.glob("*.ckpt")
+            saved["checkpoint"] = json.loads(path.read_text(encoding="utf-8"))
+            saved["flows"] = (checkpoint_dir / f"{path.name}.flows").read_text(encoding="utf-8").split()
+            raise OSError("Stale file handle")
+        return original_write(self, *args)
+
+    monkeypatch.setattr(RawPcapWriter, "write_record", flaky_write)
+    output_path = tmp_path / "resumed.pcap"
+    resumed = run(input_path, output_path, checkpoint_dir)
+
+    assert resumed.success
+    assert resumed.performance_metrics["resumed_after_packet"] == 150
+    # The flow table lives in the journal, not in the checkpoint state
+    assert saved["flows"] == [f"10.0.1.{flow + 1}:{1000 + flow}-10.0.2.1:443" for flow in (1, 2, 3, 4, 0)]
+    assert saved["checkpoint"]["flow_count"] == 5
+    assert "10.0.1." not in json.dumps(saved["checkpoint"]["state"])
+    # 169 packets written before the failure, the last 150 again after resuming
+    assert calls["count"] == 169 + 1 + 150
+    assert output_path.read_bytes() == (tmp_path / "clean.pcap").read_bytes()
+    assert (resumed.processed_packets, resumed.modified_packets) == (clean.processed_packets, clean.modified_packets)
+    assert (resumed.preserved_bytes, resumed.masked_bytes) == (clean.preserved_bytes, clean.masked_bytes)
+    assert list(checkpoint_dir.iterdir()) == []
+    assert not os.path.exists(f"{output_path}.ckpt")
+
+
+@pytest.mark.unit
+def test_changed_output_is_not_resumed(write_capture, run, keep_rules, tmp_path):
+    input_path = write_capture(_packets(300), interval=0.01)
+    checkpoint_dir = tmp_path / "checkpoints"
+    clean = run(input_path, tmp_path / "clean.pcap", checkpoint_dir)
+
+    # A checkpoint after packet 150 whose output was replaced after the crash
+    output_path = tmp_path / "out.pcap"
+    with RawCaptureReader(str(input_path)) as reader, RawPcapWriter(str(output_path)) as writer:
+        for _, record in zip(range(150), reader):
+            writer.write_record(record.data, record.sec, record.usec, record.wirelen)
+        state = {"reader": reader.checkpoint(), "writer": writer.checkpoint()}
+    assert RawPcapWriter.matches_checkpoint(str(output_path), state["writer"])
+    data = bytearray(output_path.read_bytes())
+    data[-1] ^= 0xFF
+    output_path.write_bytes(bytes(data))
+    assert not RawPcapWriter.matches_checkpoint(str(output_path), state["writer"])
+    checkpoint = MaskingCheckpoint.for_run(
+        str(input_path), str(output_path), keep_rules, {"directory": str(checkpoint_dir)}
+    )
+    checkpoint.save(state)
+
+    rerun = run(input_path, output_path, checkpoint_dir)
+
+    assert rerun.success
+    assert "resumed_after_packet" not in rerun.performance_metrics
+    assert output_path.read_bytes() == (tmp_path / "clean.pcap").read_bytes()
+    assert rerun.processed_packets == clean.processed_packets
+
+
+@pytest.mark.unit
+def test_checkpoints_are_opt_in(tmp_path):
+    masker = PayloadMasker({"masking_engine": "raw"})
+    assert masker._create_checkpoint(str(tmp_path / "in.pcap"), str(tmp_path / "out.pcap"), KeepRuleSet()) is None
+
+
+@pytest.mark.unit
+def test_checkpoint_of_other_rules_is_ignored(write_capture, keep_rules, tmp_path):
+    input_path = write_capture(_packets(10), interval=0.01)
+    output_path = str(tmp_path / "out.pcap")
+
+    config = {"directory": str(tmp_path / "checkpoints")}
+    saved = MaskingCheckpoint.for_run(str(input_path), output_path, keep_rules, config)
+    saved.save({"marker": True})
+    assert MaskingCheckpoint.for_run(str(input_path), output_path, keep_rules, config).load() == {"marker": True}
+    assert os.path.dirname(saved.path) == config["directory"]
+
+    other = MaskingCheckpoint.for_run(str(input_path), output_path, KeepRuleSet(), config)
+    assert other.load() is None
+    assert not os.path.exists(saved.path)
+
+
+@pytest.mark.unit
+def test_flow_journal_is_append_only(write_capture, keep_rules, tmp_path):
+    input_path = write_capture(_packets(10), interval=0.01)
+    config = {"directory": str(tmp_path / "checkpoints")}
+    checkpoint = MaskingCheckpoint.for_run(str(input_path), str(tmp_path / "out.pcap"), keep_rules, config)
+    checkpoint.save({"n": 1}, ["a:1-b:2", "c:3-d:4"])
+    checkpoint.save({"n": 2}, [])
+    checkpoint.save({"n": 3}, ["e:5-f:6"])
+    # Flows journaled by a save that crashed before its state was written
+    with open(checkpoint.flows_path, "a", encoding="utf-8") as f:
+        f.write("lost:1-lost:2\n")
+
+    resumed = MaskingCheckpoint.for_run(str(input_path), str(tmp_path / "out.pcap"), keep_rules, config)
+    assert resumed.load() == {"n": 3}
+    assert resumed.load_flows() == ["a:1-b:2", "c:3-d:4", "e:5-f:6"]
+    resumed.save({"n": 4}, ["g:7-h:8"])
+    assert open(resumed.flows_path, encoding="utf-8").read().split() == ["a:1-b:2", "c:3-d:4", "e:5-f:6", "g:7-h:8"]
+
+    resumed.discard()
+    assert list((tmp_path / "checkpoints").iterdir()) == []
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize(
+    "config, reason",
+    [({"masking_engine": "scapy"}, "only the raw engine"), ({"masking_workers": 2}, "sharded masking")],
+)
+def test_engines_that_cannot_resume_log_it(write_capture, keep_rules, tmp_path, caplog, config, reason):
+    input_path = write_capture(_packets(60), interval=0.01)
+    masker = _masker(tmp_path / "checkpoints", **config)
+
+    with caplog.at_level(logging.WARNING):
+        stats = masker.apply_masking(str(input_path), str(tmp_path / "out.pcap"), keep_rules)
+
+    assert stats.success
+    assert any("checkpoints are ignored" in message and reason in message for message in caplog.messages)
+    assert not (tmp_path / "checkpoints").exists() or list((tmp_path / "checkpoints").iterdir()) == []
@@ -0,0 +1,212 @@
+"""
+Native TLS marker tests
+
+The tshark-free marker reassembles TCP streams itself: records spanning
+segments, out-of-order and retransmitted segments, gaps and captures starting
+mid-stream all produce the same keep rules the tshark marker would, and
+non-TLS payload produces none.
+"""
+
+import shutil
+import struct
+from pathlib import Path
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker import NativeTLSProtocolMarker, TLSProtocolMarker
+from pktmask.core.pipeline.stages.masking_stage.marker.auto_marker import AutoProtocolMarker
+from pktmask.core.pipeline.stages.masking_stage.stage import MaskingStage
+
+TLS_DATA_DIR = Path(__file__).resolve().parents[1] / "data" / "tls"
+CLIENT, SERVER = ("10.0.0.1", 40000), ("10.0.0.2", 443)
+ISN = 1000
+
+
+def _record(content_type, length, fill=b"\xaa"):
+    return struct.pack("!BHH", content_type, 0x0303, length) + fill * length
+
+
+def _segments(stream, sizes):
+    """Split ``stream`` into (offset, bytes) segments of the given sizes"""
+    segments, offset = [], 0
+    for size in sizes:
+        segments.append((offset, stream[offset : offset + size]))
+        offset += size
+    if offset < len(stream):
+        segments.append((offset, stream[offset:]))
+    return segments
+
+
+def _write(path, segments, syn=True, src=CLIENT, dst=SERVER):
+    packets = []
+    if syn:
+        packets.append(Ether() / IP(src=src[0], dst=dst[0]) / TCP(sport=src[1], dport=dst[1], seq=ISN - 1, flags="S"))
+    for offset, data in segments:
+        packets.append(
+            Ether()
+            / IP(src=src[0], dst=dst[0])
+            / TCP(sport=src[1], dport=dst[1], seq=ISN + offset, flags="PA")
+            / Raw(data)
+        )
+    wrpcap(str(path), packets)
+    return str(path)
+
+
+def _rules(path, **config):
+    ruleset = NativeTLSProtocolMarker(config).analyze_file(path, {})
+    assert not ruleset.metadata.get("analysis_failed")
+    return ruleset, [(r.rule_type, r.seq_start - ISN, r.seq_end - ISN) for r in ruleset.rules]
+
+
+@pytest.mark.unit
+def test_records_spanning_segments(tmp_path):
+    stream = _record(22, 300) + _record(20, 1) + _record(23, 1000)
+    path = _write(tmp_path / "span.pcap", _segments(stream, [3, 200, 104, 500]))
+
+    ruleset, rules = _rules(path)
+
+    assert rules == [
+        ("tls_handshake", 0, 305),
+        ("tls_changecipherspec", 305, 311),
+        ("tls_applicationdata_header", 311, 316),
+    ]
+    rule = ruleset.rules[0]
+    assert (rule.stream_id, rule.direction) == ("0", "forward")
+    assert rule.metadata["tuple_key"] == "10.0.0.1:40000-10.0.0.2:443"
+    assert rule.metadata["preserve_strategy"] == "full_message"
+    assert ruleset.rules[2].metadata["preserve_strategy"] == "header_only"
+    assert ruleset.tcp_flows["0"].packet_count == 6
+
+
+@pytest.mark.unit
+def test_out_of_order_and_retransmitted_segments(tmp_path):
+    stream = _record(22, 120) + _record(23, 400) + _record(23, 50)
+    in_order = _segments(stream, [60, 60, 100, 100, 100, 100])
+    shuffled = [in_order[2], in_order[0], in_order[0], in_order[4], in_order[1], in_order[3], in_order[1]]
+    # Retransmission overlapping already delivered bytes
+    overlap = (in_order[4][0] - 10, stream[in_order[4][0] - 10 : in_order[5][0] + 20])
+    shuffled += [overlap, in_order[5], in_order[6]]
+
+    expected = _rules(_write(tmp_path / "ordered.pcap", in_order))[1]
+    ruleset, rules = _rules(_write(tmp_path / "shuffled.pcap", shuffled))
+
+    assert (
+        rules
+        == expected
+        == [
+            ("tls_handshake", 0, 125),
+            ("tls_applicationdata_header", 125, 130),
+            ("tls_applicationdata_header", 530, 535),
+        ]
+    )
+    assert ruleset.statistics["out_of_order_segments"] > 0
+    assert ruleset.statistics["retransmitted_bytes"] > 0
+
+
+@pytest.mark.unit
+def test_header_only_and_full_message_application_data(tmp_path):
+    stream = _record(23, 100) + _record(21, 2)
+    path = _write(tmp_path / "app.pcap", _segments(stream, []))
+
+    assert _rules(path)[1] == [("tls_applicationdata_header", 0, 5), ("tls_alert", 105, 112)]
+    assert _rules(path, preserve={"application_data": True})[1] == [
+        ("tls_applicationdata", 0, 105),
+        ("tls_alert", 105, 112),
+    ]
+
+
+@pytest.mark.unit
+def test_parser_resynchronizes_after_gap(tmp_path):
+    stream = _record(22, 50) + _record(23, 3000) + _record(23, 40) + _record(23, 40)
+    segments = _segments(stream, [55, 1000, 1000, 1000])
+    # The segment carrying the middle of the second record is lost
+    del segments[2]
+
+    ruleset, rules = _rules(_write(tmp_path / "gap.pcap", segments), max_reassembly_buffer=64)
+
+    assert ("tls_handshake", 0, 55) in rules
+    assert ("tls_applicationdata_header", 3060, 3065) in rules
+    assert ("tls_applicationdata_header", 3105, 3110) in rules
+    assert ruleset.statistics["reassembly_gaps"] == 1
+
+
+@pytest.mark.unit
+def test_mid_stream_capture_needs_confirmed_header(tmp_path):
+    # Capture starts inside a record; trailing bytes of it look like a header
+    tail = b"\x00" * 7 + b"\x17\x03\x03\x00\x20" + b"\x00" * 20
+    stream = tail + _record(23, 64) + _record(23, 64) + _record(23, 16)
+
+    _, rules = _rules(_write(tmp_path / "mid.pcap", _segments(stream, [40, 40]), syn=False))
+
+    # The decoy is rejected; the header inside its body is skipped with it,
+    # parsing resumes at the next pair of headers confirming each other
+    start = len(tail)
+    assert rules == [
+        ("tls_applicationdata_header", start + 69, start + 74),
+        ("tls_applicationdata_header", start + 138, start + 143),
+    ]
+
+    # Without the decoy the first complete record is found
+    _, rules = _rules(_write(tmp_path / "clean.pcap", _segments(b"\x00" * 7 + stream[len(tail) :], [40]), syn=False))
+    assert rules[0] == ("tls_applicationdata_header", 7, 12)
+
+
+@pytest.mark.unit
+def test_non_tls_payload_produces_no_rules(tmp_path):
+    http = b"GET / HTTP/1.1\r\nHost: example\r\n\r\n" + bytes(range(256)) * 8
+    path = _write(tmp_path / "http.pcap", _segments(http, [100, 700]), src=("10.0.0.1", 41000), dst=("10.0.0.2", 80))
+
+    ruleset, rules = _rules(path)
+    assert rules == []
+    assert ruleset.tcp_flows == {}
+
+
+@pytest.mark.unit
+def test_engine_selection_and_fingerprint():
+    stage = MaskingStage({"protocol": "tls", "marker_config": {"tls_engine": "native"}})
+    assert isinstance(stage._create_marker(), NativeTLSProtocolMarker)
+
+    auto = AutoProtocolMarker({"tls_engine": "native"})
+    assert auto.initialize()
+    assert isinstance(auto.tls_marker, NativeTLSProtocolMarker)
+
+    fingerprint = NativeTLSProtocolMarker({}).cache_fingerprint()
+    assert fingerprint["marker"] == "NativeTLSProtocolMarker"
+    assert fingerprint != NativeTLSProtocolMarker({"preserve": {"handshake": False}}).cache_fingerprint()
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("pcap", sorted(TLS_DATA_DIR.glob("*.pcap*")), ids=lambda path: path.name)
+def test_masks_tls_corpus(tmp_path, pcap):
+    stage = MaskingStage(
+        {
+            "protocol": "tls",
+            "marker_config": {"tls_engine": "native"},
+            "masker_config": {"enable_performance_monitoring": False},
+        }
+    )
+    assert stage.initialize()
+    stats = stage.process_file(pcap, tmp_path / pcap.name)
+
+    assert stats.packets_processed > 0
+    assert stats.extra_metrics["success"]
+
+
+@pytest.mark.unit
+@pytest.mark.skipif(shutil.which("tshark") is None, reason="tshark not installed")
+@pytest.mark.parametrize("pcap", sorted(TLS_DATA_DIR.glob("*.pcap*")), ids=lambda path: path.name)
+def test_rules_match_tshark_marker(pcap):
+    def header_rules(marker):
+        ruleset = marker.analyze_file(str(pcap), {})
+        return {
+            (r.metadata["tuple_key"], r.direction, r.metadata["tls_header_seq_start"], r.rule_type)
+            for r in ruleset.rules
+            if r.metadata.get("is_complete", True)
+        }
+
+    tshark = TLSProtocolMarker({})
+    assert tshark.initialize()
+    native = header_rules(NativeTLSProtocolMarker({}))
+
+    assert header_rules(tshark) <= native
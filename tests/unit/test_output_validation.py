@@ -0,0 +1,101 @@
+"""
+Output validation tests
+
+Output files are validated from the counters and checksum collected while
+writing them; re-reading the file is only done for record walks and the
+"paranoid" mode.
+"""
+
+import logging
+import zlib
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker.types import KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.masker.data_validator import DataValidator
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.core.rawpacket.pcap_io import RawPcapWriter, count_pcap_records
+
+
+def _write(path, count):
+    with RawPcapWriter(str(path), buffer_size=256) as writer:
+        for index in range(count):
+            writer.write_record(bytes([index % 256]) * (40 + index), 1700000000 + index, 0, 40 + index)
+    return writer.digest
+
+
+@pytest.mark.unit
+def test_writer_digest_describes_file(tmp_path):
+    path = tmp_path / "out.pcap"
+    digest = _write(path, 50)
+
+    content = path.read_bytes()
+    assert digest.records == 50
+    assert digest.bytes_written == len(content)
+    assert digest.checksum == f"{zlib.crc32(content):08x}"
+    assert count_pcap_records(str(path)) == 50
+
+    path.write_bytes(content[:-3])
+    with pytest.raises(ValueError):
+        count_pcap_records(str(path))
+
+
+@pytest.mark.unit
+def test_digest_validation_does_not_reread_packets(tmp_path, monkeypatch):
+    path = tmp_path / "out.pcap"
+    digest = _write(path, 20)
+    validator = DataValidator({})
+    monkeypatch.setattr(validator, "_count_packets_in_file", pytest.fail)
+    monkeypatch.setattr(validator, "_calculate_file_checksum", pytest.fail)
+
+    result = validator.validate_output_file(path, expected_packet_count=20, write_digest=digest)
+
+    assert result.is_valid and not result.warnings
+    assert result.details["packet_count_source"] == "write_digest"
+    assert result.details["write_crc32"] == digest.checksum
+
+    # A file that lost bytes after writing no longer matches its digest
+    path.write_bytes(path.read_bytes()[:-10])
+    assert not validator.validate_output_file(path, expected_packet_count=20, write_digest=digest).is_valid
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("mode, source", [("walk", "record_walk"), ("paranoid", "scapy")])
+def test_rereading_verification_modes(tmp_path, mode, source):
+    path = tmp_path / "out.pcap"
+    digest = _write(path, 20)
+
+    result = DataValidator({"output_verification": mode}).validate_output_file(
+        path, expected_packet_count=21, write_digest=digest
+    )
+
+    assert result.is_valid
+    assert result.details["packet_count"] == 20
+    assert result.details["packet_count_source"] == source
+    assert any("数据包数量不匹配" in warning for warning in result.warnings)
+    assert ("file_checksum" in result.details) == (mode == "paranoid")
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("engine", ["raw", "scapy"])
+def test_masking_validates_output_from_write_digest(tmp_path, engine):
+    packets = [
+        Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=1, dport=2, seq=i * 10) / Raw(b"x" * 10)
+        for i in range(30)
+    ]
+    input_path = tmp_path / "in.pcap"
+    output_path = tmp_path / "out.pcap"
+    wrpcap(str(input_path), packets)
+
+    logging.disable(logging.WARNING)
+    try:
+        masker = PayloadMasker({"masking_engine": engine, "enable_performance_monitoring": False})
+        stats = masker.apply_masking(str(input_path), str(output_path), KeepRuleSet())
+    finally:
+        logging.disable(logging.NOTSET)
+
+    details = stats.validation_results["output_validation"]
+    assert details["packet_count"] == details["records_written"] == 30
+    assert details["packet_count_source"] == "write_digest"
+    assert details["write_crc32"] == f"{zlib.crc32(output_path.read_bytes()):08x}"
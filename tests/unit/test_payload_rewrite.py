@@ -0,0 +1,67 @@
+"""
+PayloadMasker in-place payload rewrite tests
+
+The in-place path patches the captured frame bytes and recomputes the TCP
+checksum; its output must be byte-identical to the deepcopy rebuild path.
+"""
+
+import pytest
+from scapy.all import IP, TCP, UDP, Dot1Q, Ether, Raw
+
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.core.rawpacket import transport_checksum
+
+
+def _reparse(packet):
+    """Round-trip through bytes so layers carry ``original`` like PcapReader output."""
+    return packet.__class__(bytes(packet))
+
+
+FRAMES = [
+    Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=40000, dport=443) / Raw(b"\x17\x03\x03" + b"A" * 40),
+    Ether() / Dot1Q(vlan=7) / IP(src="10.0.0.3", dst="10.0.0.4") / TCP(sport=1, dport=2) / Raw(b"secret"),
+    # Short frame: Ethernet padding follows the TCP payload
+    Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=40000, dport=443) / Raw(b"\x16\x03"),
+    Ether() / IP(src="10.0.0.1", dst="10.0.0.2", options=b"\x01\x01\x01\x00") / TCP(sport=5, dport=6) / Raw(b"xyz" * 9),
+]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("frame", FRAMES)
+def test_inplace_rewrite_matches_deepcopy(frame):
+    packet = _reparse(frame)
+    tcp_layer = packet[TCP]
+    original_payload = bytes(tcp_layer.payload)
+    new_payload = bytes(len(original_payload))
+
+    deepcopy_masker = PayloadMasker({"payload_rewrite_mode": "deepcopy"})
+    inplace_masker = PayloadMasker({"payload_rewrite_mode": "inplace"})
+
+    expected = deepcopy_masker._modify_packet_payload(packet, tcp_layer, new_payload)
+    rewritten = inplace_masker._rewrite_payload_inplace(packet, tcp_layer, new_payload)
+
+    assert rewritten is not None
+    assert bytes(rewritten) == bytes(expected)
+    assert rewritten.time == packet.time
+    # The source packet is left untouched
+    assert bytes(packet[TCP].payload) == original_payload
+
+
+@pytest.mark.unit
+def test_inplace_rewrite_declines_fragments():
+    packet = _reparse(Ether() / IP(flags="MF") / TCP() / Raw(b"data"))
+    masker = PayloadMasker({})
+
+    assert masker._rewrite_payload_inplace(packet, packet[TCP], b"\x00" * 4) is None
+
+
+@pytest.mark.unit
+def test_transport_checksum_matches_scapy():
+    for layer in (TCP(sport=1, dport=2) / Raw(b"abc"), UDP(sport=53, dport=53) / Raw(b"hello!")):
+        packet = IP(bytes(IP(src="192.0.2.1", dst="198.51.100.7") / layer))
+        segment = bytearray(bytes(packet.payload))
+        offset = 16 if packet.proto == 6 else 6
+        expected = int.from_bytes(segment[offset : offset + 2], "big")
+        segment[offset : offset + 2] = b"\x00\x00"
+
+        assert transport_checksum(packet.original[12:16], packet.original[16:20], packet.proto, segment) == expected
@@ -0,0 +1,197 @@
+"""
+Raw-bytes masking engine tests
+
+The raw engine must write byte-identical output to the scapy engine, including
+for frames it hands back to scapy (tunnels, fragments, ICMP errors).
+"""
+
+import io
+
+import pytest
+from scapy.all import (
+    ARP,
+    GRE,
+    ICMP,
+    IP,
+    LLC,
+    SNAP,
+    STP,
+    TCP,
+    UDP,
+    VXLAN,
+    CookedLinux,
+    CookedLinuxV2,
+    Dot1AD,
+    Dot1Q,
+    Dot3,
+    Ether,
+    IPerror,
+    IPv6,
+    PcapNgReader,
+    PcapReader,
+    Raw,
+    TCPerror,
+    wrpcap,
+    wrpcapng,
+)
+from scapy.utils import PcapWriter
+
+from pktmask.core.pipeline.stages.masking_stage.masker.payload_masker import PayloadMasker
+from pktmask.core.rawpacket.frame import NEEDS_DISSECTION, PASS_THROUGH, TCP_SEGMENT, FrameClassifier
+from pktmask.core.rawpacket.pcap_io import RawCaptureReader
+
+
+def _eth(**kwargs):
+    return Ether(src="00:11:22:33:44:55", dst="66:77:88:99:aa:bb", **kwargs)
+
+
+def _tcp(src="10.0.0.1", dst="10.0.0.2", sport=40000, dport=443, seq=1000, **ip_kwargs):
+    return IP(src=src, dst=dst, **ip_kwargs) / TCP(sport=sport, dport=dport, seq=seq, flags="PA")
+
+
+FRAMES = [
+    _eth() / _tcp() / Raw(b"\x17\x03\x03\x00\x10" + b"A" * 64),
+    _eth() / _tcp(src="10.0.0.2", dst="10.0.0.1", sport=443, dport=40000, seq=5000),
+    _eth() / Dot1Q(vlan=5) / _tcp(seq=1069) / Raw(b"B" * 40),
+    _eth() / Dot1AD(vlan=3) / Dot1Q(vlan=4) / _tcp(src="10.0.0.3", sport=1, seq=7) / Raw(b"C" * 80),
+    # Short frame with Ethernet padding after the TCP payload
+    _eth() / _tcp(seq=1109) / Raw(b"\x16\x03"),
+    _eth() / IP(src="10.0.0.3", dst="10.0.0.9") / UDP(sport=53, dport=53) / Raw(b"dns"),
+    _eth() / ARP(),
+    _eth() / IPv6(src="::1", dst="::2") / TCP(sport=1, dport=2) / Raw(b"v6"),
+    _eth() / IP(src="1.1.1.1", dst="2.2.2.2") / GRE() / _tcp(seq=3) / Raw(b"D" * 50),
+    _eth() / IP(src="1.1.1.1", dst="2.2.2.2") / UDP(sport=1234, dport=4789) / VXLAN() / _eth() / _tcp(seq=9),
+    _eth() / _tcp(flags="MF") / Raw(b"F" * 40),
+    _eth() / IP(src="10.0.0.1", dst="10.0.0.2", frag=10) / Raw(b"G" * 40),
+    _eth() / IP(src="10.0.0.1", dst="10.0.0.2") / ICMP(type=3) / IPerror() / TCPerror() / Raw(b"H" * 30),
+]
+
+
+@pytest.fixture
+def keep_rules(keep_rule_set):
+    return keep_rule_set([("0", "forward", 1000, 1005, "10.0.0.1:40000-10.0.0.2:443")])
+
+
+@pytest.fixture
+def run_engines(run_variants, keep_rules, quiet_logging):
+    """Mask with the scapy and the raw engine; returns their stats after checking the outputs are identical"""
+
+    def run(input_path):
+        def mask(engine, output_path):
+            masker = PayloadMasker({"masking_engine": engine, "enable_performance_monitoring": False})
+            return masker.apply_masking(str(input_path), str(output_path), keep_rules)
+
+        results = run_variants(mask, ["scapy", "raw"])
+        return results["scapy"], results["raw"]
+
+    return run
+
+
+@pytest.mark.unit
+def test_raw_engine_output_matches_scapy_engine(write_capture, run_engines):
+    scapy_stats, raw_stats = run_engines(write_capture(FRAMES, interval=0.0013))
+
+    assert raw_stats.performance_metrics["masking_engine"] == "raw"
+    assert raw_stats.processed_packets == scapy_stats.processed_packets == len(FRAMES)
+    assert raw_stats.modified_packets == scapy_stats.modified_packets
+    # Only the GRE, VXLAN and first-fragment frames need scapy
+    assert raw_stats.performance_metrics["dissected_packets"] == 3
+
+
+LINK_LAYER_FRAMES = {
+    "sll": [
+        CookedLinux(proto=0x0800) / _tcp() / Raw(b"\x17\x03\x03\x00\x10" + b"A" * 64),
+        CookedLinux(proto=0x86DD) / IPv6(src="::1", dst="::2") / UDP(sport=53, dport=53) / Raw(b"dns"),
+        CookedLinux(proto=0x8100) / Dot1Q(vlan=5) / _tcp(seq=1069) / Raw(b"B" * 40),
+    ],
+    "sll2": [
+        CookedLinuxV2(proto=0x0800) / _tcp() / Raw(b"\x17\x03\x03\x00\x10" + b"A" * 64),
+        CookedLinuxV2(proto=0x0806) / ARP(),
+    ],
+    "raw_ip": [
+        _tcp() / Raw(b"\x17\x03\x03\x00\x10" + b"A" * 64),
+        IP(src="10.0.0.3", dst="10.0.0.9") / UDP(sport=53, dport=53) / Raw(b"dns"),
+    ],
+    "llc": [
+        Dot3(src="00:11:22:33:44:55", dst="01:80:c2:00:00:00") / LLC() / STP(),
+        _eth() / _tcp() / Raw(b"\x17\x03\x03\x00\x10" + b"A" * 64),
+    ],
+}
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("link", sorted(LINK_LAYER_FRAMES))
+def test_non_ethernet_link_layers_skip_dissection(write_capture, run_engines, link):
+    input_path = write_capture(LINK_LAYER_FRAMES[link], interval=1, **({"linktype": 101} if link == "raw_ip" else {}))
+
+    scapy_stats, raw_stats = run_engines(input_path)
+
+    assert raw_stats.modified_packets == scapy_stats.modified_packets > 0
+    assert raw_stats.performance_metrics["dissected_packets"] == 0
+
+
+@pytest.mark.unit
+def test_frame_classifier_link_layers():
+    classifier = FrameClassifier()
+    tcp = _tcp() / Raw(b"x" * 10)
+
+    assert classifier.classify(113, bytes(CookedLinux(proto=0x0800) / tcp))[1].payload_offset == 16 + 40
+    assert classifier.classify(276, bytes(CookedLinuxV2(proto=0x0800) / tcp))[1].payload_offset == 20 + 40
+    assert classifier.classify(101, bytes(tcp))[1].payload_offset == 40
+    assert classifier.classify(101, bytes(IPv6() / TCP()))[0] == PASS_THROUGH
+    assert classifier.classify(1, bytes(Dot3() / LLC() / STP()))[0] == PASS_THROUGH
+    # SNAP may carry IP trimmed to the 802.3 length, scapy decides
+    assert classifier.classify(1, bytes(Dot3() / LLC() / SNAP() / tcp))[0] == NEEDS_DISSECTION
+    # Link types without a raw walker (802.11 here) are left to scapy
+    assert classifier.classify(105, bytes(tcp))[0] == NEEDS_DISSECTION
+
+
+@pytest.mark.unit
+def test_frame_classifier_verdicts():
+    classifier = FrameClassifier()
+    verdicts = [classifier.classify(1, bytes(frame))[0] for frame in FRAMES]
+
+    assert verdicts == [
+        TCP_SEGMENT,
+        TCP_SEGMENT,
+        TCP_SEGMENT,
+        TCP_SEGMENT,
+        TCP_SEGMENT,
+        PASS_THROUGH,
+        PASS_THROUGH,
+        PASS_THROUGH,
+        NEEDS_DISSECTION,
+        NEEDS_DISSECTION,
+        NEEDS_DISSECTION,
+        PASS_THROUGH,
+        PASS_THROUGH,
+    ]
+    _, info = classifier.classify(1, bytes(FRAMES[2]))
+    assert (info.src, info.dst, info.sport, info.dport, info.seq) == ("10.0.0.1", "10.0.0.2", 40000, 443, 1069)
+    assert info.payload_offset == 14 + 4 + 20 + 20
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("writer", ["pcap", "pcap_nano", "pcapng"])
+def test_raw_reader_matches_scapy_records(tmp_path, writer):
+    packets = [frame.copy() for frame in FRAMES]
+    for index, packet in enumerate(packets):
+        packet.time = 1700000000 + index * 0.000123457
+    path = tmp_path / "records"
+    if writer == "pcapng":
+        wrpcapng(str(path), packets)
+        reader_cls = PcapNgReader
+    else:
+        wrpcap(str(path), packets, nano=writer == "pcap_nano")
+        reader_cls = PcapReader
+
+    with RawCaptureReader(str(path)) as raw_reader:
+        records = list(raw_reader)
+    with reader_cls(str(path)) as scapy_reader:
+        expected = list(scapy_reader)
+
+    time_writer = PcapWriter(io.BytesIO())
+    assert len(records) == len(expected)
+    for record, packet in zip(records, expected):
+        sec, usec = time_writer._get_time(packet, None, None)
+        assert (record.sec, record.usec, record.wirelen, record.data) == (int(sec), usec, packet.wirelen, bytes(packet))
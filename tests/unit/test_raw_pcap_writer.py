@@ -0,0 +1,59 @@
+"""
+RawPcapWriter buffering and sync policy tests
+"""
+
+import struct
+
+import pytest
+
+from pktmask.core.rawpacket import pcap_io
+from pktmask.core.rawpacket.pcap_io import RawCaptureReader, RawPcapWriter, SyncPolicy, SyncTracker
+
+
+def _expected_file(records, linktype=1):
+    out = struct.pack("=IHHIIII", pcap_io.PCAP_MAGIC_USEC, 2, 4, 0, 0, pcap_io.MAX_RECORD_SIZE, linktype)
+    for data, sec, usec in records:
+        out += struct.pack("=IIII", sec, usec, len(data), len(data)) + data
+    return out
+
+
+@pytest.mark.unit
+def test_writer_batches_records_into_large_writes(tmp_path):
+    records = [(bytes([i % 256]) * (60 + i % 40), 1700000000 + i, i) for i in range(500)]
+    path = tmp_path / "out.pcap"
+
+    with RawPcapWriter(str(path), buffer_size=8192) as writer:
+        for data, sec, usec in records:
+            writer.write_record(data, sec, usec, len(data))
+
+    content = path.read_bytes()
+    assert content == _expected_file(records)
+    # One write() per filled buffer instead of two per record
+    assert writer.write_calls <= len(content) // 8192 + 1
+    with RawCaptureReader(str(path)) as reader:
+        assert [record.data for record in reader] == [data for data, _, _ in records]
+
+
+@pytest.mark.unit
+def test_writer_syncs_on_packet_interval(tmp_path, monkeypatch):
+    synced = []
+    monkeypatch.setattr(pcap_io.os, "fsync", lambda fd: synced.append(fd))
+    path = tmp_path / "out.pcap"
+
+    with RawPcapWriter(str(path), sync_policy=SyncPolicy(every_packets=10)) as writer:
+        for i in range(25):
+            writer.write_record(b"x" * 20, i, 0, 20)
+            if i == 9:
+                # Everything up to the sync point is on disk already
+                assert path.stat().st_size == 24 + 10 * 36
+
+    # Two interval syncs plus the final one on close
+    assert len(synced) == 3
+
+
+@pytest.mark.unit
+def test_sync_tracker_intervals():
+    assert not SyncTracker(SyncPolicy()).record(10**9, 10**6)
+
+    tracker = SyncTracker(SyncPolicy(every_bytes=100))
+    assert [tracker.record(40) for _ in range(5)] == [False, False, True, False, False]
@@ -0,0 +1,152 @@
+"""
+Keep rule cache tests
+
+Cached keep rules round-trip exactly (flow records without their IP addresses),
+are keyed by capture content and marker identity, and the cache directory stays
+below its size cap.
+"""
+
+import os
+
+import pytest
+from scapy.all import IP, TCP, Ether, Raw, wrpcap
+
+from pktmask.core.pipeline.stages.masking_stage.marker.rule_cache import (
+    KeepRuleCache,
+    decode_keep_rules,
+    encode_keep_rules,
+)
+from pktmask.core.pipeline.stages.masking_stage.marker.types import FlowInfo, KeepRule, KeepRuleSet
+from pktmask.core.pipeline.stages.masking_stage.stage import MaskingStage
+
+FINGERPRINT = {"marker": "TLSProtocolMarker", "preserve": {"handshake": True}, "tshark_version": "4.2.0"}
+
+
+def _rule_set(rule_count=3):
+    rule_set = KeepRuleSet()
+    for index in range(rule_count):
+        rule_set.rules.append(
+            KeepRule(
+                stream_id=str(index % 2),
+                direction="reverse" if index % 3 else "forward",
+                seq_start=2**32 + index * 100,
+                seq_end=2**32 + index * 100 + 5,
+                rule_type="tls_handshake",
+                metadata={"tls_content_type": 22, "tuple_key": f"10.0.0.1:{1000 + index % 2}-10.0.0.2:443"},
+            )
+        )
+    rule_set.tcp_flows["0"] = FlowInfo("0", "10.0.0.1", "10.0.0.2", 1000, 443, "tcp", "forward", packet_count=4)
+    rule_set.tcp_flows["1"] = {
+        "directions": {"forward": {"src_ip": "10.0.0.1", "dst_ip": "10.0.0.2", "src_port": 1001}}
+    }
+    rule_set.statistics = {"total_packets": 12, "tls_packets": 6}
+    rule_set.metadata = {"analyzer": "TLSProtocolMarker", "pcap_path": "/tmp/in.pcap"}
+    return rule_set
+
+
+def _write_capture(path, marker=b"GET"):
+    packets = [
+        Ether() / IP(src="10.0.0.1", dst="10.0.0.2") / TCP(sport=1000, dport=80, seq=1, flags="PA") / Raw(data)
+        for data in (marker + b" / HTTP/1.1\r\nHost: a\r\nCookie: x\r\n\r\n", b"body" * 10)
+    ]
+    wrpcap(str(path), packets)
+
+
+@pytest.mark.unit
+def test_encoding_round_trip():
+    rule_set = _rule_set(50)
+    decoded = decode_keep_rules(encode_keep_rules(rule_set))
+
+    assert decoded.rules == rule_set.rules
+    assert isinstance(decoded.tcp_flows["0"], FlowInfo)
+    assert decoded.tcp_flows["0"] == FlowInfo("0", "", "", 1000, 443, "tcp", "forward", packet_count=4)
+    assert decoded.tcp_flows["1"] == {"directions": {"forward": {"src_ip": "", "dst_ip": "", "src_port": 1001}}}
+    assert (decoded.statistics, decoded.metadata) == (rule_set.statistics, rule_set.metadata)
+    # Rules sharing metadata get their own dicts
+    decoded.rules[0].metadata["x"] = 1
+    assert "x" not in decoded.rules[2].metadata
+
+
+@pytest.mark.unit
+def test_encoding_rejects_corrupt_data():
+    data = encode_keep_rules(_rule_set())
+    for bad in (b"", b"XXXX" + data[4:], data[:-3]):
+        with pytest.raises(ValueError):
+            decode_keep_rules(bad)
+
+
+@pytest.mark.unit
+def test_key_depends_on_content_and_marker(tmp_path):
+    cache = KeepRuleCache(str(tmp_path / "cache"), 1 << 20)
+    first, copy, other = tmp_path / "a.pcap", tmp_path / "b.pcap", tmp_path / "c.pcap"
+    _write_capture(first)
+    _write_capture(other, b"PUT")
+    copy.write_bytes(first.read_bytes())
+
+    key = cache.key_for(str(first), FINGERPRINT)
+    assert cache.key_for(str(copy), FINGERPRINT) == key
+    assert cache.key_for(str(other), FINGERPRINT) != key
+    assert cache.key_for(str(first), dict(FINGERPRINT, tshark_version="4.4.1")) != key
+    assert cache.key_for(str(first), dict(FINGERPRINT, preserve={"handshake": False})) != key
+
+
+@pytest.mark.unit
+def test_get_put_counters_and_corrupt_entry(tmp_path):
+    cache = KeepRuleCache(str(tmp_path), 1 << 20)
+    assert cache.get("k") is None
+    assert cache.put("k", _rule_set())
+    assert cache.get("k").rules == _rule_set().rules
+
+    (tmp_path / "k.rules").write_bytes(b"garbage")
+    assert cache.get("k") is None
+    assert not (tmp_path / "k.rules").exists()
+    assert cache.stats() == {"hits": 1, "misses": 2, "stores": 1, "evictions": 0}
+
+
+@pytest.mark.unit
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    entry_size = len(encode_keep_rules(_rule_set()))
+    cache = KeepRuleCache(str(tmp_path), entry_size * 3)
+    for index, key in enumerate(("a", "b", "c")):
+        cache.put(key, _rule_set())
+        os.utime(tmp_path / f"{key}.rules", ns=(index * 10**9, index * 10**9))
+
+    # "a" becomes the most recently used entry, "b" the oldest
+    assert cache.get("a") is not None
+    cache.put("d", _rule_set())
+
+    assert sorted(path.stem for path in tmp_path.glob("*.rules")) == ["a", "c", "d"]
+    assert cache.evictions == 1
+    # Entries larger than the whole cache are not stored
+    assert not KeepRuleCache(str(tmp_path), entry_size - 1).put("e", _rule_set())
+
+
+@pytest.mark.unit
+def test_stage_reuses_rules_of_identical_capture(tmp_path, monkeypatch):
+    first, copy = tmp_path / "first.pcap", tmp_path / "copy.pcap"
+    _write_capture(first)
+    copy.write_bytes(first.read_bytes())
+    config = {
+        "protocol": "http",
+        "masker_config": {"enable_performance_monitoring": False},
+        "rule_cache": {"enabled": True, "directory": str(tmp_path / "cache")},
+    }
+
+    stage = MaskingStage(config)
+    assert stage.initialize()
+    calls = []
+    analyze_file = stage.marker.analyze_file
+    monkeypatch.setattr(stage.marker, "analyze_file", lambda *args: calls.append(args) or analyze_file(*args))
+
+    miss = stage.process_file(first, tmp_path / "out1.pcap")
+    hit = stage.process_file(copy, tmp_path / "out2.pcap")
+
+    assert len(calls) == 1
+    assert miss.extra_metrics["rule_cache"]["status"] == "miss"
+    assert hit.extra_metrics["rule_cache"] == {"status": "hit", "hits": 1, "misses": 1, "stores": 1, "evictions": 0}
+    assert (tmp_path / "out1.pcap").read_bytes() == (tmp_path / "out2.pcap").read_bytes()
+
+    # Opt-in: no rule_cache section means no cache
+    disabled = MaskingStage({key: value for key, value in config.items() if key != "rule_cache"})
+    stats = disabled.process_file(first, tmp_path / "out3.pcap")
+    assert stats.extra_metrics["rule_cache"] == {"status": "disabled"}
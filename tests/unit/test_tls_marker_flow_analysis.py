@@ -0,0 +1,176 @@
+"""
+TLSProtocolMarker TCP flow analysis tests
+
+Verifies that the batched flow analysis mode produces the same tcp_flows as the
+legacy per-stream mode, using a fake tshark that serves synthetic JSON or
+delimited field output, and that reassembled payload offsets map back to raw
+TCP sequence numbers.
+"""
+
+import json
+import re
+import subprocess
+
+import pytest
+
+from pktmask.core.pipeline.stages.masking_stage.marker.tls_marker import (
+    TCP_FLOW_FIELDS,
+    TLS_RECORD_SCAN_FIELDS,
+    SegmentSeqIndex,
+    TLSProtocolMarker,
+)
+
+
+def _packet(frame, stream, src, dst, sport, dport, seq, payload_hex):
+    return {
+        "_source": {
+            "layers": {
+                "frame.number": [str(frame)],
+                "ip.src": [src],
+                "ip.dst": [dst],
+                "tcp.srcport": [str(sport)],
+                "tcp.dstport": [str(dport)],
+                "tcp.stream": [str(stream)],
+                "tcp.seq": [str(seq)],
+                "tcp.seq_raw": [str(1000 + seq)],
+                "tcp.len": [str(len(payload_hex) // 2)],
+                "tcp.payload": [payload_hex] if payload_hex else [],
+            }
+        }
+    }
+
+
+SYNTHETIC_PACKETS = [
+    _packet(1, 0, "10.0.0.1", "10.0.0.2", 40000, 443, 1, "1603010005" + "00" * 5),
+    _packet(2, 1, "10.0.0.3", "10.0.0.2", 40001, 443, 1, "1703030002aabb"),
+    _packet(3, 0, "10.0.0.2", "10.0.0.1", 443, 40000, 1, "1603030004" + "11" * 4),
+    _packet(4, 2, "10.0.0.4", "10.0.0.2", 40002, 443, 1, ""),
+    _packet(5, 1, "10.0.0.2", "10.0.0.3", 443, 40001, 1, "1503030002" + "0102"),
+]
+
+
+def _render_fields(cmd, packets):
+    """Render packets the way ``tshark -T fields -E separator=/t -E occurrence=a`` would"""
+    fields = [cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-e"]
+    lines = []
+    for packet in packets:
+        layers = packet["_source"]["layers"]
+        lines.append("\t".join(",".join(layers.get(field, [])) for field in fields))
+    return "".join(line + "\n" for line in lines)
+
+
+@pytest.fixture
+def fake_tshark(monkeypatch):
+    """Serve SYNTHETIC_PACKETS filtered by the -Y expression and count invocations."""
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        display_filter = cmd[cmd.index("-Y") + 1]
+        single = re.fullmatch(r"tcp\.stream == (\d+)", display_filter)
+        if single:
+            wanted = {single.group(1)}
+        else:
+            wanted = set(re.fullmatch(r"tcp\.stream in \{(.*)\}", display_filter).group(1).split())
+        selected = [p for p in SYNTHETIC_PACKETS if p["_source"]["layers"]["tcp.stream"][0] in wanted]
+        if cmd[cmd.index("-T") + 1] == "fields":
+            stdout = _render_fields(cmd, selected)
+        else:
+            stdout = json.dumps(selected)
+        return subprocess.CompletedProcess(cmd, 0, stdout=stdout, stderr="")
+
+    monkeypatch.setattr("pktmask.utils.subprocess_utils.run_hidden_subprocess", fake_run)
+    return calls
+
+
+def _make_marker(**config):
+    marker = TLSProtocolMarker(config)
+    marker.tshark_exec = "tshark"
+    return marker
+
+
+def _records(marker, fields, packets):
+    decoder = marker._field_decoder(fields)
+    return [decoder.decode_layers(packet["_source"]["layers"]) for packet in packets]
+
+
+TLS_PACKETS = [p for p in SYNTHETIC_PACKETS if p["_source"]["layers"]["tcp.payload"]]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tshark_output", ["fields", "json"])
+def test_batched_flow_analysis_matches_per_stream(fake_tshark, tshark_output):
+    marker = _make_marker(flow_analysis_mode="per_stream", tshark_output=tshark_output)
+    per_stream = marker._analyze_tcp_flows("x.pcap", _records(marker, TLS_RECORD_SCAN_FIELDS, TLS_PACKETS))
+    per_stream_calls = len(fake_tshark)
+    fake_tshark.clear()
+
+    marker = _make_marker(tshark_output=tshark_output)
+    batched = marker._analyze_tcp_flows("x.pcap", _records(marker, TLS_RECORD_SCAN_FIELDS, TLS_PACKETS))
+
+    assert per_stream_calls == 2
+    assert len(fake_tshark) == 1
+    assert batched == per_stream
+
+
+@pytest.mark.unit
+def test_flow_analysis_fields_output_matches_json(fake_tshark):
+    marker = _make_marker(tshark_output="json")
+    from_json = marker._analyze_tcp_flows("x.pcap", _records(marker, TLS_RECORD_SCAN_FIELDS, TLS_PACKETS))
+    marker = _make_marker(tshark_output="fields")
+    from_fields = marker._analyze_tcp_flows("x.pcap", _records(marker, TLS_RECORD_SCAN_FIELDS, TLS_PACKETS))
+
+    assert from_fields == from_json
+    assert from_fields["1"]["directions"]["forward"]["src_port"] == 443
+    assert "fields" in fake_tshark[-1] and "json" in fake_tshark[0]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tshark_output", ["fields", "json"])
+def test_batched_flow_analysis_respects_batch_size(fake_tshark, tshark_output):
+    marker = _make_marker(flow_analysis_batch_size=1, tshark_output=tshark_output)
+    packets_by_stream = marker._scan_tcp_flow_packets("x.pcap", {"0", "1", "2"})
+
+    assert len(fake_tshark) == 3
+    assert [len(packets_by_stream[sid]) for sid in ("0", "1", "2")] == [2, 2, 1]
+
+
+@pytest.mark.unit
+def test_segment_seq_index_lookup():
+    index = SegmentSeqIndex()
+    for offset, seq, length in ((0, 5000, 10), (10, 5010, 4), (14, 9000, 6)):
+        index.append(offset, seq, length)
+
+    assert [index.seq_at(offset) for offset in (0, 9, 10, 13, 14, 19)] == [5000, 5009, 5010, 5013, 9000, 9005]
+    assert index.seq_at(20) == 0
+    assert index.seq_at(-1) == 0
+    assert len(index) == 3
+
+
+@pytest.mark.unit
+def test_reassembled_records_map_to_raw_seq():
+    # Handshake record (10 byte body) split over three segments, then an application data record
+    stream = bytes.fromhex("160303000a") + b"\x01" * 10 + bytes.fromhex("1703030014") + b"\x02" * 20
+    cuts = [(1, 0, 3), (4, 3, 12), (16, 12, 40)]
+    marker = _make_marker()
+    packets = _records(
+        marker,
+        TCP_FLOW_FIELDS,
+        [
+            _packet(frame, 0, "10.0.0.1", "10.0.0.2", 40000, 443, seq, stream[start:end].hex(":"))
+            for frame, start, end in cuts
+            for seq in [1 + start]
+        ],
+    )
+    # Packets arrive out of order; reassembly sorts them by sequence number
+    reassembled = marker._reassemble_tcp_payloads(packets[::-1], {"forward": {"packets": packets[::-1]}})
+    payload, seq_mapping = reassembled["forward"]["payload"], reassembled["forward"]["seq_mapping"]
+    assert bytes(payload) == stream
+
+    records = marker._parse_tls_records_from_payload(payload, "0", "forward", seq_mapping)
+
+    assert [(r["content_type"], r["tls_header_seq_start"], r["tls_payload_seq_end"]) for r in records] == [
+        (22, 1001, 1016),
+        (23, 1016, 1041),
+    ]
+    assert all(r["is_complete"] for r in records)
@@ -0,0 +1,335 @@
+"""
+tshark streaming output tests
+
+Covers incremental JSON array parsing, the typed ``-T fields`` row decoder,
+subprocess streaming and the frame-ordered merge of the reassembled/segment TLS
+scan views, which must give the same TLS packets for JSON and field output.
+"""
+
+import io
+import json
+import shutil
+import subprocess
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+
+from pktmask.core.pipeline.stages.masking_stage.marker.tls_marker import (
+    TLS_PACKET_SPOOL_FIELDS,
+    TLS_RECORD_SCAN_FIELDS,
+    TLS_SEGMENT_SCAN_FIELDS,
+    TLSProtocolMarker,
+)
+from pktmask.core.pipeline.stages.masking_stage.marker.tshark_fields import TsharkFieldDecoder, TsharkFieldsError
+from pktmask.core.pipeline.stages.masking_stage.marker.tshark_stream import (
+    PacketSpool,
+    iter_json_array,
+    tshark_fields_stream,
+    tshark_json_stream,
+)
+
+TLS_DATA_DIR = Path(__file__).resolve().parents[1] / "data" / "tls"
+
+
+def _layers(frame, **fields):
+    layers = {"frame.number": [str(frame)]}
+    layers.update({k.replace("__", "."): v for k, v in fields.items()})
+    return {"_source": {"layers": layers}}
+
+
+def _records(marker, fields, packets):
+    decoder = marker._field_decoder(fields)
+    return [decoder.decode_layers(packet["_source"]["layers"]) for packet in packets]
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_iter_json_array_matches_json_loads(chunk_size):
+    # Literals, numbers and escapes get split across chunk boundaries too
+    packets = [_layers(i, tcp__payload=["16:03:01" * i], x=[True, None, -12.5e3, "\u00e9"]) for i in range(1, 20)]
+    text = json.dumps(packets, indent=2)
+
+    assert list(iter_json_array(io.StringIO(text), chunk_size=chunk_size)) == json.loads(text)
+
+
+@pytest.mark.unit
+def test_iter_json_array_empty_and_truncated_output():
+    assert list(iter_json_array(io.StringIO(""))) == []
+    assert list(iter_json_array(io.StringIO("[\n]\n"))) == []
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(io.StringIO('[{"a": 1}, {"b"'), chunk_size=4))
+
+
+@pytest.mark.unit
+def test_iter_json_array_fails_on_first_syntax_error():
+    text = '[{"a": 1 "b": 2}, ' + ", ".join(json.dumps(_layers(i)) for i in range(10000)) + "]"
+    stream = io.StringIO(text)
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(stream, chunk_size=64))
+    # The error is raised without buffering the rest of the output
+    assert stream.tell() <= 64
+
+
+@pytest.mark.unit
+def test_packet_spool_replays_spooled_fields_only():
+    marker = TLSProtocolMarker({})
+    reassembled = _records(
+        marker,
+        TLS_RECORD_SCAN_FIELDS,
+        [_layers(i, tls__record__content_type=["22", "23"], tls__app_data=["ab" * 512]) for i in range(50)],
+    )
+    segments = _records(marker, TLS_SEGMENT_SCAN_FIELDS, [_layers(i, tls__segment__data=["0a0b"]) for i in range(50)])
+    records = [record for pair in zip(reassembled, segments) for record in pair]
+    decoder = marker._field_decoder(TLS_PACKET_SPOOL_FIELDS)
+
+    with PacketSpool(iter(records), decoder) as spool:
+        assert len(spool) == 100
+        for _ in range(2):
+            replayed = list(spool)
+            assert [type(r) for r in replayed] == [decoder.record_type] * 100
+            for field in TLS_PACKET_SPOOL_FIELDS:
+                attr = field.replace(".", "_")
+                assert [getattr(r, attr) for r in replayed] == [getattr(r, attr) for r in records]
+    assert replayed[0].tls_record_content_type == (22, 23) and replayed[1].tls_segment_data == ("0a0b",)
+    # Fields the later stages never read are not spooled
+    assert replayed[0].tls_app_data == ()
+
+
+@pytest.mark.unit
+def test_tshark_json_stream_reads_pipe_and_checks_exit_code():
+    ok_cmd = [sys.executable, "-c", "import json; print(json.dumps([{'n': i} for i in range(1000)]))"]
+    with tshark_json_stream(ok_cmd) as packets:
+        assert [p["n"] for p in packets] == list(range(1000))
+
+    fail_cmd = [sys.executable, "-c", "import sys; print('[]'); sys.stderr.write('boom'); sys.exit(2)"]
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        with tshark_json_stream(fail_cmd) as packets:
+            list(packets)
+    assert "boom" in exc_info.value.stderr
+
+
+@pytest.mark.unit
+def test_streaming_merge_matches_buffered_merge():
+    reassembled = [
+        _layers(1),
+        _layers(2, tls__record__content_type=["22"]),
+        _layers(3),
+        _layers(4, tls__record__opaque_type=["23"]),
+        _layers(5, tls__record__content_type=["99"]),
+    ]
+    segments = [
+        _layers(1, tls__segment__data=["160301"]),
+        _layers(2, tls__segment__data=["170303"]),
+        _layers(3),
+        _layers(4),
+        _layers(5, tls__segment__data=["170303"]),
+    ]
+    marker = TLSProtocolMarker({})
+    reassembled = _records(marker, TLS_RECORD_SCAN_FIELDS, reassembled)
+    segments = _records(marker, TLS_SEGMENT_SCAN_FIELDS, segments)
+
+    buffered = marker._merge_tls_scan_results(reassembled, segments)
+    streamed = list(marker._merge_tls_scan_streams(iter(reassembled), iter(segments)))
+
+    assert streamed == buffered
+    assert [p.first("frame_number") for p in streamed] == [1, 2, 4, 5]
+    assert [p.tls_segment_data for p in streamed] == [("160301",), (), (), ("170303",)]
+
+
+def _render_fields(fields, packets):
+    """Render packets the way ``tshark -T fields -E separator=/t -E occurrence=a`` would"""
+    return "".join(
+        "\t".join(",".join(p["_source"]["layers"].get(field, [])) for field in fields) + "\n" for p in packets
+    )
+
+
+@pytest.mark.unit
+def test_field_decoder_builds_typed_slotted_records():
+    decoder = TsharkFieldDecoder(("frame.number", "ip.src", "tcp.stream", "tls.record.content_type", "tcp.payload"))
+    record = decoder.decode_line("7\t10.0.0.1\t3,5\t22,23\t16:03:01:00:02\n")
+
+    assert not hasattr(record, "__dict__")
+    assert record.frame_number == (7,)
+    assert record.ip_src == ("10.0.0.1",)
+    assert record.tcp_stream == (3, 5)
+    assert record.tls_record_content_type == (22, 23)
+    assert record.tcp_payload == ("1603010002",)
+    assert record.first("frame_number") == 7
+    assert record.layers() == {
+        "frame.number": ["7"],
+        "ip.src": ["10.0.0.1"],
+        "tcp.stream": ["3", "5"],
+        "tls.record.content_type": ["22", "23"],
+        "tcp.payload": ["16:03:01:00:02"],
+    }
+
+    empty = decoder.decode_line("8\t\t\t\t\r\n")
+    assert empty.first("tcp_payload") is None
+    assert empty.to_packet() == {"_source": {"layers": {"frame.number": ["8"]}}}
+
+    with pytest.raises(TsharkFieldsError):
+        decoder.decode_line("1\t2\n")
+    with pytest.raises(ValueError):
+        TsharkFieldDecoder(("tcp.flags-bad",))
+
+    # Fields that are not extracted still read as empty on records with optional_fields
+    partial = TsharkFieldDecoder(("frame.number",), optional_fields=("frame.number", "tls.segment.data"))
+    record = partial.decode_line("9\n")
+    assert record.tls_segment_data == () and record.first("tls_segment_data") is None
+    assert record.layers() == {"frame.number": ["9"]}
+
+
+@pytest.mark.unit
+def test_field_decoder_round_trips_json_layers():
+    packets = [
+        _layers(1, tcp__stream=["0"], tcp__payload=["1603010005"], tls__record__content_type=["22", "20"]),
+        _layers(2, ip__src=["10.0.0.2"], tcp__seq_raw=["4294967295"], tls__record__version=["0x0303"]),
+        _layers(3),
+    ]
+    decoder = TsharkFieldDecoder(TLS_RECORD_SCAN_FIELDS)
+    text = _render_fields(TLS_RECORD_SCAN_FIELDS, packets)
+
+    assert [record.to_packet() for record in decoder.decode_output(text)] == packets
+    assert [decoder.decode_layers(packet["_source"]["layers"]) for packet in packets] == decoder.decode_output(text)
+    assert list(decoder.iter_records(io.StringIO(text + "\n"))) == decoder.decode_output(text)
+    assert decoder.command_args()[:2] == ["-T", "fields"]
+
+
+@pytest.mark.unit
+def test_tshark_fields_stream_reads_pipe_and_checks_exit_code():
+    decoder = TsharkFieldDecoder(("frame.number", "tcp.len"))
+    ok_cmd = [sys.executable, "-c", "for i in range(1000): print(f'{i}\\t{i * 2}')"]
+    with tshark_fields_stream(ok_cmd, decoder) as records:
+        assert [(r.frame_number, r.tcp_len) for r in records] == [((i,), (i * 2,)) for i in range(1000)]
+
+    fail_cmd = [sys.executable, "-c", "import sys; sys.stderr.write('boom'); sys.exit(2)"]
+    with pytest.raises(subprocess.CalledProcessError) as exc_info:
+        with tshark_fields_stream(fail_cmd, decoder) as records:
+            list(records)
+    assert "boom" in exc_info.value.stderr
+
+
+def _scan_layers(frame, stream, **fields):
+    # One client -> server connection per tcp.stream, raw sequence numbers grow with the frame number
+    endpoints = {
+        "ip__src": ["10.0.0.1"],
+        "ip__dst": ["10.0.0.2"],
+        "tcp__srcport": [str(40000 + int(stream))],
+        "tcp__dstport": ["443"],
+        "tcp__stream": [stream],
+        "tcp__seq_raw": [str(1000 + frame * 100)],
+    }
+    return _layers(frame, **endpoints, **fields)
+
+
+SCAN_REASSEMBLED = [
+    _scan_layers(1, "0", tcp__payload=["0a0b"]),
+    _scan_layers(2, "0", tcp__payload=["1603010005"], tcp__len=["5"], tls__record__content_type=["22", "22"]),
+    _scan_layers(3, "0", tls__record__content_type=["99"]),
+    _scan_layers(4, "1", tls__record__opaque_type=["23"], tls__record__length=["32"]),
+]
+SCAN_SEGMENTS = [
+    _scan_layers(1, "0", tcp__payload=["0a0b"], tls__segment__data=["160301", "1703"]),
+    _scan_layers(2, "0", tcp__payload=["1603010005"], tcp__len=["5"]),
+    _scan_layers(3, "0", tls__segment__data=["170303"]),
+    _scan_layers(4, "1"),
+]
+
+
+@pytest.fixture
+def fake_tshark_scan(monkeypatch, tmp_path):
+    """Serve SCAN_REASSEMBLED/SCAN_SEGMENTS as JSON or field output to both scan modes"""
+
+    def output_for(cmd):
+        packets = SCAN_REASSEMBLED if "-2" in cmd else SCAN_SEGMENTS
+        if cmd[cmd.index("-T") + 1] == "fields":
+            return _render_fields([cmd[i + 1] for i, arg in enumerate(cmd) if arg == "-e"], packets)
+        return json.dumps(packets)
+
+    def fake_run(cmd, **kwargs):
+        return subprocess.CompletedProcess(cmd, 0, stdout=output_for(cmd), stderr="")
+
+    def fake_popen(cmd, stderr=None, **kwargs):
+        path = tmp_path / ("reassembled" if "-2" in cmd else "segments")
+        path.write_text(output_for(cmd), encoding="utf-8")
+        script = "import sys; sys.stdout.write(open(sys.argv[1], encoding='utf-8').read())"
+        return subprocess.Popen(
+            [sys.executable, "-c", script, str(path)], stdout=subprocess.PIPE, stderr=stderr, text=True
+        )
+
+    monkeypatch.setattr("pktmask.utils.subprocess_utils.run_hidden_subprocess", fake_run)
+    monkeypatch.setattr("pktmask.utils.subprocess_utils.popen_hidden_subprocess", fake_popen)
+
+
+@pytest.mark.unit
+def test_tls_scan_fields_output_matches_json(fake_tshark_scan):
+    results = {}
+    for tshark_output in ("json", "fields"):
+        for scan_mode in ("streaming", "buffered"):
+            marker = TLSProtocolMarker({"tshark_output": tshark_output, "tls_scan_mode": scan_mode})
+            marker.tshark_exec = "tshark"
+            results[tshark_output, scan_mode] = list(marker._scan_tls_messages("x.pcap"))
+
+    expected = results["json", "buffered"]
+    assert [p.first("frame_number") for p in expected] == [1, 2, 3, 4]
+    assert expected[0].to_packet() == SCAN_SEGMENTS[0] and expected[3].to_packet() == SCAN_REASSEMBLED[3]
+    assert all(result == expected for result in results.values())
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("tshark_output", ["json", "fields"])
+def test_streaming_tls_scan_yields_packets_lazily(fake_tshark_scan, tshark_output):
+    marker = TLSProtocolMarker({"tshark_output": tshark_output})
+    marker.tshark_exec = "tshark"
+
+    packets = marker._scan_tls_messages("x.pcap")
+    assert isinstance(packets, Iterator)
+    assert next(packets).frame_number == (1,)
+    packets.close()
+
+
+@pytest.mark.unit
+def test_spooled_streaming_scan_generates_same_rules_as_buffered(fake_tshark_scan):
+    def keep_rules(scan_mode):
+        marker = TLSProtocolMarker({"tls_scan_mode": scan_mode})
+        marker.tshark_exec = "tshark"
+        with marker._spool_tls_packets(marker._scan_tls_messages("x.pcap")) as tls_packets:
+            assert isinstance(tls_packets, PacketSpool if scan_mode == "streaming" else list)
+            tcp_flows = marker._analyze_tcp_flows("x.pcap", tls_packets)
+            ruleset = marker._generate_keep_rules(tls_packets, tcp_flows)
+        # Local stream ids follow tshark stream iteration order; the tuple key identifies the flow
+        return sorted(
+            (r.metadata["tuple_key"], r.direction, r.seq_start, r.seq_end, r.rule_type) for r in ruleset.rules
+        )
+
+    rules = keep_rules("streaming")
+    assert rules == keep_rules("buffered")
+    assert ("10.0.0.1:40000-10.0.0.2:443", "forward", 1200, 1205, "tls_handshake") in rules
+
+
+@pytest.mark.unit
+def test_streaming_tls_scan_wraps_parse_errors():
+    marker = TLSProtocolMarker({"tshark_output": "json"})
+    bad_cmd = [sys.executable, "-c", 'print(\'[{"a": 1 "b": 2}]\')']
+    ok_cmd = [sys.executable, "-c", "print('[]')"]
+
+    with pytest.raises(RuntimeError):
+        list(marker._scan_tls_messages_streaming(bad_cmd, ok_cmd))
+
+
+@pytest.mark.unit
+@pytest.mark.skipif(shutil.which("tshark") is None, reason="tshark not installed")
+@pytest.mark.parametrize("pcap", sorted(TLS_DATA_DIR.glob("*.pcap*")), ids=lambda path: path.name)
+def test_tls_scan_fields_output_matches_json_with_tshark(pcap):
+    def scan(tshark_output):
+        marker = TLSProtocolMarker({"tshark_output": tshark_output})
+        assert marker.initialize()
+        # Compare typed values: older tshark versions print bytes fields with ':' separators in JSON output
+        return [
+            tuple(getattr(packet, field.replace(".", "_")) for field in packet.FIELDS)
+            for packet in marker._scan_tls_messages(str(pcap))
+        ]
+
+    assert scan("fields") == scan("json")